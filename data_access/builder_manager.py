@@ -9,6 +9,30 @@ import os
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 from data_access.notion_client import notion_client
+from data_access.id_sequence import id_sequences, max_sequence_number
+from data_access.property_decoder import (
+    DATE, EMAIL, NUMBER, PHONE, SELECT, TEXT, TITLE, URL, Field, RecordSchema
+)
+
+
+# ビルダーDBのページ → ビルダーレコード
+BUILDER_RECORD = RecordSchema("BuilderRecord", [
+    Field("builder_id", "ビルダーID", TITLE),
+    Field("name", "ビルダー名", TEXT),
+    Field("prefecture", "所在地（都道府県）", SELECT),
+    Field("address", "住所", TEXT),
+    Field("phone", "電話番号", PHONE),
+    Field("email", "メールアドレス", EMAIL),
+    Field("contact_person", "担当者名", TEXT),
+    Field("line_account", "LINE公式アカウント", URL),
+    Field("status", "ステータス", SELECT),
+    Field("registered_date", "登録日", DATE),
+    Field("total_referrals", "総紹介数", NUMBER),
+    Field("total_deals", "成約数", NUMBER),
+    Field("monthly_fee", "月額利用料", NUMBER),
+    Field("contract_start_date", "契約開始日", DATE),
+    Field("notes", "備考", TEXT),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
 
 
 class BuilderManager:
@@ -37,35 +61,13 @@ class BuilderManager:
         """
         次のビルダーIDを生成（BUILDER-001形式）
         
+        連番はローカルの採番シーケンスから払い出す（Notion上の最大値はプロセスで最初の1回だけ参照）
+        
         Returns:
             次のビルダーID（例: BUILDER-001）
         """
         try:
-            # 既存のビルダーを取得して最大IDを探す
-            response = self.notion.databases.query(
-                database_id=self.builder_db_id,
-                page_size=100
-            )
-            
-            max_num = 0
-            for page in response.get("results", []):
-                props = page.get("properties", {})
-                builder_id_prop = props.get("ビルダーID", {})
-                
-                if builder_id_prop.get("type") == "title":
-                    title_array = builder_id_prop.get("title", [])
-                    if title_array:
-                        builder_id = title_array[0].get("plain_text", "")
-                        # BUILDER-001形式から数値を抽出
-                        if builder_id.startswith("BUILDER-"):
-                            try:
-                                num = int(builder_id.split("-")[1])
-                                max_num = max(max_num, num)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 次のIDを生成
-            next_num = max_num + 1
+            next_num = id_sequences.next_value("BUILDER-", seed=self._max_builder_number)
             return f"BUILDER-{next_num:03d}"
             
         except Exception as e:
@@ -74,6 +76,18 @@ class BuilderManager:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             return f"BUILDER-{timestamp}"
     
+    def _max_builder_number(self) -> int:
+        """Notion上の既存ビルダーIDの最大連番を取得（採番シーケンスの初期値）"""
+        pages = notion_client.iter_database_pages(
+            self.builder_db_id,
+            filter={"property": "ビルダーID", "title": {"starts_with": "BUILDER-"}}
+        )
+        return max_sequence_number((BUILDER_RECORD.decode(page).builder_id for page in pages), "BUILDER-")
+    
+    def seed_id_sequence(self) -> None:
+        """起動時にビルダーIDの採番シーケンスをNotion上の最大値で初期化"""
+        id_sequences.ensure_seeded("BUILDER-", self._max_builder_number)
+    
     def list_builders(
         self,
         status: Optional[str] = None,
@@ -356,90 +370,5 @@ class BuilderManager:
     
     def _parse_builder_page(self, page: Dict) -> Dict[str, Any]:
         """Notionページをビルダー情報にパース"""
-        props = page.get("properties", {})
-        
-        return {
-            "page_id": page["id"],
-            "builder_id": self._get_property_title(props, "ビルダーID"),
-            "name": self._get_property_text(props, "ビルダー名"),
-            "prefecture": self._get_property_select(props, "所在地（都道府県）"),
-            "address": self._get_property_text(props, "住所"),
-            "phone": self._get_property_phone(props, "電話番号"),
-            "email": self._get_property_email(props, "メールアドレス"),
-            "contact_person": self._get_property_text(props, "担当者名"),
-            "line_account": self._get_property_url(props, "LINE公式アカウント"),
-            "status": self._get_property_select(props, "ステータス"),
-            "registered_date": self._get_property_date(props, "登録日"),
-            "total_referrals": self._get_property_number(props, "総紹介数"),
-            "total_deals": self._get_property_number(props, "成約数"),
-            "monthly_fee": self._get_property_number(props, "月額利用料"),
-            "contract_start_date": self._get_property_date(props, "契約開始日"),
-            "notes": self._get_property_text(props, "備考"),
-            "created_time": page.get("created_time"),
-            "last_edited_time": page.get("last_edited_time")
-        }
-    
-    def _get_property_title(self, props: Dict, key: str) -> str:
-        """Titleプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "title":
-            title_array = prop.get("title", [])
-            if title_array:
-                return title_array[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_text(self, props: Dict, key: str) -> str:
-        """Text/Rich Textプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") in ("rich_text", "text"):
-            texts = prop.get("rich_text", [])
-            if texts:
-                return texts[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_select(self, props: Dict, key: str) -> Optional[str]:
-        """Selectプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "select":
-            select_obj = prop.get("select")
-            if select_obj:
-                return select_obj.get("name")
-        return None
-    
-    def _get_property_phone(self, props: Dict, key: str) -> Optional[str]:
-        """Phoneプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "phone_number":
-            return prop.get("phone_number")
-        return None
-    
-    def _get_property_email(self, props: Dict, key: str) -> Optional[str]:
-        """Emailプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "email":
-            return prop.get("email")
-        return None
-    
-    def _get_property_url(self, props: Dict, key: str) -> Optional[str]:
-        """URLプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "url":
-            return prop.get("url")
-        return None
-    
-    def _get_property_date(self, props: Dict, key: str) -> Optional[str]:
-        """Dateプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "date":
-            date_obj = prop.get("date")
-            if date_obj:
-                return date_obj.get("start")
-        return None
-    
-    def _get_property_number(self, props: Dict, key: str) -> float:
-        """Numberプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "number":
-            return prop.get("number", 0)
-        return 0
+        return BUILDER_RECORD.decode_dict(page)
 
@@ -10,43 +10,144 @@ import pickle
 import hashlib
 import json
 import time
-from typing import Any, Optional, Dict, List
-from datetime import datetime, timedelta
+from typing import Any, Optional, Dict, Iterable, Mapping
 import os
 import threading
+import functools
+import inspect
+import weakref
+
+from utils.cache_layer import caches
+from utils.data_paths import data_path, ensure_parent_dir
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 値の先頭1バイトで保存形式を区別する（従来の pickle は b"\x80" で始まるのでそのまま読める）
+_ORJSON_TAG = b"J"
+# dict / list / str / 数値 / bool / None 以外（datetime・dataclass・str や dict のサブクラスなど）は
+# orjson で変換せずに TypeError にして pickle で保存する。タプルはリストとして戻る
+_ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+    if ORJSON_AVAILABLE else 0
+)
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", data_path("cache.db"))
+# get_many の IN 句1回あたりのキー数（SQLiteのプレースホルダ上限より小さく）
+_BATCH_SIZE = 500
+
+
+def _serialize(value: Any) -> bytes:
+    """JSONと同じ型の値は orjson、それ以外は pickle で直列化"""
+    if ORJSON_AVAILABLE:
+        try:
+            return _ORJSON_TAG + orjson.dumps(value, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(blob: bytes) -> Any:
+    if blob[:1] == _ORJSON_TAG:
+        return orjson.loads(blob[1:])
+    return pickle.loads(blob)
+
+
+class _Connection(sqlite3.Connection):
+    """弱参照できるSQLite接続（sqlite3.Connection そのものは WeakSet に入れられない）"""
 
 
 class CacheManager:
     """SQLiteベースのキャッシュ管理クラス"""
     
-    def __init__(self, cache_db_path: str = "cache.db"):
+    def __init__(
+        self,
+        cache_db_path: str = CACHE_DB_PATH,
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        evict_check_interval: int = 1000,
+    ):
+        """
+        初期化
+
+        Args:
+            cache_db_path: SQLiteファイルのパス
+            max_bytes: 保存する値の合計サイズの上限（None は無制限）
+            max_entries: 保存する件数の上限（None は無制限）
+            evict_check_interval: 上限の確認を行う書き込み回数の間隔
+        """
         self.cache_db_path = cache_db_path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.evict_check_interval = max(1, evict_check_interval)
+        self._local = threading.local()
+        # スレッドが終われば接続も解放されるように弱参照で持つ（close() で閉じるためだけに使う）
+        self._connections: "weakref.WeakSet[sqlite3.Connection]" = weakref.WeakSet()
         self._lock = threading.Lock()
-        self._init_database()
+        self._writes_since_check = 0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evicted": 0, "decode_errors": 0}
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+    
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（WAL、文はSQLiteの文キャッシュで使い回す）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.cache_db_path)
+            conn = sqlite3.connect(
+                self.cache_db_path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=64,
+                factory=_Connection,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.add(conn)
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
     
     def _init_database(self):
         """データベースを初期化"""
+        conn = self._connect()
+        
+        # キャッシュテーブルを作成
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                created_at REAL,
+                expires_at REAL,
+                cache_type TEXT,
+                size INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # 以前のスキーマ（size 列なし）のファイルは列を追加してサイズを埋める
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if "size" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE cache SET size = length(value)")
+        
+        # インデックスを作成
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_expires_at ON cache(expires_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_type ON cache(cache_type)')
+    
+    def _count(self, name: str, value: int = 1) -> None:
         with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            # キャッシュテーブルを作成
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    value BLOB,
-                    created_at REAL,
-                    expires_at REAL,
-                    cache_type TEXT
-                )
-            ''')
-            
-            # インデックスを作成
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_expires_at ON cache(expires_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_type ON cache(cache_type)')
-            
-            conn.commit()
-            conn.close()
+            self._stats[name] += value
     
     def _generate_key(self, prefix: str, *args, **kwargs) -> str:
         """キャッシュキーを生成"""
@@ -55,150 +156,267 @@ class CacheManager:
             'args': args,
             'kwargs': sorted(kwargs.items())
         }
-        key_string = json.dumps(key_data, sort_keys=True)
+        # JSONにできない引数（メソッドの self など）は文字列表現を使う
+        key_string = json.dumps(key_data, sort_keys=True, default=str)
         return hashlib.md5(key_string.encode()).hexdigest()
     
+    def _decode(self, key: str, blob: bytes) -> Optional[Any]:
+        try:
+            return _deserialize(blob)
+        except Exception as e:
+            print(f"⚠️ キャッシュ値の読み込みエラー: {key}: {e}")
+            self._count("decode_errors")
+            return None
+    
     def get(self, key: str) -> Optional[Any]:
         """キャッシュから値を取得"""
-        with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT value, expires_at FROM cache 
-                WHERE key = ? AND expires_at > ?
-            ''', (key, time.time()))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return pickle.loads(result[0])
+        row = self._connect().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            self._count("misses")
             return None
+        self._count("hits")
+        return self._decode(key, row[0])
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """複数のキーをまとめて取得（見つかったキーだけを含む dict を返す）"""
+        keys = list(dict.fromkeys(keys))
+        conn = self._connect()
+        now = time.time()
+        found: Dict[str, Any] = {}
+        for start in range(0, len(keys), _BATCH_SIZE):
+            chunk = keys[start:start + _BATCH_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?',
+                (*chunk, now),
+            ).fetchall()
+            for key, blob in rows:
+                value = self._decode(key, blob)
+                if value is not None:
+                    found[key] = value
+        with self._lock:
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        return found
     
     def set(self, key: str, value: Any, ttl: int = 3600, cache_type: str = "default") -> None:
         """キャッシュに値を保存"""
+        self.set_many({key: value}, ttl, cache_type)
+    
+    def set_many(self, items: Mapping[str, Any], ttl: int = 3600, cache_type: str = "default") -> None:
+        """複数の値を1つのトランザクションで保存"""
+        now = time.time()
+        expires_at = now + ttl
+        rows = []
+        for key, value in items.items():
+            blob = _serialize(value)
+            rows.append((key, blob, now, expires_at, cache_type, len(blob)))
+        if not rows:
+            return
+        
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO cache (key, value, created_at, expires_at, cache_type, size)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        
         with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            expires_at = time.time() + ttl
-            value_blob = pickle.dumps(value)
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO cache (key, value, created_at, expires_at, cache_type)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (key, value_blob, time.time(), expires_at, cache_type))
-            
-            conn.commit()
-            conn.close()
+            self._stats["sets"] += len(rows)
+            self._writes_since_check += len(rows)
+            check = self._writes_since_check >= self.evict_check_interval
+            if check:
+                self._writes_since_check = 0
+        if check and (self.max_bytes is not None or self.max_entries is not None):
+            self.enforce_limits()
     
     def delete(self, key: str) -> None:
         """キャッシュから値を削除"""
-        with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM cache WHERE key = ?', (key,))
-            
-            conn.commit()
-            conn.close()
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
     
     def clear_expired(self) -> int:
         """期限切れのキャッシュを削除"""
-        with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
-            
-            return deleted_count
+        return self._connect().execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),)).rowcount
     
     def clear_by_type(self, cache_type: str) -> int:
         """指定タイプのキャッシュを削除"""
-        with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM cache WHERE cache_type = ?', (cache_type,))
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
-            
-            return deleted_count
+        return self._connect().execute('DELETE FROM cache WHERE cache_type = ?', (cache_type,)).rowcount
+    
+    def enforce_limits(self) -> int:
+        """
+        件数・合計サイズの上限を超えている分を削除
+
+        期限切れを先に削除し、それでも超えていれば期限が近いものから削除する。
+        """
+        if self.max_bytes is None and self.max_entries is None:
+            return 0
+        self.clear_expired()
+        conn = self._connect()
+        count, total_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        excess_entries = count - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = total_bytes - self.max_bytes if self.max_bytes is not None else 0
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return 0
+        
+        victims = []
+        for key, size in conn.execute('SELECT key, size FROM cache ORDER BY expires_at'):
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            victims.append((key,))
+            excess_entries -= 1
+            excess_bytes -= size
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("evicted", len(victims))
+        return len(victims)
     
     def get_stats(self) -> Dict[str, Any]:
         """キャッシュ統計を取得"""
+        conn = self._connect()
+        now = time.time()
+        
+        # 総数・合計サイズ
+        total_count, total_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+        ).fetchone()
+        
+        # タイプ別統計（有効なキャッシュのみ）
+        type_stats = dict(conn.execute('''
+            SELECT cache_type, COUNT(*) 
+            FROM cache 
+            WHERE expires_at > ? 
+            GROUP BY cache_type
+        ''', (now,)).fetchall())
+        valid_count = sum(type_stats.values())
+        
         with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            # 総数
-            cursor.execute('SELECT COUNT(*) FROM cache')
-            total_count = cursor.fetchone()[0]
-            
-            # 有効なキャッシュ数
-            cursor.execute('SELECT COUNT(*) FROM cache WHERE expires_at > ?', (time.time(),))
-            valid_count = cursor.fetchone()[0]
-            
-            # タイプ別統計
-            cursor.execute('''
-                SELECT cache_type, COUNT(*) 
-                FROM cache 
-                WHERE expires_at > ? 
-                GROUP BY cache_type
-            ''', (time.time(),))
-            type_stats = dict(cursor.fetchall())
-            
-            conn.close()
-            
-            return {
-                'total_count': total_count,
-                'valid_count': valid_count,
-                'expired_count': total_count - valid_count,
-                'type_stats': type_stats
-            }
+            counters = dict(self._stats)
+        return {
+            'total_count': total_count,
+            'valid_count': valid_count,
+            'expired_count': total_count - valid_count,
+            'type_stats': type_stats,
+            'bytes': total_bytes,
+            'max_bytes': self.max_bytes,
+            'max_entries': self.max_entries,
+            'serializer': 'orjson+pickle' if ORJSON_AVAILABLE else 'pickle',
+            **counters,
+        }
     
     def cleanup(self) -> Dict[str, int]:
         """キャッシュクリーンアップを実行"""
         expired_deleted = self.clear_expired()
         
         # 古いキャッシュも削除（7日以上前）
-        with self._lock:
-            conn = sqlite3.connect(self.cache_db_path)
-            cursor = conn.cursor()
-            
-            old_threshold = time.time() - (7 * 24 * 3600)  # 7日前
-            cursor.execute('DELETE FROM cache WHERE created_at < ?', (old_threshold,))
-            old_deleted = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
+        old_threshold = time.time() - (7 * 24 * 3600)  # 7日前
+        old_deleted = self._connect().execute(
+            'DELETE FROM cache WHERE created_at < ?', (old_threshold,)
+        ).rowcount
         
         return {
             'expired_deleted': expired_deleted,
             'old_deleted': old_deleted
         }
+    
+    def start_sweeper(self, interval: float = 300) -> bool:
+        """期限切れ・上限超過を定期的に削除するスレッドを開始（開始済みなら何もしない）"""
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return False
+            self._stop.clear()
+            self._sweeper = threading.Thread(
+                target=self._run, args=(interval,), name="cache-db-sweeper", daemon=True
+            )
+            self._sweeper.start()
+            return True
+    
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+    
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.clear_expired()
+                self.enforce_limits()
+            except Exception as e:
+                print(f"⚠️ キャッシュDB定期削除エラー: {e}")
+    
+    def close(self) -> None:
+        """すべてのスレッドの接続を閉じる（ファイルを削除する前など）"""
+        self.stop_sweeper()
+        with self._lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
 
 
 # グローバルキャッシュマネージャー
-cache_manager = CacheManager()
+cache_manager = CacheManager(
+    max_bytes=_env_int("CACHE_DB_MAX_BYTES") or 256 * 1024 * 1024,
+    max_entries=_env_int("CACHE_DB_MAX_ENTRIES"),
+)
+CACHE_DB_SWEEP_INTERVAL = float(os.getenv("CACHE_DB_SWEEP_INTERVAL", "300"))
 
 
 def cached_result(ttl: int = 3600, cache_type: str = "default"):
-    """キャッシュデコレータ"""
+    """
+    キャッシュデコレータ
+
+    統合キャッシュの名前空間（cache_type）を使い、メモリ → SQLite の2段で保存する。
+    async 関数にも使える（コルーチンではなく結果をキャッシュする）。
+    """
+    namespace = caches.namespace(
+        cache_type,
+        ttl=ttl,
+        max_entries=int(os.getenv("CACHED_RESULT_MAX_ENTRIES", "128")),
+        disk=cache_manager,
+    )
+
     def decorator(func):
+        def make_key(args, kwargs):
+            return cache_manager._generate_key(func.__name__, *args, **kwargs)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(args, kwargs)
+                cached_value = namespace.get(key)
+                if cached_value is not None:
+                    return cached_value
+                result = await func(*args, **kwargs)
+                if result is not None:
+                    namespace.set(key, result, ttl)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # キャッシュキーを生成
-            key = cache_manager._generate_key(func.__name__, *args, **kwargs)
+            key = make_key(args, kwargs)
             
             # キャッシュから取得を試行
-            cached_value = cache_manager.get(key)
+            cached_value = namespace.get(key)
             if cached_value is not None:
                 return cached_value
             
@@ -207,7 +425,7 @@ def cached_result(ttl: int = 3600, cache_type: str = "default"):
             
             # 結果をキャッシュに保存
             if result is not None:
-                cache_manager.set(key, result, ttl, cache_type)
+                namespace.set(key, result, ttl)
             
             return result
         return wrapper
@@ -7,12 +7,16 @@ RAGシステムのベクトル検索機能をモジュール化
 
 import os
 import glob
-import shutil
 from typing import List, Dict, Optional, Any
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 
+from utils.embedding_cache import cached_embeddings
+from utils.embedding_index import EmbeddingManifest, manifest_path, sync_embeddings
+from utils.flat_vector_index import open_vector_store, vector_store_available
+from utils.text_chunker import chunk_documents
+
 # ChromaDBの安全なインポート
 try:
     from langchain_chroma import Chroma
@@ -47,7 +51,8 @@ class ChromaManager:
         if not self.openai_api_key:
             raise ValueError("OpenAI APIキーが設定されていません。環境変数OPENAI_API_KEYを設定してください。")
         
-        self.embeddings_model = OpenAIEmbeddings(openai_api_key=self.openai_api_key)
+        # 同じテキストの埋め込みはキャッシュから返す（再構築・同じ質問でAPIを呼ばない）
+        self.embeddings_model = cached_embeddings(OpenAIEmbeddings(openai_api_key=self.openai_api_key))
         self.db = None
     
     def initialize(self, force_rebuild: bool = False) -> bool:
@@ -55,59 +60,37 @@ class ChromaManager:
         ChromaDBを初期化
         
         Args:
-            force_rebuild: 既存のDBを強制的に再構築するか
+            force_rebuild: 既存のDBもソースに合わせて更新するか（変わった断片だけを埋め込み直す）
         
         Returns:
             bool: 初期化成功時True
         """
-        if not CHROMA_AVAILABLE:
-            print("❌ ChromaDBが利用できません")
+        if not vector_store_available():
+            print("❌ ChromaDB・FlatVectorIndex（numpy）のどちらも利用できません")
             return False
         
-        # 既存のDBがある場合の処理
-        if os.path.exists(self.persist_dir):
-            if force_rebuild:
-                print(f"🔄 既存のChromaDBを削除中: {self.persist_dir}")
-                try:
-                    shutil.rmtree(self.persist_dir)
-                    print("✅ 既存のDBを削除しました")
-                except Exception as e:
-                    print(f"⚠️ DB削除エラー: {e}")
-                    print("💡 既存のDBを使用して続行します")
-            else:
-                # 既存のDBを読み込む
-                try:
-                    print(f"🔄 既存のChromaDBを読み込み中: {self.persist_dir}")
-                    self.db = Chroma(
-                        persist_directory=self.persist_dir,
-                        embedding_function=self.embeddings_model,
-                        collection_name=self.collection_name
-                    )
-                    print("✅ 既存のChromaDBを読み込みました")
-                    return True
-                except Exception as e:
-                    print(f"⚠️ 既存DB読み込みエラー: {e}")
-                    print("🔄 新しいDBを作成します...")
+        # 既存のDBがある場合はそのまま読み込む
+        if os.path.exists(self.persist_dir) and not force_rebuild:
+            try:
+                print(f"🔄 既存のChromaDBを読み込み中: {self.persist_dir}")
+                self.db = open_vector_store(self.persist_dir, self.embeddings_model, self.collection_name)
+                print("✅ 既存のChromaDBを読み込みました")
+                return True
+            except Exception as e:
+                print(f"⚠️ 既存DB読み込みエラー: {e}")
+                print("🔄 DBを更新します...")
         
-        # 新しいDBを作成
+        # DBを開き（無ければ作成）、新しい・変わった断片だけを埋め込む
         try:
             documents = self._load_documents()
-            if not documents:
-                print("⚠️ ドキュメントがありません。空のDBを作成します。")
-                self.db = Chroma(
-                    persist_directory=self.persist_dir,
-                    embedding_function=self.embeddings_model,
-                    collection_name=self.collection_name
-                )
-            else:
-                print(f"📚 {len(documents)}件のドキュメントでChromaDBを作成中...")
-                self.db = Chroma.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings_model,
-                    persist_directory=self.persist_dir,
-                    collection_name=self.collection_name
-                )
-                print("✅ ChromaDBを作成しました")
+            print(f"📚 {len(documents)}件の断片でChromaDBを差分更新中...")
+            self.db = open_vector_store(self.persist_dir, self.embeddings_model, self.collection_name)
+            sync_embeddings(
+                self.db,
+                documents,
+                EmbeddingManifest(manifest_path(self.persist_dir, self.collection_name))
+            )
+            print("✅ ChromaDBを更新しました")
             return True
         except Exception as e:
             print(f"❌ ChromaDB作成エラー: {e}")
@@ -134,6 +117,7 @@ class ChromaManager:
                         doc.page_content = str(doc.page_content)
                     doc.metadata["source_type"] = "manual"
                     doc.metadata["url"] = "キャンピングカー修理マニュアル.pdf"
+                    doc.metadata["source_version"] = os.path.getmtime(pdf_path)
                     documents.append(doc)
                 print(f"✅ PDFドキュメント {len(pdf_docs)} 件を読み込みました")
             except Exception as e:
@@ -151,12 +135,14 @@ class ChromaManager:
                     doc.metadata["source_type"] = "text_file"
                     doc.metadata["url"] = os.path.basename(txt_file)
                     doc.metadata["title"] = os.path.basename(txt_file).replace('.txt', '')
+                    doc.metadata["source_version"] = os.path.getmtime(txt_file)
                     documents.append(doc)
                 print(f"✅ テキストファイル {os.path.basename(txt_file)} を読み込みました")
             except Exception as e:
                 print(f"⚠️ テキストファイル {txt_file} 読み込みエラー: {e}")
         
-        return documents
+        # ケース・見出し単位の断片に分割
+        return chunk_documents(documents)
     
     def upsert_docs(self, docs: List[Document], metadata: Optional[Dict[str, Any]] = None) -> bool:
         """
@@ -179,9 +165,10 @@ class ChromaManager:
                 for doc in docs:
                     doc.metadata.update(metadata)
             
-            # ChromaDBに追加（既存のIDがある場合は更新）
-            self.db.add_documents(docs)
-            print(f"✅ {len(docs)}件のドキュメントを登録しました")
+            # 断片に分割し、断片IDで登録（既存のIDがある場合は更新）
+            chunks = chunk_documents(docs)
+            self.db.add_documents(chunks, ids=[doc.metadata["chunk_id"] for doc in chunks])
+            print(f"✅ {len(docs)}件のドキュメントを登録しました（{len(chunks)}断片）")
             return True
         except Exception as e:
             print(f"❌ ドキュメント登録エラー: {e}")
@@ -293,15 +280,7 @@ class ChromaManager:
         """
         print(f"🔄 RAGシステムを再構築中（ソース: {source}）...")
         
-        # 既存のDBを削除して再構築
-        if os.path.exists(self.persist_dir):
-            try:
-                shutil.rmtree(self.persist_dir)
-                print("✅ 既存のDBを削除しました")
-            except Exception as e:
-                print(f"⚠️ DB削除エラー: {e}")
-        
-        # 再初期化
+        # 既存のDBは削除せず、変わった断片だけを埋め込み直す
         return self.initialize(force_rebuild=True)
     
     def get_db(self) -> Optional[Chroma]:
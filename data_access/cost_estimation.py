@@ -9,7 +9,7 @@ import os
 import re
 from typing import Dict, Optional, Any, List
 from datetime import datetime
-from data_access.notion_client import NotionClient
+from data_access.notion_client import notion_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -40,7 +40,7 @@ class CostEstimationEngine:
     
     def __init__(self):
         """初期化"""
-        self.notion_client = NotionClient()
+        self.notion_client = notion_client
         
         # デフォルトの工賃単価（時間あたり）
         self.default_hourly_rate = 8000  # 円/時間
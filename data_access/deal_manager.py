@@ -11,6 +11,35 @@ from typing import List, Dict, Optional, Any
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from data_access.notion_client import notion_client
+from data_access.id_sequence import id_sequences, max_sequence_number
+from data_access.notion_replica import notion_replica
+from data_access.property_decoder import (
+    DATE, EMAIL, NUMBER, PHONE, RELATION, SELECT, TEXT, TITLE, Field, RecordSchema
+)
+
+
+# 商談DBのページ → 商談レコード（抽出プランはデータベースごとに1回だけコンパイル）
+DEAL_RECORD = RecordSchema("DealRecord", [
+    Field("deal_id", "商談ID", TITLE),
+    Field("customer_name", "顧客名", TEXT),
+    Field("phone", "電話番号", PHONE),
+    Field("email", "メールアドレス", EMAIL),
+    Field("prefecture", "所在地（都道府県）", SELECT),
+    Field("symptom_category", "症状カテゴリ", SELECT),
+    Field("symptom_detail", "症状詳細", TEXT),
+    Field("partner_page_ids", "紹介修理店", RELATION),
+    Field("inquiry_date", "問い合わせ日時", DATE),
+    Field("status", "紹介ステータス", SELECT),
+    Field("deal_date", "成約日", DATE),
+    Field("deal_amount", "成約金額", NUMBER),
+    Field("commission_rate", "手数料率", NUMBER),
+    Field("commission_amount", "手数料金額", NUMBER),
+    Field("payment_status", "支払いステータス", SELECT),
+    Field("notification_method", "通知方法", SELECT),
+    Field("line_user_id", "LINEユーザーID", TEXT),
+    Field("notes", "備考", TEXT),
+    Field("progress_report_count", "経過報告回数", NUMBER),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
 
 
 class DealManager:
@@ -23,6 +52,7 @@ class DealManager:
         
         if not self.deal_db_id:
             raise ValueError("NOTION_DEAL_DB_IDが設定されていません")
+        notion_replica.register("deals", self.deal_db_id)
     
     def _get_database_id(self) -> Optional[str]:
         """データベースIDを取得"""
@@ -39,42 +69,15 @@ class DealManager:
         """
         次の商談IDを生成（DEAL-20241103-001形式）
         
+        連番は日付ごとのローカル採番シーケンスから払い出す（Notion上の最大値はその日の最初の1回だけ参照）
+        
         Returns:
             次の商談ID（例: DEAL-20241103-001）
         """
         try:
             today = datetime.now().strftime("%Y%m%d")
             prefix = f"DEAL-{today}-"
-            
-            # 今日の日付で始まる商談を取得
-            response = self.notion.databases.query(
-                database_id=self.deal_db_id,
-                filter={
-                    "property": "商談ID",
-                    "title": {"starts_with": prefix}
-                },
-                page_size=100
-            )
-            
-            max_num = 0
-            for page in response.get("results", []):
-                props = page.get("properties", {})
-                deal_id_prop = props.get("商談ID", {})
-                
-                if deal_id_prop.get("type") == "title":
-                    title_array = deal_id_prop.get("title", [])
-                    if title_array:
-                        deal_id = title_array[0].get("plain_text", "")
-                        # DEAL-YYYYMMDD-XXX形式から数値を抽出
-                        if deal_id.startswith(prefix):
-                            try:
-                                num = int(deal_id.split("-")[2])
-                                max_num = max(max_num, num)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 次のIDを生成
-            next_num = max_num + 1
+            next_num = id_sequences.next_value(prefix, seed=lambda: self._max_deal_number(prefix))
             return f"{prefix}{next_num:03d}"
             
         except Exception as e:
@@ -82,6 +85,19 @@ class DealManager:
             # エラー時はタイムスタンプベースのIDを生成
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             return f"DEAL-{timestamp}"
+    
+    def _max_deal_number(self, prefix: str) -> int:
+        """Notion上で prefix（DEAL-YYYYMMDD-）から始まる商談IDの最大連番を取得"""
+        pages = notion_client.iter_database_pages(
+            self.deal_db_id,
+            filter={"property": "商談ID", "title": {"starts_with": prefix}}
+        )
+        return max_sequence_number((DEAL_RECORD.decode(page).deal_id for page in pages), prefix)
+    
+    def seed_id_sequence(self) -> None:
+        """起動時に今日の商談IDの採番シーケンスをNotion上の最大値で初期化"""
+        prefix = f"DEAL-{datetime.now().strftime('%Y%m%d')}-"
+        id_sequences.ensure_seeded(prefix, lambda: self._max_deal_number(prefix))
 
     def _now_jst_iso(self) -> str:
         """JST(Asia/Tokyo)のタイムゾーン付きISO文字列を返す（Notionの日時ズレ対策）"""
@@ -186,6 +202,7 @@ class DealManager:
                 parent={"database_id": self.deal_db_id},
                 properties=properties
             )
+            notion_replica.upsert_pages("deals", [new_page])
             
             return self._parse_deal_page(new_page)
             
@@ -211,6 +228,12 @@ class DealManager:
             商談リスト
         """
         try:
+            # ローカルレプリカが新しければNotionに問い合わせない
+            replica_deals = self._list_deals_from_replica(status, partner_page_id)
+            if replica_deals is not None:
+                replica_deals.sort(key=lambda d: d.get("inquiry_date") or "", reverse=True)
+                return replica_deals[:limit]
+            
             filters = []
             
             # ステータスフィルタ
@@ -262,6 +285,11 @@ class DealManager:
             商談情報（見つからない場合はNone）
         """
         try:
+            # ローカルレプリカを優先（見つからない場合はNotionで確認）
+            replica_pages = notion_replica.find_pages("deals", title=deal_id)
+            if replica_pages:
+                return self._parse_deal_page(replica_pages[0])
+            
             # 商談IDで検索
             response = self.notion.databases.query(
                 database_id=self.deal_db_id,
@@ -321,6 +349,7 @@ class DealManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_replica.upsert_pages("deals", [updated_page])
             
             updated_deal = self._parse_deal_page(updated_page)
             
@@ -359,6 +388,10 @@ class DealManager:
             商談リスト
         """
         try:
+            replica_deals = self._list_deals_from_replica(status, partner_page_id)
+            if replica_deals is not None:
+                return replica_deals[:limit]
+            
             filters = [{
                 "property": "紹介修理店",
                 "relation": {"contains": partner_page_id}
@@ -392,6 +425,28 @@ class DealManager:
             traceback.print_exc()
             return []
     
+    def _list_deals_from_replica(
+        self,
+        status: Optional[str] = None,
+        partner_page_id: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """レプリカから商談を取得してフィルタ（レプリカが古い場合はNone）"""
+        pages = (
+            notion_replica.find_pages("deals", status=status) if status
+            else notion_replica.read_pages("deals")
+        )
+        if pages is None:
+            return None
+        
+        deals = [deal for deal in map(self._parse_deal_page, pages) if deal]
+        if partner_page_id:
+            wanted = partner_page_id.replace("-", "").lower()
+            deals = [
+                d for d in deals
+                if any((pid or "").replace("-", "").lower() == wanted for pid in d.get("partner_page_ids", []))
+            ]
+        return deals
+    
     def _send_status_update_notification(self, deal: Dict[str, Any], status: str):
         """ステータス更新時にLINE通知を送信"""
         try:
@@ -697,6 +752,7 @@ class DealManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_replica.upsert_pages("deals", [updated_page])
             
             updated_deal = self._parse_deal_page(updated_page)
             
@@ -756,6 +812,7 @@ class DealManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_replica.upsert_pages("deals", [updated_page])
             
             return self._parse_deal_page(updated_page)
             
@@ -819,6 +876,7 @@ class DealManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_replica.upsert_pages("deals", [updated_page])
             
             return self._parse_deal_page(updated_page)
             
@@ -828,93 +886,5 @@ class DealManager:
     
     def _parse_deal_page(self, page: Dict) -> Dict[str, Any]:
         """Notionページを商談情報にパース"""
-        props = page.get("properties", {})
-        
-        # 紹介修理店のリレーションを取得
-        partner_relation = props.get("紹介修理店", {})
-        partner_page_ids = []
-        if partner_relation.get("type") == "relation":
-            partner_page_ids = [rel.get("id") for rel in partner_relation.get("relation", [])]
-        
-        return {
-            "page_id": page["id"],
-            "deal_id": self._get_property_title(props, "商談ID"),
-            "customer_name": self._get_property_text(props, "顧客名"),
-            "phone": self._get_property_phone(props, "電話番号"),
-            "email": self._get_property_email(props, "メールアドレス"),
-            "prefecture": self._get_property_select(props, "所在地（都道府県）"),
-            "symptom_category": self._get_property_select(props, "症状カテゴリ"),
-            "symptom_detail": self._get_property_text(props, "症状詳細"),
-            "partner_page_ids": partner_page_ids,
-            "inquiry_date": self._get_property_date(props, "問い合わせ日時"),
-            "status": self._get_property_select(props, "紹介ステータス"),
-            "deal_date": self._get_property_date(props, "成約日"),
-            "deal_amount": self._get_property_number(props, "成約金額"),
-            "commission_rate": self._get_property_number(props, "手数料率"),
-            "commission_amount": self._get_property_number(props, "手数料金額"),
-            "payment_status": self._get_property_select(props, "支払いステータス"),
-            "notification_method": self._get_property_select(props, "通知方法"),
-            "line_user_id": self._get_property_text(props, "LINEユーザーID"),
-            "notes": self._get_property_text(props, "備考"),
-            "progress_report_count": self._get_property_number(props, "経過報告回数"),
-            "created_time": page.get("created_time"),
-            "last_edited_time": page.get("last_edited_time")
-        }
-    
-    def _get_property_title(self, props: Dict, key: str) -> str:
-        """Titleプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "title":
-            title_array = prop.get("title", [])
-            if title_array:
-                return title_array[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_text(self, props: Dict, key: str) -> str:
-        """Text/Rich Textプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") in ("rich_text", "text"):
-            texts = prop.get("rich_text", [])
-            if texts:
-                return texts[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_select(self, props: Dict, key: str) -> Optional[str]:
-        """Selectプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "select":
-            select_obj = prop.get("select")
-            if select_obj:
-                return select_obj.get("name")
-        return None
-    
-    def _get_property_phone(self, props: Dict, key: str) -> Optional[str]:
-        """Phoneプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "phone_number":
-            return prop.get("phone_number")
-        return None
-    
-    def _get_property_email(self, props: Dict, key: str) -> Optional[str]:
-        """Emailプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "email":
-            return prop.get("email")
-        return None
-    
-    def _get_property_date(self, props: Dict, key: str) -> Optional[str]:
-        """Dateプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "date":
-            date_obj = prop.get("date")
-            if date_obj:
-                return date_obj.get("start")
-        return None
-    
-    def _get_property_number(self, props: Dict, key: str) -> float:
-        """Numberプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "number":
-            return prop.get("number", 0)
-        return 0
+        return DEAL_RECORD.decode_dict(page)
 
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+診断フローのグラフ
+診断データの読み込みごとに1回だけ、ID → ノードの索引・カテゴリ別の開始ノード・
+隣接リスト・ノードごとの選択肢・routing_config のキーワード照合器・終端ノードの結果を作り、
+/chat/diagnose/start・/chat/diagnose/answer の各ステップでノード一覧を走査しないようにする
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .keyword_automaton import RoutingMatcher
+
+
+DEFAULT_NEXT_STEPS = "専門業者への相談をお勧めします"
+
+# 同時に保持するグラフの数（カテゴリ別の読み込みなど、診断データが複数ある場合用）
+_GRAPH_CACHE_SIZE = 4
+
+
+def build_options(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """診断ノードから選択肢を作成（routing_config の next_nodes_map、無ければ next_nodes）"""
+    options = []
+
+    routing_config = node.get("routing_config")
+    if routing_config and isinstance(routing_config, dict):
+        for option in routing_config.get("next_nodes_map", []):
+            options.append({
+                "text": option.get("label", "選択肢"),
+                "value": option.get("id", "")
+            })
+
+    if not options:
+        for next_node_id in node.get("next_nodes", []):
+            options.append({
+                "text": f"選択肢 {len(options) + 1}",
+                "value": next_node_id
+            })
+
+    return options
+
+
+def summarize_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    """診断結果のサマリーを作成"""
+    result = node.get("diagnosis_result") or node.get("result") or ""
+    return {
+        "title": result or "診断結果",
+        "details": result,
+        "next_steps": DEFAULT_NEXT_STEPS
+    }
+
+
+def _is_start(node: Dict[str, Any]) -> bool:
+    # 開始フラグはチェックボックス（is_start）とメモ形式（start）の両方がある
+    return bool(node.get("is_start") or node.get("start"))
+
+
+def _is_terminal(node: Dict[str, Any]) -> bool:
+    return bool(node.get("is_end") or node.get("terminal"))
+
+
+# routing_config はプロパティ（routing_config）とメモ内JSON（routing）の2通りある
+ROUTING_KEYS = ("routing_config", "routing")
+
+
+def _routing(node: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ROUTING_KEYS:
+        config = node.get(key)
+        if config and isinstance(config, dict):
+            return config
+    return {}
+
+
+class DiagnosticGraph:
+    """
+    診断ノード一覧から作る読み取り専用のグラフ
+
+    ノードはIDでもノードID（タイトル）でも引ける。ノードの dict は元の一覧と共有する。
+    """
+
+    def __init__(self, nodes: Iterable[Dict[str, Any]]):
+        self.nodes: Tuple[Dict[str, Any], ...] = tuple(node for node in nodes if isinstance(node, dict))
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_node_id: Dict[str, Dict[str, Any]] = {}
+        self.start_nodes: List[Dict[str, Any]] = []
+        self._start_by_category: Dict[str, Dict[str, Any]] = {}
+        self._adjacency: Dict[str, Tuple[str, ...]] = {}
+        self._options: Dict[str, List[Dict[str, Any]]] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._matchers: Dict[Tuple[str, str], RoutingMatcher] = {}
+
+        for node in self.nodes:
+            if node.get("id"):
+                self._by_id.setdefault(node["id"], node)
+            if node.get("node_id"):
+                self.by_node_id.setdefault(node["node_id"], node)
+            if _is_start(node):
+                self.start_nodes.append(node)
+                self._start_by_category.setdefault((node.get("category") or "").lower(), node)
+
+        for node in self.nodes:
+            key = self._key(node)
+            if key is None:
+                continue
+            self._adjacency[key] = self._resolve_edges(node)
+            self._options[key] = build_options(node)
+            for config_key in ROUTING_KEYS:
+                config = node.get(config_key)
+                if config and isinstance(config, dict) and config.get("next_nodes_map"):
+                    self._matchers[(key, config_key)] = RoutingMatcher(config)
+            if _is_terminal(node) or not self._adjacency[key]:
+                self._summaries[key] = summarize_node(node)
+
+    @staticmethod
+    def _key(node: Dict[str, Any]) -> Optional[str]:
+        return node.get("id") or node.get("node_id")
+
+    def _resolve_edges(self, node: Dict[str, Any]) -> Tuple[str, ...]:
+        """next_nodes・next_raw・routing の遷移先をノードのキーに解決（重複と未知のIDは除く）"""
+        targets: List[str] = list(node.get("next_nodes") or [])
+        targets += [target.strip() for target in (node.get("next_raw") or "").split(",")]
+        targets += [candidate.get("id") for candidate in _routing(node).get("next_nodes_map", [])
+                    if isinstance(candidate, dict)]
+        edges = []
+        for target in targets:
+            next_node = self.get_node(target) if target else None
+            key = self._key(next_node) if next_node else None
+            if key and key not in edges:
+                edges.append(key)
+        return tuple(edges)
+
+    # ---- 参照 ----
+
+    def get_node(self, node_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """IDまたはノードIDでノードを取得"""
+        if not node_id:
+            return None
+        return self._by_id.get(node_id) or self.by_node_id.get(node_id)
+
+    def start_node(self, category: str = "general") -> Optional[Dict[str, Any]]:
+        """カテゴリの開始ノード（"general" は最初の開始ノード）"""
+        if category == "general":
+            return self.start_nodes[0] if self.start_nodes else None
+        return self._start_by_category.get((category or "").lower())
+
+    def next_node_ids(self, node_id: str) -> Tuple[str, ...]:
+        node = self.get_node(node_id)
+        return self._adjacency.get(self._key(node), ()) if node else ()
+
+    def options(self, node_id: str) -> List[Dict[str, Any]]:
+        """ノードの選択肢（呼び出し側で変更されてもよいようにコピーを返す）"""
+        node = self.get_node(node_id)
+        if not node:
+            return []
+        return [dict(option) for option in self._options.get(self._key(node), [])]
+
+    def summary(self, node_id: str) -> Dict[str, Any]:
+        """ノードの診断結果サマリー（終端ノード以外はその場で作る）"""
+        node = self.get_node(node_id)
+        if not node:
+            return summarize_node({})
+        cached = self._summaries.get(self._key(node))
+        return dict(cached) if cached else summarize_node(node)
+
+    def matcher(self, node_id: str, config_key: str = "routing_config") -> Optional[RoutingMatcher]:
+        """ノードの routing_config の照合器（構築後に設定された routing_config はその場でコンパイル）"""
+        node = self.get_node(node_id)
+        if not node:
+            return None
+        key = (self._key(node), config_key)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            config = node.get(config_key)
+            if not (config and isinstance(config, dict)):
+                return None
+            matcher = self._matchers[key] = RoutingMatcher(config)
+        return matcher
+
+    def is_terminal(self, node_id: str) -> bool:
+        node = self.get_node(node_id)
+        return bool(node) and self._key(node) in self._summaries
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self.nodes),
+            "start_nodes": len(self.start_nodes),
+            "edges": sum(len(edges) for edges in self._adjacency.values()),
+            "terminal_nodes": len(self._summaries),
+            "routing_matchers": len(self._matchers),
+        }
+
+
+_graph_cache: List[Tuple[Any, DiagnosticGraph]] = []
+_graph_cache_lock = threading.Lock()
+_graph_stats = {"builds": 0, "hits": 0}
+
+
+def get_diagnostic_graph(diagnostic_data: Union[Dict[str, Any], List[Dict[str, Any]], None]) -> DiagnosticGraph:
+    """
+    診断データのグラフを取得（同じノード一覧のオブジェクトに対しては作り直さない）
+
+    キャッシュされた診断データは同じリストオブジェクトが返るので、その同一性で判定する。
+
+    Args:
+        diagnostic_data: load_diagnostic_data の戻り値（{"nodes": [...]}）またはノードのリスト
+    """
+    if isinstance(diagnostic_data, dict):
+        nodes = diagnostic_data.get("nodes") or []
+    else:
+        nodes = diagnostic_data or []
+
+    with _graph_cache_lock:
+        for position, (source, graph) in enumerate(_graph_cache):
+            if source is nodes and len(graph.nodes) == len(nodes):
+                _graph_cache.insert(0, _graph_cache.pop(position))
+                _graph_stats["hits"] += 1
+                return graph
+
+    graph = DiagnosticGraph(nodes)
+    with _graph_cache_lock:
+        # 元のリストへの参照を保持する（id() だけだと解放後に同じ値が再利用されるため）
+        _graph_cache.insert(0, (nodes, graph))
+        del _graph_cache[_GRAPH_CACHE_SIZE:]
+        _graph_stats["builds"] += 1
+    print(f"🧭 診断グラフ構築: {graph.get_stats()}")
+    return graph
+
+
+def remember_diagnostic_graph(nodes: List[Dict[str, Any]], graph: DiagnosticGraph) -> None:
+    """作成済みのグラフを nodes のグラフとして登録（スナップショットから復元した場合など）"""
+    with _graph_cache_lock:
+        _graph_cache.insert(0, (nodes, graph))
+        del _graph_cache[_GRAPH_CACHE_SIZE:]
+
+
+def get_graph_stats() -> Dict[str, Any]:
+    with _graph_cache_lock:
+        return {"cached_graphs": len(_graph_cache), **_graph_stats}
@@ -6,12 +6,16 @@
 """
 
 import os
-import requests
 import logging
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from utils.http_transport import HTTPTransport, http_transport
+from data_access.property_decoder import (
+    DATE, EMAIL, PHONE, RELATION, SELECT, TEXT, TITLE, URL, Field, RecordSchema
+)
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -43,10 +47,39 @@ NOTION_COMMENTS_URL = "https://api.notion.com/v1/comments"
 STATUS_OPTIONS = ["受付", "診断中", "修理中", "完了", "キャンセル"]
 
 
+# チャットログDB・商談DBのページ → 案件レコード（抽出プランはデータベースごとに1回だけコンパイル）
+CHAT_LOG_RECORD = RecordSchema("ChatLogRecord", [
+    Field("title", None, TITLE),
+    Field("user_message", "user_message", TEXT),
+    Field("bot_message", "bot_message", TEXT),
+    Field("session_id", "session_id", TEXT),
+    Field("category", "category", SELECT),
+    Field("status", "status", SELECT),
+    Field("timestamp", "timestamp", DATE | TEXT),
+    Field("comment", "comment", TEXT),
+    Field("image_url", "image_url", URL),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
+
+DEAL_CASE_RECORD = RecordSchema("DealCaseRecord", [
+    Field("deal_id", "商談ID", TITLE),
+    Field("customer_name", "顧客名", TEXT),
+    Field("phone", "電話番号", PHONE, default=""),
+    # カード表示と送信で同じロジックにするため、メール型だけでなく rich_text の場合も拾う
+    Field("email", "メールアドレス", EMAIL | TEXT, default=""),
+    Field("prefecture", "所在地（都道府県）", SELECT),
+    Field("symptom_category", "症状カテゴリ", SELECT),
+    Field("symptom_detail", "症状詳細", TEXT),
+    Field("inquiry_date", "問い合わせ日時", DATE | TEXT),
+    Field("deal_status", "紹介ステータス", SELECT),
+    Field("partner_page_ids", "紹介修理店", RELATION),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
+
+
 class FactoryDashboardManager:
     """工場向けダッシュボード管理クラス（Phase 4）"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
+        self.http = transport or http_transport
         if not NOTION_API_KEY:
             raise ValueError("NOTION_API_KEYが設定されていません")
         
@@ -166,7 +199,7 @@ class FactoryDashboardManager:
                 "direction": sort_direction
             }]
             
-            response = requests.post(
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.log_db_id}/query",
                 headers=self.headers,
                 json=query,
@@ -248,7 +281,7 @@ class FactoryDashboardManager:
                 "direction": sort_direction
             }]
             
-            response = requests.post(
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.deal_db_id}/query",
                 headers=self.headers,
                 json=query,
@@ -277,41 +310,11 @@ class FactoryDashboardManager:
     def _parse_page(self, page: Dict) -> Optional[Dict[str, Any]]:
         """Notionページをパースして案件データに変換"""
         try:
-            props = page.get("properties", {})
-            
-            # タイトル取得
-            title = ""
-            for prop_name, prop_data in props.items():
-                if prop_data.get("type") == "title":
-                    title_list = prop_data.get("title", [])
-                    if title_list:
-                        title = title_list[0].get("text", {}).get("content", "")
-                    break
-            
-            # 各種プロパティ取得
-            user_message = self._get_rich_text(props.get("user_message", {}))
-            bot_message = self._get_rich_text(props.get("bot_message", {}))
-            session_id = self._get_rich_text(props.get("session_id", {}))
-            category = self._get_select(props.get("category", {}))
-            status = self._get_select(props.get("status", {}))
-            timestamp = self._get_date(props.get("timestamp", {}))
-            comment = self._get_rich_text(props.get("comment", {}))
-            image_url = self._get_url(props.get("image_url", {}))
-            
-            return {
-                "page_id": page.get("id"),
-                "title": title or session_id or "未設定",
-                "user_message": user_message,
-                "bot_message": bot_message,
-                "session_id": session_id,
-                "category": category,
-                "status": status or "受付",  # デフォルトは「受付」
-                "timestamp": timestamp,
-                "comment": comment,
-                "image_url": image_url,
-                "created_time": page.get("created_time"),
-                "last_edited_time": page.get("last_edited_time"),
-            }
+            record = CHAT_LOG_RECORD.decode(page)
+            case = record.to_dict()
+            case["title"] = record.title or record.session_id or "未設定"
+            case["status"] = record.status or "受付"  # デフォルトは「受付」
+            return case
         except Exception as e:
             logger.warning(f"⚠️ ページパースエラー: {e}")
             return None
@@ -356,54 +359,28 @@ class FactoryDashboardManager:
     def _parse_deal_page(self, page: Dict) -> Optional[Dict[str, Any]]:
         """商談DBのページをパースして案件データに変換"""
         try:
-            props = page.get("properties", {})
-            
-            # 商談ID（タイトル）を取得
-            deal_id = ""
-            deal_id_prop = props.get("商談ID", {})
-            if deal_id_prop.get("type") == "title":
-                title_list = deal_id_prop.get("title", [])
-                if title_list:
-                    deal_id = title_list[0].get("text", {}).get("content", "")
-            
-            # 各種プロパティ取得
-            customer_name = self._get_rich_text(props.get("顧客名", {}))
-            phone = self._get_phone(props.get("電話番号", {}))
-            email = self._resolve_email_property(props, "メールアドレス")
-            prefecture = self._get_select(props.get("所在地（都道府県）", {}))
-            symptom_category = self._get_select(props.get("症状カテゴリ", {}))
-            symptom_detail = self._get_rich_text(props.get("症状詳細", {}))
-            inquiry_date = self._get_date(props.get("問い合わせ日時", {}))
-            deal_status = self._get_select(props.get("紹介ステータス", {}))
-            
-            # ステータスを工場ダッシュボードのステータスにマッピング
-            dashboard_status = self.status_mapping.get(deal_status, "受付")
-            
-            # 紹介修理店のリレーションを取得
-            partner_relation = props.get("紹介修理店", {})
-            partner_page_ids = []
-            if partner_relation.get("type") == "relation":
-                partner_page_ids = [rel.get("id") for rel in partner_relation.get("relation", [])]
+            record = DEAL_CASE_RECORD.decode(page)
             
             return {
-                "page_id": page.get("id"),
-                "title": deal_id or customer_name or "未設定",
-                "deal_id": deal_id,
-                "customer_name": customer_name,
-                "phone": phone,
-                "email": email,
-                "prefecture": prefecture,
-                "symptom_category": symptom_category,
-                "symptom_detail": symptom_detail,
-                "status": dashboard_status,
-                "deal_status": deal_status,  # 元のステータスも保持
-                "timestamp": inquiry_date,
-                "partner_page_ids": partner_page_ids,
-                "created_time": page.get("created_time"),
-                "last_edited_time": page.get("last_edited_time"),
-                "user_message": symptom_detail,  # 症状詳細をuser_messageとして使用
+                "page_id": record.page_id,
+                "title": record.deal_id or record.customer_name or "未設定",
+                "deal_id": record.deal_id,
+                "customer_name": record.customer_name,
+                "phone": record.phone,
+                "email": record.email.strip(),
+                "prefecture": record.prefecture,
+                "symptom_category": record.symptom_category,
+                "symptom_detail": record.symptom_detail,
+                # ステータスを工場ダッシュボードのステータスにマッピング
+                "status": self.status_mapping.get(record.deal_status, "受付"),
+                "deal_status": record.deal_status,  # 元のステータスも保持
+                "timestamp": record.inquiry_date,
+                "partner_page_ids": record.partner_page_ids,
+                "created_time": record.created_time,
+                "last_edited_time": record.last_edited_time,
+                "user_message": record.symptom_detail,  # 症状詳細をuser_messageとして使用
                 "bot_message": "",  # 商談DBにはbot_messageがない
-                "category": symptom_category,
+                "category": record.symptom_category,
                 "comment": "",
                 "image_url": None,
             }
@@ -468,7 +445,7 @@ class FactoryDashboardManager:
         """ページIDからデータソースを判定"""
         try:
             # ページを取得してプロパティを確認
-            response = requests.get(
+            response = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15
@@ -497,7 +474,7 @@ class FactoryDashboardManager:
                 }
             }
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 json={"properties": properties},
@@ -533,7 +510,7 @@ class FactoryDashboardManager:
                 }
             }
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 json={"properties": properties},
@@ -570,7 +547,7 @@ class FactoryDashboardManager:
         """ステータス更新時にLINE通知を送信"""
         try:
             # 商談情報を取得
-            response = requests.get(
+            response = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15
@@ -654,7 +631,7 @@ class FactoryDashboardManager:
         """ステータス更新時にメール通知を送信"""
         try:
             # 商談情報を取得
-            response = requests.get(
+            response = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15
@@ -741,7 +718,7 @@ class FactoryDashboardManager:
         """ステータスプロパティがない場合、コメントに追記"""
         try:
             # 既存のコメントを取得
-            page = requests.get(
+            page = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15
@@ -760,7 +737,7 @@ class FactoryDashboardManager:
                     }
                 }
                 
-                response = requests.patch(
+                response = self.http.patch(
                     f"{NOTION_PAGES_URL}/{page_id}",
                     headers=self.headers,
                     json={"properties": properties},
@@ -778,7 +755,7 @@ class FactoryDashboardManager:
                     }
                 }
                 
-                response = requests.patch(
+                response = self.http.patch(
                     f"{NOTION_PAGES_URL}/{page_id}",
                     headers=self.headers,
                     json={"properties": properties},
@@ -805,7 +782,7 @@ class FactoryDashboardManager:
         """
         try:
             # 既存のコメントを取得
-            page = requests.get(
+            page = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15
@@ -824,7 +801,7 @@ class FactoryDashboardManager:
                     }
                 }
                 
-                response = requests.patch(
+                response = self.http.patch(
                     f"{NOTION_PAGES_URL}/{page_id}",
                     headers=self.headers,
                     json={"properties": properties},
@@ -856,7 +833,7 @@ class FactoryDashboardManager:
         Notion への保存は済んでいる前提。送信失敗でも例外は握りつぶさず False を返す。
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 timeout=15,
@@ -928,7 +905,7 @@ class FactoryDashboardManager:
                 }]
             }
             
-            response = requests.post(
+            response = self.http.post(
                 NOTION_COMMENTS_URL,
                 headers=self.headers,
                 json=payload,
@@ -962,7 +939,7 @@ class FactoryDashboardManager:
                 }
             }
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{NOTION_PAGES_URL}/{page_id}",
                 headers=self.headers,
                 json={"properties": properties},
@@ -9,6 +9,32 @@ import os
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 from data_access.notion_client import notion_client
+from data_access.id_sequence import id_sequences, max_sequence_number
+from data_access.notion_replica import notion_replica
+from data_access.property_decoder import (
+    DATE, EMAIL, MULTI_SELECT, NUMBER, PHONE, SELECT, TEXT, TITLE, Field, RecordSchema
+)
+
+
+# 工場DBのページ → 工場レコード
+FACTORY_RECORD = RecordSchema("FactoryRecord", [
+    Field("factory_id", "工場ID", TITLE),
+    Field("name", "工場名", TEXT),
+    Field("prefecture", "所在地（都道府県）", SELECT),
+    Field("address", "住所", TEXT),
+    Field("phone", "電話番号", PHONE),
+    Field("email", "メールアドレス", EMAIL),
+    Field("specialties", "専門分野", MULTI_SELECT),
+    Field("business_hours", "営業時間", TEXT),
+    Field("service_areas", "対応可能エリア", MULTI_SELECT),
+    Field("status", "ステータス", SELECT),
+    Field("registered_date", "登録日", DATE),
+    Field("total_cases", "総案件数", NUMBER),
+    Field("completed_cases", "完了案件数", NUMBER),
+    Field("avg_response_time", "平均対応時間", NUMBER),
+    Field("rating", "評価スコア", NUMBER),
+    Field("notes", "備考", TEXT),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
 
 
 class FactoryManager:
@@ -21,6 +47,7 @@ class FactoryManager:
         
         if not self.factory_db_id:
             raise ValueError("NOTION_FACTORY_DB_IDが設定されていません")
+        notion_replica.register("factories", self.factory_db_id)
     
     def _get_database_id(self) -> Optional[str]:
         """データベースIDを取得"""
@@ -37,35 +64,13 @@ class FactoryManager:
         """
         次の工場IDを生成（FACTORY-001形式）
         
+        連番はローカルの採番シーケンスから払い出す（Notion上の最大値はプロセスで最初の1回だけ参照）
+        
         Returns:
             次の工場ID（例: FACTORY-001）
         """
         try:
-            # 既存の工場を取得して最大IDを探す
-            response = self.notion.databases.query(
-                database_id=self.factory_db_id,
-                page_size=100
-            )
-            
-            max_num = 0
-            for page in response.get("results", []):
-                props = page.get("properties", {})
-                factory_id_prop = props.get("工場ID", {})
-                
-                if factory_id_prop.get("type") == "title":
-                    title_array = factory_id_prop.get("title", [])
-                    if title_array:
-                        factory_id = title_array[0].get("plain_text", "")
-                        # FACTORY-001形式から数値を抽出
-                        if factory_id.startswith("FACTORY-"):
-                            try:
-                                num = int(factory_id.split("-")[1])
-                                max_num = max(max_num, num)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 次のIDを生成
-            next_num = max_num + 1
+            next_num = id_sequences.next_value("FACTORY-", seed=self._max_factory_number)
             return f"FACTORY-{next_num:03d}"
             
         except Exception as e:
@@ -74,6 +79,18 @@ class FactoryManager:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             return f"FACTORY-{timestamp}"
     
+    def _max_factory_number(self) -> int:
+        """Notion上の既存工場IDの最大連番を取得（採番シーケンスの初期値）"""
+        pages = notion_client.iter_database_pages(
+            self.factory_db_id,
+            filter={"property": "工場ID", "title": {"starts_with": "FACTORY-"}}
+        )
+        return max_sequence_number((FACTORY_RECORD.decode(page).factory_id for page in pages), "FACTORY-")
+    
+    def seed_id_sequence(self) -> None:
+        """起動時に工場IDの採番シーケンスをNotion上の最大値で初期化"""
+        id_sequences.ensure_seeded("FACTORY-", self._max_factory_number)
+    
     def list_factories(
         self,
         status: Optional[str] = None,
@@ -94,6 +111,20 @@ class FactoryManager:
             工場リスト
         """
         try:
+            # ローカルレプリカが新しければNotionに問い合わせない
+            pages = (
+                notion_replica.find_pages("factories", status=status) if status
+                else notion_replica.read_pages("factories")
+            )
+            if pages is not None:
+                factories = [
+                    factory for factory in map(self._parse_factory_page, pages)
+                    if (not prefecture or factory.get("prefecture") == prefecture)
+                    and (not specialty or specialty in factory.get("specialties", []))
+                ]
+                factories.sort(key=lambda f: f.get("registered_date") or "", reverse=True)
+                return factories[:limit]
+            
             filters = []
             
             # ステータスフィルタ
@@ -152,6 +183,10 @@ class FactoryManager:
             工場情報（見つからない場合はNone）
         """
         try:
+            replica_pages = notion_replica.find_pages("factories", title=factory_id)
+            if replica_pages:
+                return self._parse_factory_page(replica_pages[0])
+            
             # 工場IDで検索
             response = self.notion.databases.query(
                 database_id=self.factory_db_id,
@@ -263,6 +298,7 @@ class FactoryManager:
                 parent={"database_id": self.factory_db_id},
                 properties=properties
             )
+            notion_replica.upsert_pages("factories", [new_page])
             
             return self._parse_factory_page(new_page)
             
@@ -361,6 +397,7 @@ class FactoryManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_replica.upsert_pages("factories", [updated_page])
             
             return self._parse_factory_page(updated_page)
             
@@ -441,38 +478,7 @@ class FactoryManager:
     
     def _parse_factory_page(self, page: Dict) -> Dict[str, Any]:
         """Notionページを工場情報にパース"""
-        props = page.get("properties", {})
-        
-        return {
-            "page_id": page["id"],
-            "factory_id": self._get_property_title(props, "工場ID"),
-            "name": self._get_property_text(props, "工場名"),
-            "prefecture": self._get_property_select(props, "所在地（都道府県）"),
-            "address": self._get_property_text(props, "住所"),
-            "phone": self._get_property_phone(props, "電話番号"),
-            "email": self._get_property_email(props, "メールアドレス"),
-            "specialties": self._get_property_multi_select(props, "専門分野"),
-            "business_hours": self._get_property_text(props, "営業時間"),
-            "service_areas": self._get_property_multi_select(props, "対応可能エリア"),
-            "status": self._get_property_select(props, "ステータス"),
-            "registered_date": self._get_property_date(props, "登録日"),
-            "total_cases": self._get_property_number(props, "総案件数"),
-            "completed_cases": self._get_property_number(props, "完了案件数"),
-            "avg_response_time": self._get_property_number(props, "平均対応時間"),
-            "rating": self._get_property_number(props, "評価スコア"),
-            "notes": self._get_property_text(props, "備考"),
-            "created_time": page.get("created_time"),
-            "last_edited_time": page.get("last_edited_time")
-        }
-    
-    def _get_property_title(self, props: Dict, key: str) -> str:
-        """Titleプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "title":
-            title_array = prop.get("title", [])
-            if title_array:
-                return title_array[0].get("plain_text", "")
-        return ""
+        return FACTORY_RECORD.decode_dict(page)
     
     def _get_property_text(self, props_or_page: Dict, key: str) -> str:
         """Text/Rich Textプロパティを取得"""
@@ -504,41 +510,3 @@ class FactoryManager:
                 return select_obj.get("name")
         return None
     
-    def _get_property_multi_select(self, props: Dict, key: str) -> List[str]:
-        """Multi-selectプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "multi_select":
-            multi_select_array = prop.get("multi_select", [])
-            return [item.get("name", "") for item in multi_select_array]
-        return []
-    
-    def _get_property_phone(self, props: Dict, key: str) -> Optional[str]:
-        """Phoneプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "phone_number":
-            return prop.get("phone_number")
-        return None
-    
-    def _get_property_email(self, props: Dict, key: str) -> Optional[str]:
-        """Emailプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "email":
-            return prop.get("email")
-        return None
-    
-    def _get_property_date(self, props: Dict, key: str) -> Optional[str]:
-        """Dateプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "date":
-            date_obj = prop.get("date")
-            if date_obj:
-                return date_obj.get("start")
-        return None
-    
-    def _get_property_number(self, props: Dict, key: str) -> float:
-        """Numberプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "number":
-            return prop.get("number", 0)
-        return 0
-
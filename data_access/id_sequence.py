@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ID採番シーケンス
+DEAL-YYYYMMDD-NNN / REVIEW-YYYYMMDD-NNN / FACTORY-NNN / BUILDER-NNN / SHOP-NNN の連番を
+SQLiteで管理する（作成のたびにNotionを検索して最大値を探さない）
+
+各シーケンスはプロセス内で最初に使うときに1回だけNotion上の最大値で初期化する
+（ローカルの値と大きい方を採用するので、デプロイでDBファイルが消えても番号は戻らない）
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from utils.data_paths import data_path, ensure_parent_dir
+
+
+def max_sequence_number(ids: Iterable[Optional[str]], prefix: str) -> int:
+    """
+    prefix で始まるIDの末尾の連番の最大値を取得
+
+    Args:
+        ids: 既存のID（例: DEAL-20241103-001）
+        prefix: 連番の直前までの文字列（例: DEAL-20241103-）
+
+    Returns:
+        最大の連番（該当が無ければ 0）
+    """
+    max_num = 0
+    for value in ids:
+        if not value or not value.startswith(prefix):
+            continue
+        try:
+            max_num = max(max_num, int(value[len(prefix):]))
+        except ValueError:
+            pass
+    return max_num
+
+
+class IDSequenceAllocator:
+    """SQLiteの連番テーブル（BEGIN IMMEDIATE で原子的に加算する）"""
+
+    def __init__(self, db_path: str = "id_sequences.db", block_size: int = 1):
+        """
+        初期化
+
+        Args:
+            db_path: SQLiteファイルのパス
+            block_size: 1回の書き込みで予約する番号の数
+                （2以上にすると書き込みは減るが、再起動時に予約済みの番号が欠番になる）
+        """
+        self.db_path = db_path
+        self.block_size = max(1, block_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._block_lock = threading.Lock()
+        self._seed_locks: Dict[str, threading.Lock] = {}
+        self._seeded: set = set()
+        self._blocks: Dict[str, list] = {}  # 名前 → [次の番号, 予約済みの最後の番号]
+        self._stats = {"allocated": 0, "reserved": 0, "seeded": 0, "seed_errors": 0}
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（トランザクションは明示的に開始する）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
+
+    def _init_database(self):
+        """連番テーブルを作成"""
+        self._connect().execute('''
+            CREATE TABLE IF NOT EXISTS sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0,
+                seeded_at REAL,
+                updated_at REAL
+            )
+        ''')
+
+    # ---- 採番 ----
+
+    def reserve(self, name: str, count: int = 1) -> range:
+        """
+        連番を count 個まとめて予約
+
+        Returns:
+            予約した番号の range（例: range(4, 7) → 4, 5, 6）
+        """
+        if count < 1:
+            raise ValueError("count は1以上を指定してください")
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+            start = (row[0] if row else 0) + 1
+            conn.execute(
+                '''
+                INSERT INTO sequences (name, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                ''',
+                (name, start + count - 1, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._stats["reserved"] += count
+        return range(start, start + count)
+
+    def next_value(self, name: str, seed: Optional[Callable[[], int]] = None) -> int:
+        """
+        次の番号を取得
+
+        Args:
+            name: シーケンス名（ID の連番より前の部分。例: DEAL-20241103-）
+            seed: Notion上の最大値を返す関数（このプロセスで未初期化の場合に1回だけ呼ぶ）
+        """
+        if seed is not None:
+            self.ensure_seeded(name, seed)
+
+        if self.block_size == 1:
+            value = self.reserve(name)[0]
+        else:
+            with self._block_lock:
+                block = self._blocks.get(name)
+                if block is None or block[0] > block[1]:
+                    reserved = self.reserve(name, self.block_size)
+                    block = self._blocks[name] = [reserved.start, reserved.stop - 1]
+                value = block[0]
+                block[0] += 1
+
+        with self._lock:
+            self._stats["allocated"] += 1
+        return value
+
+    # ---- 初期値 ----
+
+    def seed(self, name: str, current_max: int) -> int:
+        """
+        シーケンスを既存の最大値以上に引き上げる（下げることはしない）
+
+        Returns:
+            反映後の値
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                '''
+                INSERT INTO sequences (name, value, seeded_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    value = MAX(value, excluded.value),
+                    seeded_at = excluded.seeded_at,
+                    updated_at = excluded.updated_at
+                ''',
+                (name, int(current_max), now, now),
+            )
+            value = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._block_lock:
+            self._blocks.pop(name, None)
+        with self._lock:
+            self._seeded.add(name)
+            self._stats["seeded"] += 1
+        return value
+
+    def ensure_seeded(self, name: str, seed: Callable[[], int]) -> None:
+        """
+        このプロセスで未初期化のシーケンスを seed() の値で初期化
+
+        seed() の例外は呼び出し元に送出する（次回の採番で再度初期化を試みる）
+        """
+        if name in self._seeded:
+            return
+        with self._lock:
+            seed_lock = self._seed_locks.setdefault(name, threading.Lock())
+        with seed_lock:
+            if name in self._seeded:
+                return
+            try:
+                current_max = seed()
+            except Exception:
+                with self._lock:
+                    self._stats["seed_errors"] += 1
+                raise
+            self.seed(name, current_max)
+
+    def peek(self, name: str) -> int:
+        """最後に払い出した（予約した）番号を取得"""
+        row = self._connect().execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """シーケンス数と採番回数"""
+        count = self._connect().execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+        with self._lock:
+            return {
+                "sequences": count,
+                "seeded_in_process": len(self._seeded),
+                "block_size": self.block_size,
+                **self._stats,
+            }
+
+
+# グローバル採番シーケンス
+id_sequences = IDSequenceAllocator(
+    os.getenv("ID_SEQUENCE_DB_PATH", data_path("id_sequences.db")),
+    block_size=int(os.getenv("ID_SEQUENCE_BLOCK_SIZE", "1")),
+)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+routing_config のキーワード照合
+各ノードの routing_config（候補のキーワード・安全ワード・名詞×症状ペア）を
+読み込み時に1つの Aho–Corasick オートマトンにまとめ、回答文を1回走査するだけで
+全候補のヒット・スコア・安全ワードを求める
+"""
+
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# 名詞×症状ペア（両方を含む回答は全候補に加点）
+NOUN_SYMPTOM_PAIRS: Tuple[Tuple[str, str], ...] = (
+    ("水圧", "弱い"), ("炎", "弱い"), ("電圧", "低い"),
+    ("音", "大きい"), ("温度", "高い"), ("振動", "激しい"),
+    ("エンジン", "かからない"), ("バッテリー", "上がらない"),
+    ("エアコン", "効かない"), ("トイレ", "詰まる"),
+)
+PAIR_BONUS = 0.3
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick 法の複数パターン照合（大文字・小文字は区別しない）
+
+    パターン数・パターン長に関係なく、テキストを1回走査するだけで含まれるパターンをすべて求める。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: Tuple[str, ...] = tuple(dict.fromkeys(p.lower() for p in patterns if p))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._out[state] += (index,)
+
+        # 失敗遷移は幅優先で（浅い状態から）決める
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0) if state else 0
+                self._fail[next_state] = target
+                self._out[next_state] += self._out[target]
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """テキストに含まれるパターン（小文字化したもの）"""
+        found = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in (text or "").lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found.update(out[state])
+        return frozenset(self.patterns[index] for index in found)
+
+
+class RoutingMatch(NamedTuple):
+    """回答文1件の照合結果"""
+    candidate_hits: Tuple[List[str], ...]  # 候補ごとのヒットしたキーワード（routing_config の表記・順序のまま）
+    pair_count: int                        # 一致した名詞×症状ペアの数
+    safety_word: Optional[str]             # 最初に一致した安全ワード（safety_words の順）
+
+
+class RoutingMatcher:
+    """1ノードの routing_config をまとめたオートマトン"""
+
+    def __init__(self, config: Optional[Dict[str, Any]], pairs: Sequence[Tuple[str, str]] = NOUN_SYMPTOM_PAIRS):
+        config = config or {}
+        self.candidates: Tuple[Dict[str, Any], ...] = tuple(
+            candidate for candidate in config.get("next_nodes_map", []) or [] if isinstance(candidate, dict)
+        )
+        self.safety_words: Tuple[str, ...] = tuple(config.get("safety_words", []) or [])
+        self.pairs = tuple(pairs)
+        self.automaton = KeywordAutomaton(
+            [keyword for candidate in self.candidates for keyword in candidate.get("keywords", []) or []]
+            + list(self.safety_words)
+            + [term for pair in self.pairs for term in pair]
+        )
+
+    def match(self, text: str) -> RoutingMatch:
+        found = self.automaton.find(text)
+        candidate_hits = tuple(
+            [keyword for keyword in candidate.get("keywords", []) or [] if keyword.lower() in found]
+            for candidate in self.candidates
+        )
+        pair_count = sum(1 for noun, symptom in self.pairs if noun.lower() in found and symptom.lower() in found)
+        safety_word = next((word for word in self.safety_words if word.lower() in found), None)
+        return RoutingMatch(candidate_hits, pair_count, safety_word)
+
+    def match_many(self, texts: Iterable[str]) -> List[RoutingMatch]:
+        """複数の回答文をまとめて照合（オフライン評価用）"""
+        return [self.match(text) for text in texts]
+
+    def score(self, match: RoutingMatch) -> List[Dict[str, Any]]:
+        """候補ごとのスコア（ヒット数 × weight + ペア加点）"""
+        results = []
+        for candidate, hits in zip(self.candidates, match.candidate_hits):
+            score = len(hits) * candidate.get("weight", 1.0)
+            for _ in range(match.pair_count):
+                score += PAIR_BONUS
+            results.append({"score": score, "hits": hits})
+        return results
@@ -6,11 +6,16 @@
 """
 
 import os
-import requests
 import logging
 from typing import List, Dict, Optional, Any
 from dotenv import load_dotenv
 
+from data_access.notion_replica import notion_replica
+from utils.http_transport import HTTPTransport, http_transport
+from data_access.property_decoder import (
+    MULTI_SELECT, NUMBER, SELECT, TEXT_JOINED, TITLE, Field, RecordSchema
+)
+
 load_dotenv(override=True)
 
 logger = logging.getLogger(__name__)
@@ -38,6 +43,20 @@ _DEFAULT_DIFFICULTY_OPTIONS = frozenset(
 )
 
 
+# マニュアルDBのページ → マニュアルレコード（抽出プランはデータベースごとに1回だけコンパイル）
+MANUAL_RECORD = RecordSchema("ManualRecord", [
+    Field("manual_id", None, TITLE),
+    Field("title", "タイトル", TEXT_JOINED),
+    Field("category", "カテゴリ", SELECT, default=""),
+    Field("steps", "作業手順", TEXT_JOINED),
+    Field("tools", "必要な工具", MULTI_SELECT),
+    Field("difficulty", "難易度", SELECT, default=""),
+    Field("estimated_time", "推定時間", NUMBER, default=None),
+    Field("safety_notes", "安全注意事項", TEXT_JOINED),
+    Field("tags", "タグ", MULTI_SELECT),
+], page_attrs={"id": "id", "url": "url", "created_time": "created_time", "last_edited_time": "last_edited_time"})
+
+
 class ManualSearchError(RuntimeError):
     """作業マニュアル検索で上流エラーを伝える例外"""
 
@@ -58,7 +77,8 @@ def _normalize_manual_db_id(raw: Optional[str]) -> Optional[str]:
 class ManualManager:
     """作業マニュアル管理クラス"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
+        self.http = transport or http_transport
         if not NOTION_API_KEY:
             raise ValueError("NOTION_API_KEYが設定されていません")
         if not NOTION_MANUAL_DB_ID:
@@ -70,6 +90,7 @@ class ManualManager:
             "Content-Type": "application/json",
         }
         self.db_id = _normalize_manual_db_id(NOTION_MANUAL_DB_ID)
+        notion_replica.register("manuals", self.db_id)
         extra = os.getenv("NOTION_MANUAL_DIFFICULTY_OPTIONS", "")
         self._difficulty_options = set(_DEFAULT_DIFFICULTY_OPTIONS)
         if extra.strip():
@@ -102,6 +123,11 @@ class ManualManager:
             return []
         
         try:
+            # ローカルレプリカが新しければNotionに問い合わせない
+            replica_manuals = self._search_manuals_from_replica(query, category, difficulty)
+            if replica_manuals is not None:
+                return replica_manuals[:limit]
+            
             # 検索フィルターを構築
             query_filters = []
             
@@ -169,7 +195,7 @@ class ManualManager:
             if filter_obj:
                 request_body["filter"] = filter_obj
             
-            response = requests.post(
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.db_id}/query",
                 headers=self.headers,
                 json=request_body,
@@ -219,7 +245,11 @@ class ManualManager:
             マニュアル情報
         """
         try:
-            response = requests.get(
+            replica_pages = notion_replica.find_pages("manuals", page_id=manual_id)
+            if replica_pages:
+                return self._parse_manual_page(replica_pages[0])
+            
+            response = self.http.get(
                 f"{NOTION_PAGES_URL}/{manual_id}",
                 headers=self.headers,
                 timeout=15
@@ -236,88 +266,53 @@ class ManualManager:
             logger.error(f"❌ マニュアル取得エラー: {e}")
             return None
     
+    def _search_manuals_from_replica(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        difficulty: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """レプリカ上で search_manuals と同じ条件の検索を行う（レプリカが古い場合はNone）"""
+        category_stripped = (category or "").strip()
+        pages = (
+            notion_replica.find_pages("manuals", category=category_stripped) if category_stripped
+            else notion_replica.read_pages("manuals")
+        )
+        if pages is None:
+            return None
+        
+        difficulty_stripped = (difficulty or "").strip()
+        if difficulty_stripped not in self._difficulty_options:
+            difficulty_stripped = ""
+        query_lower = (query or "").lower()
+        
+        manuals = []
+        for page in pages:
+            manual = self._parse_manual_page(page)
+            if not manual:
+                continue
+            # Notionの contains と同様に大文字小文字を区別しない
+            if query_lower and not any(
+                query_lower in (manual.get(key) or "").lower()
+                for key in ("manual_id", "title", "steps")
+            ):
+                continue
+            if difficulty_stripped and manual.get("difficulty") != difficulty_stripped:
+                continue
+            manuals.append(manual)
+        return manuals
+    
     def _parse_manual_page(self, page: Dict) -> Optional[Dict[str, Any]]:
         """Notionページをパースしてマニュアルデータに変換"""
         try:
-            props = page.get("properties", {})
-            
-            # マニュアルID（タイトル）
-            manual_id = ""
-            title_prop = None
-            for prop_name, prop_data in props.items():
-                if prop_data.get("type") == "title":
-                    title_list = prop_data.get("title", [])
-                    if title_list:
-                        manual_id = title_list[0].get("text", {}).get("content", "")
-                    title_prop = prop_data
-                    break
-            
-            # 各種プロパティ取得
-            title = self._get_rich_text(props.get("タイトル", {}))
-            category = self._get_select(props.get("カテゴリ", {}))
-            steps = self._get_rich_text(props.get("作業手順", {}))
-            tools = self._get_multi_select(props.get("必要な工具", {}))
-            difficulty = self._get_select(props.get("難易度", {}))
-            estimated_time = self._get_number(props.get("推定時間", {}))
-            safety_notes = self._get_rich_text(props.get("安全注意事項", {}))
-            tags = self._get_multi_select(props.get("タグ", {}))
-            
-            return {
-                "id": page.get("id"),
-                "manual_id": manual_id,
-                "title": title or manual_id,
-                "category": category,
-                "steps": steps,
-                "tools": tools,
-                "difficulty": difficulty,
-                "estimated_time": estimated_time,
-                "safety_notes": safety_notes,
-                "tags": tags,
-                "url": page.get("url", ""),
-                "created_time": page.get("created_time"),
-                "last_edited_time": page.get("last_edited_time")
-            }
+            manual = MANUAL_RECORD.decode_dict(page)
+            manual["title"] = manual["title"] or manual["manual_id"]
+            manual["url"] = manual["url"] or ""
+            return manual
         
         except Exception as e:
             logger.warning(f"⚠️ マニュアルパースエラー: {e}")
             return None
-    
-    def _get_rich_text(self, prop: Dict) -> str:
-        """Rich Textプロパティから値を取得"""
-        if not prop:
-            return ""
-        
-        rich_text = prop.get("rich_text", [])
-        if not rich_text:
-            return ""
-        
-        return "".join(item.get("plain_text", "") for item in rich_text)
-    
-    def _get_select(self, prop: Dict) -> str:
-        """Selectプロパティから値を取得"""
-        if not prop:
-            return ""
-        
-        select = prop.get("select")
-        if not select:
-            return ""
-        
-        return select.get("name", "")
-    
-    def _get_multi_select(self, prop: Dict) -> List[str]:
-        """Multi-selectプロパティから値を取得"""
-        if not prop:
-            return []
-        
-        multi_select = prop.get("multi_select", [])
-        return [item.get("name", "") for item in multi_select]
-    
-    def _get_number(self, prop: Dict) -> Optional[float]:
-        """Numberプロパティから値を取得"""
-        if not prop:
-            return None
-        
-        return prop.get("number")
 
 
 # グローバルインスタンス
@@ -9,9 +9,14 @@ import os
 import asyncio
 import aiohttp
 import json
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from functools import lru_cache
-from typing import Dict, List, Optional, Any
+from itertools import chain
+from typing import Dict, List, Optional, Any, Iterator, Iterable, Union
 import time
 
 # .envファイルを読み込む
@@ -21,6 +26,17 @@ try:
 except ImportError:
     pass  # dotenvがインストールされていない場合はスキップ
 
+from utils.http_transport import HTTPTransport, http_transport
+from .relation_resolver import RelationResolver, normalize_page_id
+from .notion_replica import notion_replica
+from .notion_scheduler import notion_scheduler
+from .notion_query_planner import SEARCH_MAX_RESULTS, merge_results, plan_keyword_search
+from .diagnostic_graph import get_diagnostic_graph
+from .property_decoder import (
+    MULTI_SELECT, RELATION, SELECT, TEXT, TEXT_JOINED, TEXT_LIST, TITLE, Field, PropertyKind, RecordSchema,
+    invalidate_all_plans
+)
+
 try:
     from .cache_manager import cache_manager, cached_result
 except ImportError:
@@ -42,17 +58,85 @@ except ImportError:
 # バックアップ作成日時: 2025-01-15 23:00:00
 # Notion診断フロールーティングシステム実装完了版
 
+NOTION_API_BASE = "https://api.notion.com/v1"
+NOTION_API_VERSION = "2022-06-28"
+# 非同期クライアントのNotion向け同時接続数（実際の送信レートはスケジューラーが制御）
+NOTION_ASYNC_POOL_SIZE = int(os.getenv("NOTION_ASYNC_POOL_SIZE", "10"))
+
+
+class NotionAPIError(Exception):
+    """Notion APIのHTTPエラー（スケジューラーが status / headers で再試行を判断する）"""
+    
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.headers = headers or {}
+
+
+# 診断フローDB・修理ケースDB・部品DBのページ → レコード（抽出プランはデータベースごとに1回だけコンパイル）
+NODE_RECORD = RecordSchema("DiagnosticNodeRecord", [
+    Field("node_id", "ノードID", TITLE),
+    Field("start_flag", "開始フラグ", TEXT_JOINED | SELECT, default=""),
+    Field("terminal_flag", "終端フラグ", TEXT_JOINED | SELECT, default=""),
+    Field("next_raw", "次のノード", TEXT_JOINED),
+    Field("question", "質問内容", TEXT_JOINED),
+    Field("result", "診断結果", TEXT_JOINED),
+    Field("steps", "修理手順", TEXT_JOINED),
+    Field("cautions", "注意事項", TEXT_JOINED),
+    Field("memo", "メモ", TEXT_JOINED, default=None),
+    Field("category", "カテゴリ", TEXT_JOINED | SELECT, default=""),
+    Field("symptoms", "症状", MULTI_SELECT | TEXT_LIST),
+    Field("case_ids", "関連修理ケース", RELATION),
+    Field("item_ids", "関連部品・工具", RELATION),
+], page_attrs={"id": "id"})
+
+CASE_RECORD = RecordSchema("RepairCaseRecord", [
+    Field("title", "ケースID", TITLE),
+    Field("category", "カテゴリ", TEXT_JOINED | SELECT, default=""),
+    Field("symptoms", "症状", MULTI_SELECT | TEXT_LIST),
+    Field("solution", "解決方法", TEXT),
+    Field("cost_estimate", "費用見積もり", TEXT),
+    Field("difficulty", "難易度", TEXT_JOINED | SELECT, default=""),
+    Field("tools_required", "必要な工具", MULTI_SELECT | TEXT_LIST),
+    Field("parts_required", "必要な部品", MULTI_SELECT | TEXT_LIST),
+], page_attrs={"id": "id", "last_edited_time": "last_edited_time"})
+
+RELATED_CASE_RECORD = RecordSchema("RelatedCaseRecord", [
+    Field("title", "ケースID", TITLE),
+    Field("category", "カテゴリ", TEXT_JOINED | SELECT, default=""),
+    Field("solution", "解決方法", TEXT),
+])
+
+RELATED_ITEM_RECORD = RecordSchema("RelatedItemRecord", [
+    Field("name", "部品名", TITLE),
+    Field("category", "カテゴリ", TEXT_JOINED | SELECT, default=""),
+    Field("price", "価格", TEXT_JOINED | PropertyKind({"number": lambda prop: str(prop["number"])}), default=""),
+    Field("supplier", "サプライヤー", TEXT),
+])
+
 
 class NotionClient:
     """Notion APIクライアントの管理クラス（非同期対応・キャッシュ対応）"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
         self.client = None
         self.api_key = None
         self.session = None
+        # 直接HTTPでNotionを呼ぶ場合の共有コネクションプール
+        self.http = transport or http_transport
+        # 非同期API用: イベントループごとの aiohttp セッションと、同期ラッパー用の専用ループ
+        self._aio_sessions = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._schema_cache: Dict[str, Dict[str, str]] = {}
         self._initialize_api_key()
         # クライアントを自動初期化
         self.client = self.initialize_client()
+        # リレーション先ページの一括解決（他のマネージャーとも共有）
+        self.relation_resolver = RelationResolver(
+            lambda: self.client,
+            scanner=self.iter_database_pages
+        )
     
     def _initialize_api_key(self):
         """APIキーの初期化（遅延インポート対応）"""
@@ -76,27 +160,32 @@ class NotionClient:
             print("❌ Notion APIキーが取得できませんでした")
     
     async def _get_session(self):
-        """非同期HTTPセッションを取得"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession(
+        """非同期HTTPセッションを取得（実行中のイベントループ用、Keep-Alive接続を使い回す）"""
+        loop = asyncio.get_running_loop()
+        session = self._aio_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
-                    "Notion-Version": "2022-06-28",
+                    "Notion-Version": NOTION_API_VERSION,
                     "Content-Type": "application/json"
-                }
+                },
+                connector=aiohttp.TCPConnector(limit_per_host=NOTION_ASYNC_POOL_SIZE, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=15, connect=5)
             )
-        return self.session
+            self._aio_sessions[loop] = session
+        self.session = session
+        return session
     
     async def _close_session(self):
         """HTTPセッションを閉じる"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        session = self._aio_sessions.pop(asyncio.get_running_loop(), None)
+        if session:
+            await session.close()
+        self.session = None
     
     def _query_database_direct(self, database_id: str, **kwargs) -> Dict:
         """データベースを直接HTTPリクエストでクエリ（queryメソッドが存在しない場合の代替）"""
-        import requests
-        
         # #region agent log
         import json, time
         try:
@@ -129,7 +218,7 @@ class NotionClient:
         # #endregion
         
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = self.http.post(url, headers=headers, json=data, timeout=10)
             response.raise_for_status()
             result = response.json()
             
@@ -154,28 +243,329 @@ class NotionClient:
             # #endregion
             raise Exception(f"Database query failed: {str(e)}")
     
+    def _query_database_page(self, database_id: str, **kwargs) -> Dict:
+        """データベースを1ページ分クエリ（databases.query が無い環境では直接HTTP）"""
+        if self.client and hasattr(self.client.databases, 'query'):
+            return self.client.databases.query(database_id=database_id, **kwargs)
+        return self._query_database_direct(database_id, **kwargs)
+    
+    def iter_database_batches(
+        self,
+        database_id: str,
+        page_size: int = 100,
+        prefetch: bool = True,
+        max_items: Optional[int] = None,
+        use_replica: bool = True,
+        **query
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        has_more / next_cursor を辿ってデータベースの結果をページ単位で順次返す
+        
+        Args:
+            database_id: NotionデータベースID
+            page_size: 1リクエストあたりの取得件数（最大100）
+            prefetch: 呼び出し側が現在のページを処理している間に次ページを先読みするか
+            max_items: 取得する最大件数（Noneの場合は全件）
+            use_replica: フィルタ無しの全件取得でローカルレプリカが新しければそちらを読む
+            **query: filter / sorts などのクエリパラメータ
+        
+        Yields:
+            1リクエスト分の results リスト
+        """
+        if use_replica and not query.get("filter") and not query.get("sorts"):
+            replica_pages = notion_replica.read_database(database_id)
+            if replica_pages is not None:
+                yield replica_pages if max_items is None else replica_pages[:max_items]
+                return
+        
+        page_size = max(1, min(page_size, 100))
+        if max_items is not None:
+            page_size = max(1, min(page_size, max_items))
+        
+        # 先読みは常に1ページまで（メモリとAPIレート制限を圧迫しないため）
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            response = self._query_database_page(database_id, page_size=page_size, **query)
+            fetched = 0
+            while True:
+                results = response.get("results", [])
+                next_cursor = response.get("next_cursor") if response.get("has_more") else None
+                
+                if max_items is not None:
+                    results = results[:max_items - fetched]
+                    if fetched + len(results) >= max_items:
+                        next_cursor = None
+                fetched += len(results)
+                
+                pending = None
+                if next_cursor and executor:
+                    # 先読みスレッドでも呼び出し元と同じ優先レーンで送信する
+                    pending = executor.submit(
+                        contextvars.copy_context().run,
+                        self._query_database_page, database_id,
+                        page_size=page_size, start_cursor=next_cursor, **query
+                    )
+                
+                yield results
+                
+                if not next_cursor:
+                    break
+                if pending is not None:
+                    response = pending.result()
+                else:
+                    response = self._query_database_page(
+                        database_id, page_size=page_size, start_cursor=next_cursor, **query
+                    )
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+    
+    def iter_database_pages(self, database_id: str, **kwargs) -> Iterator[Dict[str, Any]]:
+        """データベースの全ページを1件ずつ返す（iter_database_batches のフラット版）"""
+        return chain.from_iterable(self.iter_database_batches(database_id, **kwargs))
+    
+    def query_all_pages(self, database_id: str, **kwargs) -> List[Dict[str, Any]]:
+        """データベースの全ページをリストで取得（100件を超える場合もカーソルを辿る）"""
+        return list(self.iter_database_pages(database_id, **kwargs))
+    
     async def _make_request(self, method: str, url: str, data: Optional[Dict] = None) -> Dict:
         """非同期HTTPリクエストを実行（HTTPステータス検査付き）"""
-        session = await self._get_session()
-        
+        if method.upper() not in ("GET", "POST"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
         try:
-            if method.upper() == "GET":
-                async with session.get(url) as resp:
-                    txt = await resp.text()
-            elif method.upper() == "POST":
-                async with session.post(url, json=data) as resp:
-                    txt = await resp.text()
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            # HTTPステータス検査
-            if resp.status >= 400:
-                raise Exception(f"HTTP {resp.status}: {txt[:300]}")
-            
-            return json.loads(txt)
+            return await self._arequest(method, url[len(NOTION_API_BASE):], data)
         except Exception as e:
             raise Exception(f"Notion API request failed: {str(e)}")
     
+    async def _arequest(self, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        """
+        Notion APIを非同期で呼び出す（共有スケジューラーのレート制限・再試行付き）
+        
+        Args:
+            method: HTTPメソッド
+            path: /v1 以下のパス（例: "databases/<id>/query"）
+            body: リクエストボディ
+        
+        Raises:
+            NotionAPIError: HTTP 4xx/5xx（再試行後も失敗した場合）
+        """
+        path = path.strip("/")
+        url = f"{NOTION_API_BASE}/{path}"
+        
+        async def send():
+            session = await self._get_session()
+            async with session.request(method, url, json=body) as resp:
+                text = await resp.text()
+                if resp.status >= 400:
+                    raise NotionAPIError(resp.status, text[:300], dict(resp.headers))
+                return json.loads(text) if text else {}
+        
+        # ページ作成などのPOSTは二重作成を避けるため一時エラーで再試行しない
+        idempotent = method.upper() != "POST" or path.endswith(("query", "search"))
+        return await notion_scheduler.acall(send, idempotent=idempotent)
+    
+    async def aquery_database(
+        self,
+        database_id: str,
+        max_items: Optional[int] = None,
+        use_replica: bool = True,
+        **query
+    ) -> List[Dict[str, Any]]:
+        """
+        データベースを非同期でクエリ（next_cursor を辿って全件取得）
+        
+        Args:
+            database_id: NotionデータベースID
+            max_items: 取得する最大件数（Noneの場合は全件）
+            use_replica: フィルタ無しの全件取得でローカルレプリカが新しければそちらを読む
+            **query: filter / sorts / page_size
+        
+        Returns:
+            ページのリスト
+        """
+        if use_replica and not query.get("filter") and not query.get("sorts"):
+            replica_pages = notion_replica.read_database(database_id)
+            if replica_pages is not None:
+                return replica_pages if max_items is None else replica_pages[:max_items]
+        
+        body = {k: v for k, v in query.items() if k in ("filter", "sorts") and v is not None}
+        body["page_size"] = max(1, min(query.get("page_size") or 100, max_items or 100, 100))
+        pages: List[Dict[str, Any]] = []
+        while True:
+            response = await self._arequest("POST", f"databases/{database_id}/query", body)
+            pages.extend(response.get("results", []))
+            if max_items is not None and len(pages) >= max_items:
+                return pages[:max_items]
+            if not response.get("has_more") or not response.get("next_cursor"):
+                return pages
+            body["start_cursor"] = response["next_cursor"]
+    
+    async def aretrieve_pages(self, page_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        複数ページを並行して取得（リレーション索引にあるページは再取得しない）
+        
+        Returns:
+            正規化済みページIDをキーとするページの辞書（取得できなかったIDは含まない）
+        """
+        wanted = {normalize_page_id(pid): pid for pid in page_ids if pid}
+        resolved: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for key, pid in wanted.items():
+            page = self.relation_resolver.get(key)
+            if page is not None:
+                resolved[key] = page
+            else:
+                missing.append(pid)
+        
+        async def fetch(page_id: str) -> Optional[Dict[str, Any]]:
+            try:
+                return await self._arequest("GET", f"pages/{page_id}")
+            except Exception as e:
+                print(f"⚠️ 関連ページ取得エラー ({page_id}): {e}")
+                return None
+        
+        fetched = [page for page in await asyncio.gather(*(fetch(pid) for pid in missing)) if page]
+        self.relation_resolver.add_pages(fetched)
+        for page in fetched:
+            resolved[normalize_page_id(page["id"])] = page
+        return resolved
+    
+    def clear_schema_cache(self) -> None:
+        """データベーススキーマとデコーダーのプランを破棄（Notion側でプロパティを変更した後など）"""
+        self._schema_cache.clear()
+        invalidate_all_plans()
+
+    def get_database_schema(self, database_id: str) -> Optional[Dict[str, str]]:
+        """データベースのプロパティ名 → 型（aget_database_schema の同期版。キャッシュを共有する）"""
+        key = normalize_page_id(database_id)
+        if key in self._schema_cache:
+            return self._schema_cache[key]
+        if not self.client:
+            return None
+        try:
+            database = self.client.databases.retrieve(database_id=database_id)
+        except Exception as e:
+            print(f"⚠️ データベーススキーマ取得エラー ({database_id}): {e}")
+            return None
+        schema = {name: prop.get("type") for name, prop in database.get("properties", {}).items()}
+        self._schema_cache[key] = schema
+        return schema
+
+    async def aget_database_schema(self, database_id: str) -> Optional[Dict[str, str]]:
+        """データベースのプロパティ名 → 型（取得に失敗した場合は None）"""
+        key = normalize_page_id(database_id)
+        if key in self._schema_cache:
+            return self._schema_cache[key]
+        try:
+            database = await self._arequest("GET", f"databases/{database_id}")
+        except Exception as e:
+            print(f"⚠️ データベーススキーマ取得エラー ({database_id}): {e}")
+            return None
+        schema = {name: prop.get("type") for name, prop in database.get("properties", {}).items()}
+        self._schema_cache[key] = schema
+        return schema
+    
+    async def asearch_databases(
+        self,
+        query: Union[str, List[str]],
+        dbs: Dict[str, str],
+        property_names: Optional[List[str]] = None,
+        max_results: int = SEARCH_MAX_RESULTS
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        複数データベースをキーワード検索（データベースごとに or 複合フィルターの1クエリを並行実行）
+        
+        各データベースのスキーマを見て、存在しないプロパティの条件は入れない。
+        複合フィルターのクエリが失敗した場合は条件ごとのクエリに分けて再検索する。
+        
+        Args:
+            query: 検索キーワード（文字列またはキーワードのリスト）
+            dbs: データベース名 → データベースID
+            property_names: 検索対象のプロパティ名
+            max_results: 1クエリあたりの最大取得件数
+        
+        Returns:
+            データベース名 → ページのリスト（重複排除済み、matched_keyword / matched_property 付き）
+        """
+        keywords = [query] if isinstance(query, str) else [kw for kw in query if kw]
+        schemas = await asyncio.gather(*(self.aget_database_schema(db_id) for db_id in dbs.values()))
+        
+        jobs = []
+        for (db_name, db_id), schema in zip(dbs.items(), schemas):
+            for chunk in plan_keyword_search(keywords, property_names, schema):
+                jobs.append((db_name, db_id, chunk))
+        
+        async def run(job):
+            db_name, db_id, chunk = job
+            try:
+                return [(chunk.conditions, await self.aquery_database(db_id, max_items=max_results, filter=chunk.filter))]
+            except Exception as e:
+                if len(chunk.conditions) == 1:
+                    print(f"⚠️ {db_name} のプロパティ '{chunk.conditions[0].prop_name}' での検索エラー: {e}")
+                    return []
+                print(f"⚠️ {db_name} の複合フィルター検索エラー（条件ごとに再検索）: {e}")
+                batches = []
+                for condition in chunk.conditions:
+                    try:
+                        pages = await self.aquery_database(db_id, max_items=max_results, filter=condition.to_filter())
+                    except Exception as inner:
+                        print(f"⚠️ {db_name} のプロパティ '{condition.prop_name}' での検索エラー: {inner}")
+                        continue
+                    batches.append(((condition,), pages))
+                return batches
+        
+        results = await asyncio.gather(*(run(job) for job in jobs))
+        
+        batches_by_db: Dict[str, list] = {db_name: [] for db_name in dbs}
+        for (db_name, _, _), batches in zip(jobs, results):
+            batches_by_db[db_name].extend(batches)
+        return {db_name: merge_results(batches) for db_name, batches in batches_by_db.items()}
+    
+    # ---- 同期ラッパー（Flaskハンドラー用） ----
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """非同期APIを実行する専用イベントループ（aiohttpセッションを使い回すため常駐させる）"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="notion-async", daemon=True).start()
+                self._loop = loop
+            return self._loop
+    
+    def run_async(self, coro, timeout: Optional[float] = None):
+        """
+        コルーチンを専用イベントループで実行して結果を待つ
+        
+        呼び出し元のNotion優先レーンを引き継ぐ。timeout を超えた場合はコルーチンを取り消して
+        concurrent.futures.TimeoutError を送出する。
+        """
+        lane = notion_scheduler.current_lane()
+        
+        async def run_in_lane():
+            with notion_scheduler.lane(lane):
+                return await coro
+        
+        future = asyncio.run_coroutine_threadsafe(run_in_lane(), self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+    
+    def search_databases(
+        self,
+        query: Union[str, List[str]],
+        dbs: Dict[str, str],
+        property_names: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """asearch_databases の同期版"""
+        return self.run_async(self.asearch_databases(query, dbs, property_names), timeout)
+    
+    def retrieve_pages(self, page_ids: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """aretrieve_pages の同期版"""
+        return self.run_async(self.aretrieve_pages(list(page_ids)), timeout)
+    
     @cached_result(ttl=1800, cache_type="notion_diagnostic")  # 30分キャッシュ
     async def load_diagnostic_data_async(self):
         """非同期で診断データを読み込み（キャッシュ対応）"""
@@ -192,8 +582,14 @@ class NotionClient:
             print(url)
             assert url.startswith("https://api.notion.com/"), f"URL malformed: {url}"
             response = await self._make_request("POST", url, {"page_size": 100})
-            
             nodes = response.get("results", [])
+            # has_more の間は next_cursor を辿って全件取得
+            while response.get("has_more") and response.get("next_cursor"):
+                response = await self._make_request(
+                    "POST", url, {"page_size": 100, "start_cursor": response["next_cursor"]}
+                )
+                nodes.extend(response.get("results", []))
+            
             if not nodes:
                 return None
             
@@ -354,34 +750,8 @@ class NotionClient:
             print(url)
             assert url.startswith("https://api.notion.com/"), f"URL malformed: {url}"
             response = await self._make_request("GET", url)
-            properties = response.get("properties", {})
-            
-            case_info = {
-                "id": case_id,
-                "title": "",
-                "category": "",
-                "solution": "",
-                "type": "case"
-            }
-            
-            # タイトル抽出（修理ケースDB: ケースID）
-            title_prop = properties.get("ケースID", {})
-            if title_prop.get("type") == "title" and title_prop.get("title"):
-                case_info["title"] = title_prop["title"][0].get("plain_text", "")
-            
-            # カテゴリ抽出（text型対応）
-            cat_prop = properties.get("カテゴリ", {})
-            if cat_prop.get("type") in ("rich_text","text"):
-                texts = cat_prop.get("rich_text", [])
-                case_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-            elif cat_prop.get("type") == "select" and cat_prop.get("select"):
-                case_info["category"] = cat_prop["select"].get("name", "")
-            
-            # 解決方法抽出
-            solution_prop = properties.get("解決方法", {})
-            if solution_prop.get("type") == "rich_text" and solution_prop.get("rich_text"):
-                case_info["solution"] = solution_prop["rich_text"][0].get("plain_text", "")
-            
+            case_info = self._parse_related_case(case_id, response)
+            case_info["type"] = "case"
             return case_info
         except Exception:
             return {"type": "case", "error": True}
@@ -393,47 +763,33 @@ class NotionClient:
             print(url)
             assert url.startswith("https://api.notion.com/"), f"URL malformed: {url}"
             response = await self._make_request("GET", url)
-            properties = response.get("properties", {})
-            
-            item_info = {
-                "id": item_id,
-                "name": "",
-                "category": "",
-                "price": "",
-                "supplier": "",
-                "type": "item"
-            }
-            
-            # 名前抽出（部品・工具DB: 部品名）
-            name_prop = properties.get("部品名", {})
-            if name_prop.get("type") == "title" and name_prop.get("title"):
-                item_info["name"] = name_prop["title"][0].get("plain_text", "")
-            
-            # カテゴリ抽出（text型対応）
-            cat_prop = properties.get("カテゴリ", {})
-            if cat_prop.get("type") in ("rich_text","text"):
-                texts = cat_prop.get("rich_text", [])
-                item_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-            elif cat_prop.get("type") == "select" and cat_prop.get("select"):
-                item_info["category"] = cat_prop["select"].get("name", "")
-            
-            # 価格抽出（text型対応）
-            price_prop = properties.get("価格", {})
-            if price_prop.get("type") in ("rich_text","text"):
-                texts = price_prop.get("rich_text", [])
-                item_info["price"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-            elif price_prop.get("type") == "number":
-                item_info["price"] = str(price_prop.get("number", ""))
-            
-            # サプライヤー抽出
-            supplier_prop = properties.get("サプライヤー", {})
-            if supplier_prop.get("type") == "rich_text" and supplier_prop.get("rich_text"):
-                item_info["supplier"] = supplier_prop["rich_text"][0].get("plain_text", "")
-            
+            item_info = self._parse_related_item(item_id, response)
+            item_info["type"] = "item"
             return item_info
         except Exception:
             return {"type": "item", "error": True}
     
+    def _parse_related_case(self, case_id: str, page: Dict) -> Dict:
+        """関連修理ケースのページを要約情報にパース"""
+        return {"id": case_id, **RELATED_CASE_RECORD.decode_dict(page)}
+    
+    def _parse_related_item(self, item_id: str, page: Dict) -> Dict:
+        """関連部品・工具のページを要約情報にパース"""
+        return {"id": item_id, **RELATED_ITEM_RECORD.decode_dict(page)}
+    
+    def _schedule_client_requests(self, client) -> None:
+        """notion-client の全エンドポイント呼び出しをレート制限スケジューラー経由にする"""
+        original_request = client.request
+        
+        def scheduled_request(*args, **kwargs):
+            path = kwargs.get("path", args[0] if args else "")
+            method = kwargs.get("method", args[1] if len(args) > 1 else "GET")
+            # ページ作成などのPOSTは二重作成を避けるため一時エラーで再試行しない
+            idempotent = method.upper() != "POST" or path.rstrip("/").endswith(("query", "search"))
+            return notion_scheduler.call(original_request, *args, idempotent=idempotent, **kwargs)
+        
+        client.request = scheduled_request
+    
     def initialize_client(self):
         """Notionクライアントを初期化（改善版）"""
         # Streamlitのインポートを先に試行
@@ -468,6 +824,7 @@ class NotionClient:
             from notion_client import Client
             print(f"🔧 Notionクライアント作成中... (APIキー: {self.api_key[:10]}...)")
             self.client = Client(auth=self.api_key)
+            self._schedule_client_requests(self.client)
             
             # databases.queryのフォールバック処理を追加
             if not hasattr(self.client.databases, 'query'):
@@ -643,15 +1000,11 @@ class NotionClient:
             
             # Notionから診断フローデータを取得（ルーティング対応）
             try:
-                # queryメソッドが存在する場合は使用、なければ直接HTTPリクエストを使用
-                if hasattr(self.client.databases, 'query'):
-                    if hasattr(self.client.databases, 'query'):
-                        response = self.client.databases.query(database_id=node_db_id)
-                else:
-                    response = self._query_database_direct(node_db_id)
-                nodes = response.get("results", [])
+                # 先頭ページだけ先に取得し、残りは解析中に先読みする
+                node_batches = self.iter_database_batches(node_db_id)
+                first_nodes = next(node_batches, [])
                 
-                if not nodes:
+                if not first_nodes:
                     print("⚠️ 診断フローDBにデータがありません")
                     print("💡 Notionデータベースに診断ノードを追加してください")
                     return None
@@ -679,190 +1032,34 @@ class NotionClient:
                 "nodes": [],
                 "start_nodes": []
             }
+            pending_relations = []
             
-            for node in nodes:
-                properties = node.get("properties", {})
-                
-                # ノードの基本情報を抽出（ルーティング対応）
+            for record in map(NODE_RECORD.decode, chain(first_nodes, chain.from_iterable(node_batches))):
+                # ノードの基本情報（ルーティング対応）
                 node_info = {
-                    "id": node.get("id"),
-                    "node_id": "",  # ノードID（title）
-                    "title": "",
-                    "category": "",
-                    "symptoms": [],
+                    "id": record.id,
+                    "node_id": record.node_id,  # ノードID（title）
+                    "title": record.node_id,    # 互換性のため
+                    "category": record.category,
+                    "symptoms": record.symptoms,
                     "next_nodes": [],
                     "related_cases": [],  # 関連する修理ケース
                     "related_items": [],   # 関連する部品・工具
                     # ルーティング用フィールド
-                    "start": False,        # 開始フラグ
-                    "terminal": False,     # 終端フラグ
-                    "next_raw": "",       # 次のノード（カンマ区切り）
-                    "question": "",       # 質問内容
-                    "result": "",         # 診断結果
-                    "steps": "",          # 修理手順
-                    "cautions": "",       # 注意事項
-                    "routing": None       # メモ内JSONのrouting_config
+                    "start": record.start_flag == "**YES**",        # 開始フラグ
+                    "terminal": record.terminal_flag == "**YES**",  # 終端フラグ
+                    "next_raw": record.next_raw,  # 次のノード（カンマ区切り）
+                    "question": record.question,  # 質問内容
+                    "result": record.result,      # 診断結果
+                    "steps": record.steps,        # 修理手順
+                    "cautions": record.cautions,  # 注意事項
+                    # メモ内JSONのrouting_config
+                    "routing": self._parse_routing_config(record.memo) if record.memo is not None else None
                 }
                 
-                # ノードIDの抽出（診断フローDB: ノードID）
-                title_prop = properties.get("ノードID", {})
-                if title_prop.get("type") == "title" and title_prop.get("title"):
-                    node_info["node_id"] = title_prop["title"][0].get("plain_text", "")
-                    node_info["title"] = node_info["node_id"]  # 互換性のため
-                
-                # 開始フラグの抽出
-                start_prop = properties.get("開始フラグ", {})
-                if start_prop.get("type") in ("rich_text", "text"):
-                    texts = start_prop.get("rich_text", [])
-                    start_value = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                    node_info["start"] = start_value == "**YES**"
-                elif start_prop.get("type") == "select" and start_prop.get("select"):
-                    node_info["start"] = start_prop["select"].get("name", "") == "**YES**"
-                
-                # 終端フラグの抽出
-                terminal_prop = properties.get("終端フラグ", {})
-                if terminal_prop.get("type") in ("rich_text", "text"):
-                    texts = terminal_prop.get("rich_text", [])
-                    terminal_value = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                    node_info["terminal"] = terminal_value == "**YES**"
-                elif terminal_prop.get("type") == "select" and terminal_prop.get("select"):
-                    node_info["terminal"] = terminal_prop["select"].get("name", "") == "**YES**"
-                
-                # 次のノードの抽出
-                next_prop = properties.get("次のノード", {})
-                if next_prop.get("type") in ("rich_text", "text"):
-                    texts = next_prop.get("rich_text", [])
-                    node_info["next_raw"] = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                
-                # 質問内容の抽出
-                question_prop = properties.get("質問内容", {})
-                if question_prop.get("type") in ("rich_text", "text"):
-                    texts = question_prop.get("rich_text", [])
-                    node_info["question"] = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                
-                # 診断結果の抽出
-                result_prop = properties.get("診断結果", {})
-                if result_prop.get("type") in ("rich_text", "text"):
-                    texts = result_prop.get("rich_text", [])
-                    node_info["result"] = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                
-                # 修理手順の抽出
-                steps_prop = properties.get("修理手順", {})
-                if steps_prop.get("type") in ("rich_text", "text"):
-                    texts = steps_prop.get("rich_text", [])
-                    node_info["steps"] = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                
-                # 注意事項の抽出
-                cautions_prop = properties.get("注意事項", {})
-                if cautions_prop.get("type") in ("rich_text", "text"):
-                    texts = cautions_prop.get("rich_text", [])
-                    node_info["cautions"] = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                
-                # メモ（routing_config）の抽出
-                memo_prop = properties.get("メモ", {})
-                if memo_prop.get("type") in ("rich_text", "text"):
-                    texts = memo_prop.get("rich_text", [])
-                    memo_content = "".join(t.get("plain_text", "") for t in texts) if texts else ""
-                    node_info["routing"] = self._parse_routing_config(memo_content)
-                
-                # カテゴリの抽出（text型対応）
-                category_prop = properties.get("カテゴリ", {})
-                if category_prop.get("type") in ("rich_text","text"):
-                    texts = category_prop.get("rich_text", [])
-                    node_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                elif category_prop.get("type") == "select" and category_prop.get("select"):
-                    node_info["category"] = category_prop["select"].get("name", "")
-                
-                # 症状の抽出（text型対応）
-                symptoms_prop = properties.get("症状", {})
-                if symptoms_prop.get("type") == "multi_select":
-                    node_info["symptoms"] = [item.get("name", "") for item in symptoms_prop.get("multi_select", [])]
-                elif symptoms_prop.get("type") in ("rich_text","text"):
-                    texts = symptoms_prop.get("rich_text", [])
-                    node_info["symptoms"] = ["".join(t.get("plain_text","") for t in texts)] if texts else []
-                
-                # 関連修理ケースの抽出（リレーション対応）
-                cases_prop = properties.get("関連修理ケース", {})
-                if cases_prop.get("type") == "relation":
-                    for relation in cases_prop.get("relation", []):
-                        try:
-                            case_response = self.client.pages.retrieve(page_id=relation["id"])
-                            case_properties = case_response.get("properties", {})
-                            
-                            case_info = {
-                                "id": relation["id"],
-                                "title": "",
-                                "category": "",
-                                "solution": ""
-                            }
-                            
-                            # ケースタイトルの抽出（修理ケースDB: ケースID）
-                            title_prop = case_properties.get("ケースID", {})
-                            if title_prop.get("type") == "title" and title_prop.get("title"):
-                                case_info["title"] = title_prop["title"][0].get("plain_text", "")
-                            
-                            # カテゴリの抽出（text型対応）
-                            cat_prop = case_properties.get("カテゴリ", {})
-                            if cat_prop.get("type") in ("rich_text","text"):
-                                texts = cat_prop.get("rich_text", [])
-                                case_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                            elif cat_prop.get("type") == "select" and cat_prop.get("select"):
-                                case_info["category"] = cat_prop["select"].get("name", "")
-                            
-                            # 解決方法の抽出
-                            solution_prop = case_properties.get("解決方法", {})
-                            if solution_prop.get("type") == "rich_text" and solution_prop.get("rich_text"):
-                                case_info["solution"] = solution_prop["rich_text"][0].get("plain_text", "")
-                            
-                            node_info["related_cases"].append(case_info)
-                        except Exception as e:
-                            print(f"修理ケース情報の取得に失敗: {e}")
-                
-                # 関連部品・工具の抽出（リレーション対応）
-                items_prop = properties.get("関連部品・工具", {})
-                if items_prop.get("type") == "relation":
-                    for relation in items_prop.get("relation", []):
-                        try:
-                            item_response = self.client.pages.retrieve(page_id=relation["id"])
-                            item_properties = item_response.get("properties", {})
-                            
-                            item_info = {
-                                "id": relation["id"],
-                                "name": "",
-                                "category": "",
-                                "price": "",
-                                "supplier": ""
-                            }
-                            
-                            # アイテム名の抽出（部品・工具DB: 部品名）
-                            name_prop = item_properties.get("部品名", {})
-                            if name_prop.get("type") == "title" and name_prop.get("title"):
-                                item_info["name"] = name_prop["title"][0].get("plain_text", "")
-                            
-                            # カテゴリの抽出（text型対応）
-                            cat_prop = item_properties.get("カテゴリ", {})
-                            if cat_prop.get("type") in ("rich_text","text"):
-                                texts = cat_prop.get("rich_text", [])
-                                item_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                            elif cat_prop.get("type") == "select" and cat_prop.get("select"):
-                                item_info["category"] = cat_prop["select"].get("name", "")
-                            
-                            # 価格の抽出（text型対応）
-                            price_prop = item_properties.get("価格", {})
-                            if price_prop.get("type") in ("rich_text","text"):
-                                texts = price_prop.get("rich_text", [])
-                                item_info["price"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                            elif price_prop.get("type") == "number":
-                                item_info["price"] = str(price_prop.get("number", ""))
-                            
-                            # サプライヤーの抽出
-                            supplier_prop = item_properties.get("サプライヤー", {})
-                            if supplier_prop.get("type") == "rich_text" and supplier_prop.get("rich_text"):
-                                item_info["supplier"] = supplier_prop["rich_text"][0].get("plain_text", "")
-                            
-                            node_info["related_items"].append(item_info)
-                        except Exception as e:
-                            print(f"部品・工具情報の取得に失敗: {e}")
+                # リレーションIDは後でまとめて解決（ノードごとの pages.retrieve を避ける）
+                case_ids, item_ids = record.case_ids, record.item_ids
+                pending_relations.append((node_info, case_ids, item_ids))
                 
                 diagnostic_data["nodes"].append(node_info)
                 
@@ -870,12 +1067,42 @@ class NotionClient:
                 if node_info["category"] == "開始":
                     diagnostic_data["start_nodes"].append(node_info)
             
+            self._attach_related_pages(pending_relations, case_db_id, item_db_id)
             return diagnostic_data
             
         except Exception as e:
             print(f"❌ Notionからの診断データ読み込みに失敗: {e}")
             return None
     
+    def _attach_related_pages(self, pending_relations, case_db_id: Optional[str], item_db_id: Optional[str]):
+        """全ノードの関連修理ケース・部品をまとめて解決してノードに付与"""
+        case_ids = [cid for _, ids, _ in pending_relations for cid in ids]
+        item_ids = [iid for _, _, ids in pending_relations for iid in ids]
+        if not case_ids and not item_ids:
+            return
+        
+        # 参照のあるDBだけを一括スキャンし、索引に無いページのみ並列取得
+        databases = []
+        if case_ids:
+            databases.append(case_db_id)
+        if item_ids:
+            databases.append(item_db_id)
+        pages = self.relation_resolver.resolve(case_ids + item_ids, databases)
+        
+        for node_info, node_case_ids, node_item_ids in pending_relations:
+            for case_id in node_case_ids:
+                page = pages.get(normalize_page_id(case_id))
+                if page is None:
+                    print(f"修理ケース情報の取得に失敗: {case_id}")
+                    continue
+                node_info["related_cases"].append(self._parse_related_case(case_id, page))
+            for item_id in node_item_ids:
+                page = pages.get(normalize_page_id(item_id))
+                if page is None:
+                    print(f"部品・工具情報の取得に失敗: {item_id}")
+                    continue
+                node_info["related_items"].append(self._parse_related_item(item_id, page))
+    
     def _parse_routing_config(self, memo_content):
         """メモ内のrouting_configをパース"""
         if not memo_content:
@@ -903,13 +1130,9 @@ class NotionClient:
             print("❌ 診断データがありません")
             return {"text": "フォールバック診断（暫定）:\n" + user_input, "end": True}
         
-        nodes = diagnostic_data["nodes"]
-        
-        # ノードインデックス作成
-        node_index = {node["node_id"]: node for node in nodes if node.get("node_id")}
-        
-        # 開始ノードを検索
-        start_nodes = [node for node in nodes if node.get("start", False)]
+        # ノードインデックス・開始ノード（診断データごとに1回だけ作る）
+        graph = get_diagnostic_graph(diagnostic_data)
+        start_nodes = graph.start_nodes
         
         print(f"📊 開始ノード数: {len(start_nodes)}")
         
@@ -952,7 +1175,7 @@ class NotionClient:
                 return {"text": result_text, "end": True}
             
             # 次のノードを選択
-            next_node = self._choose_next_node(user_input, current_node, node_index)
+            next_node = self._choose_next_node(user_input, current_node, graph)
             
             if not next_node:
                 print(f"❌ 次のノードが見つかりません: {node_id}")
@@ -965,14 +1188,14 @@ class NotionClient:
         print("🔄 フォールバック採否: はい")
         return {"text": "フォールバック診断（暫定）:\n" + user_input, "end": True}
     
-    def _choose_next_node(self, user_input, current_node, node_index):
+    def _choose_next_node(self, user_input, current_node, graph):
         """次のノードを選択"""
-        node_id = current_node.get("node_id")
+        node_index = graph.by_node_id
         
         # 1. routing_config を最優先
         routing_config = current_node.get("routing")
         if routing_config and routing_config.get("next_nodes_map"):
-            next_node = self._choose_by_routing(user_input, current_node, node_index)
+            next_node = self._choose_by_routing(user_input, current_node, graph)
             if next_node:
                 return next_node
         
@@ -986,20 +1209,25 @@ class NotionClient:
         
         return None
     
-    def _choose_by_routing(self, user_input, current_node, node_index):
+    def _choose_by_routing(self, user_input, current_node, graph):
         """routing_config によるノード選択"""
         routing_config = current_node.get("routing")
         if not routing_config:
             return None
         
+        node_index = graph.by_node_id
         next_nodes_map = routing_config.get("next_nodes_map", [])
         threshold = routing_config.get("threshold", 0)
         
+        # 全候補のキーワードを回答文1回の走査で照合
+        matcher = graph.matcher(current_node.get("id") or current_node.get("node_id"), "routing")
+        match = matcher.match(user_input)
+        
         best_candidate = None
         best_score = -1
         best_keyword_count = 0
         
-        for candidate in next_nodes_map:
+        for candidate, candidate_hits in zip(matcher.candidates, match.candidate_hits):
             candidate_id = candidate.get("id")
             if not candidate_id or candidate_id not in node_index:
                 continue
@@ -1008,7 +1236,7 @@ class NotionClient:
             keywords = candidate.get("keywords", [])
             weight = candidate.get("weight", 1)
             
-            hits = sum(1 for kw in keywords if kw in user_input)
+            hits = len(candidate_hits)
             score = hits * weight
             keyword_count = len(keywords)
             
@@ -1058,16 +1286,10 @@ class NotionClient:
             # Notionから修理ケースデータを取得
             try:
                 print(f"🔍 修理ケースDBからデータを取得中... (ID: {case_db_id})")
-                if hasattr(self.client.databases, 'query'):
-                    if hasattr(self.client.databases, 'query'):
-                        response = self.client.databases.query(database_id=case_db_id)
-                else:
-                    response = self._query_database_direct(case_db_id)
-                cases = response.get("results", [])
-                
-                print(f"📊 取得した修理ケース数: {len(cases)}件")
+                case_batches = self.iter_database_batches(case_db_id)
+                first_cases = next(case_batches, [])
                 
-                if not cases:
+                if not first_cases:
                     print("⚠️ 修理ケースDBにデータがありません")
                     print("💡 Notionデータベースに修理ケースを追加してください")
                     return None
@@ -1090,79 +1312,13 @@ class NotionClient:
             
             repair_cases = []
             
-            for case in cases:
-                properties = case.get("properties", {})
-                
-                # ケースの基本情報を抽出
-                case_info = {
-                    "id": case.get("id"),
-                    "title": "",
-                    "category": "",
-                    "symptoms": [],
-                    "solution": "",
-                    "cost_estimate": "",
-                    "difficulty": "",
-                    "tools_required": [],
-                    "parts_required": []
-                }
-                
-                # タイトルの抽出（修理ケースDB: ケースID）
-                title_prop = properties.get("ケースID", {})
-                if title_prop.get("type") == "title" and title_prop.get("title"):
-                    case_info["title"] = title_prop["title"][0].get("plain_text", "")
-                
-                # カテゴリの抽出（text型対応）
-                category_prop = properties.get("カテゴリ", {})
-                if category_prop.get("type") in ("rich_text","text"):
-                    texts = category_prop.get("rich_text", [])
-                    case_info["category"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                elif category_prop.get("type") == "select" and category_prop.get("select"):
-                    case_info["category"] = category_prop["select"].get("name", "")
-                
-                # 症状の抽出（text型対応）
-                symptoms_prop = properties.get("症状", {})
-                if symptoms_prop.get("type") == "multi_select":
-                    case_info["symptoms"] = [item.get("name", "") for item in symptoms_prop.get("multi_select", [])]
-                elif symptoms_prop.get("type") in ("rich_text","text"):
-                    texts = symptoms_prop.get("rich_text", [])
-                    case_info["symptoms"] = ["".join(t.get("plain_text","") for t in texts)] if texts else []
-                
-                # 解決方法の抽出
-                solution_prop = properties.get("解決方法", {})
-                if solution_prop.get("type") == "rich_text" and solution_prop.get("rich_text"):
-                    case_info["solution"] = solution_prop["rich_text"][0].get("plain_text", "")
-                
-                # 費用見積もりの抽出
-                cost_prop = properties.get("費用見積もり", {})
-                if cost_prop.get("type") == "rich_text" and cost_prop.get("rich_text"):
-                    case_info["cost_estimate"] = cost_prop["rich_text"][0].get("plain_text", "")
-                
-                # 難易度の抽出（text型対応）
-                difficulty_prop = properties.get("難易度", {})
-                if difficulty_prop.get("type") in ("rich_text","text"):
-                    texts = difficulty_prop.get("rich_text", [])
-                    case_info["difficulty"] = "".join(t.get("plain_text","") for t in texts) if texts else ""
-                elif difficulty_prop.get("type") == "select" and difficulty_prop.get("select"):
-                    case_info["difficulty"] = difficulty_prop["select"].get("name", "")
-                
-                # 必要な工具の抽出（text型対応）
-                tools_prop = properties.get("必要な工具", {})
-                if tools_prop.get("type") == "multi_select":
-                    case_info["tools_required"] = [item.get("name", "") for item in tools_prop.get("multi_select", [])]
-                elif tools_prop.get("type") in ("rich_text","text"):
-                    texts = tools_prop.get("rich_text", [])
-                    case_info["tools_required"] = ["".join(t.get("plain_text","") for t in texts)] if texts else []
-                
-                # 必要な部品の抽出（text型対応）
-                parts_prop = properties.get("必要な部品", {})
-                if parts_prop.get("type") == "multi_select":
-                    case_info["parts_required"] = [item.get("name", "") for item in parts_prop.get("multi_select", [])]
-                elif parts_prop.get("type") in ("rich_text","text"):
-                    texts = parts_prop.get("rich_text", [])
-                    case_info["parts_required"] = ["".join(t.get("plain_text","") for t in texts)] if texts else []
+            for record in map(CASE_RECORD.decode, chain(first_cases, chain.from_iterable(case_batches))):
+                # ケースの基本情報
+                case_info = record.to_dict()
                 
                 repair_cases.append(case_info)
             
+            print(f"📊 取得した修理ケース数: {len(repair_cases)}件")
             return repair_cases
             
         except Exception as e:
@@ -1211,37 +1367,16 @@ class NotionClient:
             if not item_db_id:
                 return []
             
-            # text型フィールドに対応した検索フィルター
-            if hasattr(self.client.databases, 'query'):
-                response = self.client.databases.query(
-                    database_id=item_db_id,
-                    filter={
-                        "property": "カテゴリ",
-                        "rich_text": {
-                            "contains": category
-                        }
+            # text型フィールドに対応した検索フィルター（全ページを取得）
+            items = self.iter_database_pages(
+                item_db_id,
+                filter={
+                    "property": "カテゴリ",
+                    "rich_text": {
+                        "contains": category
                     }
-                )
-            else:
-                # フィルター付きクエリは直接HTTPリクエストで実装（簡易版）
-                response = self._query_database_direct(item_db_id)
-                # フィルターは後でフィルタリング
-                if response.get("results"):
-                    filtered_results = []
-                    for item in response.get("results", []):
-                        props = item.get("properties", {})
-                        cat_prop = props.get("カテゴリ", {})
-                        if cat_prop.get("type") == "rich_text":
-                            rich_text_array = cat_prop.get("rich_text", [])
-                            if rich_text_array and category.lower() in rich_text_array[0].get("plain_text", "").lower():
-                                filtered_results.append(item)
-                        elif cat_prop.get("type") == "select":
-                            select_obj = cat_prop.get("select")
-                            if select_obj and category.lower() in select_obj.get("name", "").lower():
-                                filtered_results.append(item)
-                    response["results"] = filtered_results
-            
-            items = response.get("results", [])
+                }
+            )
             item_list = []
             
             for item in items:
@@ -1311,28 +1446,12 @@ class NotionClient:
                 print("2. NotionデータベースのIDを確認")
                 return None
             
-            # Notionからナレッジベースデータを取得
+            # Notionからナレッジベースデータを取得（カーソルを辿って全件）
             try:
-                if hasattr(self.client.databases, 'query'):
-                    response = self.client.databases.query(database_id=kb_db_id, page_size=100)
-                else:
-                    response = self._query_database_direct(kb_db_id, page_size=100)
-                pages = response.get("results", [])
-
-                # ページネーション対応（queryメソッドが存在する場合のみ）
-                if hasattr(self.client.databases, 'query'):
-                    while response.get("has_more", False):
-                        response = self.client.databases.query(
-                            database_id=kb_db_id,
-                            page_size=100,
-                            start_cursor=response.get("next_cursor")
-                        )
-                        pages.extend(response.get("results", []))
-                else:
-                    # ページネーションは簡易版（最初の100件のみ）
-                    print("⚠️ ページネーションはqueryメソッドが必要です。最初の100件のみ取得します")
+                kb_batches = self.iter_database_batches(kb_db_id)
+                first_pages = next(kb_batches, [])
                 
-                if not pages:
+                if not first_pages:
                     print("⚠️ ナレッジベースDBにデータがありません")
                     print("💡 Notionデータベースにナレッジを追加してください")
                     return None
@@ -1351,12 +1470,13 @@ class NotionClient:
             
             knowledge_items = []
             
-            for page in pages:
+            for page in chain(first_pages, chain.from_iterable(kb_batches)):
                 properties = page.get("properties", {})
                 
                 # ナレッジベースアイテムの基本情報を抽出
                 kb_info = {
                     "id": page.get("id"),
+                    "last_edited_time": page.get("last_edited_time"),
                     "title": "",
                     "category": "",
                     "content": "",
@@ -1750,13 +1870,9 @@ class NotionClient:
             print("❌ 診断データがありません")
             return {"text": "フォールバック診断（暫定）:\n" + user_input, "end": True}
         
-        nodes = diagnostic_data["nodes"]
-        
-        # ノードインデックス作成
-        node_index = {node["node_id"]: node for node in nodes if node.get("node_id")}
-        
-        # 開始ノードを検索
-        start_nodes = [node for node in nodes if node.get("start", False)]
+        # ノードインデックス・開始ノード（診断データごとに1回だけ作る）
+        graph = get_diagnostic_graph(diagnostic_data)
+        start_nodes = graph.start_nodes
         
         print(f"📊 開始ノード数: {len(start_nodes)}")
         
@@ -1799,7 +1915,7 @@ class NotionClient:
                 return {"text": result_text, "end": True}
             
             # 次のノードを選択
-            next_node = self._choose_next_node(user_input, current_node, node_index)
+            next_node = self._choose_next_node(user_input, current_node, graph)
             
             if not next_node:
                 print(f"❌ 次のノードが見つかりません: {node_id}")
@@ -1812,14 +1928,14 @@ class NotionClient:
         print("🔄 フォールバック採否: はい")
         return {"text": "フォールバック診断（暫定）:\n" + user_input, "end": True}
 
-    def _choose_next_node(self, user_input, current_node, node_index):
+    def _choose_next_node(self, user_input, current_node, graph):
         """次のノードを選択"""
-        node_id = current_node.get("node_id")
+        node_index = graph.by_node_id
         
         # 1. routing_config を最優先
         routing_config = current_node.get("routing")
         if routing_config and routing_config.get("next_nodes_map"):
-            next_node = self._choose_by_routing(user_input, current_node, node_index)
+            next_node = self._choose_by_routing(user_input, current_node, graph)
             if next_node:
                 return next_node
         
@@ -1833,20 +1949,25 @@ class NotionClient:
         
         return None
 
-    def _choose_by_routing(self, user_input, current_node, node_index):
+    def _choose_by_routing(self, user_input, current_node, graph):
         """routing_config によるノード選択"""
         routing_config = current_node.get("routing")
         if not routing_config:
             return None
         
+        node_index = graph.by_node_id
         next_nodes_map = routing_config.get("next_nodes_map", [])
         threshold = routing_config.get("threshold", 0)
         
+        # 全候補のキーワードを回答文1回の走査で照合
+        matcher = graph.matcher(current_node.get("id") or current_node.get("node_id"), "routing")
+        match = matcher.match(user_input)
+        
         best_candidate = None
         best_score = -1
         best_keyword_count = 0
         
-        for candidate in next_nodes_map:
+        for candidate, candidate_hits in zip(matcher.candidates, match.candidate_hits):
             candidate_id = candidate.get("id")
             if not candidate_id or candidate_id not in node_index:
                 continue
@@ -1855,7 +1976,7 @@ class NotionClient:
             keywords = candidate.get("keywords", [])
             weight = candidate.get("weight", 1)
             
-            hits = sum(1 for kw in keywords if kw in user_input)
+            hits = len(candidate_hits)
             score = hits * weight
             keyword_count = len(keywords)
             
@@ -1883,21 +2004,19 @@ class NotionClient:
         
         return None
 
-    def get_all_pages(self, database_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    def get_all_pages(self, database_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         データベースから全ページを取得
         
         Args:
             database_id: NotionデータベースID
-            limit: 取得する最大件数
+            limit: 取得する最大件数（Noneの場合は全件）
         
         Returns:
             ページのリスト
         """
         try:
-            result = self._query_database_direct(database_id, page_size=limit)
-            pages = result.get("results", [])
-            return pages
+            return self.query_all_pages(database_id, max_items=limit)
         except Exception as e:
             print(f"⚠️ ページ取得エラー: {e}")
             return []
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionキーワード検索のクエリプランナー
+キーワード×プロパティの contains 条件を1つの or 複合フィルターにまとめ、
+データベースごとに1回（条件数の上限を超える場合のみ分割）のクエリで検索する
+"""
+
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+DEFAULT_SEARCH_PROPERTIES = ['タイトル', '内容', '症状', '解決方法', 'Title']
+TITLE_PROPERTY_NAMES = ('タイトル', 'Title', 'Name')
+
+# 1つの複合フィルターに入れる条件数の上限（Notionの配列要素数の上限は100）
+MAX_FILTER_CONDITIONS = int(os.getenv("NOTION_MAX_FILTER_CONDITIONS", "100"))
+# 1データベースあたりの最大取得件数（or でまとめると1クエリの結果が増えるため、カーソルを辿る上限）
+SEARCH_MAX_RESULTS = int(os.getenv("NOTION_SEARCH_MAX_RESULTS", "300"))
+
+
+class SearchCondition(NamedTuple):
+    """1つの contains 条件"""
+    keyword: str
+    prop_name: str
+    prop_type: str
+
+    def to_filter(self) -> Dict[str, Any]:
+        return {"property": self.prop_name, self.prop_type: {"contains": self.keyword}}
+
+
+class QueryChunk(NamedTuple):
+    """1回のクエリで送るフィルターと、その元になった条件"""
+    filter: Dict[str, Any]
+    conditions: Tuple[SearchCondition, ...]
+
+
+def plan_keyword_search(
+    keywords: Iterable[str],
+    property_names: Optional[List[str]] = None,
+    schema: Optional[Dict[str, str]] = None,
+    max_conditions: int = MAX_FILTER_CONDITIONS,
+) -> List[QueryChunk]:
+    """
+    キーワード×プロパティの検索を or 複合フィルターのクエリに変換
+
+    Args:
+        keywords: 検索キーワード
+        property_names: 検索対象のプロパティ名（省略時は DEFAULT_SEARCH_PROPERTIES）
+        schema: データベースのプロパティ名 → 型（存在しないプロパティの条件は作らない。
+            None の場合はプロパティ名から title / rich_text を推定）
+        max_conditions: 1クエリあたりの条件数の上限
+
+    Returns:
+        クエリのリスト（条件が無い場合は空）
+    """
+    conditions: List[SearchCondition] = []
+    seen_keywords = set()
+    for keyword in keywords:
+        keyword = (keyword or "").strip()
+        # Notionの contains は大文字小文字を区別しないので、同じ語は1回だけ
+        if not keyword or keyword.casefold() in seen_keywords:
+            continue
+        seen_keywords.add(keyword.casefold())
+        for prop_name in property_names or DEFAULT_SEARCH_PROPERTIES:
+            if schema is not None:
+                prop_type = schema.get(prop_name)
+            else:
+                prop_type = "title" if prop_name in TITLE_PROPERTY_NAMES else "rich_text"
+            if prop_type in ("title", "rich_text"):
+                conditions.append(SearchCondition(keyword, prop_name, prop_type))
+
+    max_conditions = max(1, max_conditions)
+    chunks = []
+    for start in range(0, len(conditions), max_conditions):
+        group = tuple(conditions[start:start + max_conditions])
+        query_filter = group[0].to_filter() if len(group) == 1 else {"or": [c.to_filter() for c in group]}
+        chunks.append(QueryChunk(query_filter, group))
+    return chunks
+
+
+def _property_text(prop: Dict[str, Any]) -> str:
+    prop_type = prop.get("type")
+    if prop_type not in ("title", "rich_text"):
+        return ""
+    return "".join(item.get("plain_text", "") for item in prop.get(prop_type) or [])
+
+
+def _match_index(page: Dict[str, Any], conditions: Tuple[SearchCondition, ...]) -> int:
+    """ページが一致した最初の条件の位置（ローカルで判定できない場合は 0）"""
+    properties = page.get("properties") or {}
+    texts: Dict[str, str] = {}
+    for index, condition in enumerate(conditions):
+        if condition.prop_name not in texts:
+            texts[condition.prop_name] = _property_text(properties.get(condition.prop_name) or {}).casefold()
+        if condition.keyword.casefold() in texts[condition.prop_name]:
+            return index
+    return 0
+
+
+def merge_results(batches: Iterable[Tuple[Tuple[SearchCondition, ...], List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    クエリ結果を重複排除してまとめ、一致したキーワード・プロパティを付ける
+
+    結果は一致した条件の順（キーワード順 → プロパティ順）に並べる
+    （キーワード×プロパティごとに検索していた頃と同じ順序）。
+
+    Args:
+        batches: (クエリの条件, 結果ページ) のリスト（プランの順）
+    """
+    ranked = []
+    seen = set()
+    offset = 0
+    for conditions, pages in batches:
+        for page in pages:
+            page_id = page.get("id")
+            if page_id in seen:
+                continue
+            seen.add(page_id)
+            index = _match_index(page, conditions) if conditions else 0
+            if conditions:
+                page["matched_keyword"] = conditions[index].keyword
+                page["matched_property"] = conditions[index].prop_name
+            ranked.append((offset + index, len(ranked), page))
+        offset += len(conditions)
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    return [page for _, _, page in ranked]
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionデータベースのローカルレプリカ
+SQLiteにNotionデータベースごとのテーブルを持ち、last_edited_time で差分同期する
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.data_paths import data_path, ensure_parent_dir
+from .notion_scheduler import BACKGROUND, notion_scheduler
+
+
+# テーブル定義: 論理名 → データベースIDの環境変数（各マネージャーと同じ優先順）と抽出カラム
+REPLICA_TABLES: Dict[str, Dict[str, Any]] = {
+    "diagnostic_nodes": {
+        "env": ["NODE_DB_ID", "NOTION_DIAGNOSTIC_DB_ID"],
+        "columns": {"category": "カテゴリ"},
+    },
+    "repair_cases": {
+        "env": ["CASE_DB_ID", "NOTION_REPAIR_CASE_DB_ID"],
+        "columns": {"category": "カテゴリ"},
+    },
+    "items": {
+        "env": ["ITEM_DB_ID"],
+        "columns": {"category": "カテゴリ"},
+    },
+    "partner_shops": {
+        "env": ["NOTION_PARTNER_DB_ID", "PARTNER_SHOP_DB_ID", "PARTNER_DB_ID"],
+        "columns": {"status": "ステータス", "email": "メールアドレス"},
+    },
+    "deals": {
+        "env": ["NOTION_DEAL_DB_ID", "DEAL_DB_ID"],
+        "columns": {"status": "紹介ステータス"},
+    },
+    "factories": {
+        "env": ["NOTION_FACTORY_DB_ID", "FACTORY_DB_ID"],
+        "columns": {"status": "ステータス"},
+    },
+    "reviews": {
+        "env": ["NOTION_REVIEW_DB_ID"],
+        "columns": {"status": "承認ステータス"},
+    },
+    "manuals": {
+        "env": ["NOTION_MANUAL_DB_ID"],
+        "columns": {"category": "カテゴリ"},
+    },
+}
+
+DEFAULT_MAX_STALENESS = int(os.getenv("NOTION_REPLICA_MAX_STALENESS", "300"))
+DEFAULT_SYNC_INTERVAL = int(os.getenv("NOTION_REPLICA_SYNC_INTERVAL", "60"))
+# 差分同期ではアーカイブ（削除）を検知できないため、定期的に全件同期する
+DEFAULT_FULL_SYNC_INTERVAL = int(os.getenv("NOTION_REPLICA_FULL_SYNC_INTERVAL", "3600"))
+
+
+def _normalize_db_id(db_id: Optional[str]) -> Optional[str]:
+    if not db_id:
+        return None
+    cleaned = re.sub(r"[^0-9a-fA-F]", "", db_id).lower()
+    return cleaned or None
+
+
+def _plain_value(prop: Dict[str, Any]) -> Optional[str]:
+    """プロパティを検索・索引用の文字列に変換"""
+    prop_type = prop.get("type")
+    if prop_type in ("title", "rich_text", "text"):
+        texts = prop.get(prop_type if prop_type != "text" else "rich_text", []) or []
+        return "".join(t.get("plain_text", "") for t in texts)
+    if prop_type == "select":
+        return (prop.get("select") or {}).get("name")
+    if prop_type == "status":
+        return (prop.get("status") or {}).get("name")
+    if prop_type == "multi_select":
+        return ",".join(item.get("name", "") for item in prop.get("multi_select", []) or [])
+    if prop_type in ("email", "phone_number", "url"):
+        return prop.get(prop_type)
+    if prop_type == "number":
+        number = prop.get("number")
+        return None if number is None else str(number)
+    if prop_type == "date":
+        return (prop.get("date") or {}).get("start")
+    return None
+
+
+def _page_title(page: Dict[str, Any]) -> str:
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return _plain_value(prop) or ""
+    return ""
+
+
+class NotionReplica:
+    """NotionデータベースのSQLiteレプリカ"""
+
+    def __init__(self, db_path: str = "notion_replica.db", max_staleness: int = DEFAULT_MAX_STALENESS):
+        self.db_path = db_path
+        self.max_staleness = max_staleness
+        self.enabled = os.getenv("NOTION_REPLICA_ENABLED", "true").lower() == "true"
+        self._local = threading.local()
+        self._tables: Dict[str, str] = {}  # 論理名 → データベースID
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（WALモードで読み書きを並行させる）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
+
+    def _init_database(self):
+        """同期状態テーブルと各レプリカテーブルを作成"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                table_name TEXT PRIMARY KEY,
+                database_id TEXT,
+                high_watermark TEXT,
+                last_synced_at REAL,
+                last_full_sync_at REAL
+            )
+        ''')
+        # テーブルの内容が変わるたびに増える版数（HTTPの ETag / Last-Modified に使う。ワーカー間で共有）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                modified_at REAL NOT NULL
+            )
+        ''')
+        for name, spec in REPLICA_TABLES.items():
+            extra = "".join(f", {col} TEXT" for col in spec["columns"])
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS "{name}" (
+                    page_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    created_time TEXT,
+                    last_edited_time TEXT,
+                    archived INTEGER DEFAULT 0,
+                    data TEXT{extra}
+                )
+            ''')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}_title" ON "{name}"(title)')
+            for col in spec["columns"]:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}_{col}" ON "{name}"({col})')
+        conn.commit()
+
+    # ---- テーブル登録 ----
+
+    def register(self, name: str, database_id: Optional[str]) -> bool:
+        """論理名とNotionデータベースIDを対応付ける"""
+        if name not in REPLICA_TABLES:
+            raise ValueError(f"未定義のレプリカテーブル: {name}")
+        db_id = _normalize_db_id(database_id)
+        if not db_id:
+            return False
+        with self._lock:
+            self._tables[name] = db_id
+        return True
+
+    def register_from_env(self) -> List[str]:
+        """環境変数に設定されているデータベースをすべて登録"""
+        registered = []
+        for name, spec in REPLICA_TABLES.items():
+            db_id = next((os.getenv(key) for key in spec["env"] if os.getenv(key)), None)
+            if self.register(name, db_id):
+                registered.append(name)
+        return registered
+
+    def table_for_database(self, database_id: Optional[str]) -> Optional[str]:
+        db_id = _normalize_db_id(database_id)
+        with self._lock:
+            for name, registered_id in self._tables.items():
+                if registered_id == db_id:
+                    return name
+        return None
+
+    # ---- 書き込み ----
+
+    def upsert_pages(self, name: str, pages: Iterable[Dict[str, Any]]) -> int:
+        """ページをレプリカに反映（書き込み直後のページをそのまま渡してもよい）"""
+        if not self.enabled:
+            return 0
+        columns = list(REPLICA_TABLES[name]["columns"].items())
+        col_names = "".join(f", {col}" for col, _ in columns)
+        placeholders = ", ?" * len(columns)
+        rows = []
+        for page in pages:
+            if not page or not page.get("id"):
+                continue
+            props = page.get("properties", {})
+            rows.append((
+                page["id"].replace("-", "").lower(),
+                _page_title(page),
+                page.get("created_time"),
+                page.get("last_edited_time"),
+                1 if page.get("archived") or page.get("in_trash") else 0,
+                json.dumps(page, ensure_ascii=False),
+                *[_plain_value(props.get(prop_name, {})) for _, prop_name in columns],
+            ))
+        if not rows:
+            return 0
+        updates = ", ".join(
+            f"{col} = excluded.{col}"
+            for col in ["title", "created_time", "last_edited_time", "archived", "data", *(c for c, _ in columns)]
+        )
+        conn = self._connect()
+        before = conn.total_changes
+        # 内容が同じページは書き換えない（差分同期で毎回返る境界のページで版数を上げないため）
+        conn.executemany(
+            f'INSERT INTO "{name}" '
+            f'(page_id, title, created_time, last_edited_time, archived, data{col_names}) '
+            f'VALUES (?, ?, ?, ?, ?, ?{placeholders}) '
+            f'ON CONFLICT(page_id) DO UPDATE SET {updates} WHERE data IS NOT excluded.data',
+            rows
+        )
+        if conn.total_changes != before:
+            self._bump_version(name)
+        conn.commit()
+        return len(rows)
+
+    def _bump_version(self, name: str) -> None:
+        """テーブルの版数を上げる（呼び出し側の commit で確定する）"""
+        self._connect().execute('''
+            INSERT INTO table_versions (table_name, version, modified_at) VALUES (?, 1, ?)
+            ON CONFLICT(table_name) DO UPDATE SET version = version + 1, modified_at = excluded.modified_at
+        ''', (name, time.time()))
+
+    def _delete_missing(self, name: str, keep_ids: Iterable[str]) -> int:
+        conn = self._connect()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _keep_ids (page_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM _keep_ids")
+        conn.executemany("INSERT OR IGNORE INTO _keep_ids VALUES (?)", ((pid,) for pid in keep_ids))
+        cursor = conn.execute(f'DELETE FROM "{name}" WHERE page_id NOT IN (SELECT page_id FROM _keep_ids)')
+        if cursor.rowcount:
+            self._bump_version(name)
+        conn.commit()
+        return cursor.rowcount
+
+    # ---- 読み込み ----
+
+    def _state(self, name: str) -> Optional[tuple]:
+        conn = self._connect()
+        return conn.execute(
+            "SELECT database_id, high_watermark, last_synced_at, last_full_sync_at "
+            "FROM sync_state WHERE table_name = ?", (name,)
+        ).fetchone()
+
+    def is_fresh(self, name: str, max_staleness: Optional[int] = None) -> bool:
+        """最後の同期が許容範囲内か（未同期・DB変更時は False）"""
+        if not self.enabled or name not in self._tables:
+            return False
+        state = self._state(name)
+        if not state or state[0] != self._tables[name] or state[2] is None:
+            return False
+        bound = self.max_staleness if max_staleness is None else max_staleness
+        return time.time() - state[2] <= bound
+
+    def read_pages(self, name: str, max_staleness: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        レプリカから全ページを取得
+
+        Returns:
+            ページのリスト（レプリカが古い・未同期の場合は None。呼び出し側はNotionを直接読む）
+        """
+        if not self.is_fresh(name, max_staleness):
+            return None
+        rows = self._connect().execute(
+            f'SELECT data FROM "{name}" WHERE archived = 0 ORDER BY created_time DESC'
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def read_database(self, database_id: str, max_staleness: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """データベースIDでレプリカを読む（未登録なら None）"""
+        name = self.table_for_database(database_id)
+        return self.read_pages(name, max_staleness) if name else None
+
+    def find_pages(self, name: str, max_staleness: Optional[int] = None, **equals) -> Optional[List[Dict[str, Any]]]:
+        """抽出カラム（title を含む）の完全一致でページを検索"""
+        if not self.is_fresh(name, max_staleness):
+            return None
+        allowed = {"title", "page_id", *REPLICA_TABLES[name]["columns"]}
+        clauses, params = ["archived = 0"], []
+        for col, value in equals.items():
+            if col not in allowed:
+                raise ValueError(f"{name} に抽出カラム {col} はありません")
+            clauses.append(f"{col} = ?")
+            params.append(value.replace("-", "").lower() if col == "page_id" else value)
+        rows = self._connect().execute(
+            f'SELECT data FROM "{name}" WHERE {" AND ".join(clauses)}', params
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def version(self, name: str, max_staleness: Optional[int] = None) -> Optional[Tuple[int, Optional[float]]]:
+        """
+        テーブルの版数と最終更新時刻
+
+        Returns:
+            (版数, 最終更新のUNIX時刻)。レプリカが古い・未同期の場合は None
+            （read_pages / find_pages もNotionを直接読むので、版数では内容を表せない）
+        """
+        if not self.is_fresh(name, max_staleness):
+            return None
+        row = self._connect().execute(
+            "SELECT version, modified_at FROM table_versions WHERE table_name = ?", (name,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """テーブルごとの件数と同期状態"""
+        conn = self._connect()
+        stats = {}
+        for name in REPLICA_TABLES:
+            count = conn.execute(f'SELECT COUNT(*) FROM "{name}" WHERE archived = 0').fetchone()[0]
+            state = self._state(name)
+            stats[name] = {
+                "registered": name in self._tables,
+                "rows": count,
+                "high_watermark": state[1] if state else None,
+                "age_seconds": round(time.time() - state[2], 1) if state and state[2] else None,
+                "fresh": self.is_fresh(name),
+            }
+        return stats
+
+    # ---- 同期 ----
+
+    def sync_table(self, name: str, notion, full: bool = False) -> int:
+        """
+        Notionから変更分を取り込む
+
+        Args:
+            name: 論理テーブル名
+            notion: iter_database_pages を持つ NotionClient
+            full: 全件同期（アーカイブされたページの削除も反映）
+
+        Returns:
+            反映したページ数
+        """
+        database_id = self._tables.get(name)
+        if not database_id:
+            return 0
+        state = self._state(name)
+        if state and state[0] != database_id:
+            # DBが差し替えられた場合は作り直す
+            self._connect().execute(f'DELETE FROM "{name}"')
+            self._bump_version(name)
+            state = None
+        now = time.time()
+        watermark = state[1] if state else None
+        if not full and state and state[3] and now - state[3] >= DEFAULT_FULL_SYNC_INTERVAL:
+            full = True
+        if not watermark:
+            full = True
+
+        query = {}
+        if not full:
+            query["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": watermark},
+            }
+
+        synced = 0
+        seen_ids = []
+        newest = watermark
+        batch = []
+        for page in notion.iter_database_pages(database_id, use_replica=False, **query):
+            batch.append(page)
+            seen_ids.append(page["id"].replace("-", "").lower())
+            edited = page.get("last_edited_time")
+            if edited and (newest is None or edited > newest):
+                newest = edited
+            if len(batch) >= 100:
+                synced += self.upsert_pages(name, batch)
+                batch = []
+        synced += self.upsert_pages(name, batch)
+        if full:
+            self._delete_missing(name, seen_ids)
+
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO sync_state (table_name, database_id, high_watermark, last_synced_at, last_full_sync_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(table_name) DO UPDATE SET
+                database_id = excluded.database_id,
+                high_watermark = excluded.high_watermark,
+                last_synced_at = excluded.last_synced_at,
+                last_full_sync_at = COALESCE(excluded.last_full_sync_at, sync_state.last_full_sync_at)
+        ''', (name, database_id, newest, now, now if full else None))
+        conn.commit()
+        return synced
+
+    def sync_all(self, notion, full: bool = False) -> Dict[str, int]:
+        """登録済みの全テーブルを同期（失敗したテーブルはスキップ）"""
+        results = {}
+        for name in list(self._tables):
+            try:
+                results[name] = self.sync_table(name, notion, full=full)
+            except Exception as e:
+                print(f"⚠️ レプリカ同期エラー ({name}): {e}")
+                results[name] = -1
+        return results
+
+
+class ReplicaSyncWorker:
+    """レプリカを定期的に差分同期するバックグラウンドワーカー"""
+
+    def __init__(self, replica: NotionReplica, notion, interval: int = DEFAULT_SYNC_INTERVAL):
+        self.replica = replica
+        self.notion = notion
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        if not self.replica.enabled or (self._thread and self._thread.is_alive()):
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="notion-replica-sync", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            # 同期はチャット・ダッシュボードより後回しにする
+            with notion_scheduler.lane(BACKGROUND):
+                results = self.replica.sync_all(self.notion)
+            changed = {k: v for k, v in results.items() if v}
+            if changed:
+                print(f"🔄 Notionレプリカ同期: {changed} ({time.time() - started:.2f}秒)")
+            self._stop.wait(self.interval)
+
+
+# グローバルレプリカ
+notion_replica = NotionReplica(os.getenv("NOTION_REPLICA_PATH", data_path("notion_replica.db")))
+notion_replica.register_from_env()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notion APIリクエストスケジューラー
+トークンバケットでインテグレーション全体のリクエストレート（約3件/秒）を守り、
+優先レーン（チャット・診断 > ダッシュボード > バックグラウンド同期・ログ書き込み）順に送信する
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import requests
+    _TRANSIENT_ERRORS: tuple = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+except ImportError:
+    _TRANSIENT_ERRORS = ()
+
+try:
+    import httpx
+    _TRANSIENT_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+
+try:
+    import aiohttp
+    _TRANSIENT_ERRORS += (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+except (ImportError, AttributeError):
+    pass
+
+
+INTERACTIVE = "interactive"
+DASHBOARD = "dashboard"
+BACKGROUND = "background"
+# 優先度の高い順
+LANES = (INTERACTIVE, DASHBOARD, BACKGROUND)
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+_current_lane: ContextVar[str] = ContextVar("notion_lane", default=INTERACTIVE)
+
+
+def _status_of(error: Exception) -> Optional[int]:
+    """notion-client の APIResponseError / requests の HTTPError からステータスを取得"""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """Retry-After ヘッダー（秒）を取得"""
+    if not headers:
+        return None
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class NotionScheduler:
+    """優先レーン付きトークンバケットでNotion APIの呼び出しを制御"""
+
+    def __init__(
+        self,
+        rate: float = float(os.getenv("NOTION_RATE_LIMIT_RPS", "3")),
+        burst: int = int(os.getenv("NOTION_RATE_LIMIT_BURST", "3")),
+        max_retries: int = int(os.getenv("NOTION_MAX_RETRIES", "4")),
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0
+    ):
+        """
+        初期化
+
+        Args:
+            rate: 1秒あたりに補充するトークン数
+            burst: バケットの容量（連続して送信できる件数）
+            max_retries: 429・一時エラー時の最大再試行回数
+            base_backoff: 指数バックオフの初期値（秒）
+            max_backoff: バックオフの上限（秒）
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = {lane: 0 for lane in LANES}
+        self._lane_stats = {
+            lane: {"acquired": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for lane in LANES
+        }
+        self._counters = {"rate_limited": 0, "retries": 0, "failures": 0}
+
+    # ---- レーン指定 ----
+
+    def current_lane(self) -> str:
+        return _current_lane.get()
+
+    def set_lane(self, lane: str):
+        """現在のコンテキストのレーンを設定（reset_lane に渡すトークンを返す）"""
+        if lane not in LANES:
+            raise ValueError(f"未定義のレーン: {lane}")
+        return _current_lane.set(lane)
+
+    def reset_lane(self, token) -> None:
+        try:
+            _current_lane.reset(token)
+        except ValueError:
+            # 別コンテキストで作られたトークンの場合は既定レーンに戻す
+            _current_lane.set(INTERACTIVE)
+
+    @contextmanager
+    def lane(self, lane: str):
+        """with ブロック内のNotion呼び出しを指定レーンで送信"""
+        token = self.set_lane(lane)
+        try:
+            yield
+        finally:
+            self.reset_lane(token)
+
+    def in_lane(self, lane: str) -> Callable:
+        """関数内のNotion呼び出しを指定レーンで送信するデコレーター"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.lane(lane):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ---- トークンバケット ----
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, lane: Optional[str] = None) -> float:
+        """
+        送信用のトークンを1つ取得（取得できるまで待機）
+
+        上位レーンに待機中のリクエストがある間は下位レーンはトークンを取らない。
+
+        Returns:
+            待機した秒数
+        """
+        lane = lane or self.current_lane()
+        started = time.monotonic()
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    delay = self._try_take(lane)
+                    if delay == 0:
+                        break
+                    self._cond.wait(delay)
+            finally:
+                self._waiting[lane] -= 1
+                self._cond.notify_all()
+            return self._record_wait(lane, started)
+
+    async def aacquire(self, lane: Optional[str] = None) -> float:
+        """acquire の非同期版（イベントループを止めずに待機）"""
+        lane = lane or self.current_lane()
+        started = time.monotonic()
+        with self._cond:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_take(lane)
+                if delay == 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            with self._cond:
+                self._waiting[lane] -= 1
+                self._cond.notify_all()
+        with self._cond:
+            return self._record_wait(lane, started)
+
+    def _try_take(self, lane: str) -> float:
+        """トークンを取れたら 0、取れなければ次に試すまでの秒数（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        higher = LANES[:LANES.index(lane)]
+        if self._tokens >= 1 and not any(self._waiting[h] for h in higher):
+            self._tokens -= 1
+            return 0
+        return max((1 - self._tokens) / self.rate, 0.01)
+
+    def _record_wait(self, lane: str, started: float) -> float:
+        waited = time.monotonic() - started
+        stats = self._lane_stats[lane]
+        stats["acquired"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """レート制限を受けたとき、全レーンの送信を一時停止"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._cond.notify_all()
+
+    # ---- 実行 ----
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        jitter = random.uniform(0, self.base_backoff)
+        if retry_after is not None:
+            return retry_after + jitter
+        return min(self.max_backoff, self.base_backoff * (2 ** attempt)) + jitter
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        *args,
+        idempotent: bool = True,
+        lane: Optional[str] = None,
+        **kwargs
+    ) -> Any:
+        """
+        トークンを取得してから func を呼び出す
+
+        429 は Retry-After だけ全体を停止して再試行する。5xx・通信エラーは
+        冪等なリクエスト（読み取り・更新）のみジッター付き指数バックオフで再試行する。
+        func が requests.Response を返す場合はステータスコードで判定する。
+        """
+        lane = lane or self.current_lane()
+        attempt = 0
+        while True:
+            self.acquire(lane)
+            result, error = None, None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+            delay = self._retry_delay(attempt, result, error, idempotent, lane)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(
+        self,
+        func: Callable[..., Any],
+        *args,
+        idempotent: bool = True,
+        lane: Optional[str] = None,
+        **kwargs
+    ) -> Any:
+        """call の非同期版（func はコルーチン関数）"""
+        lane = lane or self.current_lane()
+        attempt = 0
+        while True:
+            await self.aacquire(lane)
+            result, error = None, None
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+            delay = self._retry_delay(attempt, result, error, idempotent, lane)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(
+        self,
+        attempt: int,
+        result: Any,
+        error: Optional[Exception],
+        idempotent: bool,
+        lane: str
+    ) -> Optional[float]:
+        """
+        再試行までの待機秒数を返す（再試行しない場合は None）
+
+        429 の場合は全レーンを停止するため、呼び出し側の待機は次の acquire で行われる（0 を返す）。
+        """
+        if error is not None:
+            status = _status_of(error)
+            headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+        else:
+            status = getattr(result, "status_code", None)
+            headers = getattr(result, "headers", None)
+
+        if status == 429:
+            retryable = True
+        elif status in RETRY_STATUS_CODES or (error is not None and isinstance(error, _TRANSIENT_ERRORS)):
+            retryable = idempotent
+        else:
+            retryable = False
+
+        if not retryable:
+            return None
+        if attempt >= self.max_retries:
+            with self._cond:
+                self._counters["failures"] += 1
+            return None
+
+        delay = self._backoff(attempt, _retry_after(headers) if status == 429 else None)
+        with self._cond:
+            self._counters["retries"] += 1
+            if status == 429:
+                self._counters["rate_limited"] += 1
+        if status == 429:
+            print(f"⏳ Notionレート制限 (429) - {delay:.1f}秒停止して再試行 ({lane})")
+            self.pause(delay)
+            return 0.0
+        print(f"⏳ Notion一時エラー ({status or type(error).__name__}) - {delay:.1f}秒後に再試行")
+        return delay
+
+    def wrap(self, func: Callable[..., Any], idempotent: bool = True) -> Callable[..., Any]:
+        """func をスケジューラー経由で呼び出す関数を返す"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, idempotent=idempotent, **kwargs)
+        return wrapper
+
+    # ---- メトリクス ----
+
+    def get_stats(self) -> Dict[str, Any]:
+        """レーンごとの待機数・待ち時間と、レート制限・再試行の回数"""
+        with self._cond:
+            self._refill(time.monotonic())
+            lanes = {}
+            for lane in LANES:
+                stats = self._lane_stats[lane]
+                acquired = stats["acquired"]
+                lanes[lane] = {
+                    "queue_depth": self._waiting[lane],
+                    "acquired": acquired,
+                    "avg_wait_ms": round(stats["wait_seconds"] / acquired * 1000, 1) if acquired else 0.0,
+                    "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 1),
+                }
+            return {
+                "rate_per_second": self.rate,
+                "tokens": round(self._tokens, 2),
+                "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "lanes": lanes,
+                **self._counters,
+            }
+
+
+# グローバルスケジューラー（インテグレーション単位のレート制限を全モジュールで共有）
+notion_scheduler = NotionScheduler()
+
+# 共有HTTPトランスポート経由の直接HTTP呼び出しもスケジューラーを通す
+try:
+    from utils.http_transport import http_transport
+    http_transport.register_gate("api.notion.com", notion_scheduler)
+except ImportError:
+    pass
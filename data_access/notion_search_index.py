@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+修理ケース・診断ノードの転置インデックス
+文字n-gram（日本語は分かち書きせずに文字単位で切る）→ ドキュメントID の転置リストを
+データ更新時に差分で作り直し、キーワード検索をリクエストごとの全件走査なしで行う
+"""
+
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+# 項目名 → (重み, ドキュメント内のキー候補)
+CASE_FIELDS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "title": (3.0, ("title",)),
+    "category": (2.0, ("category",)),
+    "solution": (1.0, ("solution",)),
+}
+NODE_FIELDS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "title": (3.0, ("title",)),
+    "category": (2.0, ("category",)),
+    "question": (1.0, ("question",)),
+    "diagnosis_result": (1.0, ("diagnosis_result", "result")),
+}
+
+
+def normalize_text(text: Any) -> str:
+    """全角・半角と大文字・小文字の違いをなくす"""
+    return unicodedata.normalize("NFKC", str(text or "")).lower()
+
+
+def _grams(text: str, n: int) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SearchHit(NamedTuple):
+    """検索結果1件"""
+    doc: Dict[str, Any]
+    score: float
+    matched_keywords: List[str]
+
+
+class NGramIndex:
+    """
+    文字n-gramの転置インデックス
+
+    キーワードのn-gramをすべて含むドキュメントを候補にし、項目ごとの部分一致を確認して
+    一致した項目の重みを合計したスコアで並べる（n-gramの一致だけでは連続しているか分からないため）。
+    n 文字未満のキーワードは1文字の転置リストで引く。
+    """
+
+    def __init__(self, fields: Dict[str, Tuple[float, Tuple[str, ...]]], n: int = 2):
+        """
+        Args:
+            fields: 項目名 → (重み, ドキュメント内のキー候補)
+            n: n-gramの文字数
+        """
+        self.fields = fields
+        self.n = n
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._texts: Dict[str, Dict[str, str]] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._order: Dict[str, int] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._source: Optional[Any] = None
+        self._lock = threading.RLock()
+        self._stats = {"builds": 0, "added": 0, "updated": 0, "removed": 0, "searches": 0}
+
+    # ---- 構築 ----
+
+    def _doc_key(self, doc: Dict[str, Any], position: int) -> str:
+        return str(doc.get("id") or doc.get("node_id") or doc.get("title") or f"#{position}")
+
+    def _field_texts(self, doc: Dict[str, Any]) -> Dict[str, str]:
+        texts = {}
+        for name, (_, keys) in self.fields.items():
+            value = next((doc.get(key) for key in keys if doc.get(key)), "")
+            texts[name] = normalize_text(value)
+        return texts
+
+    def _doc_grams(self, texts: Dict[str, str]) -> Set[str]:
+        grams: Set[str] = set()
+        for text in texts.values():
+            grams.update(text)
+            grams.update(_grams(text, self.n))
+        return grams
+
+    def _add(self, key: str, texts: Dict[str, str]) -> None:
+        for gram in self._doc_grams(texts):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        for gram in self._doc_grams(self._texts.get(key, {})):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+
+    def update(self, docs: Optional[Iterable[Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        ドキュメント一覧でインデックスを更新（変わったドキュメントだけ作り直す）
+
+        前回と同じリストオブジェクト（キャッシュから返された一覧）の場合は何もしない。
+
+        Returns:
+            追加・更新・削除したドキュメント数
+        """
+        changes = {"added": 0, "updated": 0, "removed": 0}
+        if docs is None:
+            return changes
+        with self._lock:
+            if docs is self._source:
+                return changes
+
+            seen = set()
+            for position, doc in enumerate(docs):
+                if not isinstance(doc, dict):
+                    continue
+                key = self._doc_key(doc, position)
+                if key in seen:
+                    continue
+                seen.add(key)
+                texts = self._field_texts(doc)
+                fingerprint = hashlib.md5("\x1f".join(texts.values()).encode("utf-8")).hexdigest()
+                self._docs[key] = doc
+                self._order[key] = position
+                if self._fingerprints.get(key) == fingerprint:
+                    continue
+                if key in self._fingerprints:
+                    self._remove(key)
+                    changes["updated"] += 1
+                else:
+                    changes["added"] += 1
+                self._texts[key] = texts
+                self._fingerprints[key] = fingerprint
+                self._add(key, texts)
+
+            for key in [key for key in self._docs if key not in seen]:
+                self._remove(key)
+                for table in (self._docs, self._texts, self._fingerprints, self._order):
+                    table.pop(key, None)
+                changes["removed"] += 1
+
+            self._source = docs
+            self._stats["builds"] += 1
+            for name, count in changes.items():
+                self._stats[name] += count
+        if any(changes.values()):
+            print(f"🗂️ 検索インデックス更新: {changes}（{len(self._docs)}件）")
+        return changes
+
+    # ---- 検索 ----
+
+    def _candidates(self, keyword: str) -> Set[str]:
+        grams = _grams(keyword, self.n) if len(keyword) >= self.n else {keyword}
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, keywords: Iterable[str], limit: Optional[int] = None) -> List[SearchHit]:
+        """
+        キーワードのいずれかを含むドキュメントをスコア順に取得
+
+        Args:
+            keywords: 検索キーワード（元の表記のまま matched_keywords に入る）
+            limit: 最大件数
+
+        Returns:
+            スコアの高い順（同点は元の一覧の順）の SearchHit
+        """
+        scores: Dict[str, float] = {}
+        matched: Dict[str, List[str]] = {}
+        with self._lock:
+            self._stats["searches"] += 1
+            for keyword in dict.fromkeys(keywords):
+                needle = normalize_text(keyword)
+                if not needle:
+                    continue
+                for key in self._candidates(needle):
+                    texts = self._texts[key]
+                    score = sum(weight for name, (weight, _) in self.fields.items() if needle in texts[name])
+                    if score:
+                        scores[key] = scores.get(key, 0.0) + score
+                        matched.setdefault(key, []).append(keyword)
+            ranked = sorted(scores, key=lambda key: (-scores[key], self._order[key]))
+            if limit is not None:
+                ranked = ranked[:limit]
+            return [SearchHit(self._docs[key], scores[key], matched[key]) for key in ranked]
+
+    # ---- スナップショット ----
+
+    _STATE_FIELDS = ("_docs", "_texts", "_fingerprints", "_order", "_postings", "_source")
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        インデックスの中身を取得（起動時の暖機用スナップショットに保存する）
+
+        保存はロックの外で行うので、更新中の表を直列化しないようにロック内でコピーを返す
+        （転置リストの集合はその場で追加・削除するので集合もコピーする）。
+        """
+        with self._lock:
+            return {
+                "n": self.n,
+                "_docs": dict(self._docs),
+                "_texts": dict(self._texts),
+                "_fingerprints": dict(self._fingerprints),
+                "_order": dict(self._order),
+                "_postings": {gram: set(keys) for gram, keys in self._postings.items()},
+                "_source": self._source,
+            }
+
+    def restore_state(self, state: Dict[str, Any]) -> bool:
+        """export_state の値でインデックスを置き換え（n-gramの文字数が違う場合は何もしない）"""
+        if not state or state.get("n") != self.n:
+            return False
+        with self._lock:
+            for name in self._STATE_FIELDS:
+                setattr(self, name, state[name])
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"documents": len(self._docs), "grams": len(self._postings), **self._stats}
+
+
+# グローバルインデックス（search_notion_knowledge 用）
+repair_case_index = NGramIndex(CASE_FIELDS)
+diagnostic_node_index = NGramIndex(NODE_FIELDS)
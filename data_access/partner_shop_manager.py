@@ -9,6 +9,36 @@ import os
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 from data_access.notion_client import notion_client
+from data_access.id_sequence import id_sequences, max_sequence_number
+from data_access.notion_replica import notion_replica
+from data_access.relation_resolver import normalize_page_id
+from data_access.property_decoder import (
+    CHECKBOX, DATE, EMAIL, MULTI_SELECT, NUMBER, PHONE, SELECT, TEXT, TITLE, URL, Field, RecordSchema
+)
+
+
+# パートナー修理店DBのページ → 修理店レコード
+SHOP_RECORD = RecordSchema("PartnerShopRecord", [
+    Field("shop_id", "店舗ID", TITLE),
+    Field("name", "店舗名", TEXT),
+    Field("phone", "電話番号", PHONE),
+    Field("email", "メールアドレス", EMAIL),
+    Field("prefecture", "所在地（都道府県）", SELECT),
+    Field("address", "住所", TEXT),
+    Field("specialties", "専門分野", MULTI_SELECT),
+    Field("business_hours", "営業時間", TEXT),
+    Field("initial_diagnosis_fee", "初診断料", NUMBER),
+    Field("success_rate", "成約率", NUMBER),
+    Field("total_referrals", "総紹介数", NUMBER),
+    Field("total_deals", "成約数", NUMBER),
+    Field("status", "ステータス", SELECT),
+    Field("line_notification", "LINE通知", CHECKBOX),
+    Field("line_webhook_url", "LINE Webhook URL", URL),
+    Field("line_bot_id", "LINE Bot ID", TEXT),
+    Field("line_user_id", "LINEユーザーID", TEXT),
+    Field("registered_date", "登録日", DATE),
+    Field("notes", "備考", TEXT),
+], page_attrs={"page_id": "id", "created_time": "created_time", "last_edited_time": "last_edited_time"})
 
 
 class PartnerShopManager:
@@ -21,6 +51,7 @@ class PartnerShopManager:
         
         if not self.partner_db_id:
             raise ValueError("NOTION_PARTNER_DB_IDが設定されていません")
+        notion_replica.register("partner_shops", self.partner_db_id)
     
     def _get_database_id(self) -> Optional[str]:
         """データベースIDを取得"""
@@ -118,35 +149,13 @@ class PartnerShopManager:
         """
         次の店舗IDを生成（SHOP-001形式）
         
+        連番はローカルの採番シーケンスから払い出す（Notion上の最大値はプロセスで最初の1回だけ参照）
+        
         Returns:
             次の店舗ID（例: SHOP-001）
         """
         try:
-            # 既存の店舗を取得して最大IDを探す
-            response = self.notion.databases.query(
-                database_id=self.partner_db_id,
-                page_size=100
-            )
-            
-            max_num = 0
-            for page in response.get("results", []):
-                props = page.get("properties", {})
-                shop_id_prop = props.get("店舗ID", {})
-                
-                if shop_id_prop.get("type") == "title":
-                    title_array = shop_id_prop.get("title", [])
-                    if title_array:
-                        shop_id = title_array[0].get("plain_text", "")
-                        # SHOP-001形式から数値を抽出
-                        if shop_id.startswith("SHOP-"):
-                            try:
-                                num = int(shop_id.split("-")[1])
-                                max_num = max(max_num, num)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 次のIDを生成
-            next_num = max_num + 1
+            next_num = id_sequences.next_value("SHOP-", seed=self._max_shop_number)
             return f"SHOP-{next_num:03d}"
             
         except Exception as e:
@@ -155,6 +164,18 @@ class PartnerShopManager:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             return f"SHOP-{timestamp}"
     
+    def _max_shop_number(self) -> int:
+        """Notion上の既存店舗IDの最大連番を取得（採番シーケンスの初期値）"""
+        pages = notion_client.iter_database_pages(
+            self.partner_db_id,
+            filter={"property": "店舗ID", "title": {"starts_with": "SHOP-"}}
+        )
+        return max_sequence_number((SHOP_RECORD.decode(page).shop_id for page in pages), "SHOP-")
+    
+    def seed_id_sequence(self) -> None:
+        """起動時に店舗IDの採番シーケンスをNotion上の最大値で初期化"""
+        id_sequences.ensure_seeded("SHOP-", self._max_shop_number)
+    
     def list_shops(
         self,
         status: Optional[str] = None,
@@ -191,6 +212,11 @@ class PartnerShopManager:
         print("[AgentLog][A] list_shops called:", log_payload["data"])
         # #endregion
         try:
+            # ローカルレプリカが新しければNotionに問い合わせない
+            replica_shops = self._list_shops_from_replica(status, prefecture, specialty)
+            if replica_shops is not None:
+                return replica_shops[:limit]
+            
             filters = []
             normalized_prefecture = None
             use_partial_match = False
@@ -309,6 +335,51 @@ class PartnerShopManager:
             print(f"❌ パートナー修理店一覧取得エラー: {e}")
             return []
     
+    def _list_shops_from_replica(
+        self,
+        status: Optional[str] = None,
+        prefecture: Optional[str] = None,
+        specialty: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        レプリカからパートナー修理店を取得し、list_shops と同じ条件で絞り込み・並び替え
+        
+        Returns:
+            パートナー修理店リスト（レプリカが古い場合はNone）
+        """
+        pages = (
+            notion_replica.find_pages("partner_shops", status=status) if status
+            else notion_replica.read_pages("partner_shops")
+        )
+        if pages is None:
+            return None
+        
+        normalized_prefecture = self._normalize_prefecture(prefecture) if prefecture else None
+        prefecture_lower = prefecture.lower().strip() if prefecture else ""
+        
+        def sort_key(page: Dict) -> tuple:
+            props = page.get("properties", {})
+            return tuple(
+                self._get_property_number(props, key) or 0
+                for key in ("修理回数", "修理金額の合計", "平均星評価", "評価件数")
+            )
+        
+        shops = []
+        for page in sorted(pages, key=sort_key, reverse=True):
+            shop = self._parse_shop_page(page)
+            shop_prefecture = shop.get("prefecture") or ""
+            if normalized_prefecture and shop_prefecture != normalized_prefecture:
+                continue
+            if prefecture and not normalized_prefecture:
+                # 正規化できない場合は部分一致
+                shop_prefecture_lower = shop_prefecture.lower()
+                if not (prefecture_lower in shop_prefecture_lower or shop_prefecture_lower in prefecture_lower):
+                    continue
+            if specialty and specialty not in shop.get("specialties", []):
+                continue
+            shops.append(shop)
+        return shops
+    
     def get_shop(self, shop_id: str) -> Optional[Dict[str, Any]]:
         """
         パートナー修理店詳細を取得
@@ -320,14 +391,15 @@ class PartnerShopManager:
             パートナー修理店情報（見つからない場合はNone）
         """
         try:
-            # まずpage_idで直接取得を試みる
+            # まずpage_idで直接取得を試みる（共有のリレーション索引を優先）
             if len(shop_id) == 32:  # Notion Page IDは32文字
-                try:
-                    page = self.notion.pages.retrieve(shop_id)
-                    if page.get("parent", {}).get("database_id") == self.partner_db_id:
-                        return self._parse_shop_page(page)
-                except Exception:
-                    pass
+                page = notion_client.relation_resolver.resolve([shop_id]).get(normalize_page_id(shop_id))
+                if page and normalize_page_id(page.get("parent", {}).get("database_id")) == self.partner_db_id:
+                    return self._parse_shop_page(page)
+            
+            replica_pages = notion_replica.find_pages("partner_shops", title=shop_id)
+            if replica_pages:
+                return self._parse_shop_page(replica_pages[0])
             
             # 店舗IDで検索
             response = self.notion.databases.query(
@@ -358,7 +430,9 @@ class PartnerShopManager:
             パートナー修理店情報（見つからない場合はNone）
         """
         try:
-            page = self.notion.pages.retrieve(page_id)
+            page = notion_client.relation_resolver.resolve([page_id]).get(normalize_page_id(page_id))
+            if page is None:
+                raise ValueError("ページが見つかりません")
             return self._parse_shop_page(page)
         except Exception as e:
             print(f"❌ パートナー修理店取得エラー（Page ID: {page_id}）: {e}")
@@ -463,6 +537,7 @@ class PartnerShopManager:
                 parent={"database_id": self.partner_db_id},
                 properties=properties
             )
+            notion_replica.upsert_pages("partner_shops", [new_page])
             
             return self._parse_shop_page(new_page)
             
@@ -565,6 +640,8 @@ class PartnerShopManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_client.relation_resolver.add_pages([updated_page])
+            notion_replica.upsert_pages("partner_shops", [updated_page])
             
             return self._parse_shop_page(updated_page)
             
@@ -574,97 +651,7 @@ class PartnerShopManager:
     
     def _parse_shop_page(self, page: Dict) -> Dict[str, Any]:
         """Notionページをパートナー修理店情報にパース"""
-        props = page.get("properties", {})
-        
-        return {
-            "page_id": page["id"],
-            "shop_id": self._get_property_title(props, "店舗ID"),
-            "name": self._get_property_text(props, "店舗名"),
-            "phone": self._get_property_phone(props, "電話番号"),
-            "email": self._get_property_email(props, "メールアドレス"),
-            "prefecture": self._get_property_select(props, "所在地（都道府県）"),
-            "address": self._get_property_text(props, "住所"),
-            "specialties": self._get_property_multi_select(props, "専門分野"),
-            "business_hours": self._get_property_text(props, "営業時間"),
-            "initial_diagnosis_fee": self._get_property_number(props, "初診断料"),
-            "success_rate": self._get_property_number(props, "成約率"),
-            "total_referrals": self._get_property_number(props, "総紹介数"),
-            "total_deals": self._get_property_number(props, "成約数"),
-            "status": self._get_property_select(props, "ステータス"),
-            "line_notification": self._get_property_checkbox(props, "LINE通知"),
-            "line_webhook_url": self._get_property_url(props, "LINE Webhook URL"),
-            "line_bot_id": self._get_property_text(props, "LINE Bot ID"),
-            "line_user_id": self._get_property_text(props, "LINEユーザーID"),
-            "registered_date": self._get_property_date(props, "登録日"),
-            "notes": self._get_property_text(props, "備考"),
-            "created_time": page.get("created_time"),
-            "last_edited_time": page.get("last_edited_time")
-        }
-    
-    def _get_property_title(self, props: Dict, key: str) -> str:
-        """Titleプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "title":
-            title_array = prop.get("title", [])
-            if title_array:
-                return title_array[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_text(self, props: Dict, key: str) -> str:
-        """Text/Rich Textプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") in ("rich_text", "text"):
-            texts = prop.get("rich_text", [])
-            if texts:
-                return texts[0].get("plain_text", "")
-        return ""
-    
-    def _get_property_select(self, props: Dict, key: str) -> Optional[str]:
-        """Selectプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "select":
-            select_obj = prop.get("select")
-            if select_obj:
-                return select_obj.get("name")
-        return None
-    
-    def _get_property_multi_select(self, props: Dict, key: str) -> List[str]:
-        """Multi-selectプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "multi_select":
-            multi_select_array = prop.get("multi_select", [])
-            return [item.get("name", "") for item in multi_select_array]
-        return []
-    
-    def _get_property_phone(self, props: Dict, key: str) -> Optional[str]:
-        """Phoneプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "phone_number":
-            return prop.get("phone_number")
-        return None
-    
-    def _get_property_email(self, props: Dict, key: str) -> Optional[str]:
-        """Emailプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "email":
-            return prop.get("email")
-        return None
-    
-    def _get_property_url(self, props: Dict, key: str) -> Optional[str]:
-        """URLプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "url":
-            return prop.get("url")
-        return None
-    
-    def _get_property_date(self, props: Dict, key: str) -> Optional[str]:
-        """Dateプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "date":
-            date_obj = prop.get("date")
-            if date_obj:
-                return date_obj.get("start")
-        return None
+        return SHOP_RECORD.decode_dict(page)
     
     def _get_property_number(self, props: Dict, key: str) -> float:
         """Numberプロパティを取得"""
@@ -673,13 +660,6 @@ class PartnerShopManager:
             return prop.get("number", 0)
         return 0
     
-    def _get_property_checkbox(self, props: Dict, key: str) -> bool:
-        """Checkboxプロパティを取得"""
-        prop = props.get(key, {})
-        if prop.get("type") == "checkbox":
-            return prop.get("checkbox", False)
-        return False
-    
     def get_shop_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """
         メールアドレスでパートナー修理店詳細を取得
@@ -691,6 +671,10 @@ class PartnerShopManager:
             パートナー修理店情報（見つからない場合はNone）
         """
         try:
+            replica_pages = notion_replica.find_pages("partner_shops", email=email)
+            if replica_pages:
+                return self._parse_shop_page(replica_pages[0])
+            
             response = self.notion.databases.query(
                 database_id=self.partner_db_id,
                 filter={
@@ -748,6 +732,8 @@ class PartnerShopManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_client.relation_resolver.add_pages([updated_page])
+            notion_replica.upsert_pages("partner_shops", [updated_page])
             
             return True
         
@@ -802,6 +788,8 @@ class PartnerShopManager:
                 page_id=page_id,
                 properties=properties
             )
+            notion_client.relation_resolver.add_pages([updated_page])
+            notion_replica.upsert_pages("partner_shops", [updated_page])
             
             print(f"✅ パートナー工場統計情報を更新しました: {page_id} (修理回数: {repair_count}, 合計金額: {total_amount:,}円)")
             return True
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionプロパティデコーダー
+データベースのスキーマ（プロパティ名 → 型）を1回だけ調べて抽出プランをコンパイルし、
+ページを __slots__ 付きの軽量レコードに変換する（全マネージャーで共有）
+"""
+
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# ---- 型ごとの抽出関数（プロパティの型はコンパイル時に確定しているので型チェックしない） ----
+
+def _first_plain_text(items: List[Dict]) -> str:
+    return items[0].get("plain_text", "") if items else ""
+
+
+def _joined_plain_text(items: List[Dict]) -> str:
+    return "".join(item.get("plain_text", "") for item in items) if items else ""
+
+
+def _title(prop: Dict) -> str:
+    return _first_plain_text(prop["title"])
+
+
+def _rich_text(prop: Dict) -> str:
+    return _first_plain_text(prop["rich_text"])
+
+
+def _rich_text_joined(prop: Dict) -> str:
+    return _joined_plain_text(prop["rich_text"])
+
+
+def _rich_text_as_list(prop: Dict) -> List[str]:
+    texts = prop["rich_text"]
+    return [_joined_plain_text(texts)] if texts else []
+
+
+def _select(prop: Dict) -> Optional[str]:
+    select = prop["select"]
+    return select.get("name") if select else None
+
+
+def _status(prop: Dict) -> Optional[str]:
+    status = prop["status"]
+    return status.get("name") if status else None
+
+
+def _multi_select(prop: Dict) -> List[str]:
+    return [item.get("name", "") for item in prop["multi_select"]]
+
+
+def _date(prop: Dict) -> Optional[str]:
+    date = prop["date"]
+    return date.get("start") if date else None
+
+
+def _relation(prop: Dict) -> List[str]:
+    return [rel.get("id") for rel in prop["relation"]]
+
+
+def _scalar(type_name: str) -> Callable[[Dict], Any]:
+    def extract(prop: Dict) -> Any:
+        return prop[type_name]
+    return extract
+
+
+class PropertyKind:
+    """Notionの型 → 抽出関数 の対応と既定値（| で複数の型を受け付ける種類を作れる）"""
+
+    __slots__ = ("extractors", "default")
+
+    def __init__(self, extractors: Dict[str, Callable[[Dict], Any]], default: Any = None):
+        self.extractors = extractors
+        self.default = default
+
+    def __or__(self, other: "PropertyKind") -> "PropertyKind":
+        # 左側の型を優先し、既定値も左側を使う
+        return PropertyKind({**other.extractors, **self.extractors}, self.default)
+
+
+TITLE = PropertyKind({"title": _title}, "")
+TEXT = PropertyKind({"rich_text": _rich_text}, "")
+TEXT_JOINED = PropertyKind({"rich_text": _rich_text_joined}, "")
+TEXT_LIST = PropertyKind({"rich_text": _rich_text_as_list}, list)
+SELECT = PropertyKind({"select": _select, "status": _status}, None)
+MULTI_SELECT = PropertyKind({"multi_select": _multi_select}, list)
+PHONE = PropertyKind({"phone_number": _scalar("phone_number")}, None)
+EMAIL = PropertyKind({"email": _scalar("email")}, None)
+URL = PropertyKind({"url": _scalar("url")}, None)
+DATE = PropertyKind({"date": _date}, None)
+NUMBER = PropertyKind({"number": _scalar("number")}, 0)
+CHECKBOX = PropertyKind({"checkbox": _scalar("checkbox")}, False)
+RELATION = PropertyKind({"relation": _relation}, list)
+
+_UNSET = object()
+
+# 生成済みの RecordSchema（スキーマ変更・再読み込み時にまとめてプランを破棄するため）
+_SCHEMAS: "weakref.WeakSet[RecordSchema]" = weakref.WeakSet()
+
+
+class Field:
+    """レコードの1項目（出力キー・Notionのプロパティ名・種類）"""
+
+    __slots__ = ("key", "prop", "kind", "default")
+
+    def __init__(self, key: str, prop: Optional[str], kind: PropertyKind, default: Any = _UNSET):
+        """
+        Args:
+            key: レコードの属性名（to_dict のキー）
+            prop: Notionのプロパティ名（None の場合はデータベースのタイトルプロパティ）
+            kind: プロパティの種類（TITLE / TEXT / SELECT / TEXT_JOINED | SELECT など）
+            default: 値が無い場合の既定値（省略時は種類の既定値。list などの型を渡すと毎回新しく作る）
+        """
+        self.key = key
+        self.prop = prop
+        self.kind = kind
+        self.default = kind.default if default is _UNSET else default
+
+
+class NotionRecord:
+    """デコード結果の基底クラス（サブクラスは __slots__ のみを持つ）"""
+
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class _Plan:
+    """1つのデータベース用にコンパイルされた抽出プラン"""
+
+    __slots__ = ("steps", "property_count")
+
+    def __init__(self, steps: Tuple, property_count: int):
+        self.steps = steps
+        self.property_count = property_count
+
+
+class RecordSchema:
+    """
+    ページ → レコード の変換定義
+
+    データベースごとに最初の1ページ（または databases.retrieve のスキーマ）から
+    プロパティの型を読み取り、各項目の抽出関数を確定したプランをキャッシュする。
+    以降のページは型の判定なしで1回の走査でデコードされる。
+    """
+
+    def __init__(self, name: str, fields: Iterable[Field], page_attrs: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            name: レコードクラス名
+            fields: プロパティ由来の項目
+            page_attrs: レコードの属性名 → ページ直下のキー（id / created_time など）
+        """
+        self.fields = list(fields)
+        self.page_attrs = tuple((page_attrs or {}).items())
+        keys = tuple(key for key, _ in self.page_attrs) + tuple(field.key for field in self.fields)
+        self.record_class = type(name, (NotionRecord,), {"__slots__": keys})
+        self._plans: Dict[str, _Plan] = {}
+        self._lock = threading.Lock()
+        self._stats = {"compiled": 0, "decoded": 0}
+        _SCHEMAS.add(self)
+
+    # ---- コンパイル ----
+
+    def compile(self, property_types: Dict[str, str]) -> _Plan:
+        """プロパティ名 → Notionの型 から抽出プランを作成"""
+        title_prop = next((name for name, type_ in property_types.items() if type_ == "title"), None)
+        steps = []
+        for field in self.fields:
+            prop_name = field.prop if field.prop is not None else title_prop
+            extractor = field.kind.extractors.get(property_types.get(prop_name))
+            steps.append((field.key, prop_name, extractor, field.default, isinstance(field.default, type)))
+        with self._lock:
+            self._stats["compiled"] += 1
+        return _Plan(tuple(steps), len(property_types))
+
+    def register_schema(self, database_id: str, database: Dict[str, Any]) -> None:
+        """databases.retrieve の結果（またはプロパティ名 → 型の辞書）から事前にプランを作成"""
+        properties = database.get("properties", database)
+        property_types = {
+            name: prop.get("type") if isinstance(prop, dict) else prop
+            for name, prop in properties.items()
+        }
+        plan = self.compile(property_types)
+        with self._lock:
+            self._plans[database_id.replace("-", "")] = plan
+
+    def invalidate(self, database_id: Optional[str] = None) -> None:
+        """スキーマ変更時などにプランを破棄"""
+        with self._lock:
+            if database_id is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(database_id.replace("-", ""), None)
+
+    def _plan_for(self, page: Dict[str, Any], props: Dict[str, Any]) -> _Plan:
+        database_id = (page.get("parent") or {}).get("database_id")
+        if not database_id:
+            # 所属データベースが分からないページはキャッシュせずにその場でコンパイル
+            return self.compile({name: prop.get("type") for name, prop in props.items()})
+        key = database_id.replace("-", "")
+        plan = self._plans.get(key)
+        if plan is None or plan.property_count != len(props):
+            plan = self.compile({name: prop.get("type") for name, prop in props.items()})
+            with self._lock:
+                self._plans[key] = plan
+        return plan
+
+    # ---- デコード ----
+
+    def _apply(self, plan: _Plan, page: Dict[str, Any], props: Dict[str, Any]) -> NotionRecord:
+        record = self.record_class.__new__(self.record_class)
+        for key, attr in self.page_attrs:
+            setattr(record, key, page.get(attr))
+        for key, prop_name, extractor, default, is_factory in plan.steps:
+            value = None
+            if extractor is not None:
+                prop = props.get(prop_name)
+                if prop is not None:
+                    value = extractor(prop)
+            if value is None:
+                value = default() if is_factory else default
+            setattr(record, key, value)
+        return record
+
+    def decode(self, page: Dict[str, Any]) -> NotionRecord:
+        """ページを1件デコード"""
+        props = page.get("properties") or {}
+        plan = self._plan_for(page, props)
+        try:
+            record = self._apply(plan, page, props)
+        except (KeyError, TypeError, AttributeError):
+            # プロパティの型が変わった場合はこのページからプランを作り直す
+            database_id = (page.get("parent") or {}).get("database_id")
+            if database_id:
+                self.invalidate(database_id)
+            record = self._apply(self._plan_for(page, props), page, props)
+        self._stats["decoded"] += 1
+        return record
+
+    def decode_many(self, pages: Iterable[Dict[str, Any]]) -> List[NotionRecord]:
+        """複数ページをまとめてデコード"""
+        return [self.decode(page) for page in pages]
+
+    def decode_dict(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """ページを1件デコードして辞書で返す（APIレスポンス用）"""
+        return self.decode(page).to_dict()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"plans": len(self._plans), **self._stats}
+
+
+def invalidate_all_plans() -> None:
+    """全 RecordSchema のコンパイル済みプランを破棄（次のページで作り直す）"""
+    for schema in list(_SCHEMAS):
+        schema.invalidate()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionリレーション一括解決モジュール
+リレーション先のページIDをまとめて解決し、pages.retrieve の N+1 呼び出しを避ける
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+def normalize_page_id(page_id: Optional[str]) -> str:
+    """Notion Page ID をハイフン無し・小文字に正規化"""
+    return (page_id or "").replace("-", "").lower()
+
+
+class RelationResolver:
+    """
+    ページIDで索引したNotionページのキャッシュ
+
+    リレーション先のデータベースを一括スキャンしてページIDで索引し、
+    索引に無いページだけを並列に pages.retrieve で取得する。
+    """
+
+    def __init__(
+        self,
+        client_provider: Callable[[], Any],
+        scanner: Optional[Callable[[str], Iterator[Dict[str, Any]]]] = None,
+        ttl: int = 300,
+        max_workers: int = 4
+    ):
+        """
+        初期化
+
+        Args:
+            client_provider: notion-client の Client を返す関数（初期化前は None を返してよい）
+            scanner: データベースIDを受け取り全ページを返す関数（省略時は databases.query を辿る）
+            ttl: 索引したページとデータベーススキャンの有効期間（秒）
+            max_workers: 索引に無いページを取得する際の並列数
+        """
+        self._client_provider = client_provider
+        self._scanner = scanner
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._page_times: Dict[str, float] = {}
+        self._scanned_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "scans": 0, "retrieved": 0}
+
+    def _is_fresh(self, stamp: Optional[float]) -> bool:
+        return stamp is not None and time.time() - stamp < self.ttl
+
+    def _scan(self, database_id: str) -> Iterator[Dict[str, Any]]:
+        """データベースの全ページを取得"""
+        if self._scanner:
+            return self._scanner(database_id)
+        return self._scan_with_client(database_id)
+
+    def _scan_with_client(self, database_id: str) -> Iterator[Dict[str, Any]]:
+        client = self._client_provider()
+        if not client:
+            return
+        cursor = None
+        while True:
+            kwargs = {"database_id": database_id, "page_size": 100}
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            response = client.databases.query(**kwargs)
+            yield from response.get("results", [])
+            if not response.get("has_more") or not response.get("next_cursor"):
+                break
+            cursor = response["next_cursor"]
+
+    def add_pages(self, pages: Iterable[Dict[str, Any]]) -> int:
+        """取得済みのページを索引に追加（更新後のページで上書きする用途にも使う）"""
+        now = time.time()
+        count = 0
+        with self._lock:
+            for page in pages:
+                if not page or not page.get("id"):
+                    continue
+                key = normalize_page_id(page["id"])
+                self._pages[key] = page
+                self._page_times[key] = now
+                count += 1
+        return count
+
+    def invalidate(self, page_id: Optional[str] = None) -> None:
+        """索引を破棄（page_id 指定時はそのページのみ）"""
+        with self._lock:
+            if page_id is None:
+                self._pages.clear()
+                self._page_times.clear()
+                self._scanned_at.clear()
+            else:
+                key = normalize_page_id(page_id)
+                self._pages.pop(key, None)
+                self._page_times.pop(key, None)
+
+    def index_database(self, database_id: str, force: bool = False) -> int:
+        """データベースを一括スキャンしてページIDで索引（TTL内は再スキャンしない）"""
+        if not database_id:
+            return 0
+        key = normalize_page_id(database_id)
+        with self._lock:
+            if not force and self._is_fresh(self._scanned_at.get(key)):
+                return 0
+        try:
+            count = self.add_pages(self._scan(database_id))
+        except Exception as e:
+            print(f"⚠️ リレーション先DBの一括取得に失敗: {e}")
+            return 0
+        with self._lock:
+            self._scanned_at[key] = time.time()
+            self.stats["scans"] += 1
+        return count
+
+    def get(self, page_id: str) -> Optional[Dict[str, Any]]:
+        """索引済みのページを取得（期限切れ・未索引の場合は None）"""
+        key = normalize_page_id(page_id)
+        with self._lock:
+            if self._is_fresh(self._page_times.get(key)):
+                return self._pages.get(key)
+        return None
+
+    def _retrieve(self, page_id: str) -> Optional[Dict[str, Any]]:
+        client = self._client_provider()
+        if not client:
+            return None
+        try:
+            return client.pages.retrieve(page_id=page_id)
+        except Exception as e:
+            print(f"⚠️ 関連ページ取得エラー ({page_id}): {e}")
+            return None
+
+    def resolve(
+        self,
+        page_ids: Iterable[str],
+        database_ids: Iterable[Optional[str]] = ()
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        ページIDの集合をまとめて解決
+
+        Args:
+            page_ids: 解決するページID
+            database_ids: 先に一括スキャンしておくリレーション先データベースID
+
+        Returns:
+            正規化済みページIDをキーとするページの辞書（取得できなかったIDは含まない）
+        """
+        wanted = {normalize_page_id(pid): pid for pid in page_ids if pid}
+        if not wanted:
+            return {}
+
+        resolved: Dict[str, Dict[str, Any]] = {}
+
+        def collect_hits():
+            for key in list(wanted):
+                page = self.get(key)
+                if page is not None:
+                    resolved[key] = page
+                    del wanted[key]
+
+        collect_hits()
+        if wanted:
+            for database_id in database_ids:
+                if database_id:
+                    self.index_database(database_id)
+            collect_hits()
+
+        hits = len(resolved)
+        misses = list(wanted.values())
+        if misses:
+            workers = max(1, min(self.max_workers, len(misses)))
+            # 呼び出し元のコンテキスト（Notionの優先レーンなど）を各取得スレッドに引き継ぐ
+            contexts = [contextvars.copy_context() for _ in misses]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = [
+                    p for p in executor.map(lambda ctx, pid: ctx.run(self._retrieve, pid), contexts, misses)
+                    if p
+                ]
+            self.add_pages(fetched)
+            for page in fetched:
+                resolved[normalize_page_id(page["id"])] = page
+
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(misses)
+            self.stats["retrieved"] += len(resolved) - hits
+        return resolved
+
+    def resolve_relations(
+        self,
+        pages: Iterable[Dict[str, Any]],
+        relation_properties: Iterable[str],
+        database_ids: Iterable[Optional[str]] = ()
+    ) -> Dict[str, Dict[str, Any]]:
+        """複数ページのリレーションプロパティに含まれるIDをまとめて解決"""
+        relation_properties = list(relation_properties)
+        ids: List[str] = []
+        for page in pages:
+            props = page.get("properties", {})
+            for prop_name in relation_properties:
+                prop = props.get(prop_name, {})
+                if prop.get("type", "relation") == "relation":
+                    ids.extend(rel.get("id") for rel in prop.get("relation", []) or [])
+        return self.resolve(ids, database_ids)
@@ -6,12 +6,18 @@
 """
 
 import os
-import requests
 import logging
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from data_access.id_sequence import id_sequences, max_sequence_number
+from data_access.notion_replica import notion_replica
+from utils.http_transport import HTTPTransport, http_transport
+from data_access.property_decoder import (
+    DATE, NUMBER, RELATION, SELECT, TEXT, TITLE, Field, RecordSchema
+)
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -37,14 +43,31 @@ NOTION_REVIEW_DB_ID = _sanitize_db_id(NOTION_REVIEW_DB_ID)
 NOTION_DEAL_DB_ID = _sanitize_db_id(NOTION_DEAL_DB_ID)
 NOTION_PARTNER_DB_ID = _sanitize_db_id(NOTION_PARTNER_DB_ID)
 
+notion_replica.register("reviews", NOTION_REVIEW_DB_ID)
+
 NOTION_PAGES_URL = "https://api.notion.com/v1/pages"
 NOTION_DATABASE_URL = "https://api.notion.com/v1/databases"
 
 
+# 評価DBのページ → 評価レコード（抽出プランはデータベースごとに1回だけコンパイル）
+REVIEW_RECORD = RecordSchema("ReviewRecord", [
+    Field("review_id", "評価ID", TITLE),
+    Field("star_rating", "星評価", NUMBER),
+    Field("comment", "コメント", TEXT),
+    Field("customer_name", "お客様名", TEXT),
+    Field("review_date", "評価日時", DATE),
+    Field("status", "承認ステータス", SELECT, default="pending"),
+    Field("admin_comment", "運営側のコメント", TEXT),
+    Field("partner_page_ids", "パートナー工場ID", RELATION),
+    Field("deal_page_ids", "商談ID", RELATION),
+], page_attrs={"page_id": "id"})
+
+
 class ReviewManager:
     """評価管理クラス"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
+        self.http = transport or http_transport
         if not NOTION_API_KEY:
             raise ValueError("NOTION_API_KEYが設定されていません")
         
@@ -143,7 +166,7 @@ class ReviewManager:
                 "properties": properties
             }
             
-            response = requests.post(
+            response = self.http.post(
                 NOTION_PAGES_URL,
                 headers=self.headers,
                 json=page_data,
@@ -155,6 +178,7 @@ class ReviewManager:
                 return None
             
             created_page = response.json()
+            notion_replica.upsert_pages("reviews", [created_page])
             review_data = self._parse_review_page(created_page)
             
             logger.info(f"✅ 評価を作成しました: {review_id} (星評価: {star_rating})")
@@ -192,6 +216,11 @@ class ReviewManager:
             return []
         
         try:
+            # ローカルレプリカが新しければNotionに問い合わせない
+            replica_reviews = self._get_reviews_from_replica(partner_page_id, status)
+            if replica_reviews is not None:
+                return replica_reviews[:limit]
+            
             filters = []
             
             # パートナー工場でフィルタ
@@ -223,7 +252,7 @@ class ReviewManager:
                 else:
                     query["filter"] = filters[0]
             
-            response = requests.post(
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.review_db_id}/query",
                 headers=self.headers,
                 json=query,
@@ -295,7 +324,7 @@ class ReviewManager:
                     "rich_text": [{"text": {"content": admin_comment}}]
                 }
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{NOTION_PAGES_URL}/{review_page_id}",
                 headers=self.headers,
                 json={"properties": properties},
@@ -306,6 +335,7 @@ class ReviewManager:
                 logger.error(f"❌ 評価ステータス更新エラー: {response.status_code} - {response.text}")
                 return False
             
+            notion_replica.upsert_pages("reviews", [response.json()])
             logger.info(f"✅ 評価ステータスを更新しました: {review_id} -> {status}")
             
             # パートナー工場の評価情報を更新
@@ -320,67 +350,95 @@ class ReviewManager:
     
     def get_review_by_id(self, review_id: str) -> Optional[Dict[str, Any]]:
         """評価IDで評価を取得"""
+        replica_pages = notion_replica.find_pages("reviews", title=review_id)
+        if replica_pages:
+            return self._parse_review_page(replica_pages[0])
+        
         reviews = self.get_reviews(limit=1000)
         for review in reviews:
             if review.get("review_id") == review_id:
                 return review
         return None
     
+    def _get_reviews_from_replica(
+        self,
+        partner_page_id: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """レプリカから評価を取得して評価日時の新しい順に並べる（レプリカが古い場合はNone）"""
+        pages = (
+            notion_replica.find_pages("reviews", status=status) if status
+            else notion_replica.read_pages("reviews")
+        )
+        if pages is None:
+            return None
+        
+        if partner_page_id:
+            wanted = partner_page_id.replace("-", "").lower()
+            pages = [
+                page for page in pages
+                if any(
+                    (rel.get("id") or "").replace("-", "").lower() == wanted
+                    for rel in page.get("properties", {}).get("パートナー工場ID", {}).get("relation", []) or []
+                )
+            ]
+        
+        reviews = [review for review in map(self._parse_review_page, pages) if review]
+        reviews.sort(key=lambda r: r.get("review_date") or "", reverse=True)
+        return reviews
+    
     def _get_next_review_id(self) -> str:
-        """次の評価IDを生成（REVIEW-YYYYMMDD-XXX形式）"""
+        """次の評価IDを生成（REVIEW-YYYYMMDD-XXX形式、日付ごとのローカル採番シーケンスから払い出す）"""
         try:
-            if not self.review_db_id:
-                timestamp = datetime.now().strftime("%Y%m%d")
-                return f"REVIEW-{timestamp}-001"
-            
-            # 既存の評価を取得して最大IDを探す
-            response = requests.post(
-                f"{NOTION_DATABASE_URL}/{self.review_db_id}/query",
-                headers=self.headers,
-                json={"page_size": 100},
-                timeout=15
-            )
-            
-            if not response.ok:
-                timestamp = datetime.now().strftime("%Y%m%d")
-                return f"REVIEW-{timestamp}-001"
-            
-            data = response.json()
             today = datetime.now().strftime("%Y%m%d")
-            max_num = 0
+            if not self.review_db_id:
+                return f"REVIEW-{today}-001"
             
-            for page in data.get("results", []):
-                props = page.get("properties", {})
-                review_id_prop = props.get("評価ID", {})
-                
-                if review_id_prop.get("type") == "title":
-                    title_array = review_id_prop.get("title", [])
-                    if title_array:
-                        review_id = title_array[0].get("plain_text", "")
-                        # REVIEW-YYYYMMDD-XXX形式から数値を抽出
-                        if review_id.startswith(f"REVIEW-{today}-"):
-                            try:
-                                num = int(review_id.split("-")[2])
-                                max_num = max(max_num, num)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 次のIDを生成
-            next_num = max_num + 1
-            return f"REVIEW-{today}-{next_num:03d}"
+            prefix = f"REVIEW-{today}-"
+            next_num = id_sequences.next_value(prefix, seed=lambda: self._max_review_number(prefix))
+            return f"{prefix}{next_num:03d}"
         
         except Exception as e:
             logger.warning(f"⚠️ 評価ID生成エラー: {e}")
             timestamp = datetime.now().strftime("%Y%m%d")
             return f"REVIEW-{timestamp}-001"
     
+    def _max_review_number(self, prefix: str) -> int:
+        """Notion上で prefix（REVIEW-YYYYMMDD-）から始まる評価IDの最大連番を取得（全ページをカーソルで辿る）"""
+        review_ids = []
+        payload: Dict[str, Any] = {
+            "page_size": 100,
+            "filter": {"property": "評価ID", "title": {"starts_with": prefix}},
+        }
+        while True:
+            response = self.http.post(
+                f"{NOTION_DATABASE_URL}/{self.review_db_id}/query",
+                headers=self.headers,
+                json=payload,
+                timeout=15
+            )
+            response.raise_for_status()
+            data = response.json()
+            review_ids.extend(REVIEW_RECORD.decode(page).review_id for page in data.get("results", []))
+            if not data.get("has_more") or not data.get("next_cursor"):
+                break
+            payload["start_cursor"] = data["next_cursor"]
+        return max_sequence_number(review_ids, prefix)
+    
+    def seed_id_sequence(self) -> None:
+        """起動時に今日の評価IDの採番シーケンスをNotion上の最大値で初期化"""
+        if not self.review_db_id:
+            return
+        prefix = f"REVIEW-{datetime.now().strftime('%Y%m%d')}-"
+        id_sequences.ensure_seeded(prefix, lambda: self._max_review_number(prefix))
+    
     def _get_deal_page_id(self, deal_id: str) -> Optional[str]:
         """商談IDからNotion Page IDを取得"""
         if not self.deal_db_id:
             return None
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.deal_db_id}/query",
                 headers=self.headers,
                 json={
@@ -411,7 +469,11 @@ class ReviewManager:
             return None
         
         try:
-            response = requests.post(
+            replica_pages = notion_replica.find_pages("reviews", title=review_id)
+            if replica_pages:
+                return replica_pages[0].get("id")
+            
+            response = self.http.post(
                 f"{NOTION_DATABASE_URL}/{self.review_db_id}/query",
                 headers=self.headers,
                 json={
@@ -439,76 +501,25 @@ class ReviewManager:
     def _parse_review_page(self, page: Dict) -> Optional[Dict[str, Any]]:
         """Notionページをパースして評価データに変換"""
         try:
-            props = page.get("properties", {})
-            
-            # 評価ID
-            review_id = ""
-            review_id_prop = props.get("評価ID", {})
-            if review_id_prop.get("type") == "title":
-                title_array = review_id_prop.get("title", [])
-                if title_array:
-                    review_id = title_array[0].get("plain_text", "")
-            
-            # 星評価
-            star_rating = props.get("星評価", {}).get("number", 0)
-            
-            # コメント
-            comment = self._get_rich_text(props.get("コメント", {}))
-            
-            # お客様名
-            customer_name = self._get_rich_text(props.get("お客様名", {}))
-            
-            # 評価日時
-            review_date = None
-            date_prop = props.get("評価日時", {})
-            if date_prop.get("type") == "date":
-                date_value = date_prop.get("date")
-                if date_value:
-                    review_date = date_value.get("start")
-            
-            # 承認ステータス
-            status = props.get("承認ステータス", {}).get("select", {}).get("name", "pending")
-            
-            # 運営側のコメント
-            admin_comment = self._get_rich_text(props.get("運営側のコメント", {}))
-            
-            # パートナー工場ID
-            partner_page_ids = []
-            partner_relation = props.get("パートナー工場ID", {})
-            if partner_relation.get("type") == "relation":
-                partner_page_ids = [rel.get("id") for rel in partner_relation.get("relation", [])]
-            
-            # 商談ID
-            deal_page_ids = []
-            deal_relation = props.get("商談ID", {})
-            if deal_relation.get("type") == "relation":
-                deal_page_ids = [rel.get("id") for rel in deal_relation.get("relation", [])]
+            record = REVIEW_RECORD.decode(page)
             
             return {
-                "review_id": review_id,
-                "page_id": page.get("id"),
-                "star_rating": star_rating,
-                "comment": comment,
-                "customer_name": customer_name,
-                "review_date": review_date,
-                "status": status,
-                "admin_comment": admin_comment,
-                "partner_page_id": partner_page_ids[0] if partner_page_ids else None,
-                "deal_page_id": deal_page_ids[0] if deal_page_ids else None,
+                "review_id": record.review_id,
+                "page_id": record.page_id,
+                "star_rating": record.star_rating,
+                "comment": record.comment,
+                "customer_name": record.customer_name,
+                "review_date": record.review_date,
+                "status": record.status,
+                "admin_comment": record.admin_comment,
+                "partner_page_id": record.partner_page_ids[0] if record.partner_page_ids else None,
+                "deal_page_id": record.deal_page_ids[0] if record.deal_page_ids else None,
             }
         
         except Exception as e:
             logger.error(f"❌ 評価ページパースエラー: {e}")
             return None
     
-    def _get_rich_text(self, prop: Dict) -> str:
-        """Rich Textプロパティからテキストを取得"""
-        if prop.get("type") == "rich_text":
-            rich_text_array = prop.get("rich_text", [])
-            if rich_text_array:
-                return rich_text_array[0].get("plain_text", "")
-        return ""
-    
     def _update_partner_shop_ratings(self, partner_page_id: str):
         """
         パートナー工場の評価情報を更新（平均星評価、評価件数）
@@ -5,11 +5,15 @@
 
 import os
 import glob
-import shutil
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 
+from utils.embedding_cache import cached_embeddings
+from utils.embedding_index import EmbeddingManifest, manifest_path, sync_embeddings
+from utils.flat_vector_index import open_vector_store, vector_store_available
+from utils.text_chunker import chunk_documents
+
 # ChromaDBの安全なインポート
 try:
     from langchain_chroma import Chroma
@@ -19,273 +23,30 @@ except ImportError:
     CHROMA_AVAILABLE = False
 
 
-def process_markdown_content(content, filename):
-    """マークダウンテキストを構造化してRAGで活用しやすくする"""
+def open_persisted_rag_system(chroma_db_path="./chroma_db"):
+    """
+    前回作成したChromaデータベースを埋め込みをやり直さずに開く（起動直後の暫定用）
+    
+    Returns:
+        Chroma: ChromaDBインスタンス、無い・開けない場合はNone
+    """
+    if not vector_store_available() or not os.path.exists(chroma_db_path):
+        return None
     try:
-        # ケース別の構造化処理
-        if "トイレ" in filename:
-            return process_toilet_content(content)
-        elif "バッテリー" in filename:
-            return process_battery_content(content)
-        elif "サブバッテリー" in filename:
-            return process_subbattery_content(content)
-        elif "ドア" in filename or "窓" in filename:
-            return process_door_window_content(content)
-        else:
-            return process_general_content(content)
+        embeddings_model = cached_embeddings(OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")))
+        return open_vector_store(chroma_db_path, embeddings_model)
     except Exception as e:
-        print(f"Warning: マークダウン処理エラー ({filename}): {e}")
-        return content
-
-def process_toilet_content(content):
-    """トイレ関連コンテンツの構造化"""
-    # 元の構造を保持しつつ、ケース情報も抽出
-    import re
-    
-    # ケースを分割
-    cases = re.split(r'## \[Case ([^\]]+)\]', content)
-    structured_content = []
-    
-    if len(cases) > 1:  # ケースが見つかった場合
-        for i in range(1, len(cases), 2):
-            if i + 1 < len(cases):
-                case_id = cases[i]
-                case_content = cases[i + 1]
-                
-                # 症状と解決策を抽出
-                symptoms = extract_symptoms(case_content)
-                solutions = extract_solutions(case_content)
-                costs = extract_costs(case_content)
-                
-                structured_case = f"""
-ケースID: {case_id}
-症状: {symptoms}
-解決策: {solutions}
-費用目安: {costs}
-詳細: {case_content}
-"""
-                structured_content.append(structured_case)
-        
-        # ケース情報と元の内容を組み合わせ
-        return "\n".join(structured_content) + "\n\n---\n\n" + content
-    else:
-        # ケースが見つからない場合は元の内容をそのまま返す
-        return content
-
-def process_battery_content(content):
-    """バッテリー関連コンテンツの構造化"""
-    # 元の構造を保持しつつ、ケース情報も抽出
-    import re
-    
-    # ケースを分割
-    cases = re.split(r'## \[Case ([^\]]+)\]', content)
-    structured_content = []
-    
-    if len(cases) > 1:  # ケースが見つかった場合
-        for i in range(1, len(cases), 2):
-            if i + 1 < len(cases):
-                case_id = cases[i]
-                case_content = cases[i + 1]
-                
-                # バッテリー特有の情報を抽出
-                voltage_info = extract_voltage_info(case_content)
-                charging_info = extract_charging_info(case_content)
-                maintenance_info = extract_maintenance_info(case_content)
-                
-                structured_case = f"""
-ケースID: {case_id}
-電圧情報: {voltage_info}
-充電情報: {charging_info}
-メンテナンス情報: {maintenance_info}
-詳細: {case_content}
-"""
-                structured_content.append(structured_case)
-        
-        # ケース情報と元の内容を組み合わせ
-        return "\n".join(structured_content) + "\n\n---\n\n" + content
-    else:
-        # ケースが見つからない場合は元の内容をそのまま返す
-        return content
-
-def process_subbattery_content(content):
-    """サブバッテリー関連コンテンツの構造化"""
-    import re
-    
-    # ケースを分割
-    cases = re.split(r'## \[Case ([^\]]+)\]', content)
-    structured_content = []
-    
-    for i in range(1, len(cases), 2):
-        if i + 1 < len(cases):
-            case_id = cases[i]
-            case_content = cases[i + 1]
-            
-            # サブバッテリー特有の情報を抽出
-            capacity_info = extract_capacity_info(case_content)
-            charging_system = extract_charging_system(case_content)
-            usage_pattern = extract_usage_pattern(case_content)
-            
-            structured_case = f"""
-ケースID: {case_id}
-容量情報: {capacity_info}
-充電システム: {charging_system}
-使用パターン: {usage_pattern}
-詳細: {case_content}
-"""
-            structured_content.append(structured_case)
-    
-    return "\n".join(structured_content)
-
-
-def process_door_window_content(content):
-    """ドア・窓関連コンテンツの構造化"""
-    import re
-    
-    # DW-ケースを抽出
-    cases = re.findall(r'### DW-(\d+): ([^\n]+)\n\*\*症状\*\*: ([^\n]+)\n\*\*原因\*\*: ([^\n]+)\n\*\*対処法\*\*: ([^\n]+)\n\*\*修理時間\*\*: ([^\n]+)\n\*\*費用目安\*\*: ([^\n]+)', content)
-    
-    structured_cases = []
-    for case in cases:
-        case_id, title, symptoms, cause, solution, time, cost = case
-        structured_cases.append({
-            'case_id': f'DW-{case_id}',
-            'title': title,
-            'symptoms': symptoms,
-            'cause': cause,
-            'solution': solution,
-            'time': time,
-            'cost': cost
-        })
-    
-    # 構造化されたコンテンツを作成
-    structured_content = f"# ドア・窓の開閉不良 - 修理ケース一覧\n\n"
-    
-    for case in structured_cases:
-        structured_content += f"## {case['case_id']}: {case['title']}\n"
-        structured_content += f"**症状**: {case['symptoms']}\n"
-        structured_content += f"**原因**: {case['cause']}\n"
-        structured_content += f"**対処法**: {case['solution']}\n"
-        structured_content += f"**修理時間**: {case['time']}\n"
-        structured_content += f"**費用目安**: {case['cost']}\n\n"
-    
-    # 元のコンテンツも含める
-    structured_content += "\n---\n\n" + content
-    
-    return structured_content
-
-
-def process_general_content(content):
-    """一般的なコンテンツの構造化"""
-    # 基本的な構造化処理
-    import re
-    
-    # 見出しを抽出
-    headers = re.findall(r'^#+\s+(.+)$', content, re.MULTILINE)
-    
-    # リスト項目を抽出
-    list_items = re.findall(r'^[-*+]\s+(.+)$', content, re.MULTILINE)
-    
-    structured_content = f"""
-見出し: {' | '.join(headers)}
-リスト項目: {' | '.join(list_items)}
-内容: {content}
-"""
-    return structured_content
-
-
-def extract_symptoms(content):
-    """症状を抽出"""
-    import re
-    symptoms = re.findall(r'症状[：:]\s*(.+?)(?=\n|$)', content, re.DOTALL)
-    return ' | '.join(symptoms) if symptoms else "症状情報なし"
-
-
-def extract_solutions(content):
-    """解決策を抽出"""
-    import re
-    solutions = re.findall(r'解決[策法][：:]\s*(.+?)(?=\n|$)', content, re.DOTALL)
-    return ' | '.join(solutions) if solutions else "解決策情報なし"
-
-
-def extract_costs(content):
-    """費用情報を抽出"""
-    import re
-    costs = re.findall(r'(\d+[,，]\d+円|\d+円)', content)
-    return ' | '.join(costs) if costs else "費用情報なし"
-
-
-def extract_voltage_info(content):
-    """電圧情報を抽出"""
-    import re
-    voltages = re.findall(r'(\d+\.\d+V|\d+V)', content)
-    return ' | '.join(voltages) if voltages else "電圧情報なし"
-
-
-def extract_charging_info(content):
-    """充電情報を抽出"""
-    import re
-    charging = re.findall(r'(充電|チャージ|アイソレーター|DC-DC)', content)
-    return ' | '.join(charging) if charging else "充電情報なし"
-
-
-def extract_maintenance_info(content):
-    """メンテナンス情報を抽出"""
-    import re
-    maintenance = re.findall(r'(点検|清掃|交換|メンテナンス)', content)
-    return ' | '.join(maintenance) if maintenance else "メンテナンス情報なし"
-
-
-def extract_capacity_info(content):
-    """容量情報を抽出"""
-    import re
-    capacity = re.findall(r'(\d+Ah|\d+W|\d+Wh)', content)
-    return ' | '.join(capacity) if capacity else "容量情報なし"
-
-
-def extract_charging_system(content):
-    """充電システム情報を抽出"""
-    import re
-    system = re.findall(r'(アイソレーター|DC-DC|リレー|ヒューズ)', content)
-    return ' | '.join(system) if system else "充電システム情報なし"
-
-
-def extract_usage_pattern(content):
-    """使用パターン情報を抽出"""
-    import re
-    usage = re.findall(r'(冷蔵庫|エアコン|テレビ|照明|24時間)', content)
-    return ' | '.join(usage) if usage else "使用パターン情報なし"
+        print(f"⚠️ 既存データベース読み込みエラー: {e}")
+        return None
 
 
 def create_enhanced_rag_system():
-    """ブログURLも含めたRAGシステムを作成"""
+    """ブログURLも含めたRAGシステムを作成（既存のデータベースは差分だけ更新）"""
     
-    # 既存のChromaデータベースを削除（安全な方法）
     chroma_db_path = "./chroma_db"
-    if os.path.exists(chroma_db_path):
-        print("既存のChromaデータベースを削除中...")
-        try:
-            # プロセスが使用中の場合はスキップ
-            import time
-            time.sleep(1)  # 少し待機
-            shutil.rmtree(chroma_db_path)
-            print("✅ 既存のデータベースを削除しました")
-        except Exception as e:
-            print(f"⚠️ データベース削除エラー: {e}")
-            print("💡 既存のデータベースを使用して続行します")
     
     # 埋め込みモデルを設定
-    embeddings_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-    
-    # 既存のデータベースがある場合は再利用を試行
-    if os.path.exists(chroma_db_path):
-        try:
-            print("🔄 既存のデータベースを読み込み中...")
-            db = Chroma(persist_directory=chroma_db_path, embedding_function=embeddings_model)
-            print("✅ 既存のデータベースを読み込みました")
-            return db
-        except Exception as e:
-            print(f"⚠️ 既存データベース読み込みエラー: {e}")
-            print("🔄 新しいデータベースを作成します...")
+    embeddings_model = cached_embeddings(OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")))
     
     # ドキュメントを準備
     documents = []
@@ -303,6 +64,7 @@ def create_enhanced_rag_system():
                     doc.page_content = str(doc.page_content)
                 doc.metadata["source_type"] = "manual"
                 doc.metadata["url"] = "キャンピングカー修理マニュアル.pdf"
+                doc.metadata["source_version"] = os.path.getmtime(pdf_path)
                 documents.append(doc)
             print(f"✅ PDFドキュメント {len(pdf_docs)} 件を読み込みました")
         except Exception as e:
@@ -318,14 +80,12 @@ def create_enhanced_rag_system():
                 if not isinstance(doc.page_content, str):
                     doc.page_content = str(doc.page_content)
                 
-                # マークダウンコンテンツの構造化処理
-                processed_content = process_markdown_content(doc.page_content, os.path.basename(txt_file))
-                
-                doc.page_content = processed_content
+                # ケース・見出しごとの分割は最後に chunk_documents で行う
                 doc.metadata["source_type"] = "text_file"
                 doc.metadata["url"] = os.path.basename(txt_file)
                 doc.metadata["title"] = os.path.basename(txt_file).replace('.txt', '')
-                doc.metadata["content_type"] = "markdown_structured"
+                doc.metadata["content_type"] = "markdown_section"
+                doc.metadata["source_version"] = os.path.getmtime(txt_file)
                 documents.append(doc)
             print(f"✅ テキストファイル {os.path.basename(txt_file)} を読み込みました")
         except Exception as e:
@@ -367,19 +127,20 @@ def create_enhanced_rag_system():
     
     print(f"✅ 総ドキュメント数: {len(documents)} 件")
     
-    # ChromaDBが利用可能かチェック
-    if not CHROMA_AVAILABLE:
-        raise ImportError("ChromaDBが利用できません。langchain-chromaとchromadbをインストールしてください。")
+    # ケース・見出し単位の断片に分割（断片IDは内容から作るので再構築しても同じ）
+    documents = chunk_documents(documents)
+    print(f"✂️ 断片数: {len(documents)} 件")
+    
+    # ベクトルストアが利用可能かチェック（ChromaDBが無ければ numpy の FlatVectorIndex）
+    if not vector_store_available():
+        raise ImportError("ベクトルストアが利用できません。langchain-chroma と chromadb、または numpy をインストールしてください。")
     
-    # 新しいデータベースを作成
+    # データベースを開き（無ければ作成）、新しい・変わった断片だけを埋め込む
     try:
-        print("新しいChromaデータベースを作成中...")
-        db = Chroma.from_documents(
-            documents=documents, 
-            embedding=embeddings_model,
-            persist_directory=chroma_db_path
-        )
-        print("✅ Chromaデータベースを作成しました")
+        print("🔄 Chromaデータベースを差分更新中...")
+        db = open_vector_store(chroma_db_path, embeddings_model)
+        sync_embeddings(db, documents, EmbeddingManifest(manifest_path(chroma_db_path)))
+        print("✅ Chromaデータベースを更新しました")
         return db
     except Exception as e:
         print(f"❌ Chromaデータベース作成エラー: {e}")
@@ -462,7 +223,7 @@ def create_notion_based_rag_system(use_text_files=False):
     chroma_db_path = "./chroma_db"
     
     # 埋め込みモデルを設定
-    embeddings_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    embeddings_model = cached_embeddings(OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")))
     
     # ドキュメントを準備
     documents = []
@@ -527,7 +288,8 @@ def create_notion_based_rag_system(use_text_files=False):
                         "category": str(item.get("category", "")),
                         "url": str(item.get("url", "")),
                         "source_type": "notion_knowledge_base",
-                        "notion_id": str(item.get("id", ""))
+                        "notion_id": str(item.get("id", "")),
+                        "source_version": str(item.get("last_edited_time") or "")
                     }
                 )
                 documents.append(doc)
@@ -558,14 +320,12 @@ def create_notion_based_rag_system(use_text_files=False):
                     if not isinstance(doc.page_content, str):
                         doc.page_content = str(doc.page_content)
                     
-                    # マークダウンコンテンツの構造化処理
-                    processed_content = process_markdown_content(doc.page_content, os.path.basename(txt_file))
-                    
-                    doc.page_content = processed_content
+                    # ケース・見出しごとの分割は最後に chunk_documents で行う
                     doc.metadata["source_type"] = "text_file"
                     doc.metadata["url"] = os.path.basename(txt_file)
                     doc.metadata["title"] = os.path.basename(txt_file).replace('.txt', '')
-                    doc.metadata["content_type"] = "markdown_structured"
+                    doc.metadata["content_type"] = "markdown_section"
+                    doc.metadata["source_version"] = os.path.getmtime(txt_file)
                     documents.append(doc)
                 
                 print(f"✅ テキストファイル {os.path.basename(txt_file)} を読み込みました")
@@ -620,7 +380,8 @@ def create_notion_based_rag_system(use_text_files=False):
                         "title": str(case.get("title", "")),
                         "category": str(case.get("category", "")),
                         "source_type": "notion_repair_case",
-                        "notion_id": str(case.get("id", ""))
+                        "notion_id": str(case.get("id", "")),
+                        "source_version": str(case.get("last_edited_time") or "")
                     }
                 )
                 documents.append(doc)
@@ -636,32 +397,25 @@ def create_notion_based_rag_system(use_text_files=False):
     
     print(f"✅ 総ドキュメント数: {len(documents)}件")
     
+    # ケース・見出し単位の断片に分割（断片IDは内容から作るので再構築しても同じ）
+    documents = chunk_documents(documents)
+    print(f"✂️ 断片数: {len(documents)}件")
+    
     if len(documents) == 0:
         print("❌ ドキュメントが1件もありません。RAGシステムを作成できません。")
         return None
     
-    # ChromaDBが利用可能かチェック
-    if not CHROMA_AVAILABLE:
-        print("❌ ChromaDBが利用できません。langchain-chromaとchromadbをインストールしてください。")
+    # ベクトルストアが利用可能かチェック（ChromaDBが無ければ numpy の FlatVectorIndex）
+    if not vector_store_available():
+        print("❌ ベクトルストアが利用できません。langchain-chromaとchromadb、または numpy をインストールしてください。")
         print("💡 解決方法:")
         print("1. pip install langchain-chroma")
         print("2. pip install chromadb")
         return None
     
-    # 既存のデータベースを削除して新規作成
-    if os.path.exists(chroma_db_path):
-        print("🔄 既存のChromaデータベースを削除中...")
-        try:
-            import time
-            time.sleep(1)
-            shutil.rmtree(chroma_db_path)
-            print("✅ 既存のデータベースを削除しました")
-        except Exception as e:
-            print(f"⚠️ データベース削除エラー: {e}")
-    
-    # 新しいデータベースを作成
+    # 既存のデータベースは削除せず、差分だけ更新する
     try:
-        print("🔄 新しいChromaデータベースを作成中...")
+        print("🔄 Chromaデータベースを差分更新中...")
         print(f"📊 ドキュメント数: {len(documents)}")
         
         # ドキュメントの検証と修正
@@ -763,14 +517,17 @@ def create_notion_based_rag_system(use_text_files=False):
             print("❌ 使用可能なドキュメントが1件もありません")
             return None
         
-        # ChromaDBを作成
-        print(f"🔄 ChromaDBに{len(final_valid_documents)}件のドキュメントを埋め込み開始...")
-        db = Chroma.from_documents(
-            documents=final_valid_documents,
-            embedding=embeddings_model,
-            persist_directory=chroma_db_path
+        # ChromaDBを開き（無ければ作成）、新しい・変わった断片だけを埋め込む
+        # Notionを読み込めなかった場合は前回のNotionの断片を残す
+        print(f"🔄 ChromaDBと{len(final_valid_documents)}件の断片を突き合わせ中...")
+        db = open_vector_store(chroma_db_path, embeddings_model)
+        sync_embeddings(
+            db,
+            final_valid_documents,
+            EmbeddingManifest(manifest_path(chroma_db_path)),
+            keep_missing_types=("notion_knowledge_base", "notion_repair_case"),
         )
-        print("✅ Chromaデータベースを作成しました")
+        print("✅ Chromaデータベースを更新しました")
         return db
         
     except Exception as e:
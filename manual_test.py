@@ -53,8 +53,10 @@ try:
         print("❌ キャッシュデータが一致しません")
     
     # クリーンアップ
-    if os.path.exists("manual_test.db"):
-        os.remove("manual_test.db")
+    test_cache.close()
+    for path in ("manual_test.db", "manual_test.db-wal", "manual_test.db-shm"):
+        if os.path.exists(path):
+            os.remove(path)
         
 except Exception as e:
     print(f"❌ キャッシュテストエラー: {e}")
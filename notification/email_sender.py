@@ -11,13 +11,14 @@
 
 import os
 import smtplib
-import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
+from utils.http_transport import HTTPTransport, http_transport
+
 # Resend対応（公式HTTP APIで送信するため、追加ライブラリ不要）
 RESEND_API_URL = "https://api.resend.com/emails"
 
@@ -34,8 +35,9 @@ except ImportError:
 class EmailSender:
     """メール送信クラス（Resend優先、SendGrid/SMTPフォールバック）"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
         """初期化"""
+        self.http = transport or http_transport
         # 環境変数の読み込み状況を確認
         print("🔍 EmailSender初期化: 環境変数の確認")
         print(f"   - RESEND_API_KEY: {'設定済み' if os.environ.get('RESEND_API_KEY') else '未設定'}")
@@ -531,7 +533,7 @@ https://camper-repair.net/
             
             print(f"📧 Resend APIリクエスト送信...")
 
-            resp = requests.post(
+            resp = self.http.post(
                 RESEND_API_URL,
                 headers={
                     "Authorization": f"Bearer {self.resend_api_key}",
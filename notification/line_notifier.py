@@ -10,12 +10,15 @@ import requests
 from typing import Dict, Optional, List, Any
 from datetime import datetime
 
+from utils.http_transport import HTTPTransport, http_transport
+
 
 class LineNotifier:
     """LINE通知クラス"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
         """初期化"""
+        self.http = transport or http_transport
         self.channel_access_token = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN")
         self.api_url = "https://api.line.me/v2/bot/message/push"
         self.enabled = bool(self.channel_access_token)
@@ -398,7 +401,7 @@ https://camper-repair.net/
                 "messages": messages
             }
             
-            response = requests.post(
+            response = self.http.post(
                 self.api_url,
                 headers=headers,
                 json=payload,
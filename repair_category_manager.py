@@ -5,6 +5,10 @@ import re
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+from utils.cache_layer import caches
+
+_MISSING = object()
+
 class RepairCategoryManager:
     """修理カテゴリー管理クラス - データ駆動型アプローチ"""
     
@@ -18,7 +22,12 @@ class RepairCategoryManager:
         self.config_file = config_file
         self.categories = {}
         self.general_settings = {}
-        self._cache = {}  # キャッシュ用辞書を追加
+        # コンテンツのキャッシュ（統合キャッシュの名前空間。件数と有効期限で上限を設ける）
+        self._cache = caches.namespace(
+            "repair_category",
+            ttl=int(os.getenv("REPAIR_CATEGORY_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("REPAIR_CATEGORY_CACHE_MAX_ENTRIES", "512")),
+        )
         self.setup_logging()
         self.load_categories()
     
@@ -415,9 +424,11 @@ class RepairCategoryManager:
         Returns:
             キャッシュされたコンテンツ
         """
-        if cache_key not in self._cache:
-            self._cache[cache_key] = content_func(*args, **kwargs)
-        return self._cache[cache_key]
+        content = self._cache.get(cache_key, _MISSING)
+        if content is _MISSING:
+            content = content_func(*args, **kwargs)
+            self._cache.set(cache_key, content)
+        return content
     
     def clear_cache(self):
         """キャッシュをクリア"""
@@ -7,6 +7,11 @@ from datetime import datetime, timezone
 from typing import Any, Dict, Tuple, Optional, List, Union
 from dotenv import load_dotenv
 
+from data_access.notion_scheduler import BACKGROUND, notion_scheduler
+from utils.data_paths import data_path
+from utils.http_transport import HTTPTransport, http_transport
+from utils.write_behind_queue import PermanentWriteError, RetryableWriteError, WriteBehindQueue
+
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -52,7 +57,10 @@ def _rt(text: str) -> List[Dict[str, Any]]:
     return [{"type": "text", "text": {"content": chunk}} for chunk in _chunk_text(text)]
 
 
-def _ensure_log_db_schema(headers: Dict[str, str]) -> Tuple[Dict[str, str], Optional[str]]:
+def _ensure_log_db_schema(
+    headers: Dict[str, str],
+    transport: Optional[HTTPTransport] = None,
+) -> Tuple[Dict[str, str], Optional[str]]:
     """NotionログDBのスキーマとタイトルプロパティ名をキャッシュ付きで取得"""
     global _LOG_DB_SCHEMA, _LOG_DB_TITLE_PROP
 
@@ -64,7 +72,7 @@ def _ensure_log_db_schema(headers: Dict[str, str]) -> Tuple[Dict[str, str], Opti
 
     if NOTION_LOG_DB_ID:
         try:
-            resp = requests.get(
+            resp = (transport or http_transport).get(
                 f"{NOTION_DATABASE_URL}/{NOTION_LOG_DB_ID}",
                 headers=headers,
                 timeout=10,
@@ -145,7 +153,17 @@ def _build_title_value(user_msg: str, bot_msg: str, session_id: str) -> str:
     return title[:100]
 
 
-def save_chat_log_to_notion(
+def _notion_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {NOTION_API_KEY}",
+        "Notion-Version": NOTION_API_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+def _build_chat_log_page(
+    headers: Dict[str, str],
+    transport: Optional[HTTPTransport],
     user_msg: str,
     bot_msg: str,
     session_id: str = "default",
@@ -158,35 +176,17 @@ def save_chat_log_to_notion(
     confidence: Optional[str] = None,
     confidence_score: Optional[float] = None,
     sources_summary: Optional[str] = None,
-) -> Tuple[bool, str]:
-    """会話ログを Notion の Chat Logs DB に1件保存する。
-
-    失敗時は例外を投げず (False, エラーメッセージ) を返す（アプリ動作は継続）。
-    成功時は (True, "") を返す。
-    """
-    logger.info("💾 Notion保存処理開始")
-    logger.info(f"   - NOTION_API_KEY: {'設定済み' if NOTION_API_KEY else '❌ 未設定'}")
-    logger.info(f"   - NOTION_LOG_DB_ID: {'設定済み' if NOTION_LOG_DB_ID else '❌ 未設定'}")
-    
-    if not NOTION_API_KEY or not NOTION_LOG_DB_ID:
-        error_msg = "Notion環境変数が未設定のため保存をスキップします"
-        logger.warning(f"⚠️ {error_msg}")
-        return False, error_msg
-
-    headers = {
-        "Authorization": f"Bearer {NOTION_API_KEY}",
-        "Notion-Version": NOTION_API_VERSION,
-        "Content-Type": "application/json",
-    }
-
-    schema, title_prop = _ensure_log_db_schema(headers)
+    logged_at: Optional[str] = None,
+) -> Dict[str, Any]:
+    """ログDBのスキーマに合わせて pages.create のリクエストボディを組み立てる"""
+    schema, title_prop = _ensure_log_db_schema(headers, transport)
 
     props: Dict[str, Any] = {}
 
     _assign_text_property(props, schema, "user_message", user_msg)
     _assign_text_property(props, schema, "bot_message", bot_msg)
 
-    timestamp_value = datetime.now(timezone.utc).isoformat()
+    timestamp_value = logged_at or datetime.now(timezone.utc).isoformat()
     if "timestamp" in schema:
         if schema.get("timestamp") == "rich_text":
             props["timestamp"] = {"rich_text": _rt(timestamp_value)}
@@ -325,7 +325,49 @@ def save_chat_log_to_notion(
     prop_types = {k: list(v.keys())[0] if isinstance(v, dict) else type(v).__name__ for k, v in props.items()}
     logger.info(f"   - プロパティ型: {prop_types}")
 
-    data = {"parent": {"database_id": NOTION_LOG_DB_ID}, "properties": props}
+    return {"parent": {"database_id": NOTION_LOG_DB_ID}, "properties": props}
+
+
+@notion_scheduler.in_lane(BACKGROUND)
+def save_chat_log_to_notion(
+    user_msg: str,
+    bot_msg: str,
+    session_id: str = "default",
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    urgency: Optional[float] = None,
+    keywords: Optional[List[str]] = None,
+    tool_used: Optional[str] = None,
+    rag_score: Optional[float] = None,
+    confidence: Optional[str] = None,
+    confidence_score: Optional[float] = None,
+    sources_summary: Optional[str] = None,
+    transport: Optional[HTTPTransport] = None,
+    logged_at: Optional[str] = None,
+) -> Tuple[bool, str]:
+    """会話ログを Notion の Chat Logs DB に1件保存する。
+
+    失敗時は例外を投げず (False, エラーメッセージ) を返す（アプリ動作は継続）。
+    成功時は (True, "") を返す。
+    """
+    logger.info("💾 Notion保存処理開始")
+    logger.info(f"   - NOTION_API_KEY: {'設定済み' if NOTION_API_KEY else '❌ 未設定'}")
+    logger.info(f"   - NOTION_LOG_DB_ID: {'設定済み' if NOTION_LOG_DB_ID else '❌ 未設定'}")
+    
+    if not NOTION_API_KEY or not NOTION_LOG_DB_ID:
+        error_msg = "Notion環境変数が未設定のため保存をスキップします"
+        logger.warning(f"⚠️ {error_msg}")
+        return False, error_msg
+
+    headers = _notion_headers()
+    http = transport or http_transport
+    data = _build_chat_log_page(
+        headers, http, user_msg, bot_msg, session_id,
+        category=category, subcategory=subcategory, urgency=urgency, keywords=keywords,
+        tool_used=tool_used, rag_score=rag_score, confidence=confidence,
+        confidence_score=confidence_score, sources_summary=sources_summary, logged_at=logged_at,
+    )
+    props = data["properties"]
 
     last_error_details = ""
 
@@ -347,7 +389,7 @@ def save_chat_log_to_notion(
                         if value.get("rich_text") and isinstance(value["rich_text"], list) and len(value["rich_text"]) > 0:
                             content_preview = value["rich_text"][0].get("text", {}).get("content", "")[:50]
                         logger.info(f"   - {key} (rich_text): {content_preview}...")
-            resp = requests.post(NOTION_PAGES_URL, headers=headers, json=data, timeout=15)
+            resp = http.post(NOTION_PAGES_URL, headers=headers, json=data, timeout=15)
             logger.info(f"   - ステータスコード: {resp.status_code}")
             
             if 200 <= resp.status_code < 300:
@@ -395,3 +437,66 @@ def save_chat_log_to_notion(
     return False, error_msg
 
 
+
+
+@notion_scheduler.in_lane(BACKGROUND)
+def _deliver_chat_log(record: Dict[str, Any]) -> None:
+    """スプールの会話ログを1件 Notion に保存する（送信ワーカーから呼ばれる）
+
+    429・5xx・通信エラーは RetryableWriteError、それ以外の失敗は PermanentWriteError を送出する。
+    """
+    headers = _notion_headers()
+    data = _build_chat_log_page(headers, http_transport, **record)
+    try:
+        resp = http_transport.post(NOTION_PAGES_URL, headers=headers, json=data, timeout=15)
+    except requests.RequestException as e:
+        raise RetryableWriteError(f"リクエストエラー: {e}")
+
+    if 200 <= resp.status_code < 300:
+        logger.info("✅ Notion保存成功 (session_id=%s)", record.get("session_id"))
+        return
+    if resp.status_code == 429:
+        raise RetryableWriteError("レート制限 (429)", retry_after=float(resp.headers.get("Retry-After", 2)))
+    if resp.status_code in (500, 502, 503, 504):
+        raise RetryableWriteError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+    raise PermanentWriteError(f"Notion APIエラー: {resp.status_code} - {resp.text[:500]}")
+
+
+# 会話ログのライトビハインドキュー（チャット応答は Notion の保存完了を待たない）
+chat_log_queue = WriteBehindQueue(
+    "chat-log",
+    _deliver_chat_log,
+    os.getenv("CHAT_LOG_SPOOL_PATH", data_path("chat_log_spool.db")),
+    batch_size=int(os.getenv("CHAT_LOG_QUEUE_BATCH_SIZE", "10")),
+    max_attempts=int(os.getenv("CHAT_LOG_QUEUE_MAX_ATTEMPTS", "8")),
+    min_interval=float(os.getenv("CHAT_LOG_QUEUE_MIN_INTERVAL", "0.5")),
+)
+
+
+def enqueue_chat_log_to_notion(
+    user_msg: str,
+    bot_msg: str,
+    session_id: str = "default",
+    **fields: Any,
+) -> Tuple[bool, str]:
+    """会話ログを保存キュー（ディスク上のスプール）に追加してすぐに戻る。
+
+    引数は save_chat_log_to_notion と同じ（transport を除く）。保存は送信ワーカーが後で行う。
+    キューに積めた場合は (True, "")、積めなかった場合は (False, エラーメッセージ) を返す。
+    """
+    if not NOTION_API_KEY or not NOTION_LOG_DB_ID:
+        error_msg = "Notion環境変数が未設定のため保存をスキップします"
+        logger.warning(f"⚠️ {error_msg}")
+        return False, error_msg
+
+    record = {"user_msg": user_msg, "bot_msg": bot_msg, "session_id": session_id, **fields}
+    # 保存時刻ではなく会話した時刻を記録する
+    record.setdefault("logged_at", datetime.now(timezone.utc).isoformat())
+    try:
+        chat_log_queue.enqueue(record)
+    except Exception as e:
+        error_msg = f"保存キューへの追加に失敗: {e}"
+        logger.error(f"❌ {error_msg}")
+        return False, error_msg
+    chat_log_queue.start()
+    return True, ""
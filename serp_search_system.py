@@ -7,13 +7,14 @@ Google Custom Search APIを使用したリアルタイム情報取得と最新
 
 import os
 import json
-import requests
 import time
 from typing import List, Dict, Optional, Any
 import logging
 from urllib.parse import quote_plus, urlparse
 import re
 
+from utils.http_transport import HTTPTransport, http_transport
+
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,8 +22,9 @@ logger = logging.getLogger(__name__)
 class SERPSearchSystem:
     """SERP検索システムクラス"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[HTTPTransport] = None):
         """SERP検索システムの初期化"""
+        self.http = transport or http_transport
         self.google_api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("SERP_API_KEY")
         self.google_cse_id = os.getenv("GOOGLE_CSE_ID") or os.getenv("GOOGLE_SEARCH_ENGINE_ID")
         self.serp_api_key = os.getenv("SERP_API_KEY")
@@ -100,7 +102,7 @@ class SERPSearchSystem:
                 'num': 1
             }
             
-            response = requests.get(
+            response = self.http.get(
                 'https://serpapi.com/search',
                 params=test_params,
                 timeout=5
@@ -241,7 +243,7 @@ class SERPSearchSystem:
             # if search_type in ['repair_info', 'parts_price']:
             #     params['siteSearch'] = 'amazon.co.jp OR rakuten.co.jp OR yahoo.co.jp OR mercari.com OR auctions.yahoo.co.jp'
             
-            response = requests.get(
+            response = self.http.get(
                 self.search_engines['google_custom']['base_url'],
                 params=params,
                 timeout=10
@@ -285,7 +287,7 @@ class SERPSearchSystem:
             elif search_type == 'repair_info':
                 params['tbs'] = 'qdr:m'  # 過去1ヶ月
             
-            response = requests.get(
+            response = self.http.get(
                 self.search_engines['serp_api']['base_url'],
                 params=params,
                 timeout=15
@@ -34,8 +34,10 @@ try:
     
     # クリーンアップ
     import os
-    if os.path.exists("test_simple.db"):
-        os.remove("test_simple.db")
+    cache_test.close()
+    for path in ("test_simple.db", "test_simple.db-wal", "test_simple.db-shm"):
+        if os.path.exists(path):
+            os.remove(path)
         
 except Exception as e:
     print(f"❌ キャッシュテストエラー: {e}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+統合キャッシュ（CacheNamespace / CacheRegistry）のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from data_access.cache_manager import CacheManager
+from utils.cache_layer import CacheNamespace, CacheRegistry
+
+
+class TestCacheNamespace(unittest.TestCase):
+    """CacheNamespace のテストクラス"""
+
+    def test_ttl_and_counters(self):
+        """期限切れはミスになり、ヒット・ミス・期限切れを数える"""
+        cache = CacheNamespace("t", ttl=60)
+        cache.set("a", {"v": 1})
+        cache.set("b", [1, 2], ttl=0)
+        self.assertEqual(cache.get("a"), {"v": 1})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("missing", "default"), "default")
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expirations"]), (1, 2, 1))
+
+    def test_lru_and_lfu_eviction(self):
+        """LRUは最後の利用が古いもの、LFUはヒット数が少ないものから追い出す"""
+        lru = CacheNamespace("lru", max_entries=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+        self.assertEqual(lru.get_stats()["evictions"], 1)
+
+        lfu = CacheNamespace("lfu", max_entries=2, policy="lfu")
+        lfu.set("a", 1)
+        lfu.set("b", 2)
+        lfu.get("b")
+        lfu.get("b")
+        lfu.get("a")
+        lfu.set("c", 3)
+        self.assertIsNone(lfu.get("a"))
+        self.assertEqual(lfu.get("b"), 2)
+
+    def test_memory_bound(self):
+        """値のおおよそのサイズの合計が上限を超えないように追い出す"""
+        cache = CacheNamespace("bytes", max_bytes=10000)
+        for i in range(20):
+            cache.set(f"k{i}", "x" * 1000)
+        stats = cache.get_stats()
+        self.assertLessEqual(stats["bytes"], 10000)
+        self.assertLess(stats["entries"], 20)
+        self.assertEqual(cache.get("k19"), "x" * 1000)
+
+
+class TestTwoTierCache(unittest.TestCase):
+    """メモリ → SQLite の2段構成のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.disk = CacheManager(os.path.join(self.temp_dir, "cache.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_disk_tier_refills_memory(self):
+        """メモリから追い出された値はディスクから戻し、別プロセス相当の名前空間からも読める"""
+        cache = CacheNamespace("notion", ttl=60, max_entries=1, disk=self.disk)
+        cache.set("a", {"nodes": [1, 2]})
+        cache.set("b", {"nodes": [3]})
+        self.assertEqual(cache.get("a"), {"nodes": [1, 2]})
+        self.assertEqual(cache.get_stats()["disk_hits"], 1)
+
+        other = CacheNamespace("notion", ttl=60, disk=self.disk)
+        self.assertEqual(other.get("b"), {"nodes": [3]})
+        other.clear()
+        self.assertIsNone(cache.disk.get("notion:b"))
+
+    def test_registry_shares_namespaces_and_sweeps(self):
+        """同じ名前の名前空間は共有し、sweep で期限切れを削除する"""
+        registry = CacheRegistry()
+        cache = registry.namespace("api", ttl=60)
+        self.assertIs(registry.namespace("api", ttl=1), cache)
+        cache.set("old", 1, ttl=0)
+        cache.set("new", 2)
+        time.sleep(0.01)
+        self.assertEqual(registry.sweep(), {"api": 1})
+        self.assertEqual(registry.get_stats()["api"]["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
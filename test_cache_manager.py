@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLiteキャッシュ（CacheManager）のテスト
+"""
+
+import gc
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+
+from data_access.cache_manager import CacheManager
+
+
+class TestCacheManager(unittest.TestCase):
+    """CacheManager のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_round_trip_and_formats(self):
+        """JSONと同じ型もそれ以外（datetime・集合）も元の値で戻り、以前のpickle形式も読める"""
+        cache = CacheManager(self.db_path)
+        payload = {"nodes": [{"id": "n1", "title": "バッテリー", "score": 1.5, "end": False}], "count": 1}
+        cache.set("json", payload)
+        cache.set("other", {"at": datetime(2025, 1, 1), "tags": {"a"}})
+        self.assertEqual(cache.get("json"), payload)
+        self.assertEqual(cache.get("other"), {"at": datetime(2025, 1, 1), "tags": {"a"}})
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT INTO cache (key, value, created_at, expires_at, cache_type) VALUES (?, ?, ?, ?, ?)",
+            ("legacy", pickle.dumps([1, 2]), time.time(), time.time() + 60, "default"),
+        )
+        conn.commit()
+        conn.close()
+        self.assertEqual(cache.get("legacy"), [1, 2])
+        cache.close()
+
+    def test_batch_apis_and_expiry(self):
+        """get_many / set_many はまとめて読み書きし、期限切れは返さない"""
+        cache = CacheManager(self.db_path)
+        cache.set_many({f"k{i}": {"i": i} for i in range(1200)}, ttl=60, cache_type="batch")
+        cache.set("old", "x", ttl=-1)
+        found = cache.get_many([f"k{i}" for i in range(0, 1200, 2)] + ["old", "missing"])
+        self.assertEqual(len(found), 600)
+        self.assertEqual(found["k1198"], {"i": 1198})
+        self.assertEqual(cache.clear_expired(), 1)
+        stats = cache.get_stats()
+        self.assertEqual((stats["valid_count"], stats["type_stats"]["batch"]), (1200, 1200))
+        cache.close()
+
+    def test_size_bounded_eviction(self):
+        """件数・合計サイズが上限を超えたら期限が近いものから削除する"""
+        cache = CacheManager(self.db_path, max_bytes=5000, max_entries=8, evict_check_interval=1)
+        for i in range(20):
+            cache.set(f"k{i}", "x" * 1000, ttl=60 + i)
+        stats = cache.get_stats()
+        self.assertLessEqual(stats["bytes"], 5000)
+        self.assertLessEqual(stats["total_count"], 8)
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k19"), "x" * 1000)
+        cache.close()
+
+    def test_threads_share_file_and_sweeper(self):
+        """スレッドごとの接続で同時に読み書きでき、定期削除スレッドが期限切れを消す"""
+        cache = CacheManager(self.db_path)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(200):
+                    cache.set(f"{n}:{i}", [n, i])
+                    assert cache.get(f"{n}:{i}") == [n, i]
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get_stats()["valid_count"], 800)
+
+        cache.set("old", 1, ttl=-1)
+        self.assertTrue(cache.start_sweeper(interval=0.01))
+        deadline = time.time() + 5
+        while cache.get_stats()["total_count"] > 800 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get_stats()["total_count"], 800)
+        cache.close()
+
+    def test_short_lived_threads_do_not_leak_connections(self):
+        """リクエストごとのスレッドが終われば、そのスレッドの接続も解放される"""
+        cache = CacheManager(self.db_path)
+        cache.set("key", "value")
+
+        def request():
+            cache.get("key")
+            cache.get_stats()
+
+        for _ in range(50):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(len(cache._connections), 1)
+        cache.close()
+        self.assertEqual(len(cache._connections), 0)
+
+
+    def test_file_created_on_first_use(self):
+        """作成しただけではファイルを作らず、最初に使ったときに（ディレクトリごと）作る"""
+        path = os.path.join(self.temp_dir, "data", "lazy.db")
+        cache = CacheManager(path)
+        self.assertFalse(os.path.exists(path))
+        cache.set("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
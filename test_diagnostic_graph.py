@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+診断フローのグラフ（DiagnosticGraph）のテスト
+"""
+
+import unittest
+
+from data_access.diagnostic_graph import DiagnosticGraph, get_diagnostic_graph
+
+
+def make_nodes():
+    return [
+        {
+            "id": "p-start", "node_id": "START", "category": "バッテリー", "is_start": True,
+            "question": "エンジンはかかりますか",
+            "routing_config": {"next_nodes_map": [
+                {"id": "p-dead", "label": "かからない", "keywords": ["かからない"]},
+                {"id": "p-ok", "label": "かかる", "keywords": ["かかる"]},
+            ]},
+        },
+        {"id": "p-ac", "node_id": "AC_START", "category": "エアコン", "start": True, "next_raw": "AC_END"},
+        {"id": "p-dead", "node_id": "DEAD", "next_nodes": ["p-ok", "p-missing"]},
+        {"id": "p-ok", "node_id": "OK", "is_end": True, "diagnosis_result": "バッテリー正常"},
+        {"id": "p-ac-end", "node_id": "AC_END", "terminal": True, "result": "フィルター詰まり"},
+    ]
+
+
+class TestDiagnosticGraph(unittest.TestCase):
+    """DiagnosticGraph のテストクラス"""
+
+    def setUp(self):
+        self.graph = DiagnosticGraph(make_nodes())
+
+    def test_lookup_and_start_nodes(self):
+        """IDとノードIDで引け、開始ノードはカテゴリ別（general は最初の開始ノード）"""
+        self.assertEqual(self.graph.get_node("p-dead")["node_id"], "DEAD")
+        self.assertEqual(self.graph.get_node("AC_END")["id"], "p-ac-end")
+        self.assertIsNone(self.graph.get_node("unknown"))
+        self.assertEqual(self.graph.start_node("general")["id"], "p-start")
+        self.assertEqual(self.graph.start_node("エアコン")["id"], "p-ac")
+        self.assertIsNone(self.graph.start_node("水回り"))
+
+    def test_adjacency_and_options(self):
+        """遷移先はノードのIDに解決し、選択肢は routing_config を優先する"""
+        self.assertEqual(self.graph.next_node_ids("p-start"), ("p-dead", "p-ok"))
+        self.assertEqual(self.graph.next_node_ids("p-ac"), ("p-ac-end",))
+        self.assertEqual(self.graph.next_node_ids("DEAD"), ("p-ok",))
+        self.assertEqual(self.graph.options("p-start")[0], {"text": "かからない", "value": "p-dead"})
+        self.assertEqual(
+            self.graph.options("p-dead"),
+            [{"text": "選択肢 1", "value": "p-ok"}, {"text": "選択肢 2", "value": "p-missing"}],
+        )
+        # 返した選択肢を変更してもグラフには影響しない
+        self.graph.options("p-start")[0]["text"] = "changed"
+        self.assertEqual(self.graph.options("p-start")[0]["text"], "かからない")
+
+    def test_terminal_summaries(self):
+        """終端ノードの結果は diagnosis_result、無ければ result から作る"""
+        self.assertTrue(self.graph.is_terminal("p-ok"))
+        self.assertFalse(self.graph.is_terminal("p-start"))
+        self.assertEqual(self.graph.summary("p-ok")["title"], "バッテリー正常")
+        self.assertEqual(self.graph.summary("AC_END")["details"], "フィルター詰まり")
+        self.assertEqual(self.graph.summary("p-start")["title"], "診断結果")
+
+    def test_graph_built_once_per_load(self):
+        """同じノード一覧に対してはグラフを作り直さず、新しく読み込んだ一覧では作り直す"""
+        data = {"nodes": make_nodes()}
+        graph = get_diagnostic_graph(data)
+        self.assertIs(get_diagnostic_graph(data), graph)
+        self.assertIs(get_diagnostic_graph(data["nodes"]), graph)
+        self.assertIsNot(get_diagnostic_graph({"nodes": make_nodes()}), graph)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+埋め込みキャッシュ（utils.embedding_cache）のテスト
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore
+
+
+class _FakeEmbeddings:
+    """呼び出しを記録する埋め込みモデル（OpenAIEmbeddings の代わり）"""
+
+    def __init__(self, model="text-embedding-test"):
+        self.model = model
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[len(text) / 3, 0.1, -1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [len(text) / 3, 0.2, 1.0]
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+    """CachedEmbeddings のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = EmbeddingStore(os.path.join(self.temp_dir, "embeddings.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_repeated_texts_cost_no_api_calls(self):
+        """同じテキストは1回だけ埋め込み、2回目以降はAPIを呼ばない"""
+        base = _FakeEmbeddings()
+        cached = CachedEmbeddings(base, store=self.store)
+        first = cached.embed_documents(["バッテリー", "トイレ", "バッテリー"])
+        self.assertEqual(base.calls, [["バッテリー", "トイレ"]])
+        self.assertEqual(first[0], first[2])
+
+        self.assertEqual(cached.embed_documents(["トイレ", "バッテリー"]), [first[1], first[0]])
+        self.assertEqual(len(base.calls), 1)
+        stats = cached.get_stats()
+        self.assertEqual((stats["embedded"], stats["api_calls"], stats["memory_hits"]), (2, 1, 2))
+
+    def test_file_store_survives_restart(self):
+        """メモリが空でもファイルのストアから返す（再起動後の再構築でAPIを呼ばない）"""
+        CachedEmbeddings(_FakeEmbeddings(), store=self.store).embed_query("水漏れ")
+        self.store.close()
+
+        base = _FakeEmbeddings()
+        restarted = CachedEmbeddings(base, store=EmbeddingStore(self.store.path))
+        vector = restarted.embed_query("水漏れ")
+        self.assertEqual(base.calls, [])
+        self.assertEqual(restarted.get_stats()["store_hits"], 1)
+        self.assertAlmostEqual(vector[0], 1.0, places=6)
+
+    def test_key_includes_model_and_kind_but_not_whitespace(self):
+        """空白の違いは同じキー、モデルや文書/クエリの違いは別のキー"""
+        base = _FakeEmbeddings()
+        cached = CachedEmbeddings(base, store=self.store)
+        cached.embed_documents(["エアコン  が\n冷えない"])
+        cached.embed_documents([" エアコン が 冷えない "])
+        self.assertEqual(len(base.calls), 1)
+
+        cached.embed_query("エアコン が 冷えない")
+        other = _FakeEmbeddings(model="text-embedding-other")
+        CachedEmbeddings(other, store=self.store).embed_documents(["エアコン が 冷えない"])
+        self.assertEqual((len(base.calls), len(other.calls)), (2, 1))
+
+    def test_results_are_float32_and_attributes_delegate(self):
+        """APIから取得したベクトルもキャッシュと同じ float32 に丸め、他の属性は元のモデルを参照する"""
+        cached = CachedEmbeddings(_FakeEmbeddings(), store=self.store)
+        fresh = cached.embed_documents(["abcd"])[0]
+        self.assertNotEqual(fresh[0], 4 / 3)
+        self.assertAlmostEqual(fresh[0], 4 / 3, places=6)
+        self.assertEqual(CachedEmbeddings(_FakeEmbeddings(), store=self.store).embed_documents(["abcd"])[0], fresh)
+        self.assertEqual(cached.model, "text-embedding-test")
+
+    def test_queries_batched_for_openai_style_models(self):
+        """embed_query が embed_documents と同じモデルは、複数のクエリを1回で埋め込む"""
+        class OpenAIEmbeddings(_FakeEmbeddings):
+            pass
+
+        openai = OpenAIEmbeddings()
+        CachedEmbeddings(openai, store=self.store).embed_queries(["冷蔵庫", "冷えない", "冷蔵庫"])
+        self.assertEqual(openai.calls, [["冷蔵庫", "冷えない"]])
+
+        other = _FakeEmbeddings(model="text-embedding-other")
+        CachedEmbeddings(other, store=self.store).embed_queries(["冷蔵庫", "冷えない"])
+        self.assertEqual(other.calls, [["冷蔵庫"], ["冷えない"]])
+
+    def test_short_lived_threads_do_not_leak_connections(self):
+        """リクエストごとのスレッド（executor）が終われば、そのスレッドの接続も解放される"""
+        cached = CachedEmbeddings(_FakeEmbeddings(), store=self.store)
+        cached.embed_query("バッテリー")
+
+        for i in range(50):
+            thread = threading.Thread(target=cached.embed_query, args=(f"質問{i}",))
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(len(self.store._connections), 1)
+
+    def test_file_created_on_first_use(self):
+        """作成しただけではファイルを作らず、最初に使ったときに（ディレクトリごと）作る"""
+        path = os.path.join(self.temp_dir, "data", "lazy.db")
+        store = EmbeddingStore(path)
+        self.assertFalse(os.path.exists(path))
+        CachedEmbeddings(_FakeEmbeddings(), store=store).embed_query("水漏れ")
+        self.assertEqual(store.get_stats()["entries"], 1)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
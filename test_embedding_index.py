@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+埋め込みインデックスの差分更新（utils.embedding_index）のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.embedding_index import EmbeddingManifest, manifest_path, sync_embeddings
+from utils.text_chunker import chunk_documents
+
+
+class _Doc:
+    """langchain の Document と同じ形の最小のドキュメント"""
+
+    def __init__(self, page_content, metadata=None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+
+class _FakeChroma:
+    """埋め込み（add_documents）の回数と中身を記録する Chroma の代わり"""
+
+    def __init__(self, ids=(), fail_after=None):
+        self.store = {chunk_id: None for chunk_id in ids}
+        self.embedded = []
+        self.fail_after = fail_after
+
+    def get(self, include=None):
+        return {"ids": list(self.store)}
+
+    def add_documents(self, documents, ids):
+        if self.fail_after is not None and len(self.embedded) >= self.fail_after:
+            raise RuntimeError("rate limited")
+        self.embedded.extend(ids)
+        self.store.update((chunk_id, doc) for chunk_id, doc in zip(ids, documents))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.store.pop(chunk_id, None)
+
+
+def _corpus(toilet="トイレの水漏れ", battery="バッテリーが上がる", with_notion=True):
+    docs = [
+        _Doc(f"## 【Case T-1】{toilet}\n本文", {"url": "トイレ.txt", "title": "トイレ", "source_type": "text_file", "source_version": 1.0}),
+        _Doc(f"## 【Case B-1】{battery}\n本文", {"url": "バッテリー.txt", "title": "バッテリー", "source_type": "text_file", "source_version": 1.0}),
+    ]
+    if with_notion:
+        docs.append(_Doc("ケースID: C-1", {"notion_id": "page-1", "source_type": "notion_repair_case", "source_version": "2024-01-01T00:00:00.000Z"}))
+    return chunk_documents(docs)
+
+
+class TestSyncEmbeddings(unittest.TestCase):
+    """sync_embeddings のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = manifest_path(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_rebuild_embeds_only_changed_chunks(self):
+        """2回目は変わったファイルの断片だけを埋め込み、古い断片を削除する"""
+        db = _FakeChroma()
+        first = sync_embeddings(db, _corpus(), EmbeddingManifest(self.path))
+        self.assertEqual(first["added"], len(db.store))
+
+        db.embedded = []
+        unchanged = sync_embeddings(db, _corpus(), EmbeddingManifest(self.path))
+        self.assertEqual((unchanged["added"], unchanged["deleted"], db.embedded), (0, 0, []))
+
+        changed = _corpus(toilet="トイレが詰まる")
+        changed[0].metadata["source_version"] = 2.0
+        stats = sync_embeddings(db, changed, EmbeddingManifest(self.path))
+        self.assertEqual((stats["added"], stats["deleted"], stats["changed_sources"]), (1, 1, 1))
+        self.assertEqual(set(db.store), {doc.metadata["chunk_id"] for doc in changed})
+
+    def test_missing_sources_are_removed_unless_kept(self):
+        """無くなったソースの断片は削除するが、指定した種別は1件も読めなかった場合に残す"""
+        db = _FakeChroma()
+        sync_embeddings(db, _corpus(), EmbeddingManifest(self.path))
+        notion_ids = {chunk_id for chunk_id in db.store if chunk_id.startswith("page-1#")}
+
+        stats = sync_embeddings(
+            db, _corpus(with_notion=False), EmbeddingManifest(self.path),
+            keep_missing_types=("notion_repair_case",),
+        )
+        self.assertEqual(stats["deleted"], 0)
+        self.assertTrue(notion_ids <= set(db.store))
+
+        stats = sync_embeddings(db, _corpus()[:1], EmbeddingManifest(self.path))
+        self.assertEqual(set(db.store), {_corpus()[0].metadata["chunk_id"]})
+
+    def test_without_manifest_reconciles_with_collection(self):
+        """マニフェストが無い場合は既存の中身と突き合わせ、以前のランダムなIDは削除する"""
+        corpus = _corpus()
+        db = _FakeChroma(ids=[corpus[0].metadata["chunk_id"], "legacy-uuid"])
+        stats = sync_embeddings(db, corpus, EmbeddingManifest(self.path))
+        self.assertEqual((stats["added"], stats["deleted"]), (len(corpus) - 1, 1))
+        self.assertNotIn(corpus[0].metadata["chunk_id"], db.embedded)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_partial_failure_resumes_where_it_stopped(self):
+        """途中で埋め込みに失敗しても、次回は残りの断片だけを埋め込む"""
+        corpus = _corpus()
+        db = _FakeChroma(fail_after=1)
+        with self.assertRaises(RuntimeError):
+            sync_embeddings(db, corpus, EmbeddingManifest(self.path), batch_size=1)
+
+        db.fail_after = None
+        db.embedded = []
+        stats = sync_embeddings(db, corpus, EmbeddingManifest(self.path), batch_size=1)
+        self.assertEqual(stats["added"], len(corpus) - 1)
+        self.assertEqual(set(db.store), {doc.metadata["chunk_id"] for doc in corpus})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+np.memmap のベクトルインデックス（utils.flat_vector_index）のテスト
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from langchain_core.documents import Document
+
+from utils.embedding_index import EmbeddingManifest, manifest_path, sync_embeddings
+from utils.flat_vector_index import FlatVectorIndex
+from utils.text_chunker import chunk_documents
+
+
+class _KeywordEmbeddings:
+    """キーワードの有無を次元にした決定的な埋め込み"""
+
+    KEYWORDS = ["バッテリー", "トイレ", "水漏れ", "エアコン"]
+
+    def _vector(self, text):
+        return [float(text.count(keyword)) + 0.01 for keyword in self.KEYWORDS]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class TestFlatVectorIndex(unittest.TestCase):
+    """FlatVectorIndex のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.indexes = []
+        self.index = self._open()
+        self.index.add_documents(
+            [
+                Document(page_content="バッテリーが上がる", metadata={"source_type": "text_file"}),
+                Document(page_content="トイレの水漏れ", metadata={"source_type": "text_file"}),
+                Document(page_content="エアコンの水漏れ", metadata={"source_type": "blog"}),
+            ],
+            ids=["battery", "toilet", "aircon"],
+        )
+
+    def _open(self, **kwargs):
+        index = FlatVectorIndex(self.temp_dir, _KeywordEmbeddings(), **kwargs)
+        self.indexes.append(index)
+        return index
+
+    def tearDown(self):
+        for index in self.indexes:
+            index.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_search_ranks_by_cosine_and_filters_metadata(self):
+        """内積の大きい順に上位k件を返し、メタデータで絞り込める"""
+        docs = self.index.similarity_search("バッテリー", k=1)
+        self.assertEqual([doc.page_content for doc in docs], ["バッテリーが上がる"])
+
+        hits = self.index.similarity_search_with_relevance_scores("水漏れ", k=2, filter={"source_type": "blog"})
+        self.assertEqual([doc.page_content for doc, _ in hits], ["エアコンの水漏れ"])
+        distance = self.index.similarity_search_with_score("トイレ 水漏れ", k=1)[0][1]
+        self.assertLess(distance, 0.1)
+
+    def test_upsert_delete_and_reuse_rows(self):
+        """同じIDは上書きし、削除した行は次の追加で使い回す"""
+        self.index.add_texts(["トイレが詰まる"], [{"source_type": "text_file"}], ids=["toilet"])
+        self.index.delete(ids=["battery"])
+        self.assertEqual(sorted(self.index.get(include=[])["ids"]), ["aircon", "toilet"])
+        self.assertEqual(self.index.get(ids=["toilet"])["documents"], ["トイレが詰まる"])
+        self.assertNotIn("バッテリーが上がる", [doc.page_content for doc in self.index.similarity_search("バッテリー")])
+
+        self.index.add_texts(["バッテリー交換"], ids=["battery-2"])
+        self.assertEqual(self.index.get_stats()["entries"], 3)
+        self.assertEqual(len(self.index._ids), 3)
+
+    def test_reopen_and_other_process_writes(self):
+        """開き直しても同じ結果になり、別のインスタンス（別ワーカー相当）の書き込みも検索時に取り込む"""
+        reader = self._open()
+        self.assertEqual(reader.similarity_search("トイレ", k=1)[0].page_content, "トイレの水漏れ")
+
+        self.index.add_texts(["バッテリーとバッテリー充電器"], ids=["charger"])
+        reader._checked_at = 0
+        contents = [doc.page_content for doc in reader.similarity_search("バッテリー", k=4)]
+        self.assertIn("バッテリーとバッテリー充電器", contents)
+        self.assertEqual(len(contents), 4)
+
+    def test_batch_search_and_incremental_sync(self):
+        """複数のクエリを1回で検索でき、差分更新（sync_embeddings）のストアとして使える"""
+        ranked = self.index.batch_search_with_relevance_scores(
+            _KeywordEmbeddings().embed_documents(["バッテリー", "エアコン"]), k=1
+        )
+        self.assertEqual([row[0][0].page_content for row in ranked], ["バッテリーが上がる", "エアコンの水漏れ"])
+
+        index = self._open(collection_name="rag")
+        chunks = chunk_documents([Document(page_content="## 【Case T-1】トイレの水漏れ\n本文", metadata={"url": "トイレ.txt"})])
+        path = manifest_path(self.temp_dir, "rag")
+        self.assertEqual(sync_embeddings(index, chunks, EmbeddingManifest(path))["added"], 1)
+        self.assertEqual(sync_embeddings(index, chunks, EmbeddingManifest(path))["added"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
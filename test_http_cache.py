@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+条件付きGET（conditional_get / DatasetVersions）のテスト
+"""
+
+import unittest
+
+from flask import Flask, jsonify
+
+from utils.http_cache import DatasetVersions, conditional_get
+
+
+class TestDatasetVersions(unittest.TestCase):
+    """DatasetVersions のテストクラス"""
+
+    def test_hash_once_per_object_and_stable_for_same_content(self):
+        """同じオブジェクトは1回だけハッシュし、読み込み直しても内容が同じなら同じ版数"""
+        versions = DatasetVersions()
+        nodes = {"nodes": [{"id": "n1", "title": "バッテリー"}]}
+        first = versions.version(nodes)
+        self.assertEqual(versions.version(nodes), first)
+        self.assertEqual(versions.version({"nodes": [{"title": "バッテリー", "id": "n1"}]}), first)
+        self.assertNotEqual(versions.version({"nodes": []})[0], first[0])
+        self.assertEqual(versions.get_stats()["hashes"], 3)
+
+
+class TestConditionalGet(unittest.TestCase):
+    """conditional_get のテストクラス"""
+
+    def setUp(self):
+        self.version = ("v1", 1700000000.0)
+        self.calls = []
+        app = Flask(__name__)
+
+        @app.route("/versioned")
+        @conditional_get(lambda: self.version)
+        def versioned():
+            self.calls.append("versioned")
+            return jsonify([{"id": "n1"}])
+
+        @app.route("/unversioned")
+        @conditional_get(lambda: None, max_age=30)
+        def unversioned():
+            self.calls.append("unversioned")
+            return jsonify({"items": []})
+
+        @app.route("/failing")
+        @conditional_get(lambda: self.version)
+        def failing():
+            return jsonify({"error": "unavailable"}), 503
+
+        self.client = app.test_client()
+
+    def test_not_modified_skips_view(self):
+        """ETag が一致すればビューを呼ばずに 304、版数が変われば 200"""
+        first = self.client.get("/versioned?category=battery")
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn("Last-Modified", first.headers)
+        self.assertIn("must-revalidate", first.headers["Cache-Control"])
+
+        again = self.client.get("/versioned?category=battery", headers={"If-None-Match": etag})
+        self.assertEqual((again.status_code, again.data), (304, b""))
+        self.assertEqual(self.calls, ["versioned"])
+
+        other_query = self.client.get("/versioned?category=aircon", headers={"If-None-Match": etag})
+        self.assertEqual(other_query.status_code, 200)
+
+        self.version = ("v2", 1700000100.0)
+        changed = self.client.get("/versioned?category=battery", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_body_hash_fallback_and_errors(self):
+        """版数が無い場合は本文のハッシュで 304、エラー応答には ETag を付けない"""
+        first = self.client.get("/unversioned")
+        self.assertIn("max-age=30", first.headers["Cache-Control"])
+        again = self.client.get("/unversioned", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+        failed = self.client.get("/failing")
+        self.assertEqual(failed.status_code, 503)
+        self.assertNotIn("ETag", failed.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ID採番シーケンス（IDSequenceAllocator）のテスト
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from data_access.id_sequence import IDSequenceAllocator, max_sequence_number
+
+
+class TestIDSequenceAllocator(unittest.TestCase):
+    """IDSequenceAllocator のテストクラス"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "id_sequences.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_allocation_is_unique(self):
+        """複数スレッドから同時に採番しても番号は重複しない"""
+        allocator = IDSequenceAllocator(self.db_path)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            values = [allocator.next_value("DEAL-20241103-") for _ in range(25)]
+            with lock:
+                results.extend(values)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(results), list(range(1, 201)))
+        self.assertEqual(allocator.peek("DEAL-20241103-"), 200)
+
+    def test_seed_once_and_never_lowers(self):
+        """初期値はプロセスで1回だけ読み、ローカルの値より小さければ無視する"""
+        allocator = IDSequenceAllocator(self.db_path)
+        calls = []
+
+        def seed():
+            calls.append(True)
+            return 41
+
+        self.assertEqual(allocator.next_value("SHOP-", seed=seed), 42)
+        self.assertEqual(allocator.next_value("SHOP-", seed=seed), 43)
+        self.assertEqual(len(calls), 1)
+
+        # 再起動後（同じDBファイル）にNotion側が古い値を返しても番号は戻らない
+        restarted = IDSequenceAllocator(self.db_path)
+        self.assertEqual(restarted.next_value("SHOP-", seed=lambda: 10), 44)
+
+    def test_seed_error_is_retried(self):
+        """初期化に失敗した場合は例外を送出し、次回の採番で再度初期化する"""
+        allocator = IDSequenceAllocator(self.db_path)
+
+        def failing_seed():
+            raise ConnectionError("Notion unavailable")
+
+        with self.assertRaises(ConnectionError):
+            allocator.next_value("FACTORY-", seed=failing_seed)
+        self.assertEqual(allocator.next_value("FACTORY-", seed=lambda: 7), 8)
+        self.assertEqual(allocator.get_stats()["seed_errors"], 1)
+
+    def test_block_reservation(self):
+        """ブロック予約では連続した番号をまとめて確保し、他の予約と重ならない"""
+        allocator = IDSequenceAllocator(self.db_path, block_size=10)
+        self.assertEqual(list(allocator.reserve("BUILDER-", 3)), [1, 2, 3])
+        self.assertEqual([allocator.next_value("BUILDER-") for _ in range(3)], [4, 5, 6])
+        self.assertEqual(allocator.peek("BUILDER-"), 13)
+
+        other = IDSequenceAllocator(self.db_path, block_size=10)
+        self.assertEqual(other.next_value("BUILDER-"), 14)
+
+    def test_max_sequence_number(self):
+        """prefix に一致するIDだけから最大連番を取り出す"""
+        ids = ["REVIEW-20241103-002", "REVIEW-20241103-010", "REVIEW-20241102-099", "REVIEW-20241103-x", None]
+        self.assertEqual(max_sequence_number(ids, "REVIEW-20241103-"), 10)
+        self.assertEqual(max_sequence_number([], "SHOP-"), 0)
+
+    def test_file_created_on_first_use(self):
+        """作成しただけではファイルを作らず、最初の採番で（ディレクトリごと）作る"""
+        path = os.path.join(self.tmpdir.name, "data", "lazy.db")
+        allocator = IDSequenceAllocator(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(allocator.next_value("SHOP-"), 1)
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
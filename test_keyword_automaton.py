@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+routing_config のキーワード照合（KeywordAutomaton / RoutingMatcher）のテスト
+"""
+
+import unittest
+
+from data_access.diagnostic_graph import DiagnosticGraph
+from data_access.keyword_automaton import KeywordAutomaton, RoutingMatcher
+
+
+ROUTING_CONFIG = {
+    "threshold": 1.5,
+    "safety_words": ["火災", "危険"],
+    "next_nodes_map": [
+        {"id": "n2", "label": "バッテリー上がり", "keywords": ["上がらない", "始動しない"], "weight": 2.0},
+        {"id": "n3", "label": "液不足", "keywords": ["液", "不足"], "weight": 1.5},
+        {"id": "n4", "label": "安全確認", "keywords": ["危険"], "weight": 3.0, "safety": True},
+    ],
+}
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    """KeywordAutomaton のテストクラス"""
+
+    def test_overlapping_patterns(self):
+        """重なり・包含するパターンも1回の走査ですべて見つかる"""
+        automaton = KeywordAutomaton(["he", "she", "his", "hers", "ハーネス", "ネス"])
+        self.assertEqual(automaton.find("USHERS"), {"he", "she", "hers"})
+        self.assertEqual(automaton.find("配線ハーネス"), {"ハーネス", "ネス"})
+        self.assertEqual(automaton.find(""), frozenset())
+
+    def test_matches_naive_substring_search(self):
+        """結果は単純な部分文字列検索と一致する"""
+        patterns = ["aab", "ab", "b", "bab", "abba", "ba"]
+        automaton = KeywordAutomaton(patterns)
+        for text in ["abababba", "aaab", "bbbb", "xyz", "AbBa"]:
+            expected = {p for p in patterns if p in text.lower()}
+            self.assertEqual(automaton.find(text), expected, text)
+
+
+class TestRoutingMatcher(unittest.TestCase):
+    """RoutingMatcher のテストクラス"""
+
+    def setUp(self):
+        self.matcher = RoutingMatcher(ROUTING_CONFIG)
+
+    def test_hits_pairs_and_safety_in_one_pass(self):
+        """候補ごとのヒット・ペア加点・安全ワードを1回の照合で求める"""
+        match = self.matcher.match("バッテリーが上がらない、液も不足、火災が心配")
+        self.assertEqual(match.candidate_hits, (["上がらない"], ["液", "不足"], []))
+        self.assertEqual(match.pair_count, 1)  # バッテリー × 上がらない
+        self.assertEqual(match.safety_word, "火災")
+        scores = self.matcher.score(match)
+        self.assertAlmostEqual(scores[0]["score"], 2.3)
+        self.assertAlmostEqual(scores[1]["score"], 3.3)
+        self.assertAlmostEqual(scores[2]["score"], 0.3)
+
+    def test_batch_and_precompiled_in_graph(self):
+        """グラフはノードごとに照合器を作っておき、複数回答をまとめて照合できる"""
+        graph = DiagnosticGraph([{"id": "n1", "routing_config": ROUTING_CONFIG}, {"id": "n2"}])
+        matcher = graph.matcher("n1")
+        self.assertIs(graph.matcher("n1"), matcher)
+        self.assertIsNone(graph.matcher("n2"))
+        matches = matcher.match_many(["始動しない", "危険です", "何かおかしい"])
+        self.assertEqual([m.candidate_hits[0] for m in matches], [["始動しない"], [], []])
+        self.assertEqual([m.safety_word for m in matches], [None, "危険", None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+マネージャーレジストリ（ManagerRegistry）のテスト
+"""
+
+import threading
+import unittest
+
+from utils.manager_registry import ManagerRegistry
+
+
+class CountingFactory:
+    """呼ばれた回数を数えるファクトリー"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return object()
+
+
+class TestManagerRegistry(unittest.TestCase):
+    """ManagerRegistry のテストクラス"""
+
+    def test_instance_is_built_once(self):
+        """並行アクセスでもインスタンスは1回だけ生成される"""
+        registry = ManagerRegistry()
+        factory = CountingFactory()
+        registry.register("deal", factory)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get("deal"))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(factory.calls, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_failure_is_remembered_until_retry_window(self):
+        """生成エラーは同じ例外を再送出し、一定時間後に作り直す"""
+        registry = ManagerRegistry(retry_after_error=60)
+        factory = CountingFactory(error=ValueError("NOTION_DEAL_DB_IDが設定されていません"))
+        registry.register("deal", factory)
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                registry.get("deal")
+        self.assertEqual(factory.calls, 1)
+        self.assertIsNone(registry.get_optional("deal"))
+
+        registry.retry_after_error = 0
+        factory.error = None
+        self.assertIsNotNone(registry.get("deal"))
+        self.assertEqual(factory.calls, 2)
+
+    def test_reload_rebuilds_and_runs_hooks(self):
+        """reload() でインスタンスを破棄し、フックを呼ぶ"""
+        registry = ManagerRegistry()
+        registry.register("deal", CountingFactory())
+        reloaded = []
+        registry.on_reload(lambda r: reloaded.append(True))
+
+        first = registry.get("deal")
+        registry.reload()
+        self.assertIsNot(registry.get("deal"), first)
+        self.assertEqual(reloaded, [True])
+        self.assertEqual(registry.get_stats()["reloads"], 1)
+
+    def test_warm_up_builds_eager_managers(self):
+        """warm_up() は eager のマネージャーだけ生成し、失敗しても続行する"""
+        registry = ManagerRegistry()
+        lazy = CountingFactory()
+        registry.register("deal", CountingFactory())
+        registry.register("review", CountingFactory(error=ValueError("no key")))
+        registry.register("cost_estimation", lazy, eager=False)
+        warmed = []
+        registry.on_warmup(lambda r: warmed.append(True))
+
+        self.assertEqual(registry.warm_up(), {"deal": True, "review": False})
+        self.assertEqual(lazy.calls, 0)
+        self.assertEqual(warmed, [True])
+        self.assertEqual(registry.get_stats()["ready"], ["deal"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionキーワード検索のクエリプランナーのテスト
+"""
+
+import unittest
+
+from data_access.notion_query_planner import merge_results, plan_keyword_search
+from utils.notion_search_enhanced import NotionSearchEnhanced
+
+
+SCHEMA = {"タイトル": "title", "内容": "rich_text", "症状": "rich_text", "カテゴリ": "select"}
+
+
+def make_page(page_id, title="", content=""):
+    return {
+        "id": page_id,
+        "properties": {
+            "タイトル": {"type": "title", "title": [{"plain_text": title}]},
+            "内容": {"type": "rich_text", "rich_text": [{"plain_text": content}]},
+        },
+    }
+
+
+class FakeDatabases:
+    """databases.query / retrieve の呼び出しを記録する"""
+
+    def __init__(self, pages, fail_compound=False):
+        self.pages = pages
+        self.fail_compound = fail_compound
+        self.queries = []
+
+    def retrieve(self, database_id):
+        return {"properties": {name: {"type": type_} for name, type_ in SCHEMA.items()}}
+
+    def query(self, database_id, filter, page_size=100, start_cursor=None):
+        self.queries.append(filter)
+        if self.fail_compound and "or" in filter:
+            raise ValueError("validation_error")
+        conditions = filter.get("or", [filter])
+        results = []
+        for page in self.pages:
+            for condition in conditions:
+                prop = page["properties"].get(condition["property"], {})
+                text = "".join(t["plain_text"] for t in prop.get(prop.get("type"), []) or [])
+                keyword = (condition.get("title") or condition.get("rich_text"))["contains"]
+                if keyword.lower() in text.lower():
+                    results.append(page)
+                    break
+        return {"results": results, "has_more": False, "next_cursor": None}
+
+
+class FakeClient:
+    def __init__(self, databases):
+        self.databases = databases
+
+
+class TestQueryPlanner(unittest.TestCase):
+    """plan_keyword_search / merge_results のテストクラス"""
+
+    def test_single_or_filter_per_database(self):
+        """キーワード×プロパティの条件は1つの or フィルターにまとめ、スキーマに無いプロパティは除く"""
+        chunks = plan_keyword_search(["水漏れ", "ポンプ", "水漏れ"], ["タイトル", "内容", "解決方法", "カテゴリ"], SCHEMA)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(chunks[0].filter["or"]), 4)
+        self.assertEqual(chunks[0].filter["or"][0], {"property": "タイトル", "title": {"contains": "水漏れ"}})
+
+    def test_split_only_over_limit(self):
+        """条件数が上限を超える場合のみクエリを分割する"""
+        keywords = [f"kw{i}" for i in range(7)]
+        chunks = plan_keyword_search(keywords, ["タイトル", "内容"], SCHEMA, max_conditions=5)
+        self.assertEqual([len(c.conditions) for c in chunks], [5, 5, 4])
+        single = plan_keyword_search(["kw"], ["タイトル"], SCHEMA)
+        self.assertEqual(single[0].filter, {"property": "タイトル", "title": {"contains": "kw"}})
+
+    def test_merge_dedupes_and_annotates(self):
+        """結果は重複排除し、一致したキーワード・プロパティをローカルで判定して条件順に並べる"""
+        chunk = plan_keyword_search(["ポンプ", "水漏れ"], ["タイトル", "内容"], SCHEMA)[0]
+        pages = [make_page("a", content="水漏れ対策"), make_page("b", title="ポンプ交換"), make_page("b", title="ポンプ交換")]
+        merged = merge_results([(chunk.conditions, pages)])
+        self.assertEqual([p["id"] for p in merged], ["b", "a"])
+        self.assertEqual((merged[0]["matched_keyword"], merged[0]["matched_property"]), ("ポンプ", "タイトル"))
+        self.assertEqual((merged[1]["matched_keyword"], merged[1]["matched_property"]), ("水漏れ", "内容"))
+
+
+class TestSearchWithMultipleKeywords(unittest.TestCase):
+    """NotionSearchEnhanced.search_with_multiple_keywords のテストクラス"""
+
+    def setUp(self):
+        self.pages = [make_page("a", title="FFヒーター点火不良"), make_page("b", content="バッテリー上がり")]
+
+    def test_one_query_per_database(self):
+        """5キーワードでもクエリは1回"""
+        databases = FakeDatabases(self.pages)
+        search = NotionSearchEnhanced(FakeClient(databases))
+        results = search.search_with_multiple_keywords("db", ["FFヒーター", "点火", "バッテリー", "電圧", "異音"])
+        self.assertEqual(len(databases.queries), 1)
+        self.assertEqual(sorted(p["id"] for p in results), ["a", "b"])
+
+    def test_compound_failure_falls_back_to_single_conditions(self):
+        """複合フィルターが失敗した場合は条件ごとに検索し直す"""
+        databases = FakeDatabases(self.pages, fail_compound=True)
+        search = NotionSearchEnhanced(FakeClient(databases))
+        results = search.search_with_multiple_keywords("db", ["バッテリー"])
+        self.assertEqual(len(databases.queries), 4)
+        self.assertEqual([p["id"] for p in results], ["b"])
+        self.assertEqual(results[0]["matched_property"], "内容")
+
+
+if __name__ == "__main__":
+    unittest.main()
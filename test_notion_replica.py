@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionローカルレプリカ（NotionReplica）のテスト
+"""
+
+import os
+import tempfile
+import unittest
+
+from data_access.notion_replica import NotionReplica
+
+
+def make_page(page_id, title, edited, status=None):
+    """レプリカに渡すNotionページ形式の辞書を作成"""
+    props = {"商談ID": {"type": "title", "title": [{"plain_text": title}]}}
+    if status:
+        props["紹介ステータス"] = {"type": "select", "select": {"name": status}}
+    return {
+        "id": page_id,
+        "created_time": edited,
+        "last_edited_time": edited,
+        "archived": False,
+        "properties": props,
+    }
+
+
+class FakeNotion:
+    """iter_database_pages の呼び出しを記録するスタブ"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def iter_database_pages(self, database_id, use_replica=True, **query):
+        self.queries.append(query)
+        return iter(list(self.pages))
+
+
+class TestNotionReplica(unittest.TestCase):
+    """NotionReplica のテストクラス"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.replica = NotionReplica(os.path.join(self.tmpdir.name, "replica.db"))
+        self.replica.enabled = True
+        self.replica.register("deals", "abcd-1234")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_unsynced_replica_returns_none(self):
+        """未同期のレプリカは None を返し、呼び出し側にNotionを読ませる"""
+        self.assertIsNone(self.replica.read_pages("deals"))
+        self.assertIsNone(self.replica.find_pages("deals", title="DEAL-1"))
+
+    def test_full_then_incremental_sync(self):
+        """初回は全件、2回目以降は last_edited_time の on_or_after で差分同期"""
+        notion = FakeNotion([
+            make_page("p-1", "DEAL-1", "2025-01-01T00:00:00.000Z", "pending"),
+            make_page("p-2", "DEAL-2", "2025-01-02T00:00:00.000Z", "completed"),
+        ])
+        self.assertEqual(self.replica.sync_table("deals", notion), 2)
+        self.assertNotIn("filter", notion.queries[0])
+
+        self.replica.sync_table("deals", notion)
+        self.assertEqual(
+            notion.queries[1]["filter"]["last_edited_time"]["on_or_after"],
+            "2025-01-02T00:00:00.000Z",
+        )
+
+        self.assertEqual(len(self.replica.read_pages("deals")), 2)
+        found = self.replica.find_pages("deals", status="completed")
+        self.assertEqual([p["id"] for p in found], ["p-2"])
+
+    def test_full_sync_removes_deleted_pages(self):
+        """全件同期でNotionから消えたページを削除"""
+        notion = FakeNotion([
+            make_page("p-1", "DEAL-1", "2025-01-01T00:00:00.000Z"),
+            make_page("p-2", "DEAL-2", "2025-01-02T00:00:00.000Z"),
+        ])
+        self.replica.sync_table("deals", notion)
+        notion.pages = notion.pages[:1]
+        self.replica.sync_table("deals", notion, full=True)
+        self.assertEqual([p["id"] for p in self.replica.read_pages("deals")], ["p-1"])
+
+    def test_staleness_bound_and_write_through(self):
+        """許容範囲を超えたら None、書き込んだページはすぐ読める"""
+        self.replica.sync_table("deals", FakeNotion([]))
+        self.replica.upsert_pages("deals", [make_page("p-3", "DEAL-3", "2025-01-03T00:00:00.000Z")])
+        self.assertEqual(len(self.replica.find_pages("deals", title="DEAL-3")), 1)
+        self.assertIsNone(self.replica.read_pages("deals", max_staleness=-1))
+
+    def test_version_changes_only_with_content(self):
+        """版数は内容が変わった同期・書き込みでだけ上がり、古いレプリカでは None"""
+        notion = FakeNotion([make_page("p-1", "DEAL-1", "2025-01-01T00:00:00.000Z")])
+        self.assertIsNone(self.replica.version("deals"))
+        self.replica.sync_table("deals", notion)
+        first = self.replica.version("deals")
+        self.replica.sync_table("deals", notion)
+        self.assertEqual(self.replica.version("deals"), first)
+
+        self.replica.upsert_pages("deals", [make_page("p-1", "DEAL-1", "2025-01-02T00:00:00.000Z")])
+        self.assertEqual(self.replica.version("deals")[0], first[0] + 1)
+        self.assertIsNone(self.replica.version("deals", max_staleness=-1))
+
+    def test_file_created_on_first_use(self):
+        """作成しただけではファイルを作らず、最初に使ったときに（ディレクトリごと）作る"""
+        path = os.path.join(self.tmpdir.name, "data", "lazy.db")
+        replica = NotionReplica(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(replica.get_stats()["deals"]["rows"], 0)
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
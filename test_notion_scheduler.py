@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionリクエストスケジューラー（NotionScheduler）のテスト
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from data_access.notion_scheduler import BACKGROUND, INTERACTIVE, NotionScheduler
+
+
+class FakeAPIError(Exception):
+    """notion-client の APIResponseError 相当（status と headers を持つ）"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class TestNotionScheduler(unittest.TestCase):
+    """NotionScheduler のテストクラス"""
+
+    def test_interactive_lane_goes_first(self):
+        """トークン待ちの間は上位レーンが先に送信される"""
+        scheduler = NotionScheduler(rate=20, burst=1)
+        scheduler.acquire(BACKGROUND)  # バケットを空にする
+        order = []
+
+        def worker(lane):
+            scheduler.acquire(lane)
+            order.append(lane)
+
+        background = threading.Thread(target=worker, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.005)
+        interactive = threading.Thread(target=worker, args=(INTERACTIVE,))
+        interactive.start()
+        background.join(2)
+        interactive.join(2)
+        self.assertEqual(order[0], INTERACTIVE)
+
+    def test_rate_limited_call_honors_retry_after(self):
+        """429 は Retry-After だけ停止して再試行し、回数を記録する"""
+        scheduler = NotionScheduler(rate=100, burst=5, base_backoff=0.01)
+        calls = []
+
+        def flaky():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise FakeAPIError(429, {"Retry-After": "0.05"})
+            return {"ok": True}
+
+        self.assertEqual(scheduler.call(flaky), {"ok": True})
+        self.assertGreaterEqual(calls[1] - calls[0], 0.05)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["rate_limited"], 1)
+        self.assertEqual(stats["lanes"][INTERACTIVE]["acquired"], 2)
+
+    def test_non_idempotent_calls_are_not_retried_on_5xx(self):
+        """ページ作成などのPOSTはサーバーエラーで再試行しない"""
+        scheduler = NotionScheduler(rate=100, burst=5, base_backoff=0.01)
+        responses = [SimpleNamespace(status_code=502, headers={}), SimpleNamespace(status_code=200, headers={})]
+
+        result = scheduler.call(lambda: responses.pop(0), idempotent=False)
+        self.assertEqual(result.status_code, 502)
+
+        result = scheduler.call(lambda: responses.pop(0) if responses else SimpleNamespace(status_code=200, headers={}))
+        self.assertEqual(result.status_code, 200)
+
+    def test_async_call_shares_rate_limit(self):
+        """acall も同じバケットを使い、429 を再試行する"""
+        scheduler = NotionScheduler(rate=100, burst=5, base_backoff=0.01)
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise FakeAPIError(429, {"Retry-After": "0.01"})
+            return {"ok": True}
+
+        async def main():
+            return await asyncio.gather(scheduler.acall(flaky), scheduler.acall(flaky, lane=BACKGROUND))
+
+        self.assertEqual(asyncio.run(main()), [{"ok": True}, {"ok": True}])
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["rate_limited"], 1)
+        self.assertEqual(stats["lanes"][INTERACTIVE]["acquired"] + stats["lanes"][BACKGROUND]["acquired"], 3)
+
+    def test_lane_context(self):
+        """with lane() の中だけ既定レーンが変わる"""
+        scheduler = NotionScheduler()
+        with scheduler.lane(BACKGROUND):
+            self.assertEqual(scheduler.current_lane(), BACKGROUND)
+        self.assertEqual(scheduler.current_lane(), INTERACTIVE)
+        with self.assertRaises(ValueError):
+            scheduler.set_lane("unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
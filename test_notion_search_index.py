@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+修理ケース・診断ノードの転置インデックス（NGramIndex）のテスト
+"""
+
+import unittest
+
+from data_access.notion_search_index import CASE_FIELDS, NODE_FIELDS, NGramIndex
+
+
+def make_cases():
+    return [
+        {"id": "c1", "title": "FFヒーター点火不良", "category": "暖房", "solution": "グロープラグを交換"},
+        {"id": "c2", "title": "バッテリー上がり", "category": "電装", "solution": "充電またはヒーター停止"},
+        {"id": "c3", "title": "水漏れ", "category": "水回り", "solution": "パッキン交換"},
+    ]
+
+
+class TestNGramIndex(unittest.TestCase):
+    """NGramIndex のテストクラス"""
+
+    def setUp(self):
+        self.index = NGramIndex(CASE_FIELDS)
+        self.cases = make_cases()
+        self.index.update(self.cases)
+
+    def test_ranked_by_field_weight(self):
+        """タイトル一致は本文一致より上位になり、一致したキーワードを返す"""
+        hits = self.index.search(["ヒーター", "存在しない語"])
+        self.assertEqual([hit.doc["id"] for hit in hits], ["c1", "c2"])
+        self.assertGreater(hits[0].score, hits[1].score)
+        self.assertEqual(hits[0].matched_keywords, ["ヒーター"])
+
+    def test_substring_and_short_keywords(self):
+        """n-gramが揃っていても連続していなければ一致せず、1文字のキーワードも引ける"""
+        self.assertEqual(self.index.search(["ヒータ点"]), [])
+        self.assertEqual([hit.doc["id"] for hit in self.index.search(["水"])], ["c3"])
+        # 全角・半角と大文字・小文字は区別しない
+        self.assertEqual([hit.doc["id"] for hit in self.index.search(["ｆｆ"])], ["c1"])
+
+    def test_incremental_update(self):
+        """変わったドキュメントだけ作り直し、消えたドキュメントは検索されない"""
+        self.assertEqual(self.index.update(self.cases), {"added": 0, "updated": 0, "removed": 0})
+
+        refreshed = [dict(case) for case in self.cases[:2]]
+        refreshed[1]["solution"] = "ジャンプスターターで始動"
+        refreshed.append({"id": "c4", "title": "網戸の破れ", "category": "外装", "solution": "張り替え"})
+        self.assertEqual(self.index.update(refreshed), {"added": 1, "updated": 1, "removed": 1})
+
+        self.assertEqual(self.index.search(["水漏れ"]), [])
+        self.assertEqual([hit.doc["id"] for hit in self.index.search(["ヒーター"])], ["c1"])
+        self.assertEqual([hit.doc["id"] for hit in self.index.search(["網戸"])], ["c4"])
+
+    def test_node_result_field_alias(self):
+        """診断ノードは diagnosis_result が無ければ result を索引する"""
+        index = NGramIndex(NODE_FIELDS)
+        index.update([{"id": "n1", "title": "START", "question": "異音はしますか", "result": "ファンモーター故障"}])
+        self.assertEqual([hit.doc["id"] for hit in index.search(["ファン"])], ["n1"])
+
+    def test_exported_state_is_not_changed_by_later_updates(self):
+        """スナップショット用の値は、その後の更新で書き換わらない（ロック外で直列化するため）"""
+        state = self.index.export_state()
+        postings = {gram: set(keys) for gram, keys in state["_postings"].items()}
+        self.index.update([{"id": "c4", "title": "網戸の破れ", "category": "外装", "solution": "張り替え"}])
+
+        self.assertEqual(sorted(state["_docs"]), ["c1", "c2", "c3"])
+        self.assertEqual(state["_postings"], postings)
+        restored = NGramIndex(CASE_FIELDS)
+        self.assertTrue(restored.restore_state(state))
+        self.assertEqual([hit.doc["id"] for hit in restored.search(["水漏れ"])], ["c3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notionプロパティデコーダー（RecordSchema）のテスト
+"""
+
+import unittest
+
+from data_access.property_decoder import (
+    DATE, MULTI_SELECT, NUMBER, RELATION, SELECT, TEXT, TEXT_JOINED, TEXT_LIST, TITLE, Field, RecordSchema
+)
+
+
+def make_page(page_id, properties, database_id="db-1"):
+    """デコーダーに渡すNotionページ形式の辞書を作成"""
+    return {
+        "id": page_id,
+        "parent": {"type": "database_id", "database_id": database_id},
+        "created_time": "2025-01-01T00:00:00.000Z",
+        "properties": properties,
+    }
+
+
+def title(text):
+    return {"type": "title", "title": [{"plain_text": text}]}
+
+
+def rich_text(*texts):
+    return {"type": "rich_text", "rich_text": [{"plain_text": t} for t in texts]}
+
+
+def select(name):
+    return {"type": "select", "select": {"name": name} if name else None}
+
+
+class TestRecordSchema(unittest.TestCase):
+    """RecordSchema のテストクラス"""
+
+    def setUp(self):
+        self.schema = RecordSchema("TestRecord", [
+            Field("deal_id", "商談ID", TITLE),
+            Field("detail", "症状詳細", TEXT),
+            Field("category", "カテゴリ", TEXT_JOINED | SELECT, default=""),
+            Field("symptoms", "症状", MULTI_SELECT | TEXT_LIST),
+            Field("status", "紹介ステータス", SELECT),
+            Field("amount", "成約金額", NUMBER),
+            Field("inquiry_date", "問い合わせ日時", DATE),
+            Field("partner_page_ids", "紹介修理店", RELATION),
+        ], page_attrs={"page_id": "id", "created_time": "created_time"})
+
+    def test_decode_page_into_slots_record(self):
+        """各型の値と既定値を取り出し、__slots__ のレコードにする"""
+        page = make_page("p-1", {
+            "商談ID": title("DEAL-1"),
+            "症状詳細": rich_text("水が出ない", "（続き）"),
+            "カテゴリ": select("水回り"),
+            "症状": rich_text("ポンプ", "停止"),
+            "紹介ステータス": select(None),
+            "成約金額": {"type": "number", "number": 12000},
+            "紹介修理店": {"type": "relation", "relation": [{"id": "shop-1"}]},
+        })
+        record = self.schema.decode(page)
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(record.to_dict(), {
+            "page_id": "p-1",
+            "created_time": "2025-01-01T00:00:00.000Z",
+            "deal_id": "DEAL-1",
+            "detail": "水が出ない",
+            "category": "水回り",
+            "symptoms": ["ポンプ停止"],
+            "status": None,
+            "amount": 12000,
+            "inquiry_date": None,
+            "partner_page_ids": ["shop-1"],
+        })
+
+    def test_plan_is_compiled_once_per_database(self):
+        """同じデータベースのページは最初にコンパイルしたプランを使い回す"""
+        pages = [make_page(f"p-{i}", {"商談ID": title(f"DEAL-{i}")}) for i in range(50)]
+        pages.append(make_page("q-1", {"商談ID": title("OTHER")}, database_id="db-2"))
+        records = self.schema.decode_many(pages)
+        self.assertEqual([r.deal_id for r in records[:2]], ["DEAL-0", "DEAL-1"])
+        self.assertEqual(self.schema.get_stats()["compiled"], 2)
+        # リストの既定値はレコードごとに別オブジェクト
+        self.assertIsNot(records[0].symptoms, records[1].symptoms)
+
+    def test_property_type_change_recompiles(self):
+        """プロパティの型が変わったページが来たらプランを作り直す"""
+        self.schema.decode(make_page("p-1", {"商談ID": title("DEAL-1"), "カテゴリ": select("電装")}))
+        record = self.schema.decode(make_page("p-2", {"商談ID": title("DEAL-2"), "カテゴリ": rich_text("水回り")}))
+        self.assertEqual(record.category, "水回り")
+        self.assertEqual(record["deal_id"], "DEAL-2")
+
+    def test_title_property_resolved_from_schema(self):
+        """プロパティ名を省略した項目はデータベースのタイトルプロパティを読む"""
+        schema = RecordSchema("TitleRecord", [Field("name", None, TITLE)])
+        schema.register_schema("db-3", {"properties": {"マニュアルID": {"type": "title"}}})
+        record = schema.decode(make_page("p-1", {"マニュアルID": title("MAN-1")}, database_id="db-3"))
+        self.assertEqual(record.name, "MAN-1")
+        self.assertEqual(schema.get_stats()["compiled"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+強化版RAG検索（一括検索 + Reciprocal Rank Fusion）のテスト
+"""
+
+import unittest
+
+from utils.rag_search_enhanced import (
+    batch_similarity_search,
+    embed_queries,
+    enhanced_rag_retrieve_v2,
+    reciprocal_rank_fusion,
+)
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_queries(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class _FakeCollection:
+    """クエリのベクトルごとに決まった順位の断片を返す Chroma のコレクションの代わり"""
+
+    def __init__(self, rankings):
+        self.rankings = rankings
+        self.queries = []
+
+    def query(self, query_embeddings, n_results, include):
+        self.queries.append(query_embeddings)
+        rows = [self.rankings[int(vector[0])][:n_results] for vector in query_embeddings]
+        return {
+            "documents": [[f"本文 {chunk_id}" for chunk_id, _ in row] for row in rows],
+            "metadatas": [[{"chunk_id": chunk_id, "title": chunk_id} for chunk_id, _ in row] for row in rows],
+            "distances": [[distance for _, distance in row] for row in rows],
+        }
+
+
+class _FakeChroma:
+    def __init__(self, rankings):
+        self.embeddings = _FakeEmbeddings()
+        self._collection = _FakeCollection(rankings)
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    def similarity_search_with_relevance_scores(self, query, k):
+        raise AssertionError("1クエリずつの検索は呼ばれない")
+
+
+class TestBatchRetrieval(unittest.TestCase):
+    """一括検索と RRF のテストクラス"""
+
+    def test_one_embedding_call_and_one_vector_search(self):
+        """全クエリを1回で埋め込み、1回の検索でクエリごとの結果を返す"""
+        db = _FakeChroma({2: [("a", 0.1), ("b", 0.2)], 3: [("b", 0.1)]})
+        ranked = batch_similarity_search(db, ["ab", "abc"], k=2)
+        self.assertEqual(db.embeddings.calls, [["ab", "abc"]])
+        self.assertEqual(len(db._collection.queries), 1)
+        self.assertEqual([[doc.metadata["chunk_id"] for doc, _ in row] for row in ranked], [["a", "b"], ["b"]])
+        self.assertAlmostEqual(ranked[0][0][1], 0.9)
+
+    def test_rrf_prefers_chunks_found_by_several_queries(self):
+        """複数のクエリで見つかった断片は、1つのクエリで1位の断片より上になる"""
+        def result(chunk_id, rank, score):
+            return {"metadata": {"chunk_id": chunk_id}, "content": chunk_id, "rank": rank, "score": score}
+
+        fused = reciprocal_rank_fusion([
+            result("solo", 0, 0.9), result("shared", 1, 0.7),
+            result("shared", 1, 0.8), result("other", 0, 0.6),
+        ])
+        self.assertEqual([r["metadata"]["chunk_id"] for r in fused], ["shared", "solo", "other"])
+        self.assertEqual((fused[0]["query_hits"], fused[0]["score"]), (2, 0.8))
+        self.assertAlmostEqual(fused[0]["rrf_score"], 2 / 62)
+
+    def test_retrieve_v2_uses_batched_path(self):
+        """enhanced_rag_retrieve_v2 は一括検索の結果を統合して返す"""
+        db = _FakeChroma({5: [("x", 0.2), ("y", 0.25)]})
+        result = enhanced_rag_retrieve_v2("水漏れ点検", db, max_results=2, relevance_threshold=0.5,
+                                          use_query_expansion=False)
+        self.assertEqual([r["title"] for r in result["results"]], ["x", "y"])
+        self.assertIn("rrf_score", result["results"][0])
+        self.assertEqual(len(db._collection.queries), 1)
+
+    def test_embed_queries_falls_back_to_embed_query(self):
+        """embed_queries を持たないモデルは1件ずつ埋め込む"""
+        class _Plain:
+            def embed_query(self, text):
+                return [float(len(text))]
+
+        self.assertEqual(embed_queries(_Plain(), ["a", "bb"]), [[1.0], [2.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
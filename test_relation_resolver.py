@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+リレーション一括解決（RelationResolver）のテスト
+"""
+
+import unittest
+from types import SimpleNamespace
+
+from data_access.relation_resolver import RelationResolver, normalize_page_id
+
+
+class FakePages:
+    """pages.retrieve の呼び出しを記録するスタブ"""
+
+    def __init__(self):
+        self.calls = []
+
+    def retrieve(self, page_id):
+        self.calls.append(page_id)
+        return {"id": page_id, "properties": {}}
+
+
+class TestRelationResolver(unittest.TestCase):
+    """RelationResolver のテストクラス"""
+
+    def setUp(self):
+        self.pages = FakePages()
+        self.client = SimpleNamespace(pages=self.pages)
+        self.scanned = []
+
+        def scanner(database_id):
+            self.scanned.append(database_id)
+            return iter([
+                {"id": "aaaa-0001", "properties": {}},
+                {"id": "aaaa-0002", "properties": {}},
+            ])
+
+        self.resolver = RelationResolver(lambda: self.client, scanner=scanner)
+
+    def test_scan_satisfies_known_ids(self):
+        """一括スキャンで見つかったIDは pages.retrieve しない"""
+        resolved = self.resolver.resolve(["AAAA0001", "aaaa-0002"], ["case_db"])
+        self.assertEqual(set(resolved), {"aaaa0001", "aaaa0002"})
+        self.assertEqual(self.pages.calls, [])
+        self.assertEqual(self.scanned, ["case_db"])
+
+    def test_misses_are_retrieved_once(self):
+        """索引に無いIDだけ取得し、2回目以降は索引から返す"""
+        self.resolver.resolve(["aaaa-0001", "bbbb-0001"], ["case_db"])
+        self.assertEqual(self.pages.calls, ["bbbb-0001"])
+
+        resolved = self.resolver.resolve(["bbbb0001"], ["case_db"])
+        self.assertIn("bbbb0001", resolved)
+        self.assertEqual(self.pages.calls, ["bbbb-0001"])
+        self.assertEqual(self.scanned, ["case_db"])
+
+    def test_resolve_relations_collects_ids(self):
+        """複数ページのリレーションIDをまとめて解決"""
+        pages = [
+            {"properties": {"関連ケース": {"type": "relation", "relation": [{"id": "aaaa-0001"}]}}},
+            {"properties": {"関連ケース": {"type": "relation", "relation": [{"id": "cccc-0001"}]}}},
+        ]
+        resolved = self.resolver.resolve_relations(pages, ["関連ケース"], ["case_db"])
+        self.assertEqual(set(resolved), {"aaaa0001", "cccc0001"})
+        self.assertEqual(self.pages.calls, ["cccc-0001"])
+
+    def test_invalidate_page(self):
+        """invalidate したページは再取得される"""
+        self.resolver.add_pages([{"id": "dddd-0001"}])
+        self.resolver.invalidate("dddd0001")
+        self.assertIsNone(self.resolver.get("dddd-0001"))
+        self.assertEqual(normalize_page_id("DDDD-0001"), "dddd0001")
+
+
+if __name__ == "__main__":
+    unittest.main()
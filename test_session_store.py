@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+診断セッションストア（MemorySessionStore / SQLiteSessionStore）のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from utils.session_store import DiagnosticSession, MemorySessionStore, SQLiteSessionStore
+
+
+class TestDiagnosticSession(unittest.TestCase):
+    """DiagnosticSession のテストクラス"""
+
+    def test_compact_record_round_trip(self):
+        """履歴・回答はタプルで持ち、ノードIDは共有され、直列化しても元に戻る"""
+        session = DiagnosticSession("".join(["node", "_001"]), category="バッテリー")
+        session.record_answer("node_001", "上がらない", "2025-01-01T00:00:00")
+        session.move_to("node_002")
+        self.assertEqual(session.history, ("node_001", "node_002"))
+        self.assertIs(session.history[0], session.answers[0][0])
+
+        restored = DiagnosticSession.loads(session.dumps())
+        self.assertEqual(restored.to_dict(), session.to_dict())
+        self.assertEqual(restored.to_dict()["answers"][0]["answer"], "上がらない")
+
+
+class TestMemorySessionStore(unittest.TestCase):
+    """MemorySessionStore のテストクラス"""
+
+    def test_lru_and_ttl_eviction(self):
+        """上限を超えたら最後の利用が古いものから、期限切れは取得時に削除する"""
+        store = MemorySessionStore(max_sessions=2, ttl_seconds=60)
+        store.put("a", DiagnosticSession("n1"))
+        store.put("b", DiagnosticSession("n1"))
+        store.get("a")
+        store.put("c", DiagnosticSession("n1"))
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertEqual(store.get_stats()["evicted"], 1)
+
+        store.ttl_seconds = 0
+        self.assertIsNone(store.get("a"))
+        stats = store.get_stats()
+        self.assertEqual((stats["size"], stats["expired"]), (0, 2))
+
+
+class TestSQLiteSessionStore(unittest.TestCase):
+    """SQLiteSessionStore のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "sessions.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_shared_between_stores(self):
+        """同じファイルを使う別のストア（別ワーカー）から変更後のセッションが見える"""
+        worker_a = SQLiteSessionStore(self.db_path)
+        worker_b = SQLiteSessionStore(self.db_path)
+        session = DiagnosticSession("node_001", category="エアコン")
+        worker_a.put("s1", session)
+
+        loaded = worker_b.get("s1")
+        loaded.record_answer("node_001", "冷えない", "2025-01-01T00:00:00")
+        loaded.move_to("node_006")
+        worker_b.put("s1", loaded)
+
+        self.assertEqual(worker_a.get("s1").history, ("node_001", "node_006"))
+        self.assertIsNone(worker_a.get("missing"))
+        self.assertEqual(worker_a.get_stats()["size"], 1)
+
+    def test_purge_expired_and_over_limit(self):
+        """期限切れと上限超過のセッションを削除する"""
+        store = SQLiteSessionStore(self.db_path, max_sessions=2, ttl_seconds=60)
+        for session_id in ("s1", "s2", "s3"):
+            store.put(session_id, DiagnosticSession("n1"))
+        self.assertEqual(store.purge(), {"expired": 0, "evicted": 1})
+        self.assertEqual(store.purge(now=time.time() + 120), {"expired": 2, "evicted": 0})
+        self.assertEqual(store.get_stats()["size"], 0)
+
+    def test_get_extends_ttl(self):
+        """取得したセッションは有効期限が延びる（診断中に期限切れにならない）"""
+        store = SQLiteSessionStore(self.db_path, ttl_seconds=60)
+        store.put("s1", DiagnosticSession("n1"))
+        store._connect().execute("UPDATE sessions SET updated_at = ?", (time.time() - 50,))
+
+        self.assertIsNotNone(store.get("s1"))
+        self.assertEqual(store.purge(now=time.time() + 30)["expired"], 0)
+        self.assertIsNotNone(store.get("s1"))
+        self.assertIsNone(SQLiteSessionStore(self.db_path, ttl_seconds=60).get("missing"))
+
+    def test_file_created_on_first_use(self):
+        """作成しただけではファイルを作らず、最初に使ったときに（ディレクトリごと）作る"""
+        path = os.path.join(self.temp_dir, "data", "lazy.db")
+        store = SQLiteSessionStore(path)
+        self.assertFalse(os.path.exists(path))
+        store.put("s1", DiagnosticSession("n1"))
+        self.assertEqual(store.get("s1").current_node, "n1")
+
+
+if __name__ == "__main__":
+    unittest.main()
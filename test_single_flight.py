@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+読み込みの一本化（SingleFlight / CacheNamespace.get_or_load）のテスト
+"""
+
+import threading
+import time
+import unittest
+
+from utils.cache_layer import CacheNamespace, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """SingleFlight のテストクラス"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """実行中のキーを呼んだスレッドは同じ結果を待つ"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return {"nodes": [1]}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", load))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while flight.get_stats()["calls"] < 8:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"nodes": [1]}] * 8)
+        self.assertIs(results[0], results[7])
+        self.assertEqual(flight.get_stats()["coalesced"], 7)
+        self.assertFalse(flight.in_flight("k"))
+
+    def test_exception_reaches_all_waiters(self):
+        """読み込みの例外は待っていた全員に伝わり、次の呼び出しは読み込み直す"""
+        flight = SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError("notion down")
+
+        def call():
+            try:
+                flight.do("k", fail)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while flight.get_stats()["calls"] < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, ["notion down"] * 3)
+        self.assertEqual(flight.do("k", lambda: "ok"), "ok")
+
+
+class TestGetOrLoad(unittest.TestCase):
+    """CacheNamespace.get_or_load のテストクラス"""
+
+    def test_stale_value_served_while_refreshing(self):
+        """期限切れでも stale_ttl の間は古い値を返し、裏で1回だけ読み込み直す"""
+        cache = CacheNamespace("swr", ttl=60, stale_ttl=60)
+        cache.set("all", "old", ttl=0)
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return "new"
+
+        self.assertEqual(cache.get_or_load("all", load), "old")
+        self.assertEqual(cache.get_or_load("all", load), "old")
+        release.set()
+        deadline = time.time() + 5
+        while cache.get("all") != "new" and time.time() < deadline:
+            time.sleep(0.001)
+
+        self.assertEqual(cache.get_or_load("all", load), "new")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_stats()["stale_hits"], 2)
+
+    def test_disallow_stale_and_empty_results(self):
+        """allow_stale=False は新しい値を待ち、空の結果は保存しない"""
+        cache = CacheNamespace("strict", ttl=60, stale_ttl=60)
+        cache.set("all", "old", ttl=0)
+        self.assertEqual(cache.get_or_load("all", lambda: "new", allow_stale=False), "new")
+        self.assertEqual(cache.get("all"), "new")
+
+        self.assertIsNone(cache.get_or_load("empty", lambda: None))
+        self.assertNotIn("empty", cache)
+        self.assertEqual(cache.get_or_load("empty", lambda: [1]), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
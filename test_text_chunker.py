@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+見出し単位のチャンク分割（utils.text_chunker）のテスト
+"""
+
+import unittest
+
+from utils.text_chunker import chunk_documents, chunk_text, estimate_tokens
+
+
+class _Doc:
+    """langchain の Document と同じ形の最小のドキュメント"""
+
+    def __init__(self, page_content, metadata=None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+
+CASES = """### 🔋 バッテリー・トラブル知識ベース
+
+---
+## 【Case B-1】充電されない
+
+### 症状
+走行しても充電されない
+
+### 対処法
+アイソレーターを点検
+
+---
+## 【Case B-2】すぐに電圧が下がる
+
+### 症状
+一晩で電圧が下がる
+
+```bash
+# 電圧を確認（見出しではない）
+```
+"""
+
+
+class TestChunkText(unittest.TestCase):
+    """chunk_text のテストクラス"""
+
+    def test_cases_are_never_merged(self):
+        """ケースごとに断片を作り、コードブロック内の # は見出しにしない"""
+        chunks = chunk_text(CASES, title="バッテリー")
+        case_chunks = [chunk for chunk in chunks if chunk.case_id]
+        self.assertEqual([chunk.case_id for chunk in case_chunks], ["B-1", "B-2"])
+        self.assertIn("アイソレーター", case_chunks[0].text)
+        self.assertNotIn("一晩", case_chunks[0].text)
+        self.assertIn("# 電圧を確認", case_chunks[1].text)
+        self.assertTrue(case_chunks[1].text.startswith("バッテリー\n## 【Case B-2】"))
+
+    def test_large_case_splits_at_subheadings_with_context(self):
+        """上限を超えるケースは ### 見出しで分け、各断片の先頭にケース見出しを付ける"""
+        text = "## 【Case X-1】長いケース\n\n### 症状\n" + "あ" * 150 + "\n\n### 原因\n" + "い" * 150
+        chunks = chunk_text(text, title="文書", max_tokens=200)
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1].text.startswith("文書 > 【Case X-1】長いケース\n### 原因"))
+        self.assertTrue(all(chunk.case_id == "X-1" for chunk in chunks))
+        self.assertTrue(all(estimate_tokens(chunk.text) <= 200 for chunk in chunks))
+
+    def test_unstructured_text_windows_with_overlap(self):
+        """見出しの無い長い本文は上限内で分け、前の断片の末尾を重ねる"""
+        paragraphs = [f"段落{i}" + "う" * 40 for i in range(12)]
+        chunks = chunk_text("\n\n".join(paragraphs), max_tokens=120, overlap_tokens=50)
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(estimate_tokens(chunk.text) <= 120 for chunk in chunks))
+        last_of_first = chunks[0].text.split("\n")[-1]
+        self.assertTrue(chunks[1].text.startswith(last_of_first))
+
+
+class TestChunkDocuments(unittest.TestCase):
+    """chunk_documents のテストクラス"""
+
+    def test_stable_unique_ids_and_inherited_metadata(self):
+        """断片IDは再実行しても同じで重複せず、元の metadata を引き継ぐ"""
+        docs = [
+            _Doc(CASES, {"title": "バッテリー", "url": "バッテリー.txt", "source_type": "text_file"}),
+            _Doc("同じ本文", {"url": "manual.pdf", "page": 1}),
+            _Doc("同じ本文", {"url": "manual.pdf", "page": 1}),
+        ]
+        first = chunk_documents(docs)
+        second = chunk_documents(docs)
+        ids = [doc.metadata["chunk_id"] for doc in first]
+        self.assertEqual(ids, [doc.metadata["chunk_id"] for doc in second])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(ids[0].startswith("バッテリー.txt#"))
+        self.assertTrue(ids[-1].startswith("manual.pdf:p1#"))
+
+        case_doc = next(doc for doc in first if doc.metadata.get("case_id") == "B-1")
+        self.assertIsInstance(case_doc, _Doc)
+        self.assertEqual(case_doc.metadata["source_type"], "text_file")
+        self.assertEqual(case_doc.metadata["section"], "【Case B-1】充電されない")
+        self.assertEqual(case_doc.metadata["chunk_count"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+起動時スナップショット（WarmSnapshot）のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from data_access.notion_search_index import NGramIndex
+from utils.cache_layer import CacheNamespace
+from utils.warm_snapshot import WarmSnapshot
+
+
+class TestWarmSnapshot(unittest.TestCase):
+    """WarmSnapshot のテストクラス"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "warm_snapshot.pkl")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_round_trip_keeps_shared_objects(self):
+        """セクション間で共有していたオブジェクトは復元後も同じオブジェクトになる"""
+        cases = [{"id": "c1", "title": "バッテリー上がり"}]
+        self.path = os.path.join(self.temp_dir, "data", "warm_snapshot.pkl")  # 置き場所のディレクトリは保存時に作る
+        writer = WarmSnapshot(self.path)
+        writer.register("cases", lambda: {"cases": cases}, lambda value: True)
+        writer.register("index", lambda: {"source": cases}, lambda value: True)
+        self.assertTrue(writer.save())
+
+        restored = {}
+        reader = WarmSnapshot(self.path)
+        reader.register("cases", lambda: None, lambda value: restored.update(value) or True)
+        reader.register("index", lambda: None, lambda value: restored.update(value) or True)
+        self.assertFalse(reader.is_ready())
+        self.assertEqual(reader.load(), {"cases": True, "index": True})
+
+        self.assertEqual(restored["cases"], cases)
+        self.assertIs(restored["cases"], restored["source"])
+        stats = reader.get_stats()
+        self.assertTrue(stats["ready"])
+        self.assertEqual(stats["sections"]["cases"]["source"], "snapshot")
+        self.assertIsNotNone(stats["age_seconds"])
+
+    def test_other_version_is_ignored(self):
+        """ヘッダーのバージョンが違うファイル・壊れたファイルは読み込まない"""
+        with open(self.path, "wb") as f:
+            f.write(b"CAMPER-WARM-SNAPSHOT 0\n")
+        snapshot = WarmSnapshot(self.path)
+        snapshot.register("cases", lambda: None, lambda value: True)
+        self.assertEqual(snapshot.load(), {})
+
+        with open(self.path, "wb") as f:
+            f.write(b"CAMPER-WARM-SNAPSHOT 1\nbroken")
+        self.assertEqual(snapshot.load(), {})
+        self.assertEqual(snapshot.get_stats()["errors"], 1)
+        self.assertFalse(snapshot.get_stats()["loaded"])
+
+    def test_refresh_schedules_one_save(self):
+        """Notionから更新されたら少し後に1回だけ保存する"""
+        exports = []
+        snapshot = WarmSnapshot(self.path, save_delay=0.05)
+        snapshot.register("cases", lambda: exports.append(1) or [1], lambda value: True)
+        snapshot.mark_refreshed("cases")
+        snapshot.mark_refreshed("cases")
+        deadline = time.time() + 5
+        while snapshot.get_stats()["saves"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(exports), 1)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(snapshot.get_stats()["sections"]["cases"]["source"], "live")
+
+    def test_index_and_stale_cache_restore(self):
+        """インデックスは作り直さずに復元し、期限切れで復元した値は peek / get_or_load で返る"""
+        cases = [{"id": "c1", "title": "エアコンが冷えない"}, {"id": "c2", "title": "バッテリー上がり"}]
+        index = NGramIndex({"title": (1.0, ("title",))})
+        index.update(cases)
+        restored = NGramIndex({"title": (1.0, ("title",))})
+        self.assertTrue(restored.restore_state(index.export_state()))
+        self.assertEqual(restored.update(cases), {"added": 0, "updated": 0, "removed": 0})
+        self.assertEqual([hit.doc["id"] for hit in restored.search(["冷えない"])], ["c1"])
+
+        cache = CacheNamespace("warm", ttl=60, stale_ttl=60)
+        cache.set("CASE", cases, ttl=0)
+        self.assertIs(cache.peek("CASE"), cases)
+        self.assertIsNone(cache.get("CASE"))
+        self.assertIs(cache.get_or_load("CASE", lambda: cases), cases)
+
+
+if __name__ == "__main__":
+    unittest.main()
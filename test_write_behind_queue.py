@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ライトビハインドキュー（WriteBehindQueue）のテスト
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from utils.write_behind_queue import PermanentWriteError, RetryableWriteError, WriteBehindQueue
+
+
+class RecordingHandler:
+    """受け取ったペイロードを記録し、指定回数だけ失敗するハンドラー"""
+
+    def __init__(self, failures=None):
+        self.delivered = []
+        self.failures = list(failures or [])
+
+    def __call__(self, payload):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.delivered.append(payload)
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    """WriteBehindQueue のテストクラス"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.tmpdir.name, "spool.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_queue(self, handler, **kwargs):
+        return WriteBehindQueue("test", handler, self.spool_path, **kwargs)
+
+    def test_spool_survives_restart(self):
+        """送信前にプロセスが終わっても、次のプロセスでスプールから送信される"""
+        self.make_queue(RecordingHandler()).enqueue({"user_msg": "水が出ない"})
+
+        handler = RecordingHandler()
+        restarted = self.make_queue(handler)
+        self.assertEqual(restarted.get_stats()["pending"], 1)
+        self.assertTrue(restarted.flush())
+        self.assertEqual(handler.delivered, [{"user_msg": "水が出ない"}])
+        self.assertEqual(restarted.get_stats()["pending"], 0)
+
+    def test_retryable_error_backs_off(self):
+        """一時的なエラーは retry_after 秒後まで再送しない"""
+        handler = RecordingHandler([RetryableWriteError("429", retry_after=0.2)])
+        queue = self.make_queue(handler)
+        queue.enqueue({"n": 1})
+
+        self.assertEqual(queue.drain_once(), 1)
+        self.assertEqual(queue.drain_once(), 0)
+        time.sleep(0.25)
+        self.assertEqual(queue.drain_once(), 1)
+        self.assertEqual(handler.delivered, [{"n": 1}])
+        self.assertEqual(queue.get_stats()["retried"], 1)
+
+    def test_dead_letter_and_requeue(self):
+        """恒久的なエラーと再送上限に達した行はデッドレターに移り、requeue_dead() で戻せる"""
+        handler = RecordingHandler([PermanentWriteError("400"), ValueError("boom")])
+        queue = self.make_queue(handler, max_attempts=1)
+        queue.enqueue({"n": 1})
+        queue.enqueue({"n": 2})
+
+        self.assertEqual(queue.drain_once(), 2)
+        stats = queue.get_stats()
+        self.assertEqual((stats["pending"], stats["dead"]), (0, 2))
+        self.assertEqual([d["last_error"] for d in queue.dead_letters()], ["boom", "400"])
+
+        self.assertEqual(queue.requeue_dead(), 2)
+        self.assertTrue(queue.flush())
+        self.assertEqual(handler.delivered, [{"n": 1}, {"n": 2}])
+
+    def test_worker_drains_in_background(self):
+        """enqueue() はすぐに戻り、ワーカーが送信する"""
+        handler = RecordingHandler()
+        queue = self.make_queue(handler, poll_interval=0.05)
+        queue.start()
+        try:
+            for i in range(5):
+                queue.enqueue({"n": i})
+            deadline = time.time() + 5
+            while len(handler.delivered) < 5 and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            queue.stop()
+        self.assertEqual([p["n"] for p in handler.delivered], [0, 1, 2, 3, 4])
+
+    def test_spool_created_on_first_use(self):
+        """作成しただけではスプールを作らず、最初の投入で（ディレクトリごと）作る"""
+        self.spool_path = os.path.join(self.tmpdir.name, "data", "lazy.db")
+        queue = self.make_queue(lambda payload: None)
+        self.assertFalse(os.path.exists(self.spool_path))
+        queue.enqueue({"n": 1})
+        self.assertTrue(os.path.exists(self.spool_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,10 +41,20 @@ except ImportError:
 
 # 既存のモジュールをインポート
 from config import OPENAI_API_KEY, SERP_API_KEY, LANGSMITH_API_KEY
-from enhanced_rag_system import create_enhanced_rag_system, enhanced_rag_retrieve, create_notion_based_rag_system
+from enhanced_rag_system import (
+    create_enhanced_rag_system, enhanced_rag_retrieve, create_notion_based_rag_system, open_persisted_rag_system,
+)
 from serp_search_system import get_serp_search_system
 from repair_category_manager import RepairCategoryManager
-from save_to_notion import save_chat_log_to_notion
+from save_to_notion import chat_log_queue, enqueue_chat_log_to_notion, save_chat_log_to_notion
+from utils.http_transport import http_transport
+from utils.manager_registry import ManagerRegistry
+from utils.session_store import DiagnosticSession, diagnostic_sessions
+from utils.cache_layer import CACHE_SWEEP_INTERVAL, SingleFlight, caches
+from utils.warm_snapshot import warm_snapshot
+from utils.http_cache import conditional_get, dataset_versions
+from utils.embedding_cache import embedding_store
+from utils.flat_vector_index import FlatVectorIndex
 
 # フェーズ2-1: エラーハンドリングとログ分析
 try:
@@ -80,9 +90,23 @@ except ImportError as e:
     print(f"⚠️ フェーズ1モジュールが利用できません: {e}")
     PHASE1_AVAILABLE = False
 
+# 診断グラフ・キーワード照合（Notion APIには依存しないので、Notionクライアントが使えなくても読み込む）
+try:
+    from data_access.diagnostic_graph import get_diagnostic_graph, get_graph_stats, remember_diagnostic_graph
+    from data_access.keyword_automaton import RoutingMatcher
+    DIAGNOSTIC_GRAPH_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ 診断グラフモジュールが利用できません: {e}")
+    DIAGNOSTIC_GRAPH_AVAILABLE = False
+
 # Notion関連のインポート
 try:
     from data_access.notion_client import notion_client
+    from data_access.cache_manager import CACHE_DB_SWEEP_INTERVAL, cache_manager
+    from data_access.notion_replica import notion_replica, ReplicaSyncWorker
+    from data_access.notion_scheduler import notion_scheduler
+    from data_access.id_sequence import id_sequences
+    from data_access.notion_search_index import diagnostic_node_index, repair_case_index
     NOTION_AVAILABLE = True
     print("✅ Notionクライアントが利用可能です")
 except ImportError:
@@ -109,6 +133,36 @@ CORS(
     supports_credentials=True,
 )
 
+# Notion呼び出しの優先レーン（先頭から順に前方一致、該当なしはチャット・診断扱い）
+NOTION_LANE_PREFIXES = [
+    ("/api/v1/cost-estimation", "interactive"),
+    ("/api/v1/factories/match", "interactive"),
+    ("/api/v1/", "dashboard"),
+    ("/api/factory/", "dashboard"),
+    ("/api/admin", "dashboard"),
+    ("/admin", "dashboard"),
+    ("/reload_data", "background"),
+]
+
+
+@app.before_request
+def assign_notion_lane():
+    """リクエストのパスからNotion呼び出しの優先レーンを決める"""
+    if not NOTION_AVAILABLE:
+        return
+    lane = next(
+        (lane for prefix, lane in NOTION_LANE_PREFIXES if request.path.startswith(prefix)),
+        "interactive",
+    )
+    g.notion_lane_token = notion_scheduler.set_lane(lane)
+
+
+@app.teardown_request
+def release_notion_lane(exc=None):
+    token = g.pop("notion_lane_token", None)
+    if token is not None:
+        notion_scheduler.reset_lane(token)
+
 # Swagger UI用のエンドポイント
 @app.route("/api/docs")
 def swagger_ui():
@@ -189,9 +243,16 @@ notion_client_instance = None
 factory_manager = None
 builder_manager = None
 
-# キャッシュシステム
-cache = {}
+# キャッシュシステム（utils/cache_layer.py の名前空間）
 CACHE_EXPIRY_SECONDS = 300  # 5分
+api_cache = caches.namespace(
+    "api",
+    ttl=CACHE_EXPIRY_SECONDS,
+    max_entries=int(os.getenv("API_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    # 期限切れ後もこの間は前回の値を返し、Notionからの再取得はバックグラウンドで1回だけ行う
+    stale_ttl=float(os.getenv("API_CACHE_STALE_SECONDS", "600")),
+)
 
 # ソース別の重み係数（優先度: NOTION > RAG > SERP）
 SOURCE_WEIGHTS = {
@@ -224,11 +285,97 @@ SAFETY_KEYWORDS = {
     "一酸化炭素": ["CO", "頭痛", "めまい", "吐き気"]
 }
 
+replica_sync_worker = None
+
+
+def _lazy_factory(module_name: str, class_name: str):
+    """モジュールを初回生成時にインポートしてインスタンスを作るファクトリー"""
+    def factory():
+        import importlib
+        return getattr(importlib.import_module(module_name), class_name)()
+    return factory
+
+
+# アプリ単位のマネージャーレジストリ（書き込み系エンドポイントでリクエストごとに生成しない）
+managers = ManagerRegistry()
+managers.register("deal", _lazy_factory("data_access.deal_manager", "DealManager"))
+managers.register("partner_shop", _lazy_factory("data_access.partner_shop_manager", "PartnerShopManager"))
+managers.register("review", _lazy_factory("data_access.review_manager", "ReviewManager"))
+managers.register("factory_dashboard", _lazy_factory("data_access.factory_dashboard_manager", "FactoryDashboardManager"))
+managers.register("factory_matching", _lazy_factory("data_access.factory_matching", "FactoryMatchingEngine"))
+managers.register("cost_estimation", _lazy_factory("data_access.cost_estimation", "CostEstimationEngine"), eager=False)
+managers.register("email_sender", _lazy_factory("notification.email_sender", "EmailSender"))
+managers.register("line_notifier", _lazy_factory("notification.line_notifier", "LineNotifier"))
+
+
+@managers.on_reload
+def _clear_notion_schema_cache(registry):
+    """再読み込み時はNotionのスキーマとデコーダーのプランも作り直す"""
+    if NOTION_AVAILABLE:
+        notion_client.clear_schema_cache()
+
+
+@managers.on_warmup
+def _seed_id_sequences(registry):
+    """起動時にID採番シーケンスをNotion上の最大値で初期化（作成時にNotionを検索しない）"""
+    targets = [registry.get_optional(name) for name in ("deal", "review", "partner_shop")]
+    targets += [factory_manager, builder_manager]
+    for manager in targets:
+        if manager is None:
+            continue
+        try:
+            manager.seed_id_sequence()
+        except Exception as e:
+            print(f"⚠️ ID採番シーケンスの初期化に失敗: {type(manager).__name__}: {e}")
+
+
+# RAGシステムの構築は同時に1回だけ（起動時の初期化と /reload_data が重なった場合も1回にまとめる）
+rag_loader = SingleFlight("rag-db")
+CHROMA_DB_PATH = "./chroma_db"
+
+# 最後に構築したRAGシステムの情報（スナップショットに保存し、次回起動時は構築完了までこれを開く）
+_rag_snapshot: Dict[str, Any] = {}
+
+def _build_rag_db(use_text_files: bool):
+    """RAGシステムを構築（Notion統合版、失敗時は従来版）"""
+    db_temp = create_notion_based_rag_system(use_text_files=use_text_files)
+    if db_temp:
+        print("✅ Notion統合RAGシステム初期化完了")
+    else:
+        print("⚠️ Notion統合RAGシステムの初期化に失敗しました")
+        # フォールバック処理
+        print("🔄 従来のRAGシステムで再試行中...")
+        db_temp = create_enhanced_rag_system()
+        if db_temp:
+            print("✅ 従来のRAGシステムで初期化完了")
+        else:
+            print("❌ 従来のRAGシステムの初期化にも失敗しました")
+            return db_temp
+    _rag_snapshot.update({"chroma_db_path": CHROMA_DB_PATH, "built_at": time.time()})
+    warm_snapshot.mark_refreshed("rag")
+    return db_temp
+
+def _restore_rag_snapshot(value: Dict[str, Any]) -> bool:
+    if not value or not os.path.exists(value.get("chroma_db_path", "")):
+        return False
+    _rag_snapshot.update(value)
+    return True
+
+warm_snapshot.register("rag", lambda: dict(_rag_snapshot) or None, _restore_rag_snapshot)
+
+def load_rag_db(use_text_files: bool):
+    """RAGシステムを構築（実行中の構築があればその結果を待つ）"""
+    return rag_loader.do("rag_db", lambda: _build_rag_db(use_text_files))
+
 def initialize_services():
     """サービス初期化"""
     global db, category_manager, serp_system, notion_client_instance, factory_manager, builder_manager
+    global replica_sync_worker
     
     try:
+        # 前回のデータセット・インデックスをスナップショットから復元（Notionの読み込みを待たずに応答できる）
+        snapshot_restored = warm_snapshot.load()
+        
         # RAGシステムの初期化（Notion統合版）
         # 環境変数でテキストファイルも含めるか設定可能
         use_text_files = os.getenv("USE_TEXT_FILES", "true").lower() == "true"
@@ -254,21 +401,15 @@ def initialize_services():
         def init_rag_background():
             global db
             try:
+                # 前回構築したデータベースを構築完了まで使う
+                if db is None and _rag_snapshot:
+                    db = open_persisted_rag_system(_rag_snapshot["chroma_db_path"])
+                    if db:
+                        print("⚡ 前回のRAGシステムを読み込みました（再構築完了まで使用）")
                 print("🔄 バックグラウンドでRAGシステム初期化中...")
-                db_temp = create_notion_based_rag_system(use_text_files=use_text_files)
+                db_temp = load_rag_db(use_text_files)
                 if db_temp:
                     db = db_temp
-                    print("✅ Notion統合RAGシステム初期化完了（バックグラウンド）")
-                else:
-                    print("⚠️ Notion統合RAGシステムの初期化に失敗しました")
-                    # フォールバック処理
-                    print("🔄 従来のRAGシステムで再試行中...")
-                    db_temp = create_enhanced_rag_system()
-                    if db_temp:
-                        db = db_temp
-                        print("✅ 従来のRAGシステムで初期化完了（バックグラウンド）")
-                    else:
-                        print("❌ 従来のRAGシステムの初期化にも失敗しました")
             except Exception as e:
                 print(f"⚠️ RAGシステムの初期化エラー: {e}")
         
@@ -303,6 +444,18 @@ def initialize_services():
                 result = notion_client_instance.initialize_client()
                 if result:
                     print("✅ Notionクライアント初期化完了（遅延ロード有効）")
+                    
+                    # ローカルレプリカの差分同期を開始（一覧系の読み込みはレプリカを優先）
+                    if replica_sync_worker is None:
+                        replica_sync_worker = ReplicaSyncWorker(notion_replica, notion_client_instance)
+                    if replica_sync_worker.start():
+                        print("✅ Notionレプリカ同期ワーカーを開始しました")
+                    
+                    # スナップショットから復元したデータをNotionで再検証
+                    if any(snapshot_restored.values()):
+                        threading.Thread(
+                            target=revalidate_warm_snapshot, name="snapshot-revalidate", daemon=True
+                        ).start()
                 else:
                     print("⚠️ Notionクライアント初期化に失敗")
                     notion_client_instance = None
@@ -350,6 +503,18 @@ def initialize_services():
             builder_manager = None
             print("⚠️ Factory ManagerとBuilder Managerが利用できません")
         
+        # 書き込み系エンドポイントのマネージャーをバックグラウンドで事前生成
+        threading.Thread(target=managers.warm_up, name="manager-warmup", daemon=True).start()
+
+        # 期限切れキャッシュの定期削除
+        caches.start_sweeper(CACHE_SWEEP_INTERVAL)
+        if NOTION_AVAILABLE:
+            cache_manager.start_sweeper(CACHE_DB_SWEEP_INTERVAL)
+
+        # 前回のプロセスで送信しきれなかった会話ログを送信
+        if chat_log_queue.start():
+            print("✅ 会話ログ保存ワーカーを開始しました")
+
         return True
     except Exception as e:
         print(f"❌ サービス初期化エラー: {e}")
@@ -487,7 +652,7 @@ def ask():
                 print(f"   - category: {category}")
                 print(f"   - tool_used: {tool_used}")
 
-                saved, error_msg = save_chat_log_to_notion(
+                saved, error_msg = enqueue_chat_log_to_notion(
                     user_msg=user_message_for_log,
                     bot_msg=bot_text,
                     session_id=session_id or "",
@@ -498,7 +663,7 @@ def ask():
                     tool_used=tool_used,
                 )
                 if saved:
-                    print("✅ Notion保存成功")
+                    print("📥 Notion保存キューに追加しました")
                 else:
                     print(f"⚠️ Notion保存失敗: {error_msg}")
             except Exception as log_error:
@@ -1659,7 +1824,7 @@ Notionデータベースから取得した修理ケース情報を基に、ユ
             
             # Chat logを保存（回答が空でない場合のみ）
             if bot_response and bot_response.strip():
-                saved, error_msg = save_chat_log_to_notion(
+                saved, error_msg = enqueue_chat_log_to_notion(
                     user_msg=query,
                     bot_msg=bot_response,
                     session_id=session_id,
@@ -1670,7 +1835,7 @@ Notionデータベースから取得した修理ケース情報を基に、ユ
                 )
                 
                 if saved:
-                    print(f"✅ Chat logをNotionに保存しました: session_id={session_id}, category={category}")
+                    print(f"✅ Chat logをNotion保存キューに追加しました: session_id={session_id}, category={category}")
                 else:
                     print(f"⚠️ Chat logの保存に失敗しました: {error_msg}")
             else:
@@ -1744,6 +1909,28 @@ def unified_health_check():
         "status": "healthy" if basic_healthy else "degraded",
         "rag_status": rag_status,
         "services": services_status,
+        "notion_replica": notion_replica.get_stats() if NOTION_AVAILABLE else None,
+        "http_transport": http_transport.get_stats(),
+        "notion_scheduler": notion_scheduler.get_stats() if NOTION_AVAILABLE else None,
+        "managers": managers.get_stats(),
+        "id_sequences": id_sequences.get_stats() if NOTION_AVAILABLE else None,
+        "chat_log_queue": chat_log_queue.get_stats(),
+        "diagnostic_sessions": diagnostic_sessions.get_stats(),
+        "caches": caches.get_stats(),
+        "cache_db": cache_manager.get_stats() if NOTION_AVAILABLE else None,
+        "rag_loader": rag_loader.get_stats(),
+        "warm_snapshot": warm_snapshot.get_stats(),
+        "http_cache": dataset_versions.get_stats(),
+        "embedding_cache": embedding_store.get_stats() if embedding_store else None,
+        "vector_store": {
+            "backend": type(db).__name__,
+            **(db.get_stats() if hasattr(db, "get_stats") else {}),
+        } if db else None,
+        "search_index": {
+            "repair_cases": repair_case_index.get_stats(),
+            "diagnostic_nodes": diagnostic_node_index.get_stats(),
+        } if NOTION_AVAILABLE else None,
+        "diagnostic_graph": get_graph_stats() if DIAGNOSTIC_GRAPH_AVAILABLE else None,
         "timestamp": datetime.now().isoformat()
     })
 
@@ -2053,7 +2240,7 @@ def unified_chat():
             print(f"   - tool_used: {tool_used}")
             print(f"   - bot_text: {len(bot_text) if bot_text else 0}文字")
             
-            saved, error_msg = save_chat_log_to_notion(
+            saved, error_msg = enqueue_chat_log_to_notion(
                 user_msg=message,
                 bot_msg=bot_text,
                 session_id=session_id,
@@ -2064,7 +2251,7 @@ def unified_chat():
                 tool_used=tool_used,
             )
             if saved:
-                print("✅ Notion保存成功")
+                print("📥 Notion保存キューに追加しました")
             else:
                 print(f"⚠️ Notion保存失敗: {error_msg}")
         except Exception as e:
@@ -2238,7 +2425,7 @@ def chat():
         print(f"   - category: {category}")
         print(f"   - tool_used: {tool_used}")
         
-        saved, error_msg = save_chat_log_to_notion(
+        saved, error_msg = enqueue_chat_log_to_notion(
             user_msg=message,
             bot_msg=bot_text,
             session_id=conversation_id,
@@ -2249,7 +2436,7 @@ def chat():
             tool_used=tool_used,
         )
         if saved:
-            print("✅ Notion保存成功")
+            print("📥 Notion保存キューに追加しました")
         else:
             print(f"⚠️ Notion保存失敗: {error_msg}")
             
@@ -2493,7 +2680,47 @@ def api_route():
     except Exception as e:
         return jsonify({"error": f"ルーティングエラー: {str(e)}"}), 500
 
+@app.route("/api/route/batch", methods=["POST"])
+def api_route_batch():
+    """ルーティングエンジンAPI（複数回答の一括ルーティング・オフライン評価用）"""
+    try:
+        data = request.get_json() or {}
+        items = data.get("items", [])
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "itemsが必要です"}), 400
+        
+        # 診断データを取得（キャッシュ付き）
+        diagnostic_data = load_notion_diagnostic_data_cached()
+        if not diagnostic_data:
+            return jsonify({"error": "診断データが利用できません"}), 500
+        
+        context = {"nodes": diagnostic_data.get("nodes", [])}
+        results = route_next_nodes_batch(items, context)
+        
+        return jsonify({"results": results, "count": len(results)})
+        
+    except Exception as e:
+        return jsonify({"error": f"ルーティングエラー: {str(e)}"}), 500
+
+# === 一覧系GET APIの条件付きGET（ETag / Last-Modified） ===
+# キャッシュされたデータセットは内容のハッシュ、レプリカ由来の一覧はレプリカの版数を ETag にする
+
+def _cached_dataset_version(data):
+    return dataset_versions.version(data) if data else None
+
+def _replica_version(table_name: str):
+    return notion_replica.version(table_name) if NOTION_AVAILABLE else None
+
+def _nodes_version():
+    return _cached_dataset_version(load_notion_diagnostic_data_cached(
+        category=request.args.get("category", ""), updated_since=request.args.get("updatedSince", "")
+    ))
+
+def _cases_version():
+    return _cached_dataset_version(load_notion_repair_cases_cached(category=request.args.get("category", "")))
+
 @app.route("/api/nodes", methods=["GET"])
+@conditional_get(_nodes_version)
 def api_nodes():
     """診断ノード取得API"""
     try:
@@ -2522,6 +2749,7 @@ def api_nodes():
         return jsonify({"error": f"ノード取得エラー: {str(e)}"}), 500
 
 @app.route("/api/cases", methods=["GET"])
+@conditional_get(_cases_version)
 def api_cases():
     """修理ケース取得API"""
     try:
@@ -2540,6 +2768,7 @@ def api_cases():
         return jsonify({"error": f"修理ケース取得エラー: {str(e)}"}), 500
 
 @app.route("/api/kb", methods=["GET"])
+@conditional_get(lambda: None)
 def api_kb():
     """知識ベース取得API"""
     try:
@@ -2657,24 +2886,26 @@ def search_notion_knowledge(message: str, include_cache: bool = True) -> Dict[st
         else:
             repair_cases = load_notion_repair_cases()
         
-        related_cases = []
-        
         # メッセージからキーワードを抽出し、シノニムで拡張
         keywords = message.lower().split()
         expanded_keywords = expand_keywords_with_synonyms(keywords)
         
-        for case in repair_cases:
-            case_text = f"{case.get('title', '')} {case.get('category', '')} {case.get('solution', '')}".lower()
-            if any(keyword.lower() in case_text for keyword in expanded_keywords):
-                snippets = extract_snippets_from_notion_data(case)
-                related_cases.append({
-                    "title": case.get("title", ""),
-                    "category": case.get("category", ""),
-                    "solution": case.get("solution", "")[:200] + "..." if len(case.get("solution", "")) > 200 else case.get("solution", ""),
-                    "url": case.get("url", ""),
-                    "snippets": snippets,
-                    "matched_keywords": [kw for kw in expanded_keywords if kw.lower() in case_text]
-                })
+        # 転置インデックスで検索（一覧がキャッシュから更新された場合のみ差分で作り直す）
+        repair_case_index.update(repair_cases)
+        case_hits = repair_case_index.search(expanded_keywords)
+        
+        related_cases = []
+        for hit in case_hits[:3]:
+            case = hit.doc
+            snippets = extract_snippets_from_notion_data(case)
+            related_cases.append({
+                "title": case.get("title", ""),
+                "category": case.get("category", ""),
+                "solution": case.get("solution", "")[:200] + "..." if len(case.get("solution", "")) > 200 else case.get("solution", ""),
+                "url": case.get("url", ""),
+                "snippets": snippets,
+                "matched_keywords": hit.matched_keywords
+            })
         
         # 診断ノードを検索
         if include_cache:
@@ -2682,30 +2913,36 @@ def search_notion_knowledge(message: str, include_cache: bool = True) -> Dict[st
         else:
             diagnostic_nodes = load_notion_diagnostic_data()
         
-        related_nodes = []
+        # load_notion_diagnostic_data は {"nodes": [...], "start_nodes": [...]} を返す
+        if isinstance(diagnostic_nodes, dict):
+            diagnostic_nodes = diagnostic_nodes.get("nodes", [])
         
-        for node in diagnostic_nodes:
-            node_text = f"{node.get('title', '')} {node.get('category', '')} {node.get('question', '')} {node.get('diagnosis_result', '')}".lower()
-            if any(keyword.lower() in node_text for keyword in expanded_keywords):
-                snippets = extract_snippets_from_notion_data(node)
-                related_nodes.append({
-                    "title": node.get("title", ""),
-                    "category": node.get("category", ""),
-                    "question": node.get("question", "")[:150] + "..." if len(node.get("question", "")) > 150 else node.get("question", ""),
-                    "diagnosis_result": node.get("diagnosis_result", "")[:150] + "..." if len(node.get("diagnosis_result", "")) > 150 else node.get("diagnosis_result", ""),
-                    "url": node.get("url", ""),
-                    "snippets": snippets,
-                    "matched_keywords": [kw for kw in expanded_keywords if kw.lower() in node_text]
-                })
+        diagnostic_node_index.update(diagnostic_nodes or [])
+        node_hits = diagnostic_node_index.search(expanded_keywords)
+        
+        related_nodes = []
+        for hit in node_hits[:3]:
+            node = hit.doc
+            diagnosis_result = node.get("diagnosis_result") or node.get("result") or ""
+            snippets = extract_snippets_from_notion_data(node)
+            related_nodes.append({
+                "title": node.get("title", ""),
+                "category": node.get("category", ""),
+                "question": node.get("question", "")[:150] + "..." if len(node.get("question", "")) > 150 else node.get("question", ""),
+                "diagnosis_result": diagnosis_result[:150] + "..." if len(diagnosis_result) > 150 else diagnosis_result,
+                "url": node.get("url", ""),
+                "snippets": snippets,
+                "matched_keywords": hit.matched_keywords
+            })
         
         # セーフティキーワードチェック
         safety_warnings = check_safety_keywords(message)
         
         return {
-            "repair_cases": related_cases[:3],  # 最大3件
-            "diagnostic_nodes": related_nodes[:3],  # 最大3件
-            "total_cases_found": len(related_cases),
-            "total_nodes_found": len(related_nodes),
+            "repair_cases": related_cases,  # 最大3件
+            "diagnostic_nodes": related_nodes,  # 最大3件
+            "total_cases_found": len(case_hits),
+            "total_nodes_found": len(node_hits),
             "safety_warnings": safety_warnings,
             "expanded_keywords": expanded_keywords
         }
@@ -2896,7 +3133,11 @@ def process_chat_mode(message: str, intent: Dict[str, Any], include_serp: bool =
                         from utils.notion_search_enhanced import NotionSearchEnhanced
                         
                         # 強化版Notion検索インスタンスを作成
-                        enhanced_search = NotionSearchEnhanced(notion_client_instance.client)
+                        enhanced_search = NotionSearchEnhanced(
+                            notion_client_instance.client,
+                            resolver=getattr(notion_client_instance, "relation_resolver", None),
+                            async_client=notion_client_instance
+                        )
                         
                         # カテゴリを取得
                         category = intent.get('category') if isinstance(intent, dict) else None
@@ -3215,23 +3456,24 @@ def process_chat_mode(message: str, intent: Dict[str, Any], include_serp: bool =
         response_logger.log_error("ChatMode", error_str, {"message": message}, session_id)
         return {"error": f"チャット処理エラー: {error_str}"}
 
-# 診断データのキャッシュ（グローバル変数）
-_diagnostic_data_cache = None
-_diagnostic_data_cache_time = None
+# 診断データのキャッシュ（最新の1件のみ）
 _CACHE_DURATION = 300  # 5分間キャッシュ
+diagnostic_data_cache = caches.namespace(
+    "diagnostic_data",
+    ttl=_CACHE_DURATION,
+    max_entries=1,
+    stale_ttl=float(os.getenv("API_CACHE_STALE_SECONDS", "600")),
+)
 
-def load_notion_diagnostic_data(force_reload: bool = False):
-    """Notionから診断データを読み込み（キャッシュ付き）"""
-    global notion_client_instance, _diagnostic_data_cache, _diagnostic_data_cache_time
-    
-    import time
-    
-    # キャッシュチェック
-    if not force_reload and _diagnostic_data_cache is not None and _diagnostic_data_cache_time is not None:
-        cache_age = time.time() - _diagnostic_data_cache_time
-        if cache_age < _CACHE_DURATION:
-            print(f"✅ キャッシュから診断データを取得（有効期限: {int(_CACHE_DURATION - cache_age)}秒）")
-            return _diagnostic_data_cache
+def load_notion_diagnostic_data(force_reload: bool = False, allow_stale: bool = True):
+    """Notionから診断データを読み込み（キャッシュ付き。同時の読み込みは1回にまとめる）"""
+    if force_reload:
+        diagnostic_data_cache.delete("all")
+    return diagnostic_data_cache.get_or_load("all", _fetch_notion_diagnostic_data, allow_stale=allow_stale)
+
+def _fetch_notion_diagnostic_data():
+    """Notionから診断データを読み込み"""
+    global notion_client_instance
     
     if not notion_client_instance:
         print("⚠️ Notionクライアントが初期化されていません")
@@ -3241,9 +3483,9 @@ def load_notion_diagnostic_data(force_reload: bool = False):
         print("🔄 Notionから診断データを読み込み中...")
         diagnostic_data = notion_client_instance.load_diagnostic_data()
         if diagnostic_data:
-            # キャッシュに保存
-            _diagnostic_data_cache = diagnostic_data
-            _diagnostic_data_cache_time = time.time()
+            # 診断グラフは読み込みごとに1回だけ作る
+            get_diagnostic_graph(diagnostic_data)
+            warm_snapshot.mark_refreshed("diagnostic_data")
             print(f"✅ 診断データ読み込み成功: {len(diagnostic_data.get('nodes', []))}件のノード（キャッシュに保存）")
         else:
             print("⚠️ 診断データが空です")
@@ -3263,45 +3505,26 @@ def load_notion_repair_cases():
     
     try:
         repair_cases = notion_client_instance.load_repair_cases()
+        if repair_cases:
+            warm_snapshot.mark_refreshed("repair_cases")
         return repair_cases if repair_cases else []
     except Exception as e:
         print(f"⚠️ Notion修理ケース読み込みエラー: {e}")
         return []
 
 def score_candidate(text: str, candidate: Dict[str, Any]) -> Dict[str, Any]:
-    """候補ノードのスコアリング"""
-    keywords = candidate.get("keywords", [])
-    weight = candidate.get("weight", 1.0)
-    
-    # キーワード一致によるスコア計算
-    hits = [k for k in keywords if k.lower() in text.lower()]
-    score = len(hits) * weight
-    
-    # 簡易ペア加点（名詞×症状ペア）
-    noun_symptom_pairs = [
-        ["水圧", "弱い"], ["炎", "弱い"], ["電圧", "低い"],
-        ["音", "大きい"], ["温度", "高い"], ["振動", "激しい"],
-        ["エンジン", "かからない"], ["バッテリー", "上がらない"],
-        ["エアコン", "効かない"], ["トイレ", "詰まる"]
-    ]
-    
-    for noun, symptom in noun_symptom_pairs:
-        if noun in text and symptom in text:
-            score += 0.3
-    
-    return {"score": score, "hits": hits}
+    """候補ノードのスコアリング（キーワード一致 × weight + 名詞×症状ペア加点）"""
+    if not DIAGNOSTIC_GRAPH_AVAILABLE:
+        return {"score": 0.0, "hits": []}
+    matcher = RoutingMatcher({"next_nodes_map": [candidate]})
+    return matcher.score(matcher.match(text))[0]
 
 def route_next_node(current_node_id: str, user_answer: str, context: Dict[str, Any]) -> Dict[str, Any]:
     """ルーティングエンジン - 次のノードを決定"""
     try:
-        nodes = context.get("nodes", [])
-        current_node = None
-        
         # 現在のノードを検索
-        for node in nodes:
-            if node.get("id") == current_node_id:
-                current_node = node
-                break
+        graph = get_diagnostic_graph(context.get("nodes", []))
+        current_node = graph.get_node(current_node_id)
         
         if not current_node:
             return {
@@ -3317,41 +3540,31 @@ def route_next_node(current_node_id: str, user_answer: str, context: Dict[str, A
                 "decision_detail": {"reason": "no_routing_config"}
             }
         
-        text = user_answer.lower() if user_answer else ""
-        next_nodes_map = routing_config["next_nodes_map"]
         threshold = routing_config.get("threshold", 1.5)
         
+        # キーワード・安全ワード・ペアを回答文1回の走査でまとめて照合
+        matcher = graph.matcher(current_node_id)
+        match = matcher.match(user_answer or "")
+        
         # 安全ワード判定（最優先）
-        safety_words = routing_config.get("safety_words", [])
-        if safety_words:
-            for safety_word in safety_words:
-                if safety_word.lower() in text:
-                    # 安全ノードを検索
-                    safety_candidate = None
-                    for candidate in next_nodes_map:
-                        if candidate.get("safety", False):
-                            safety_candidate = candidate
-                            break
-                    
-                    if safety_candidate:
-                        return {
-                            "nextNodeId": safety_candidate["id"],
-                            "decision_detail": {
-                                "safety_triggered": True,
-                                "matched_keywords": [safety_word],
-                                "reason": "safety_word_detected"
-                            }
-                        }
+        if match.safety_word:
+            # 安全ノードを検索
+            safety_candidate = next((c for c in matcher.candidates if c.get("safety", False)), None)
+            if safety_candidate:
+                return {
+                    "nextNodeId": safety_candidate["id"],
+                    "decision_detail": {
+                        "safety_triggered": True,
+                        "matched_keywords": [match.safety_word],
+                        "reason": "safety_word_detected"
+                    }
+                }
         
         # スコアリング実行
-        scored_candidates = []
-        for candidate in next_nodes_map:
-            result = score_candidate(text, candidate)
-            scored_candidates.append({
-                **candidate,
-                "score": result["score"],
-                "hits": result["hits"]
-            })
+        scored_candidates = [
+            {**candidate, **result}
+            for candidate, result in zip(matcher.candidates, matcher.score(match))
+        ]
         
         # スコア順にソート
         scored_candidates.sort(key=lambda x: x["score"], reverse=True)
@@ -3396,6 +3609,26 @@ def route_next_node(current_node_id: str, user_answer: str, context: Dict[str, A
             "decision_detail": {"reason": "error", "error": str(e)}
         }
 
+def route_next_nodes_batch(items: List[Dict[str, Any]], context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    複数の回答をまとめてルーティング（ログは記録しない）
+    
+    グラフと照合器はノード一覧ごとに1回だけ作られるので、各回答は回答文1回の走査で済む。
+    
+    Args:
+        items: {"currentNodeId": ..., "userAnswer": ...} のリスト
+        context: {"nodes": [...]}
+    
+    Returns:
+        items と同じ順の route_next_node の結果
+    """
+    results = []
+    for item in items:
+        current_node_id = str(item.get("currentNodeId", "")).strip()
+        user_answer = str(item.get("userAnswer", "")).strip()
+        results.append(route_next_node(current_node_id, user_answer, context))
+    return results
+
 def run_notion_diagnostic_flow(message: str, symptoms: List[str]) -> Dict[str, Any]:
     """Notion診断フローを実行"""
     try:
@@ -4022,69 +4255,94 @@ def get_cache_key(cache_type: str, **kwargs) -> str:
 
 def get_from_cache(key: str) -> Optional[Any]:
     """キャッシュからデータを取得"""
-    global cache
-    
-    if key not in cache:
-        return None
-    
-    entry = cache[key]
-    if datetime.now().timestamp() > entry["expires_at"]:
-        del cache[key]
-        return None
-    
-    return entry["data"]
+    return api_cache.get(key)
 
 def set_cache(key: str, data: Any, ttl: int = CACHE_EXPIRY_SECONDS):
     """キャッシュにデータを保存"""
-    global cache
-    
-    cache[key] = {
-        "data": data,
-        "expires_at": datetime.now().timestamp() + ttl
-    }
+    api_cache.set(key, data, ttl)
 
 def load_notion_diagnostic_data_cached(category: str = "", updated_since: str = ""):
-    """キャッシュ付き診断データ取得"""
+    """キャッシュ付き診断データ取得（同時の再取得は1回にまとめ、期限切れ直後は前回の値を返す）"""
     cache_key = get_cache_key("DIAG", category=category, updated_since=updated_since)
     
-    # キャッシュから取得を試行
-    cached_data = get_from_cache(cache_key)
-    if cached_data is not None:
-        print(f"📦 キャッシュから診断データを取得: {cache_key}")
-        return cached_data
-    
-    # キャッシュにない場合は取得して保存
-    try:
-        data = load_notion_diagnostic_data()
+    def load():
+        data = load_notion_diagnostic_data(allow_stale=False)
         if data:
-            set_cache(cache_key, data)
             print(f"💾 診断データをキャッシュに保存: {cache_key}")
         return data
+    
+    try:
+        return api_cache.get_or_load(cache_key, load)
     except Exception as e:
         print(f"⚠️ 診断データ取得エラー: {e}")
         return None
 
 def load_notion_repair_cases_cached(category: str = ""):
-    """キャッシュ付き修理ケース取得"""
+    """キャッシュ付き修理ケース取得（同時の再取得は1回にまとめ、期限切れ直後は前回の値を返す）"""
     cache_key = get_cache_key("CASE", category=category)
     
-    # キャッシュから取得を試行
-    cached_data = get_from_cache(cache_key)
-    if cached_data is not None:
-        print(f"📦 キャッシュから修理ケースを取得: {cache_key}")
-        return cached_data
-    
-    # キャッシュにない場合は取得して保存
-    try:
+    def load():
         data = load_notion_repair_cases()
         if data:
-            set_cache(cache_key, data)
             print(f"💾 修理ケースをキャッシュに保存: {cache_key}")
         return data
+    
+    try:
+        return api_cache.get_or_load(cache_key, load)
     except Exception as e:
         print(f"⚠️ 修理ケース取得エラー: {e}")
         return []
 
+# === 起動時スナップショット ===
+# 診断データ・修理ケースとその検索インデックス・診断グラフを保存し、起動時に期限切れ扱いで復元する。
+# 最初のリクエストは復元した値ですぐ応答し、裏でNotionから読み込み直す（get_or_load の stale 応答）
+
+def _export_diagnostic_snapshot():
+    data = diagnostic_data_cache.peek("all")
+    if not data:
+        return None
+    nodes = data.get("nodes") or []
+    diagnostic_node_index.update(nodes)
+    return {"data": data, "graph": get_diagnostic_graph(data), "node_index": diagnostic_node_index.export_state()}
+
+def _restore_diagnostic_snapshot(value: Dict[str, Any]) -> bool:
+    data = value.get("data")
+    if not data:
+        return False
+    diagnostic_data_cache.set("all", data, ttl=0)
+    api_cache.set(get_cache_key("DIAG", category="", updated_since=""), data, ttl=0)
+    remember_diagnostic_graph(data.get("nodes") or [], value["graph"])
+    diagnostic_node_index.restore_state(value.get("node_index"))
+    return True
+
+def _export_repair_case_snapshot():
+    cases = api_cache.peek(get_cache_key("CASE", category=""))
+    if not cases:
+        return None
+    repair_case_index.update(cases)
+    return {"cases": cases, "index": repair_case_index.export_state()}
+
+def _restore_repair_case_snapshot(value: Dict[str, Any]) -> bool:
+    cases = value.get("cases")
+    if not cases:
+        return False
+    api_cache.set(get_cache_key("CASE", category=""), cases, ttl=0)
+    repair_case_index.restore_state(value.get("index"))
+    return True
+
+def revalidate_warm_snapshot():
+    """スナップショットから復元したデータをNotionで再検証（復元した値を返しつつ裏で読み込み直す）"""
+    try:
+        load_notion_diagnostic_data()
+        load_notion_diagnostic_data_cached()
+        load_notion_repair_cases_cached()
+    except Exception as e:
+        print(f"⚠️ スナップショットの再検証エラー: {e}")
+
+if NOTION_AVAILABLE:
+    warm_snapshot.register("diagnostic_data", _export_diagnostic_snapshot, _restore_diagnostic_snapshot)
+    warm_snapshot.register("repair_cases", _export_repair_case_snapshot, _restore_repair_case_snapshot)
+
 def log_routing_decision(decision_data: Dict[str, Any]):
     """ルーティング決定のログ記録"""
     try:
@@ -4111,8 +4369,7 @@ def log_routing_decision(decision_data: Dict[str, Any]):
 
 # === 診断フロー専用API エンドポイント ===
 
-# 診断セッション管理用のグローバル変数（本番環境ではRedis等を使用）
-DIAGNOSTIC_SESSIONS = {}
+# 診断セッションは diagnostic_sessions（utils/session_store.py）で管理
 DIAGNOSTIC_NODE_CACHE = {}
 CACHE_LAST_FETCHED = 0
 
@@ -4144,14 +4401,10 @@ def diagnose_start():
             import uuid
             # フォールバック診断セッションを保存
             fallback_session_id = str(uuid.uuid4())
-            DIAGNOSTIC_SESSIONS[fallback_session_id] = {
-                "current_node": "fallback_start",
-                "history": ["fallback_start"],
-                "answers": [],
-                "created_at": datetime.now().isoformat(),
-                "category": category,
-                "fallback": True
-            }
+            diagnostic_sessions.put(
+                fallback_session_id,
+                DiagnosticSession("fallback_start", category=category, fallback=True)
+            )
             print(f"✅ フォールバック診断セッション作成: {fallback_session_id}")
             
             response_data = {
@@ -4209,12 +4462,8 @@ def diagnose_start():
             pass
         
         # 開始ノードを検索
-        start_node = None
-        for node in diagnostic_data.get("nodes", []):
-            if node.get("is_start", False):
-                if category == "general" or node.get("category", "").lower() == category.lower():
-                    start_node = node
-                    break
+        graph = get_diagnostic_graph(diagnostic_data)
+        start_node = graph.start_node(category)
         
         if not start_node:
             return jsonify({"error": "開始ノードが見つかりません"}), 404
@@ -4224,13 +4473,7 @@ def diagnose_start():
         session_id = str(uuid.uuid4())
         
         # セッション情報を保存
-        DIAGNOSTIC_SESSIONS[session_id] = {
-            "current_node": start_node["id"],
-            "history": [start_node["id"]],
-            "answers": [],
-            "created_at": datetime.now().isoformat(),
-            "category": category
-        }
+        diagnostic_sessions.put(session_id, DiagnosticSession(start_node["id"], category=category))
         
         print(f"✅ 診断セッション開始: session_id={session_id}, node_id={start_node['id']}")
         
@@ -4238,7 +4481,7 @@ def diagnose_start():
             "session_id": session_id,
             "node_id": start_node["id"],
             "question": start_node.get("question", "症状を詳しく教えてください"),
-            "options": get_diagnostic_options(start_node),
+            "options": graph.options(start_node["id"]),
             "safety": {
                 "urgent": start_node.get("emergency", False),
                 "notes": start_node.get("warnings", "")
@@ -4279,53 +4522,41 @@ def diagnose_answer():
             return handle_fallback_diagnosis(answer_text, session_id)
         
         # セッションの存在確認
-        if session_id not in DIAGNOSTIC_SESSIONS:
+        session = diagnostic_sessions.get(session_id)
+        if session is None:
             return jsonify({"error": "セッションが見つかりません"}), 404
         
-        session = DIAGNOSTIC_SESSIONS[session_id]
-        
         # 診断データを取得
         diagnostic_data = load_notion_diagnostic_data_cached()
         if not diagnostic_data:
             return jsonify({"error": "診断データが利用できません"}), 500
         
         # 現在のノードを取得
-        current_node = None
-        for node in diagnostic_data.get("nodes", []):
-            if node["id"] == node_id:
-                current_node = node
-                break
+        graph = get_diagnostic_graph(diagnostic_data)
+        current_node = graph.get_node(node_id)
         
         if not current_node:
             return jsonify({"error": "診断ノードが見つかりません"}), 404
         
         # 回答をセッションに記録
-        session["answers"].append({
-            "node_id": node_id,
-            "answer": answer_text,
-            "timestamp": datetime.now().isoformat()
-        })
+        session.record_answer(node_id, answer_text, datetime.now().isoformat())
         
         # 次のノードを決定
         next_node_id = determine_next_node(current_node, answer_text, diagnostic_data)
         
         if next_node_id:
             # 次のノードを取得
-            next_node = None
-            for node in diagnostic_data.get("nodes", []):
-                if node["id"] == next_node_id:
-                    next_node = node
-                    break
+            next_node = graph.get_node(next_node_id)
             
             if next_node:
                 # セッションを更新
-                session["current_node"] = next_node_id
-                session["history"].append(next_node_id)
+                session.move_to(next_node_id)
+                diagnostic_sessions.put(session_id, session)
                 
                 return jsonify({
                     "node_id": next_node_id,
                     "question": next_node.get("question", "症状を詳しく教えてください"),
-                    "options": get_diagnostic_options(next_node),
+                    "options": graph.options(next_node_id),
                     "safety": {
                         "urgent": next_node.get("emergency", False),
                         "notes": next_node.get("warnings", "")
@@ -4334,6 +4565,7 @@ def diagnose_answer():
                 })
         
         # 診断終了処理
+        diagnostic_sessions.put(session_id, session)
         return generate_diagnostic_result(session, current_node, diagnostic_data)
         
     except Exception as e:
@@ -4351,38 +4583,14 @@ def diagnose_answer():
         response.headers['Content-Type'] = 'application/json'
         return response, 500
 
-def get_diagnostic_options(node):
-    """診断ノードから選択肢を取得"""
-    options = []
-    
-    # routing_configから選択肢を取得
-    routing_config = node.get("routing_config")
-    if routing_config and isinstance(routing_config, dict):
-        next_nodes_map = routing_config.get("next_nodes_map", [])
-        for option in next_nodes_map:
-            options.append({
-                "text": option.get("label", "選択肢"),
-                "value": option.get("id", "")
-            })
-    
-    # 次のノードから選択肢を取得（フォールバック）
-    if not options:
-        next_nodes = node.get("next_nodes", [])
-        for next_node_id in next_nodes:
-            options.append({
-                "text": f"選択肢 {len(options) + 1}",
-                "value": next_node_id
-            })
-    
-    return options
-
 def determine_next_node(current_node, answer_text, diagnostic_data):
     """次のノードを決定するルーティングエンジン"""
     try:
         # routing_configを優先
         routing_config = current_node.get("routing_config")
         if routing_config and isinstance(routing_config, dict):
-            return route_by_config(answer_text, routing_config, diagnostic_data)
+            matcher = get_diagnostic_graph(diagnostic_data).matcher(current_node.get("id"))
+            return route_by_config(answer_text, routing_config, diagnostic_data, matcher=matcher)
         
         # フォールバック: 次のノードの最初を選択
         next_nodes = current_node.get("next_nodes", [])
@@ -4395,19 +4603,20 @@ def determine_next_node(current_node, answer_text, diagnostic_data):
         print(f"⚠️ ルーティングエラー: {e}")
         return None
 
-def route_by_config(answer_text, config, diagnostic_data):
-    """routing_configに基づくルーティング"""
+def route_by_config(answer_text, config, diagnostic_data, matcher=None):
+    """routing_configに基づくルーティング（matcher はコンパイル済みの照合器）"""
     try:
-        next_nodes_map = config.get("next_nodes_map", [])
+        matcher = matcher or RoutingMatcher(config)
         threshold = config.get("threshold", 1.0)
+        match = matcher.match(answer_text)
         
-        # キーワードマッチングでスコアリング
+        # キーワードマッチングでスコアリング（ヒットしたキーワードの割合 × weight）
         scored_options = []
-        for option in next_nodes_map:
+        for option, hits in zip(matcher.candidates, match.candidate_hits):
             keywords = option.get("keywords", [])
             weight = option.get("weight", 1.0)
             
-            score = score_keywords(answer_text, keywords) * weight
+            score = (len(hits) / len(keywords) if keywords else 0.0) * weight
             scored_options.append({
                 "id": option.get("id"),
                 "score": score,
@@ -4432,15 +4641,6 @@ def route_by_config(answer_text, config, diagnostic_data):
         print(f"⚠️ ルーティング設定エラー: {e}")
         return None
 
-def score_keywords(text, keywords):
-    """キーワードマッチングによるスコアリング"""
-    if not keywords:
-        return 0.0
-    
-    text_lower = text.lower()
-    hits = sum(1 for keyword in keywords if keyword.lower() in text_lower)
-    return hits / len(keywords)
-
 def generate_diagnostic_result(session, current_node, diagnostic_data):
     """診断結果を生成"""
     try:
@@ -4448,11 +4648,7 @@ def generate_diagnostic_result(session, current_node, diagnostic_data):
         result = {
             "is_terminated": True,
             "confidence": 0.8,  # 簡易実装
-            "summary": {
-                "title": current_node.get("diagnosis_result", "診断結果"),
-                "details": current_node.get("diagnosis_result", ""),
-                "next_steps": "専門業者への相談をお勧めします"
-            },
+            "summary": get_diagnostic_graph(diagnostic_data).summary(current_node["id"]),
             "related_cases": [],
             "required_parts": []
         }
@@ -4727,6 +4923,7 @@ def auth_me():
 # === フェーズ1: Factory & Builder API エンドポイント ===
 
 @app.route("/api/v1/factories", methods=["GET"])
+@conditional_get(lambda: _replica_version("factories") if factory_manager else None)
 def get_factories():
     """工場一覧取得"""
     try:
@@ -5113,9 +5310,7 @@ def admin_deals_dashboard():
 def get_admin_cases():
     """案件一覧取得API（Next.js用）JWTあり時は工場は自社案件のみ"""
     try:
-        from data_access.factory_dashboard_manager import FactoryDashboardManager
-        
-        manager = FactoryDashboardManager()
+        manager = managers.get("factory_dashboard")
         
         status = request.args.get("status")  # フィルタ（受付/診断中/修理中/完了/キャンセル）
         limit = int(request.args.get("limit", 100))
@@ -5178,9 +5373,7 @@ def update_admin_case_status():
                 "error": "page_idとstatusが必要です"
             }), 400
         
-        from data_access.factory_dashboard_manager import FactoryDashboardManager
-        
-        manager = FactoryDashboardManager()
+        manager = managers.get("factory_dashboard")
         success = manager.update_status(page_id, status)
         
         if success:
@@ -5218,9 +5411,7 @@ def add_admin_comment():
                 "error": "page_idとcommentが必要です"
             }), 400
         
-        from data_access.factory_dashboard_manager import FactoryDashboardManager
-        
-        manager = FactoryDashboardManager()
+        manager = managers.get("factory_dashboard")
         success = manager.add_comment(page_id, comment)
         
         if success:
@@ -5235,9 +5426,8 @@ def add_admin_comment():
                             f"[factory-comment-email] 送信開始 page_id={page_id}",
                             flush=True,
                         )
-                        from data_access.factory_dashboard_manager import FactoryDashboardManager
 
-                        ok = FactoryDashboardManager().send_factory_comment_customer_email(
+                        ok = managers.get("factory_dashboard").send_factory_comment_customer_email(
                             page_id, comment
                         )
                         print(
@@ -5302,6 +5492,7 @@ def get_factory_cases(factory_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/v1/builders", methods=["GET"])
+@conditional_get(lambda: None)
 def get_builders():
     """ビルダー一覧取得"""
     try:
@@ -5427,8 +5618,6 @@ def create_review():
     """
     try:
         import uuid
-        from data_access.review_manager import ReviewManager
-        from data_access.partner_shop_manager import PartnerShopManager
         
         data = request.get_json()
         deal_id = data.get("deal_id")
@@ -5457,7 +5646,7 @@ def create_review():
             uuid.UUID(str(partner_page_id))
         except Exception:
             try:
-                partner_manager = PartnerShopManager()
+                partner_manager = managers.get("partner_shop")
                 partner_shop = partner_manager.get_shop(str(partner_page_id))
                 if partner_shop and partner_shop.get("page_id"):
                     normalized_partner_page_id = partner_shop["page_id"]
@@ -5472,7 +5661,7 @@ def create_review():
                     "error": f"パートナー工場IDの解決に失敗しました: {e}"
                 }), 500
         
-        review_manager = ReviewManager()
+        review_manager = managers.get("review")
         review = review_manager.create_review(
             deal_id=deal_id,
             partner_page_id=normalized_partner_page_id,
@@ -5520,13 +5709,11 @@ def get_reviews():
     }
     """
     try:
-        from data_access.review_manager import ReviewManager
-        
         partner_page_id = request.args.get("partner_page_id")
         status = request.args.get("status")
         limit = int(request.args.get("limit", 20))
         
-        review_manager = ReviewManager()
+        review_manager = managers.get("review")
         reviews = review_manager.get_reviews(
             partner_page_id=partner_page_id,
             status=status,
@@ -5565,8 +5752,6 @@ def update_review_status(review_id):
     }
     """
     try:
-        from data_access.review_manager import ReviewManager
-        
         data = request.get_json()
         status = data.get("status")
         admin_comment = data.get("admin_comment")
@@ -5577,7 +5762,7 @@ def update_review_status(review_id):
                 "error": "statusはapprovedまたはrejectedを指定してください"
             }), 400
         
-        review_manager = ReviewManager()
+        review_manager = managers.get("review")
         success = review_manager.update_review_status(
             review_id=review_id,
             status=status,
@@ -5651,8 +5836,6 @@ def match_factory_to_case():
         500: サーバーエラー
     """
     try:
-        from data_access.factory_matching import FactoryMatchingEngine
-        
         data = request.get_json()
         case = data.get("case", {})
         max_results = int(data.get("max_results", 5))
@@ -5663,7 +5846,7 @@ def match_factory_to_case():
                 "error": "case情報が必要です"
             }), 400
         
-        matching_engine = FactoryMatchingEngine()
+        matching_engine = managers.get("factory_matching")
         matched_factories = matching_engine.match_factory_to_case(
             case=case,
             max_results=max_results
@@ -5709,8 +5892,6 @@ def auto_assign_case_to_factory(case_id):
     }
     """
     try:
-        from data_access.factory_matching import FactoryMatchingEngine
-        
         data = request.get_json()
         case = data.get("case", {})
         
@@ -5720,7 +5901,7 @@ def auto_assign_case_to_factory(case_id):
                 "error": "case情報が必要です"
             }), 400
         
-        matching_engine = FactoryMatchingEngine()
+        matching_engine = managers.get("factory_matching")
         assigned_factory = matching_engine.auto_assign_case(
             case_id=case_id,
             case=case
@@ -5748,12 +5929,11 @@ def auto_assign_case_to_factory(case_id):
 
 # === フェーズ4-2: ビルダー（販売店）連携機能 ===
 @app.route("/api/v1/partner-shops", methods=["GET"])
+@conditional_get(lambda: _replica_version("partner_shops"))
 def get_partner_shops():
     """パートナー修理店一覧取得"""
     try:
-        from data_access.partner_shop_manager import PartnerShopManager
-        
-        manager = PartnerShopManager()
+        manager = managers.get("partner_shop")
         
         status = request.args.get("status")
         prefecture = request.args.get("prefecture")
@@ -5779,9 +5959,7 @@ def get_partner_shops():
 def get_partner_shop_detail(shop_id):
     """パートナー修理店詳細取得"""
     try:
-        from data_access.partner_shop_manager import PartnerShopManager
-        
-        manager = PartnerShopManager()
+        manager = managers.get("partner_shop")
         shop = manager.get_shop(shop_id)
         
         if not shop:
@@ -5796,8 +5974,6 @@ def get_partner_shop_detail(shop_id):
 def create_deal():
     """商談作成（問い合わせフォーム送信）"""
     try:
-        from data_access.deal_manager import DealManager
-        
         data = request.get_json()
         
         # 必須項目チェック
@@ -5812,7 +5988,7 @@ def create_deal():
                     "error": f"{field}は必須です"
                 }), 400
         
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         deal = deal_manager.create_inquiry(
             customer_name=data["customer_name"],
             phone=data["phone"],
@@ -5827,15 +6003,11 @@ def create_deal():
         
         # 通知機能（メール + LINE）
         try:
-            from notification.email_sender import EmailSender
-            from notification.line_notifier import LineNotifier
-            from data_access.partner_shop_manager import PartnerShopManager
-            
-            email_sender = EmailSender()
-            line_notifier = LineNotifier()
+            email_sender = managers.get("email_sender")
+            line_notifier = managers.get("line_notifier")
             
             # 修理店情報を取得
-            partner_manager = PartnerShopManager()
+            partner_manager = managers.get("partner_shop")
             partner_shop = partner_manager.get_shop_by_page_id(data["partner_page_id"])
             
             print(f"📧 メール通知処理開始:")
@@ -5978,9 +6150,7 @@ def create_deal():
 def get_deals():
     """商談一覧取得"""
     try:
-        from data_access.deal_manager import DealManager
-        
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         
         status = request.args.get("status")
         partner_page_id = request.args.get("partner_page_id")
@@ -6004,11 +6174,6 @@ def get_deals():
 def update_deal_status(deal_id):
     """商談ステータス更新"""
     try:
-        from data_access.deal_manager import DealManager
-        from data_access.partner_shop_manager import PartnerShopManager
-        from notification.email_sender import EmailSender
-        from notification.line_notifier import LineNotifier
-        
         data = request.get_json()
         status = data.get("status")
         notes = data.get("notes")  # 備考（オプション）
@@ -6019,7 +6184,7 @@ def update_deal_status(deal_id):
                 "error": "statusが必要です"
             }), 400
         
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         updated_deal = deal_manager.update_deal_status(deal_id, status)
         
         if not updated_deal:
@@ -6030,8 +6195,8 @@ def update_deal_status(deal_id):
         
         # ステータス更新通知を送信
         try:
-            email_sender = EmailSender()
-            line_notifier = LineNotifier()
+            email_sender = managers.get("email_sender")
+            line_notifier = managers.get("line_notifier")
             
             # 商談情報を取得
             deal = deal_manager.get_deal(deal_id)
@@ -6045,7 +6210,7 @@ def update_deal_status(deal_id):
                 partner_page_ids = deal.get("partner_page_ids", [])
                 partner_name = "修理店"
                 if partner_page_ids:
-                    partner_manager = PartnerShopManager()
+                    partner_manager = managers.get("partner_shop")
                     partner_shop = partner_manager.get_shop_by_page_id(partner_page_ids[0])
                     if partner_shop:
                         partner_name = partner_shop.get("name", "修理店")
@@ -6094,11 +6259,6 @@ def update_deal_status(deal_id):
 def add_customer_note(deal_id):
     """お客様からの備考追加"""
     try:
-        from data_access.deal_manager import DealManager
-        from data_access.partner_shop_manager import PartnerShopManager
-        from notification.email_sender import EmailSender
-        from notification.line_notifier import LineNotifier
-        
         data = request.get_json()
         customer_note = data.get("note") or data.get("customer_note")
         
@@ -6108,7 +6268,7 @@ def add_customer_note(deal_id):
                 "error": "note（備考）が必要です"
             }), 400
         
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         updated_deal = deal_manager.add_customer_note(deal_id, customer_note)
         
         if not updated_deal:
@@ -6119,8 +6279,8 @@ def add_customer_note(deal_id):
         
         # 工場側への自動通知
         try:
-            email_sender = EmailSender()
-            line_notifier = LineNotifier()
+            email_sender = managers.get("email_sender")
+            line_notifier = managers.get("line_notifier")
             
             # 商談情報を取得
             deal = deal_manager.get_deal(deal_id)
@@ -6131,7 +6291,7 @@ def add_customer_note(deal_id):
                 # 修理店情報を取得
                 partner_page_ids = deal.get("partner_page_ids", [])
                 if partner_page_ids:
-                    partner_manager = PartnerShopManager()
+                    partner_manager = managers.get("partner_shop")
                     partner_shop = partner_manager.get_shop_by_page_id(partner_page_ids[0])
                     
                     if partner_shop:
@@ -6208,11 +6368,6 @@ Notionダッシュボードで詳細を確認してください。
 def add_progress_report(deal_id):
     """工場側からの経過報告送信"""
     try:
-        from data_access.deal_manager import DealManager
-        from data_access.partner_shop_manager import PartnerShopManager
-        from notification.email_sender import EmailSender
-        from notification.line_notifier import LineNotifier
-        
         data = request.get_json()
         progress_message = data.get("message") or data.get("progress_message")
         
@@ -6222,7 +6377,7 @@ def add_progress_report(deal_id):
                 "error": "message（経過報告内容）が必要です"
             }), 400
         
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         
         # 経過報告を追加（最大2回まで）
         try:
@@ -6242,8 +6397,8 @@ def add_progress_report(deal_id):
         
         # お客様への自動通知
         try:
-            email_sender = EmailSender()
-            line_notifier = LineNotifier()
+            email_sender = managers.get("email_sender")
+            line_notifier = managers.get("line_notifier")
             
             # 商談情報を取得
             deal = deal_manager.get_deal(deal_id)
@@ -6257,7 +6412,7 @@ def add_progress_report(deal_id):
                 partner_page_ids = deal.get("partner_page_ids", [])
                 partner_name = "修理店"
                 if partner_page_ids:
-                    partner_manager = PartnerShopManager()
+                    partner_manager = managers.get("partner_shop")
                     partner_shop = partner_manager.get_shop_by_page_id(partner_page_ids[0])
                     if partner_shop:
                         partner_name = partner_shop.get("name", "修理店")
@@ -6329,9 +6484,7 @@ def add_progress_report(deal_id):
 def get_deal_by_page_id(page_id):
     """Page IDから商談IDを取得"""
     try:
-        from data_access.deal_manager import DealManager
-        
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         
         # すべての商談を検索してpage_idでフィルタ
         deals = deal_manager.list_deals(limit=1000)
@@ -6360,8 +6513,6 @@ def get_deal_by_page_id(page_id):
 def update_deal_amount(deal_id):
     """成約金額更新"""
     try:
-        from data_access.deal_manager import DealManager
-        
         data = request.get_json()
         deal_amount = data.get("deal_amount")
         commission_rate = data.get("commission_rate")
@@ -6372,7 +6523,7 @@ def update_deal_amount(deal_id):
                 "error": "deal_amountが必要です"
             }), 400
         
-        deal_manager = DealManager()
+        deal_manager = managers.get("deal")
         updated_deal = deal_manager.update_deal_amount(
             deal_id=deal_id,
             deal_amount=deal_amount,
@@ -6408,13 +6559,14 @@ def reload_data():
         global db
         use_text_files = os.getenv("USE_TEXT_FILES", "true").lower() == "true"
         
-        # 既存のDBをクリア
-        db = None
+        # マネージャーも作り直す（環境変数・DB IDの変更を反映）
+        managers.reload()
         
-        # 新しいRAGシステムを作成
-        db = create_notion_based_rag_system(use_text_files=use_text_files)
+        # 新しいRAGシステムを作成（構築が終わるまでは既存のDBで検索を続ける）
+        new_db = load_rag_db(use_text_files)
         
-        if db:
+        if new_db:
+            db = new_db
             print("✅ データベース再構築が完了しました")
             return jsonify({
                 "success": True,
@@ -6505,8 +6657,6 @@ def estimate_repair_cost():
     }
     """
     try:
-        from data_access.cost_estimation import CostEstimationEngine
-        
         data = request.get_json()
         symptoms = data.get("symptoms", "")
         category = data.get("category")
@@ -6518,7 +6668,7 @@ def estimate_repair_cost():
                 "error": "symptoms（症状）が必要です"
             }), 400
         
-        estimation_engine = CostEstimationEngine()
+        estimation_engine = managers.get("cost_estimation")
         estimation = estimation_engine.estimate_cost(
             symptoms=symptoms,
             category=category,
@@ -6560,6 +6710,7 @@ except ImportError as e:
 
 @app.route("/api/v1/partner-shops", methods=["GET"])
 @cross_origin()
+@conditional_get(lambda: _replica_version("partner_shops") if PARTNER_MANAGER_AVAILABLE and partner_manager else None)
 def get_partners():
     """
     パートナー修理店一覧を取得
@@ -6718,8 +6869,10 @@ def get_system_info():
         doc_count = 0
         if db:
             try:
-                # ChromaDBの場合、コレクションから取得
-                if hasattr(db, 'get') and hasattr(db, '_collection'):
+                # FlatVectorIndex の場合は統計の件数、ChromaDBの場合はコレクションから取得
+                if isinstance(db, FlatVectorIndex):
+                    doc_count = db.get_stats()["entries"]
+                elif hasattr(db, 'get') and hasattr(db, '_collection'):
                     # コレクションの件数を取得
                     try:
                         collection = db._collection
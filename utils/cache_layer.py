@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+統合キャッシュ
+用途ごとの名前空間に TTL・件数/メモリ上限・追い出し方式（LRU / LFU）を設定し、
+ヒット・ミス・追い出しの件数を集計する。disk にSQLiteの CacheManager を渡すと
+メモリ → ディスクの2段構成になる（メモリから追い出されてもディスクから戻せる）
+
+get_or_load は同じキーの読み込みを1つにまとめ（single-flight）、stale_ttl を設定した
+名前空間では期限切れ直後の値をすぐ返して裏で読み込み直す（stale-while-revalidate）
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """値のおおよそのメモリ使用量（バイト）。dict / list / tuple / set は中身も数える"""
+    size = sys.getsizeof(value)
+    if _depth >= 6:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, _depth + 1) for item in value)
+    return size
+
+
+class SingleFlight:
+    """
+    同じキーの処理の同時実行を1つにまとめる
+
+    実行中のキーを後から呼んだスレッドは、最初の呼び出しの結果（例外も含む）を待って受け取る。
+    """
+
+    def __init__(self, name: str = "single-flight"):
+        self.name = name
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "background": 0}
+
+    def _begin(self, key: Hashable):
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _execute(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """fn を実行して結果を返す（同じキーが実行中ならその結果を待つ）"""
+        future, leader = self._begin(key)
+        if leader:
+            self._execute(key, future, fn)
+        return future.result()
+
+    def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Future:
+        """fn をバックグラウンドスレッドで実行（同じキーが実行中なら何もせずその Future を返す）"""
+        future, leader = self._begin(key)
+        if leader:
+            with self._lock:
+                self._stats["background"] += 1
+            threading.Thread(
+                target=self._execute, args=(key, future, fn), name=f"{self.name}-refresh", daemon=True
+            ).start()
+        return future
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._inflight), **self._stats}
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "size", "hits")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+        self.hits = 0
+
+
+class CacheNamespace:
+    """1つの名前空間（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float] = 300,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        policy: str = "lru",
+        disk: Any = None,
+        size_of: Callable[[Any], int] = approx_size,
+        stale_ttl: float = 0,
+    ):
+        """
+        初期化
+
+        Args:
+            name: 名前空間名（ディスクのキーの接頭辞・cache_type にも使う）
+            ttl: 既定の有効期限（秒、None は無期限）
+            max_entries: メモリに置く最大件数
+            max_bytes: メモリに置く値のおおよその合計サイズの上限
+            policy: "lru"（最後の利用が古いもの）または "lfu"（ヒット数が少ないもの）から追い出す
+            disk: 2段目のストア（get / set(key, value, ttl, cache_type) / delete を持つ CacheManager など）
+            size_of: 値のサイズの見積もり関数（max_bytes を指定した場合のみ使う）
+            stale_ttl: 期限切れ後、get_or_load が古い値を返しつつ裏で読み込み直せる時間（秒）
+        """
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"未対応の追い出し方式です: {policy}")
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.disk = disk
+        self.size_of = size_of
+        self.stale_ttl = stale_ttl
+        self._flight = SingleFlight(f"cache-{name}")
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {
+            "hits": 0, "misses": 0, "stale_hits": 0, "disk_hits": 0,
+            "sets": 0, "loads": 0, "load_errors": 0, "evictions": 0, "expirations": 0,
+        }
+
+    # ---- 内部処理 ----
+
+    def _disk_key(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _victim(self, keep: str) -> str:
+        # 追加したばかりの値（keep）は他に候補が無い場合のみ追い出す
+        if self.policy == "lfu":
+            candidates = [key for key in self._entries if key != keep] or [keep]
+            # 同じヒット数なら利用が古いもの（OrderedDict の先頭側）
+            return min(candidates, key=lambda k: self._entries[k].hits)
+        return next((key for key in self._entries if key != keep), keep)
+
+    def _enforce_bounds(self, keep: str) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._drop(self._victim(keep))
+            self._stats["evictions"] += 1
+
+    def _store(self, key: str, value: Any, expires_at: float) -> None:
+        size = self.size_of(value) if self.max_bytes is not None else 0
+        self._drop(key)
+        self._entries[key] = _Entry(value, expires_at, expires_at + self.stale_ttl, size)
+        self._bytes += size
+        self._enforce_bounds(key)
+
+    # ---- 公開API ----
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """値を取得（メモリ → ディスクの順。期限切れ・未登録は default）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    entry.hits += 1
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.value
+                # 古い値を返せる間は get_or_load 用に残しておく
+                if entry.stale_until <= now:
+                    self._drop(key)
+                    self._stats["expirations"] += 1
+
+        value = self._get_from_disk(key, now)
+        if value is not None:
+            return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return default
+
+    def _get_from_disk(self, key: str, now: float) -> Any:
+        if self.disk is None:
+            return None
+        try:
+            value = self.disk.get(self._disk_key(key))
+        except Exception as e:
+            print(f"⚠️ ディスクキャッシュ取得エラー（{self.name}）: {e}")
+            return None
+        if value is not None:
+            with self._lock:
+                # 残りの有効期限はディスク側で管理しているので、メモリには既定のTTLで戻す
+                self._store(key, value, now + self.ttl if self.ttl is not None else float("inf"))
+                self._stats["disk_hits"] += 1
+        return value
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: Optional[float], should_cache: Callable[[Any], bool]) -> Any:
+        value = self._get_from_disk(key, time.time())
+        if value is not None:
+            return value
+        with self._lock:
+            self._stats["loads"] += 1
+        try:
+            value = loader()
+        except Exception:
+            with self._lock:
+                self._stats["load_errors"] += 1
+            raise
+        if should_cache(value):
+            self.set(key, value, ttl)
+        return value
+
+    def _log_refresh_error(self, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            print(f"⚠️ キャッシュのバックグラウンド更新エラー（{self.name}）: {error}")
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: Optional[float] = _MISSING,
+        should_cache: Callable[[Any], bool] = bool,
+        allow_stale: bool = True,
+    ) -> Any:
+        """
+        値を取得し、無ければ loader で読み込んで保存
+
+        同じキーの読み込みが実行中なら、新たに読み込まずにその結果を待つ。
+        期限切れでも stale_ttl の間は古い値をすぐ返し、裏で1回だけ読み込み直す。
+
+        Args:
+            key: キー
+            loader: 値を読み込む関数（引数なし）
+            ttl: 有効期限（省略時は名前空間の既定値）
+            should_cache: 読み込んだ値を保存するかの判定（既定では空・None は保存しない）
+            allow_stale: False の場合は古い値を返さず、読み込みを待つ
+                （別のキャッシュの loader から呼ぶ場合に、古い値を新しい期限で保存しないため）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                entry.hits += 1
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.value
+            stale = allow_stale and entry is not None and entry.stale_until > now
+            if stale:
+                self._stats["stale_hits"] += 1
+            else:
+                self._stats["misses"] += 1
+
+        load = lambda: self._load(key, loader, ttl, should_cache)
+        if stale:
+            self._flight.do_async(key, load).add_done_callback(self._log_refresh_error)
+            return entry.value
+        return self._flight.do(key, load)
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """メモリ上の値を取得（古い値を返せる間は期限切れでも返す。統計・利用順は変えない）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stale_until <= time.time():
+                return default
+            return entry.value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = _MISSING) -> None:
+        """値を保存（ttl 省略時は名前空間の既定値）"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.time() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._store(key, value, expires_at)
+            self._stats["sets"] += 1
+        if self.disk is not None:
+            try:
+                self.disk.set(self._disk_key(key), value, int(ttl) if ttl is not None else 10 * 365 * 24 * 3600, self.name)
+            except Exception as e:
+                print(f"⚠️ ディスクキャッシュ保存エラー（{self.name}）: {e}")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+        if self.disk is not None:
+            try:
+                self.disk.delete(self._disk_key(key))
+            except Exception as e:
+                print(f"⚠️ ディスクキャッシュ削除エラー（{self.name}）: {e}")
+
+    def clear(self) -> None:
+        """メモリ上の値をすべて削除（ディスク側は clear_by_type があれば削除）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk is not None and hasattr(self.disk, "clear_by_type"):
+            try:
+                self.disk.clear_by_type(self.name)
+            except Exception as e:
+                print(f"⚠️ ディスクキャッシュ削除エラー（{self.name}）: {e}")
+
+    def sweep(self) -> int:
+        """期限切れの値をメモリから削除"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.stale_until <= now]
+            for key in expired:
+                self._drop(key)
+            self._stats["expirations"] += len(expired)
+        return len(expired)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes if self.max_bytes is not None else None,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "policy": self.policy,
+                "two_tier": self.disk is not None,
+                "stale_ttl": self.stale_ttl,
+                "loader": self._flight.get_stats(),
+                **self._stats,
+            }
+
+
+class CacheRegistry:
+    """名前空間の一覧と期限切れの定期削除"""
+
+    def __init__(self):
+        self._namespaces: Dict[str, CacheNamespace] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def namespace(self, name: str, **options) -> CacheNamespace:
+        """
+        名前空間を取得（無ければ options で作成。既にある場合 options は無視）
+
+        Args:
+            name: 名前空間名
+            **options: CacheNamespace の引数（ttl / max_entries / max_bytes / policy / disk / size_of）
+        """
+        with self._lock:
+            namespace = self._namespaces.get(name)
+            if namespace is None:
+                namespace = self._namespaces[name] = CacheNamespace(name, **options)
+            return namespace
+
+    def sweep(self) -> Dict[str, int]:
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {namespace.name: namespace.sweep() for namespace in namespaces}
+
+    def clear(self) -> None:
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        for namespace in namespaces:
+            namespace.clear()
+
+    def start_sweeper(self, interval: float = 60) -> bool:
+        """期限切れを定期的に削除するスレッドを開始（開始済みなら何もしない）"""
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return False
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._run, args=(interval,), name="cache-sweeper", daemon=True)
+            self._sweeper.start()
+            return True
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ キャッシュ定期削除エラー: {e}")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {namespace.name: namespace.get_stats() for namespace in namespaces}
+
+
+# グローバルキャッシュ
+caches = CacheRegistry()
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", "60"))
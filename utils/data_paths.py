@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+実行時に作るデータファイルの置き場所
+Notionレプリカ・採番・スプール・埋め込みキャッシュ・起動時スナップショットなどのファイルを
+APP_DATA_DIR（既定はカレントディレクトリ）にまとめる。個別のパスは各ファイルの環境変数で上書きできる。
+ファイルは最初に使ったときに作る（モジュールを読み込んだだけでは作らない）。
+"""
+
+import os
+
+APP_DATA_DIR = os.getenv("APP_DATA_DIR", ".")
+
+
+def data_path(filename: str) -> str:
+    """APP_DATA_DIR 内のファイルのパス"""
+    return os.path.join(APP_DATA_DIR, filename)
+
+
+def ensure_parent_dir(path: str) -> None:
+    """ファイルを作る前に、置き場所のディレクトリを作成"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+埋め込みベクトルのキャッシュ
+OpenAIEmbeddings などを包み、同じモデル・同じテキストの埋め込みはAPIを呼ばずに返す。
+メモリのLRU（CacheNamespace）→ ローカルのSQLiteファイル（float32のBLOB）の2段構成で、
+再起動後の再構築や、同じ質問・拡張クエリの検索でも埋め込みAPIを呼ばない。
+
+キーは (モデル, 種別, 正規化したテキストのハッシュ)。正規化は Unicode NFC と空白の詰めのみ
+（意味が変わらない差だけを同一視する）。
+"""
+
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import weakref
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.cache_layer import CacheNamespace, caches
+from utils.data_paths import data_path, ensure_parent_dir
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", data_path("embedding_cache.db"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model: str, kind: str, text: str) -> str:
+    payload = "\x1f".join([model, kind, normalize_text(text)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _to_float32(vector: Sequence[float]) -> array.array:
+    return array.array("f", vector)
+
+
+class _Connection(sqlite3.Connection):
+    """弱参照できるSQLite接続（sqlite3.Connection そのものは WeakSet に入れられない）"""
+
+
+class EmbeddingStore:
+    """キー → float32 のベクトル（SQLite、スレッドごとのWAL接続）"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        # スレッドが終われば接続も解放されるように弱参照で持つ（close() で閉じるためだけに使う）
+        self._connections: "weakref.WeakSet[sqlite3.Connection]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "errors": 0}
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.path)
+            conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False, factory=_Connection
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.add(conn)
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
+
+    def _init_database(self):
+        """埋め込みテーブルを作成"""
+        self._connect().execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                dim INTEGER,
+                vector BLOB,
+                created_at REAL
+            )
+        ''')
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, array.array]:
+        """見つかったキーだけを返す"""
+        found: Dict[str, array.array] = {}
+        try:
+            conn = self._connect()
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                for key, blob in conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ):
+                    vector = array.array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector
+        except Exception as e:
+            print(f"⚠️ 埋め込みキャッシュ読み込みエラー: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+        with self._lock:
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def set_many(self, model: str, vectors: Dict[str, array.array]) -> None:
+        if not vectors:
+            return
+        now = time.time()
+        rows = [(key, model, len(vector), vector.tobytes(), now) for key, vector in vectors.items()]
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"⚠️ 埋め込みキャッシュ保存エラー: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        with self._lock:
+            self._stats["sets"] += len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except Exception:
+            entries = None
+        with self._lock:
+            return {"path": self.path, "entries": entries, **self._stats}
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+class CachedEmbeddings:
+    """
+    埋め込みモデルを包むキャッシュ（langchain の Embeddings と同じ embed_documents / embed_query を持つ）
+
+    キャッシュの有無で結果が変わらないよう、APIから取得したベクトルも float32 に丸めて返す。
+    """
+
+    # embed_query が embed_documents([text])[0] と同じになるモデル（複数のクエリを1回で埋め込める）
+    QUERY_AS_DOCUMENT_MODELS = ("OpenAIEmbeddings", "AzureOpenAIEmbeddings")
+
+    def __init__(
+        self,
+        embeddings: Any,
+        store: Optional[EmbeddingStore] = None,
+        memory: Optional[CacheNamespace] = None,
+        model: Optional[str] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            embeddings: 元の埋め込みモデル（OpenAIEmbeddings など）
+            store: 2段目のファイルストア（None はメモリのみ）
+            memory: 1段目のメモリキャッシュ（省略時はこのインスタンス専用のLRUを作る）
+            model: キーに使うモデル名（省略時は embeddings.model と dimensions から作る）
+        """
+        self.embeddings = embeddings
+        self.store = store
+        self.memory = memory or CacheNamespace("embeddings", ttl=None, max_entries=EMBEDDING_CACHE_MEMORY_ENTRIES)
+        if model is None:
+            model = str(getattr(embeddings, "model", None) or type(embeddings).__name__)
+            dimensions = getattr(embeddings, "dimensions", None)
+            if dimensions:
+                model = f"{model}:{dimensions}"
+        self.model = model
+        self.batch_queries = type(embeddings).__name__ in self.QUERY_AS_DOCUMENT_MODELS
+        self._lock = threading.Lock()
+        self._stats = {"texts": 0, "memory_hits": 0, "store_hits": 0, "embedded": 0, "api_calls": 0}
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [embedding_key(self.model, kind, text) for text in texts]
+        vectors: Dict[str, array.array] = {}
+        for key in dict.fromkeys(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        memory_hits = len(vectors)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        store_hits = 0
+        if missing and self.store is not None:
+            found = self.store.get_many(missing)
+            store_hits = len(found)
+            for key, vector in found.items():
+                self.memory.set(key, vector)
+            vectors.update(found)
+
+        # キャッシュに無いテキストだけをまとめて埋め込む（同じテキストは1回だけ）
+        pending = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        api_calls = 0
+        if pending:
+            if kind == "query" and not (self.batch_queries and len(pending) > 1):
+                results = [self.embeddings.embed_query(text) for text in pending.values()]
+                api_calls = len(results)
+            else:
+                results = self.embeddings.embed_documents(list(pending.values()))
+                api_calls = 1
+            embedded = {key: _to_float32(vector) for key, vector in zip(pending, results)}
+            for key, vector in embedded.items():
+                self.memory.set(key, vector)
+            if self.store is not None:
+                self.store.set_many(self.model, embedded)
+            vectors.update(embedded)
+
+        with self._lock:
+            self._stats["texts"] += len(texts)
+            self._stats["memory_hits"] += memory_hits
+            self._stats["store_hits"] += store_hits
+            self._stats["embedded"] += len(pending)
+            self._stats["api_calls"] += api_calls
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """複数のクエリをまとめて埋め込む（キャッシュに無いものは対応モデルなら1回のAPI呼び出し）"""
+        return self._embed(list(texts), "query")
+
+    def __getattr__(self, name: str) -> Any:
+        # 上記以外の属性（model など）は元の埋め込みモデルのものを使う
+        embeddings = self.__dict__.get("embeddings")
+        if embeddings is None:
+            raise AttributeError(name)
+        return getattr(embeddings, name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"model": self.model, **self._stats}
+
+
+# グローバルストア（EMBEDDING_CACHE_PATH を空にするとメモリのみ）
+embedding_store = EmbeddingStore(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None
+_embedding_memory = caches.namespace("embeddings", ttl=None, max_entries=EMBEDDING_CACHE_MEMORY_ENTRIES)
+
+
+def cached_embeddings(embeddings: Any) -> CachedEmbeddings:
+    """埋め込みモデルをグローバルのキャッシュ（メモリ + ファイル）で包む"""
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings
+    return CachedEmbeddings(embeddings, store=embedding_store, memory=_embedding_memory)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+埋め込みインデックス（ChromaDB）の差分更新
+ソース（テキストファイル・PDFのページ・Notionページ・ブログ）ごとに、版数（ファイルの更新時刻 /
+Notionの last_edited_time）と断片IDの一覧をマニフェストに記録し、再構築のたびに
+ディレクトリを削除して全件を埋め込み直す代わりに、新しい・変わった断片だけを埋め込み、
+無くなった断片だけを削除する。
+
+断片IDは内容のハッシュから作る（utils.text_chunker）ので、IDが同じなら埋め込みも同じ。
+差分は断片IDで判定する（Notionの last_edited_time は分単位なので、版数だけでは同じ分の更新を見落とす）。
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+MANIFEST_VERSION = 1
+# 1回の埋め込みAPI呼び出し・Chromaへの書き込みにまとめる断片数
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+
+
+def manifest_path(persist_dir: str, collection_name: str = "langchain") -> str:
+    """Chromaのディレクトリ内のマニフェストのパス（コレクションごと）"""
+    return os.path.join(persist_dir, f"embedding_manifest_{collection_name}.json")
+
+
+class EmbeddingManifest:
+    """ソース → {版数, ソース種別, 断片ID} の記録"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.loaded = False
+
+    def load(self) -> bool:
+        """ファイルを読み込む（無い・形式が違う場合は False で、全件を突き合わせ直す）"""
+        self.sources = {}
+        self.loaded = False
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 埋め込みマニフェスト読み込みエラー: {e}")
+            return False
+        if data.get("version") != MANIFEST_VERSION:
+            return False
+        self.sources = data.get("sources", {})
+        self.loaded = True
+        return True
+
+    def save(self) -> bool:
+        """一時ファイルに書いてから置き換える"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": MANIFEST_VERSION, "saved_at": time.time(), "sources": self.sources},
+                    f, ensure_ascii=False,
+                )
+            os.replace(temp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"⚠️ 埋め込みマニフェスト保存エラー: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    def chunk_ids(self) -> Set[str]:
+        return {chunk_id for entry in self.sources.values() for chunk_id in entry.get("chunk_ids", [])}
+
+
+def _batches(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_embeddings(
+    db,
+    documents: List[Any],
+    manifest: EmbeddingManifest,
+    keep_missing_types: Iterable[str] = (),
+    batch_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Chromaのコレクションを断片の一覧に合わせる（差分だけ埋め込み・削除）
+
+    Args:
+        db: langchain の Chroma または FlatVectorIndex
+        documents: chunk_documents で分割した断片（metadata に chunk_id / chunk_source が必要）
+        manifest: 前回の同期結果（同期後に更新して保存する）
+        keep_missing_types: 今回1件も読み込めなかった場合は前回の断片を残すソース種別
+            （Notionの一時的な障害でインデックスが空になるのを防ぐ）
+        batch_size: 1回に埋め込む断片数（省略時は EMBEDDING_BATCH_SIZE）
+
+    Returns:
+        件数の統計（added / deleted / unchanged / changed_sources など）
+    """
+    started = time.time()
+    size = max(1, batch_size or EMBEDDING_BATCH_SIZE)
+    manifest.load()
+
+    by_source: Dict[str, List[Any]] = {}
+    for doc in documents:
+        by_source.setdefault(doc.metadata["chunk_source"], []).append(doc)
+    loaded_types = {doc.metadata.get("source_type") for doc in documents}
+
+    # マニフェストにあるのにストアに無い断片がある場合（ストアのファイルを消した・別のバックエンドに
+    # 切り替えたなど）はマニフェストを信用しない
+    existing = set(db.get(include=[])["ids"])
+    if manifest.loaded and not manifest.chunk_ids() <= existing:
+        print("⚠️ 埋め込みマニフェストとストアの中身が一致しないため、ストアと突き合わせ直します")
+        manifest.sources = {}
+        manifest.loaded = False
+
+    # 前回の断片ID（マニフェストが無ければ、コレクションの実際の中身と突き合わせる）
+    if manifest.loaded:
+        known: Dict[str, Set[str]] = {
+            source: set(entry.get("chunk_ids", [])) for source, entry in manifest.sources.items()
+        }
+        orphans: Set[str] = set()
+    else:
+        current_ids = {doc.metadata["chunk_id"] for doc in documents}
+        known = {
+            source: {doc.metadata["chunk_id"] for doc in docs} & existing
+            for source, docs in by_source.items()
+        }
+        # 以前の全件構築で付いたランダムなIDなど、今回の断片に無いものは削除する
+        orphans = existing - current_ids
+
+    to_add: List[Any] = []
+    to_delete: List[str] = sorted(orphans)
+    changed_sources = []
+    for source, docs in by_source.items():
+        ids = {doc.metadata["chunk_id"] for doc in docs}
+        old_ids = known.setdefault(source, set())
+        old_version = manifest.sources.get(source, {}).get("version")
+        if source not in manifest.sources or old_version != docs[0].metadata.get("source_version"):
+            changed_sources.append(source)
+        to_add.extend(doc for doc in docs if doc.metadata["chunk_id"] not in old_ids)
+        to_delete.extend(sorted(old_ids - ids))
+
+    removed_sources = [
+        source for source, entry in manifest.sources.items()
+        if source not in by_source
+        and not (entry.get("source_type") in keep_missing_types and entry.get("source_type") not in loaded_types)
+    ]
+    for source in removed_sources:
+        to_delete.extend(sorted(known.get(source, ())))
+
+    added = deleted = batches = 0
+    try:
+        # 新しい断片を先に追加し、古い断片は最後に削除する（同期中も検索できるように）
+        for batch in _batches(to_add, size):
+            db.add_documents(batch, ids=[doc.metadata["chunk_id"] for doc in batch])
+            for doc in batch:
+                known[doc.metadata["chunk_source"]].add(doc.metadata["chunk_id"])
+            added += len(batch)
+            batches += 1
+            print(f"  🔄 埋め込み {added}/{len(to_add)}件")
+        for batch in _batches(to_delete, size):
+            db.delete(ids=batch)
+            deleted += len(batch)
+    finally:
+        # 途中で失敗しても、反映できた分は記録する（次回は残りだけを埋め込む）
+        deleted_ids = set(to_delete[:deleted])
+        sources = {}
+        for source, docs in by_source.items():
+            ids = known[source] - deleted_ids
+            complete = ids == {doc.metadata["chunk_id"] for doc in docs}
+            previous = manifest.sources.get(source, {})
+            sources[source] = {
+                "version": docs[0].metadata.get("source_version") if complete else previous.get("version"),
+                "source_type": docs[0].metadata.get("source_type"),
+                "chunk_ids": sorted(ids),
+            }
+        for source, entry in manifest.sources.items():
+            if source in sources:
+                continue
+            ids = known.get(source, set(entry.get("chunk_ids", []))) - deleted_ids
+            if ids:
+                sources[source] = {**entry, "chunk_ids": sorted(ids)}
+        manifest.sources = sources
+        manifest.save()
+
+    stats = {
+        "sources": len(by_source),
+        "changed_sources": len(changed_sources),
+        "removed_sources": len(removed_sources),
+        "added": added,
+        "deleted": deleted,
+        "unchanged": len(documents) - len(to_add),
+        "batches": batches,
+        "elapsed_ms": round((time.time() - started) * 1000, 1),
+    }
+    print(
+        f"✅ 埋め込みインデックス差分更新: 追加{added}件 / 削除{deleted}件 / 変更なし{stats['unchanged']}件"
+        f"（{stats['elapsed_ms']}ms）"
+    )
+    return stats
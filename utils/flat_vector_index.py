@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+軽量なベクトルインデックス（Chromaの代わり）
+コーパスが小さい（テキストファイル数十件・Notionのナレッジ・ブログ数件）ので、
+正規化した float32 の行列を np.memmap のファイルに置き、ID・本文・メタデータは横のSQLiteテーブルに置く。
+
+- 検索は行列とクエリベクトルの内積（コサイン類似度）と argpartition による上位k件（メタデータで絞り込み可）
+- ファイルは mmap で開くので読み込みはミリ秒で済み、gunicorn の複数ワーカーでもページキャッシュを共有する
+- 他のプロセスが書き込んだ場合は、世代番号を見て検索時に開き直す
+- langchain の Chroma のうち、このリポジトリで使うメソッド（similarity_search* / add_documents / delete / get）を持つ
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# 他のプロセスの書き込みを確認する間隔（秒）
+FLAT_INDEX_RELOAD_INTERVAL = float(os.getenv("FLAT_INDEX_RELOAD_INTERVAL", "1"))
+
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Chroma の where と同じ形の条件（値の一致 / $in / $ne / $and / $or）"""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class _Connection(sqlite3.Connection):
+    """弱参照できるSQLite接続（sqlite3.Connection そのものは WeakSet に入れられない）"""
+
+
+class FlatVectorIndex:
+    """np.memmap の行列 + SQLiteのメタデータによる総当たりのベクトル検索"""
+
+    def __init__(
+        self,
+        persist_directory: str = "./chroma_db",
+        embedding_function: Any = None,
+        collection_name: str = "langchain",
+    ):
+        """
+        初期化
+
+        Args:
+            persist_directory: ファイルを置くディレクトリ（Chromaと同じディレクトリでも名前は重ならない）
+            embedding_function: 埋め込みモデル（embed_documents / embed_query を持つもの）
+            collection_name: コレクション名（ファイル名に使う）
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("FlatVectorIndex には numpy が必要です")
+        os.makedirs(persist_directory, exist_ok=True)
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.collection_name = collection_name
+        self.vectors_path = os.path.join(persist_directory, f"flat_{collection_name}.f32")
+        self.db_path = os.path.join(persist_directory, f"flat_{collection_name}.db")
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # スレッドが終われば接続も解放されるように弱参照で持つ（close() で閉じるためだけに使う）
+        self._connections: "weakref.WeakSet[sqlite3.Connection]" = weakref.WeakSet()
+        self._matrix = None
+        self._dim: Optional[int] = None
+        self._ids: List[Optional[str]] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._generation = -1
+        self._checked_at = 0.0
+        self._stats = {"searches": 0, "reloads": 0, "upserts": 0, "deletes": 0}
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._reload()
+
+    # ---- ストレージ ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=30, isolation_level=None, check_same_thread=False, factory=_Connection
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.add(conn)
+        return conn
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _open_matrix(self, capacity: int) -> None:
+        """行列ファイルを（必要なら広げて）開き直す"""
+        self._matrix = None
+        if not self._dim or capacity <= 0:
+            return
+        size = capacity * self._dim * 4
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < size:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(size)
+        capacity = os.path.getsize(self.vectors_path) // (self._dim * 4)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _capacity(self) -> int:
+        return 0 if self._matrix is None else self._matrix.shape[0]
+
+    def _reload(self) -> None:
+        """SQLiteの行と行列ファイルを読み込み直す"""
+        with self._lock:
+            conn = self._connect()
+            dim = self._meta("dim")
+            self._dim = int(dim) if dim else None
+            self._generation = int(self._meta("generation") or 0)
+            rows = conn.execute("SELECT row, id, document, metadata FROM rows ORDER BY row").fetchall()
+            size = rows[-1][0] + 1 if rows else 0
+            self._ids = [None] * size
+            self._documents = [""] * size
+            self._metadatas = [{} for _ in range(size)]
+            for row, chunk_id, document, metadata in rows:
+                self._ids[row] = chunk_id
+                self._documents[row] = document or ""
+                self._metadatas[row] = json.loads(metadata) if metadata else {}
+            self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids) if chunk_id is not None}
+            self._open_matrix(size)
+            self._alive = np.zeros(self._capacity(), dtype=bool)
+            self._alive[list(self._row_of.values())] = True
+            self._checked_at = time.time()
+            self._stats["reloads"] += 1
+
+    def _refresh_if_changed(self) -> None:
+        """他のプロセスが書き込んでいれば開き直す（確認は FLAT_INDEX_RELOAD_INTERVAL ごと）"""
+        now = time.time()
+        if now - self._checked_at < FLAT_INDEX_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        if int(self._meta("generation") or 0) != self._generation:
+            self._reload()
+
+    @contextmanager
+    def _write(self):
+        """
+        書き込みのトランザクション
+
+        SQLiteの書き込みロックで複数プロセス（gunicornのワーカー）の書き込みを1つずつにし、
+        ロックを取った後で他のプロセスの書き込みを取り込んでから行を割り当てる。
+        失敗した場合はメモリ上の状態をファイルから読み込み直す。
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if int(self._meta("generation") or 0) != self._generation:
+                    self._reload()
+                yield conn
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(self._generation + 1),)
+                )
+                conn.execute("COMMIT")
+                self._generation += 1
+            except Exception:
+                conn.execute("ROLLBACK")
+                self._reload()
+                raise
+
+    # ---- 書き込み ----
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """テキストを埋め込んで登録（同じIDは上書き）"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"flat-{os.urandom(8).hex()}" for _ in texts]
+        vectors = np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._write() as conn:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"ベクトルの次元が違います: {vectors.shape[1]} != {self._dim}")
+
+            # 削除済みの行を使い回し、足りなければ末尾に追加する
+            free = [row for row, chunk_id in reversed(list(enumerate(self._ids))) if chunk_id is None]
+            next_row = len(self._ids)
+            assigned: Dict[str, int] = {}
+            rows = []
+            for chunk_id in ids:
+                row = self._row_of.get(chunk_id, assigned.get(chunk_id))
+                if row is None:
+                    if free:
+                        row = free.pop()
+                    else:
+                        row, next_row = next_row, next_row + 1
+                    assigned[chunk_id] = row
+                rows.append(row)
+            size = max(len(self._ids), max(rows) + 1)
+            if size > self._capacity():
+                self._open_matrix(max(size, self._capacity() * 2, 64))
+                alive = np.zeros(self._capacity(), dtype=bool)
+                alive[: len(self._alive)] = self._alive
+                self._alive = alive
+
+            # 行列を先に書き、その後でSQLiteに行を登録する（読み手は行が登録されてから使う）
+            self._matrix[rows] = vectors
+            self._matrix.flush()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self._dim),))
+            conn.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (row, chunk_id, text, json.dumps(metadata or {}, ensure_ascii=False))
+                    for row, chunk_id, text, metadata in zip(rows, ids, texts, metadatas)
+                ],
+            )
+
+            if size > len(self._ids):
+                extra = size - len(self._ids)
+                self._ids.extend([None] * extra)
+                self._documents.extend([""] * extra)
+                self._metadatas.extend({} for _ in range(extra))
+            for row, chunk_id, text, metadata in zip(rows, ids, texts, metadatas):
+                self._ids[row] = chunk_id
+                self._documents[row] = text
+                self._metadatas[row] = dict(metadata or {})
+                self._row_of[chunk_id] = row
+                self._alive[row] = True
+            self._stats["upserts"] += len(ids)
+        return list(ids)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        return self.add_texts(
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents],
+            ids=ids,
+        )
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> None:
+        with self._lock:
+            self._refresh_if_changed()
+            if not any(chunk_id in self._row_of for chunk_id in ids or []):
+                return
+            with self._write() as conn:
+                rows = [self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of]
+                conn.executemany("DELETE FROM rows WHERE row = ?", [(row,) for row in rows])
+                for row in rows:
+                    del self._row_of[self._ids[row]]
+                    self._ids[row] = None
+                    self._documents[row] = ""
+                    self._metadatas[row] = {}
+                    self._alive[row] = False
+                self._stats["deletes"] += len(rows)
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        """登録済みの断片（Chroma の get と同じ形）"""
+        with self._lock:
+            self._refresh_if_changed()
+            rows = [self._row_of[i] for i in ids if i in self._row_of] if ids is not None else sorted(self._row_of.values())
+            include = ["documents", "metadatas"] if include is None else include
+            result: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self._documents[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._metadatas[row]) for row in rows]
+            return result
+
+    # ---- 検索 ----
+
+    def _search(self, vectors: "np.ndarray", k: int, where: Optional[Dict[str, Any]]) -> List[List[Tuple[int, float]]]:
+        """正規化したクエリベクトルごとの (行, コサイン類似度) の上位k件"""
+        with self._lock:
+            self._refresh_if_changed()
+            self._stats["searches"] += len(vectors)
+            size = len(self._ids)
+            if self._matrix is None or size == 0 or k <= 0:
+                return [[] for _ in vectors]
+            mask = self._alive[:size].copy()
+            if where:
+                for row in np.flatnonzero(mask):
+                    mask[row] = _matches(self._metadatas[row], where)
+            candidates = np.flatnonzero(mask)
+            if candidates.size == 0:
+                return [[] for _ in vectors]
+            # (候補数 × 次元) と (次元 × クエリ数) の積を1回で計算
+            matrix = self._matrix[:size] if candidates.size == size else self._matrix[candidates]
+            scores = np.asarray(matrix) @ vectors.T
+
+        results = []
+        top = min(k, candidates.size)
+        for column in range(scores.shape[1]):
+            column_scores = scores[:, column]
+            best = np.argpartition(-column_scores, top - 1)[:top] if top < candidates.size else np.arange(candidates.size)
+            best = best[np.argsort(-column_scores[best], kind="stable")]
+            results.append([(int(candidates[i]), float(column_scores[i])) for i in best])
+        return results
+
+    def _normalize_queries(self, vectors: Sequence[Sequence[float]]) -> "np.ndarray":
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self._documents[row], metadata=dict(self._metadatas[row]))
+
+    @staticmethod
+    def _distance(similarity: float) -> float:
+        # 単位ベクトル同士のL2距離の2乗（Chroma の既定の距離と同じ尺度）
+        return max(0.0, 2.0 - 2.0 * similarity)
+
+    def _select_relevance_score_fn(self):
+        # Chroma（L2距離）と同じ変換
+        return lambda distance: 1.0 - distance / math.sqrt(2)
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        hits = self._search(self._normalize_queries([embedding]), k, filter)[0]
+        return [(self._document(row), self._distance(similarity)) for row, similarity in hits]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        """(ドキュメント, 距離) の上位k件（距離は小さいほど近い）"""
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in self.similarity_search_with_score(query, k, filter)]
+
+    def batch_search_with_relevance_scores(
+        self, embeddings: Sequence[Sequence[float]], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """複数のクエリベクトルを1回の行列積で検索（クエリごとの (ドキュメント, 関連性スコア)）"""
+        relevance = self._select_relevance_score_fn()
+        return [
+            [(self._document(row), relevance(self._distance(similarity))) for row, similarity in hits]
+            for hits in self._search(self._normalize_queries(embeddings), k, filter)
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.vectors_path,
+                "entries": len(self._row_of),
+                "dim": self._dim,
+                "capacity": self._capacity(),
+                "generation": self._generation,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        """すべてのスレッドの接続と行列ファイルを閉じる（ファイルを削除する前など）"""
+        with self._lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+            self._matrix = None
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+# RAGのベクトルストア: "chroma"（既定。langchain-chroma が無い環境では flat）または "flat"
+RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma").lower()
+
+try:
+    from langchain_chroma import Chroma as _Chroma
+except ImportError:
+    _Chroma = None
+
+
+def vector_store_available() -> bool:
+    return _Chroma is not None or NUMPY_AVAILABLE
+
+
+def open_vector_store(persist_directory: str, embedding_function: Any, collection_name: str = "langchain"):
+    """設定に応じて Chroma または FlatVectorIndex を開く（無ければ作成）"""
+    if RAG_VECTOR_BACKEND != "flat" and _Chroma is not None:
+        return _Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection_name,
+        )
+    return FlatVectorIndex(persist_directory, embedding_function, collection_name=collection_name)
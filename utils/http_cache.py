@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTPの条件付きGET（ETag / Last-Modified / 304 Not Modified）
+一覧系のGET APIで、データセットの版数から ETag を作り、変わっていなければ本文を作らずに 304 を返す
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, make_response, request
+from werkzeug.http import is_resource_modified
+
+# Cache-Control の max-age（秒）。既定の 0 はブラウザに毎回 ETag で確認させる
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+Version = Tuple[Any, Optional[float]]
+
+
+class DatasetVersions:
+    """
+    キャッシュされたデータセットの版数（内容のハッシュ）
+
+    キャッシュからは同じオブジェクトが返るので、オブジェクトごとに1回だけハッシュを計算する。
+    読み込み直しても内容が同じなら同じ版数・同じ最終更新時刻になる（ワーカー間でも同じ ETag）。
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._by_object: List[Tuple[Any, str]] = []
+        self._first_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "hashes": 0}
+
+    def version(self, value: Any) -> Version:
+        """(内容のハッシュ, そのハッシュを最初に見た時刻)"""
+        with self._lock:
+            for position, (source, digest) in enumerate(self._by_object):
+                if source is value:
+                    self._by_object.insert(0, self._by_object.pop(position))
+                    self._stats["hits"] += 1
+                    return digest, self._first_seen[digest]
+
+        payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.md5(payload.encode("utf-8")).hexdigest()
+        with self._lock:
+            # 元のオブジェクトへの参照を保持する（id() だけだと解放後に同じ値が再利用されるため）
+            self._by_object.insert(0, (value, digest))
+            del self._by_object[self.max_entries:]
+            self._first_seen.setdefault(digest, time.time())
+            live = {digest for _, digest in self._by_object}
+            for old in [d for d in self._first_seen if d not in live]:
+                del self._first_seen[old]
+            self._stats["hashes"] += 1
+            return digest, self._first_seen[digest]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tracked": len(self._by_object), **self._stats}
+
+
+dataset_versions = DatasetVersions()
+
+
+def _make_etag(*parts: Any) -> str:
+    return hashlib.md5(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _set_cache_headers(response, etag: str, last_modified: Optional[float], max_age: int):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response
+
+
+def conditional_get(version: Callable[[], Optional[Version]], max_age: Optional[int] = None):
+    """
+    GETエンドポイントに ETag / Last-Modified を付け、変わっていなければ 304 を返すデコレータ
+
+    Args:
+        version: データセットの (版数, 最終更新のUNIX時刻) を返す関数（リクエスト中に呼ばれる）。
+            None を返した場合は、作ったレスポンス本文のハッシュを ETag にする（転送量だけ減る）
+        max_age: Cache-Control の max-age（省略時は HTTP_CACHE_MAX_AGE）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            age = HTTP_CACHE_MAX_AGE if max_age is None else max_age
+            try:
+                current = version()
+            except Exception as e:
+                print(f"⚠️ データセット版数の取得エラー（{view.__name__}）: {e}")
+                current = None
+
+            etag = last_modified = None
+            if current is not None:
+                token, last_modified = current
+                # 同じデータセットでもクエリ（カテゴリ等）ごとに本文が違うので ETag に含める
+                etag = _make_etag(view.__name__, token, sorted(request.args.items(multi=True)))
+                modified_dt = (
+                    datetime.fromtimestamp(int(last_modified), tz=timezone.utc) if last_modified else None
+                )
+                if not is_resource_modified(request.environ, etag=etag, last_modified=modified_dt):
+                    return _set_cache_headers(current_app.response_class(status=304), etag, last_modified, age)
+
+            response = make_response(view(*args, **kwargs))
+            if request.method != "GET" or response.status_code != 200:
+                return response
+            if etag is None:
+                etag = hashlib.md5(response.get_data()).hexdigest()
+            _set_cache_headers(response, etag, last_modified, age)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
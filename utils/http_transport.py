@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共有HTTPトランスポート
+Notion / SERP / LINE / メール送信のHTTP呼び出しで、ホストごとのKeep-Aliveコネクションプールを共有する
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+DEFAULT_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("HTTP_READ_TIMEOUT", "15")),
+)
+DEFAULT_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+
+# ホストごとのプール設定（ここに無いホストは既定値の共通プールを使う）
+HOST_POLICIES: Dict[str, Dict[str, Any]] = {
+    # Notionの429・5xx再試行はゲート（NotionScheduler）側で行うため、ここでは接続エラーのみ
+    "api.notion.com": {"pool_maxsize": DEFAULT_POOL_MAXSIZE, "timeout": (5, 15), "retries": 3, "retry_status": False},
+    "api.line.me": {"pool_maxsize": 4, "timeout": (5, 10), "retries": 2},
+    "serpapi.com": {"pool_maxsize": 4, "timeout": (5, 15), "retries": 1},
+    "www.googleapis.com": {"pool_maxsize": 4, "timeout": (5, 10), "retries": 1},
+    "api.resend.com": {"pool_maxsize": 2, "timeout": (5, 20), "retries": 2},
+}
+
+# 一時的なエラーとして再試行するステータス
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _build_retry(retries: int, retry_status: bool = True) -> Retry:
+    """
+    再試行ポリシーを作成
+
+    接続エラーは全メソッドで再試行するが、ステータス・読み取りエラーの再試行は
+    冪等なメソッドのみ（POSTでページが二重作成されないようにする）。
+    """
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=retries if retry_status else 0,
+        status=retries if retry_status else 0,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUS_CODES if retry_status else (),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+class HTTPTransport:
+    """ホストごとのコネクションプールを持つ共有HTTPクライアント"""
+
+    def __init__(
+        self,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_MAX_RETRIES,
+        host_policies: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        """
+        初期化
+
+        Args:
+            pool_maxsize: 既定のホストあたり最大Keep-Alive接続数
+            timeout: 既定の (接続, 読み取り) タイムアウト秒
+            retries: 既定の最大再試行回数
+            host_policies: ホスト名 → {pool_maxsize, timeout, retries, retry_status} の上書き設定
+        """
+        self.timeout = timeout
+        self.host_policies = dict(HOST_POLICIES if host_policies is None else host_policies)
+        self.session = requests.Session()
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._gates: Dict[str, Any] = {}
+
+        default_adapter = HTTPAdapter(
+            pool_connections=len(self.host_policies) + 4,
+            pool_maxsize=pool_maxsize,
+            max_retries=_build_retry(retries),
+        )
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+        self._adapters["*"] = default_adapter
+
+        for host, policy in self.host_policies.items():
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=policy.get("pool_maxsize", pool_maxsize),
+                max_retries=_build_retry(policy.get("retries", retries), policy.get("retry_status", True)),
+            )
+            self.session.mount(f"https://{host}/", adapter)
+            self._adapters[host] = adapter
+
+    def register_gate(self, host: str, gate: Any) -> None:
+        """
+        ホスト宛てのリクエストをゲート経由で送信する
+
+        gate は call(func, *args, idempotent=..., **kwargs) を持つオブジェクト（NotionScheduler など）。
+        """
+        self._gates[host] = gate
+
+    def _timeout_for(self, host: str):
+        return self.host_policies.get(host, {}).get("timeout", self.timeout)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        HTTPリクエストを送信（requests.request と同じ引数・例外）
+
+        timeout を省略した場合はホストごとの設定を使う。
+        """
+        host = urlparse(url).hostname or ""
+        kwargs.setdefault("timeout", self._timeout_for(host))
+        started = time.time()
+        error = False
+        gate = self._gates.get(host)
+        try:
+            if gate is None:
+                return self.session.request(method, url, **kwargs)
+            # POST の /query・/search は読み取りなので再試行してよい
+            idempotent = method.upper() != "POST" or urlparse(url).path.rstrip("/").endswith(("/query", "/search"))
+            return gate.call(self.session.request, method, url, idempotent=idempotent, **kwargs)
+        except requests.exceptions.RequestException:
+            error = True
+            raise
+        finally:
+            elapsed = time.time() - started
+            with self._lock:
+                stats = self._stats.setdefault(host, {"requests": 0, "errors": 0, "total_seconds": 0.0})
+                stats["requests"] += 1
+                stats["errors"] += 1 if error else 0
+                stats["total_seconds"] += elapsed
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def _pool_counters(self) -> Dict[str, Dict[str, int]]:
+        """urllib3 のプールから新規接続数と送信数をホストごとに集計"""
+        counters: Dict[str, Dict[str, int]] = {}
+        for adapter in self._adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                entry = counters.setdefault(pool.host, {"connections_opened": 0, "pool_requests": 0})
+                entry["connections_opened"] += pool.num_connections
+                entry["pool_requests"] += pool.num_requests
+        return counters
+
+    def get_stats(self) -> Dict[str, Any]:
+        """ホストごとのリクエスト数・エラー数・平均時間・接続再利用率"""
+        counters = self._pool_counters()
+        with self._lock:
+            snapshot = {host: dict(values) for host, values in self._stats.items()}
+
+        hosts = {}
+        for host in set(snapshot) | set(counters):
+            stats = snapshot.get(host, {"requests": 0, "errors": 0, "total_seconds": 0.0})
+            pool = counters.get(host, {"connections_opened": 0, "pool_requests": 0})
+            reused = max(0, pool["pool_requests"] - pool["connections_opened"])
+            hosts[host] = {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_seconds"] / stats["requests"] * 1000, 1) if stats["requests"] else 0.0,
+                "connections_opened": pool["connections_opened"],
+                "connections_reused": reused,
+                "reuse_rate": round(reused / pool["pool_requests"], 3) if pool["pool_requests"] else 0.0,
+            }
+        return {"hosts": hosts}
+
+    def close(self):
+        self.session.close()
+
+
+# グローバルトランスポート
+http_transport = HTTPTransport()
+
+
+def get_http_transport() -> HTTPTransport:
+    """共有HTTPトランスポートを取得"""
+    return http_transport
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+マネージャーレジストリ
+DealManager・PartnerShopManager・EmailSender などをアプリ単位で1回だけ生成して使い回す
+（リクエストごとの環境変数読み込み・DB ID解決・初期化処理をなくす）
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class ManagerRegistry:
+    """名前 → ファクトリー を登録し、初回アクセス時に生成したインスタンスを共有する"""
+
+    def __init__(self, retry_after_error: float = 30.0):
+        """
+        初期化
+
+        Args:
+            retry_after_error: 生成に失敗したマネージャーを再生成するまでの秒数
+                （環境変数の未設定などで毎リクエスト失敗し続けるのを避ける）
+        """
+        self.retry_after_error = retry_after_error
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._eager: Dict[str, bool] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, tuple] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._warmup_hooks: List[Callable[["ManagerRegistry"], Any]] = []
+        self._reload_hooks: List[Callable[["ManagerRegistry"], Any]] = []
+        self._stats = {"created": 0, "hits": 0, "errors": 0, "reloads": 0}
+
+    # ---- 登録 ----
+
+    def register(self, name: str, factory: Callable[[], Any], eager: bool = True) -> None:
+        """
+        マネージャーのファクトリーを登録
+
+        Args:
+            name: 取得に使う名前
+            factory: 引数なしでインスタンスを返す関数（クラスでも可）
+            eager: warm_up() で事前に生成するか
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._eager[name] = eager
+            self._locks.setdefault(name, threading.Lock())
+            self._instances.pop(name, None)
+            self._errors.pop(name, None)
+
+    def on_warmup(self, hook: Callable[["ManagerRegistry"], Any]) -> Callable:
+        """warm_up() の最後に呼ばれるフックを登録（デコレーターとしても使える）"""
+        self._warmup_hooks.append(hook)
+        return hook
+
+    def on_reload(self, hook: Callable[["ManagerRegistry"], Any]) -> Callable:
+        """reload() でインスタンスを破棄した後に呼ばれるフックを登録"""
+        self._reload_hooks.append(hook)
+        return hook
+
+    # ---- 取得 ----
+
+    def get(self, name: str) -> Any:
+        """
+        インスタンスを取得（未生成なら生成）
+
+        生成時の例外は呼び出し元にそのまま送出する（従来の Manager() 呼び出しと同じ）。
+        失敗は retry_after_error 秒のあいだ記憶し、同じ例外を再送出する。
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            self._stats["hits"] += 1
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"未登録のマネージャー: {name}")
+
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+
+            failed = self._errors.get(name)
+            if failed and time.monotonic() - failed[0] < self.retry_after_error:
+                raise failed[1]
+
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                with self._lock:
+                    self._errors[name] = (time.monotonic(), e)
+                    self._stats["errors"] += 1
+                raise
+
+            with self._lock:
+                self._instances[name] = instance
+                self._errors.pop(name, None)
+                self._stats["created"] += 1
+            return instance
+
+    def get_optional(self, name: str) -> Optional[Any]:
+        """インスタンスを取得（生成できない場合は None）"""
+        try:
+            return self.get(name)
+        except Exception:
+            return None
+
+    # ---- ライフサイクル ----
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """
+        マネージャーを事前に生成し、ウォームアップフックを実行
+
+        Returns:
+            名前 → 生成できたか
+        """
+        targets = list(names) if names is not None else [n for n, eager in self._eager.items() if eager]
+        results = {}
+        for name in targets:
+            try:
+                self.get(name)
+                results[name] = True
+            except Exception as e:
+                print(f"⚠️ {name} の事前生成に失敗: {e}")
+                results[name] = False
+        for hook in self._warmup_hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                print(f"⚠️ ウォームアップフックエラー: {e}")
+        return results
+
+    def reload(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        インスタンスを破棄して次回アクセス時に作り直す（/reload_data から呼ぶ）
+
+        Args:
+            names: 破棄するマネージャー名（省略時はすべて）
+        """
+        with self._lock:
+            targets = list(names) if names is not None else list(self._factories)
+            for name in targets:
+                self._instances.pop(name, None)
+                self._errors.pop(name, None)
+            self._stats["reloads"] += 1
+        for hook in self._reload_hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                print(f"⚠️ リロードフックエラー: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """登録済み・生成済みのマネージャーと生成回数"""
+        with self._lock:
+            return {
+                "registered": sorted(self._factories),
+                "ready": sorted(self._instances),
+                "failed": sorted(self._errors),
+                **self._stats,
+            }
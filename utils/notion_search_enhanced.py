@@ -16,18 +16,26 @@ except ImportError:
     QUERY_EXPANDER_AVAILABLE = False
     print("⚠️ query_expander のインポートに失敗しました")
 
+from data_access.notion_query_planner import SEARCH_MAX_RESULTS, merge_results, plan_keyword_search
+from data_access.relation_resolver import RelationResolver, normalize_page_id
+
 
 class NotionSearchEnhanced:
     """強化版Notion検索クラス"""
     
-    def __init__(self, notion_client):
+    def __init__(self, notion_client, resolver: Optional[RelationResolver] = None, async_client=None):
         """
         初期化
         
         Args:
             notion_client: Notionクライアントインスタンス
+            resolver: リレーション一括解決（省略時はこのクライアント用に作成）
+            async_client: search_databases を持つ data_access.notion_client.NotionClient
+                （指定時はデータベースごとの検索を並行して実行し、スキーマのキャッシュも共有する）
         """
         self.notion = notion_client
+        self.resolver = resolver or RelationResolver(lambda: notion_client)
+        self.async_client = async_client
     
     def extract_keywords_from_query(self, query: str) -> List[str]:
         """
@@ -68,70 +76,69 @@ class NotionSearchEnhanced:
         self,
         database_id: str,
         keywords: List[str],
-        property_names: List[str] = None
+        property_names: List[str] = None,
+        max_results: int = SEARCH_MAX_RESULTS
     ) -> List[Dict]:
         """
         複数キーワードでNotion検索
         
+        キーワード×プロパティの条件を or 複合フィルターにまとめて1回のクエリで検索する
+        （条件数がNotionの上限を超える場合のみ分割）。
+        
         Args:
             database_id: データベースID
             keywords: キーワードのリスト
             property_names: 検索対象のプロパティ名リスト
+            max_results: 1クエリあたりの最大取得件数
         
         Returns:
             検索結果のリスト
         """
-        if not property_names:
-            # デフォルトの検索対象プロパティ
-            property_names = ['タイトル', '内容', '症状', '解決方法', 'Title']
-        
-        all_results = []
-        seen_ids = set()
-        
-        for keyword in keywords:
+        batches = []
+        for chunk in plan_keyword_search(keywords, property_names, self._get_database_schema(database_id)):
             try:
-                # 各プロパティで検索
-                for prop_name in property_names:
-                    # プロパティタイプに応じたフィルター構築
-                    filter_conditions = []
-                    
-                    # タイトルプロパティ
-                    if prop_name in ['タイトル', 'Title', 'Name']:
-                        filter_conditions.append({
-                            "property": prop_name,
-                            "title": {"contains": keyword}
-                        })
-                    else:
-                        # リッチテキストプロパティ
-                        filter_conditions.append({
-                            "property": prop_name,
-                            "rich_text": {"contains": keyword}
-                        })
-                    
-                    for condition in filter_conditions:
-                        try:
-                            results = self.notion.databases.query(
-                                database_id=database_id,
-                                filter=condition
-                            )
-                            
-                            for result in results.get("results", []):
-                                result_id = result['id']
-                                if result_id not in seen_ids:
-                                    seen_ids.add(result_id)
-                                    result['matched_keyword'] = keyword
-                                    result['matched_property'] = prop_name
-                                    all_results.append(result)
-                        
-                        except Exception as e:
-                            print(f"⚠️ プロパティ '{prop_name}' での検索エラー: {e}")
-                            continue
-            
+                batches.append((chunk.conditions, self._query_pages(database_id, chunk.filter, max_results)))
             except Exception as e:
-                print(f"⚠️ キーワード '{keyword}' での検索エラー: {e}")
-                continue
-        
-        return all_results
+                if len(chunk.conditions) == 1:
+                    print(f"⚠️ プロパティ '{chunk.conditions[0].prop_name}' での検索エラー: {e}")
+                    continue
+                # スキーマと合わない条件があると複合フィルター全体が失敗するので、条件ごとに検索し直す
+                print(f"⚠️ 複合フィルターでの検索エラー（条件ごとに再検索）: {e}")
+                for condition in chunk.conditions:
+                    try:
+                        pages = self._query_pages(database_id, condition.to_filter(), max_results)
+                    except Exception as inner:
+                        print(f"⚠️ プロパティ '{condition.prop_name}' での検索エラー: {inner}")
+                        continue
+                    batches.append(((condition,), pages))
+        
+        return merge_results(batches)
+    
+    def _get_database_schema(self, database_id: str) -> Optional[Dict[str, str]]:
+        """データベースのプロパティ名 → 型（取得できない場合は None）"""
+        if self.async_client is not None:
+            return self.async_client.get_database_schema(database_id)
+        try:
+            database = self.notion.databases.retrieve(database_id=database_id)
+        except Exception as e:
+            print(f"⚠️ データベーススキーマ取得エラー: {e}")
+            return None
+        return {name: prop.get('type') for name, prop in database.get('properties', {}).items()}
+    
+    def _query_pages(self, database_id: str, query_filter: Dict, max_results: int) -> List[Dict]:
+        """フィルター付きクエリの結果を max_results 件までカーソルを辿って取得"""
+        pages = []
+        start_cursor = None
+        while len(pages) < max_results:
+            params = {"database_id": database_id, "filter": query_filter, "page_size": min(100, max_results - len(pages))}
+            if start_cursor:
+                params["start_cursor"] = start_cursor
+            response = self.notion.databases.query(**params)
+            pages.extend(response.get("results", []))
+            start_cursor = response.get("next_cursor")
+            if not response.get("has_more") or not start_cursor:
+                break
+        return pages
     
     def get_related_items_via_relation(
         self,
@@ -156,11 +163,15 @@ class NotionSearchEnhanced:
             # リレーションプロパティを取得
             relations = page.get('properties', {}).get(relation_property, {}).get('relation', [])
             
+            # 関連ページをまとめて解決（索引済みのページは再取得しない）
+            resolved = self.resolver.resolve([relation['id'] for relation in relations])
+            
             for relation in relations:
                 try:
                     # 関連ページを取得
-                    related_page_id = relation['id']
-                    related_page = self.notion.pages.retrieve(page_id=related_page_id)
+                    related_page = resolved.get(normalize_page_id(relation['id']))
+                    if related_page is None:
+                        continue
                     
                     related_items.append({
                         'page': related_page,
@@ -370,16 +381,27 @@ class NotionSearchEnhanced:
             }
         }
         
-        # 2. 各データベースを検索
+        # 2. 全データベースを並行検索（非同期クライアントが無い場合は順次）
+        prefetched = None
+        if self.async_client is not None and keywords:
+            try:
+                prefetched = self.async_client.search_databases(keywords, databases)
+            except Exception as e:
+                print(f"⚠️ 並行検索エラー（順次検索に切り替え）: {e}")
+        
+        scored_by_db = []
         for db_name, db_id in databases.items():
             try:
                 print(f"📂 {db_name} を検索中...")
                 
                 # 複数キーワードで検索
-                results = self.search_with_multiple_keywords(
-                    database_id=db_id,
-                    keywords=keywords
-                )
+                if prefetched is not None:
+                    results = prefetched.get(db_name, [])
+                else:
+                    results = self.search_with_multiple_keywords(
+                        database_id=db_id,
+                        keywords=keywords
+                    )
                 
                 print(f"  取得: {len(results)}件")
                 
@@ -407,14 +429,28 @@ class NotionSearchEnhanced:
                 scored_results = scored_results[:max_results_per_db]
                 
                 print(f"  フィルタリング後: {len(scored_results)}件（スコア>={min_relevance}）")
-                
+                scored_by_db.append((db_name, scored_results))
+            
+            except Exception as e:
+                print(f"⚠️ {db_name} の検索エラー: {e}")
+                continue
+        
+        # 各データベースの上位3件のリレーション先を1回でまとめて解決しておく
+        relation_properties = ['工場', '使用部品', '関連ケース', 'Factory', 'Parts']
+        if use_relations:
+            self.resolver.resolve_relations(
+                [result for _, scored_results in scored_by_db for result in scored_results[:3]],
+                relation_properties
+            )
+        
+        for db_name, scored_results in scored_by_db:
+            try:
                 # 3. リレーションを活用（オプション）
                 if use_relations and scored_results:
-                    print(f"  リレーションを探索中...")
+                    print(f"  {db_name} のリレーションを探索中...")
                     
                     for result in scored_results[:3]:  # 上位3件のみ
                         # 関連アイテムを取得
-                        relation_properties = ['工場', '使用部品', '関連ケース', 'Factory', 'Parts']
                         
                         for rel_prop in relation_properties:
                             related = self.get_related_items_via_relation(
@@ -461,9 +497,9 @@ class NotionSearchEnhanced:
 
 
 # グローバル関数（簡易版）
-def create_enhanced_notion_search(notion_client):
+def create_enhanced_notion_search(notion_client, resolver: Optional[RelationResolver] = None, async_client=None):
     """強化版Notion検索インスタンスを作成"""
-    return NotionSearchEnhanced(notion_client)
+    return NotionSearchEnhanced(notion_client, resolver=resolver, async_client=async_client)
 
 
 if __name__ == "__main__":
@@ -4,11 +4,20 @@
 クエリ拡張、閾値フィルタリング、リランキングを含む高精度RAG検索
 """
 
+import os
 import time
-from typing import List, Dict, Any, Optional
-from langchain_chroma import Chroma
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from langchain_core.documents import Document
 
+try:
+    from langchain_chroma import Chroma
+except ImportError:
+    # ChromaDBが無い環境では FlatVectorIndex を使う（型注釈のみ）
+    Chroma = Any
+
+# Reciprocal Rank Fusion の定数（大きいほど下位の順位も効く）
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
 # クエリ拡張モジュールをインポート
 try:
     from utils.query_expander import query_expander
@@ -90,6 +99,67 @@ def calculate_relevance_score(query: str, document: Document, base_score: float)
     return min(score, 1.0)  # 最大1.0に制限
 
 
+def embed_queries(embeddings, queries: Sequence[str]) -> List[List[float]]:
+    """複数のクエリを埋め込む（embed_queries を持つモデルは1回の呼び出し、それ以外は1件ずつ）"""
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(list(queries))
+    return [embeddings.embed_query(query) for query in queries]
+
+
+def batch_similarity_search(db: Chroma, queries: Sequence[str], k: int) -> List[List[Tuple[Document, float]]]:
+    """
+    すべてのクエリのベクトルでChromaを1回で検索
+    
+    Returns:
+        クエリごとの (ドキュメント, 関連性スコア) のリスト（similarity_search_with_relevance_scores と同じ形）
+    """
+    vectors = embed_queries(db.embeddings, queries)
+    # FlatVectorIndex は1回の行列積で検索する
+    if hasattr(db, "batch_search_with_relevance_scores"):
+        return db.batch_search_with_relevance_scores(vectors, k=k)
+    response = db._collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        include=["documents", "metadatas", "distances"]
+    )
+    relevance = db._select_relevance_score_fn()
+    ranked_lists = []
+    for documents, metadatas, distances in zip(response["documents"], response["metadatas"], response["distances"]):
+        ranked_lists.append([
+            (Document(page_content=content or "", metadata=metadata or {}), relevance(distance))
+            for content, metadata, distance in zip(documents, metadatas, distances)
+        ])
+    return ranked_lists
+
+
+def reciprocal_rank_fusion(results: List[Dict], k: int = RAG_RRF_K) -> List[Dict]:
+    """
+    クエリごとの検索結果を Reciprocal Rank Fusion で統合
+    
+    同じ断片（chunk_id、無ければ本文）は1件にまとめ、各クエリでの順位から 1/(k + 順位) の合計を
+    rrf_score とする。代表には関連性スコアが最も高い結果を使う。
+    
+    Args:
+        results: 'rank'（クエリ内の順位、0始まり）と 'score' を持つ検索結果
+    """
+    fused: Dict[Any, Dict] = {}
+    for result in results:
+        key = result['metadata'].get('chunk_id') or result['content']
+        contribution = 1.0 / (k + result['rank'] + 1)
+        current = fused.get(key)
+        if current is None:
+            fused[key] = {**result, 'rrf_score': contribution, 'query_hits': 1}
+            continue
+        best = result if result['score'] > current['score'] else current
+        fused[key] = {
+            **best,
+            'rrf_score': current['rrf_score'] + contribution,
+            'query_hits': current['query_hits'] + 1,
+        }
+    return sorted(fused.values(), key=lambda r: (r['rrf_score'], r['score']), reverse=True)
+
+
 def enhanced_rag_retrieve_v2(
     query: str,
     db: Chroma,
@@ -138,36 +208,39 @@ def enhanced_rag_retrieve_v2(
             
             print(f"✅ {len(queries_used)}個のクエリで検索: {queries_used}")
         
-        # 2. 各クエリで検索実行
-        for search_query in queries_used:
-            try:
-                # 類似度検索（スコア付き）
-                results_with_scores = db.similarity_search_with_relevance_scores(
-                    search_query,
-                    k=max_results * 2  # 余分に取得してフィルタリング
-                )
+        # 2. 全クエリを1回で埋め込み・検索（余分に取得してフィルタリング）
+        try:
+            ranked_lists = batch_similarity_search(db, queries_used, k=max_results * 2)
+        except Exception as e:
+            # 一括検索に対応していないDBなどは1クエリずつ検索
+            print(f"⚠️ 一括検索エラー（1クエリずつ検索します）: {e}")
+            ranked_lists = []
+            for search_query in queries_used:
+                try:
+                    ranked_lists.append(db.similarity_search_with_relevance_scores(search_query, k=max_results * 2))
+                except Exception as e:
+                    print(f"⚠️ クエリ '{search_query}' の検索エラー: {e}")
+                    ranked_lists.append([])
+        
+        # 結果を整形
+        for search_query, results_with_scores in zip(queries_used, ranked_lists):
+            for rank, (doc, score) in enumerate(results_with_scores):
+                # 関連性スコアを再計算
+                enhanced_score = calculate_relevance_score(query, doc, score)
                 
-                # 結果を整形
-                for doc, score in results_with_scores:
-                    # 関連性スコアを再計算
-                    enhanced_score = calculate_relevance_score(query, doc, score)
-                    
-                    all_results.append({
-                        'document': doc,
-                        'score': enhanced_score,
-                        'original_score': score,
-                        'query_used': search_query,
-                        'content': doc.page_content,
-                        'metadata': doc.metadata
-                    })
-            
-            except Exception as e:
-                print(f"⚠️ クエリ '{search_query}' の検索エラー: {e}")
-                continue
+                all_results.append({
+                    'document': doc,
+                    'score': enhanced_score,
+                    'original_score': score,
+                    'query_used': search_query,
+                    'rank': rank,
+                    'content': doc.page_content,
+                    'metadata': doc.metadata
+                })
         
-        # 3. 重複排除
+        # 3. RRFで統合して重複排除（複数のクエリで上位に出た断片ほど上に）
         print(f"📊 重複排除前: {len(all_results)}件")
-        unique_results = deduplicate_results(all_results)
+        unique_results = deduplicate_results(reciprocal_rank_fusion(all_results))
         print(f"📊 重複排除後: {len(unique_results)}件")
         
         # 4. 閾値フィルタリング
@@ -177,10 +250,10 @@ def enhanced_rag_retrieve_v2(
         ]
         print(f"📊 閾値フィルタリング後: {len(filtered_results)}件 (閾値: {relevance_threshold})")
         
-        # 5. スコア順でソート
+        # 5. RRFスコア順でソート（同点は関連性スコア順）
         sorted_results = sorted(
             filtered_results,
-            key=lambda x: x['score'],
+            key=lambda x: (x['rrf_score'], x['score']),
             reverse=True
         )
         
@@ -202,6 +275,7 @@ def enhanced_rag_retrieve_v2(
                 'url': metadata.get('url', ''),
                 'relevance_score': round(result['score'], 3),
                 'original_score': round(result['original_score'], 3),
+                'rrf_score': round(result['rrf_score'], 4),
                 'query_used': result['query_used']
             })
         
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+診断セッションストア
+/chat/diagnose/* のセッションを有効期限付きで保持する。
+メモリ（LRU + TTL）と SQLite（WAL、複数のgunicornワーカーで共有）の2つのバックエンドがあり、
+DIAGNOSTIC_SESSION_STORE=sqlite にするとワーカー数を増やしてもセッションが引き継がれる
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.data_paths import data_path, ensure_parent_dir
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # ノードIDやカテゴリは多数のセッションで同じ値になるので1つの文字列を共有する
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class DiagnosticSession:
+    """
+    診断セッション1件
+
+    履歴は (ノードID, ...)、回答は ((ノードID, 回答, 日時), ...) のタプルで持つ。
+    """
+
+    __slots__ = ("current_node", "history", "answers", "created_at", "category", "fallback")
+
+    def __init__(
+        self,
+        current_node: str,
+        category: str = "general",
+        created_at: Optional[str] = None,
+        history: Iterable[str] = (),
+        answers: Iterable[Tuple[str, str, str]] = (),
+        fallback: bool = False,
+    ):
+        self.current_node = _intern(current_node)
+        self.history: Tuple[str, ...] = tuple(_intern(node_id) for node_id in history) or (self.current_node,)
+        self.answers: Tuple[Tuple[str, str, str], ...] = tuple(
+            (_intern(node_id), answer, timestamp) for node_id, answer, timestamp in answers
+        )
+        self.created_at = created_at or datetime.now().isoformat()
+        self.category = _intern(category)
+        self.fallback = bool(fallback)
+
+    def record_answer(self, node_id: str, answer: str, timestamp: str) -> None:
+        self.answers += ((_intern(node_id), answer, timestamp),)
+
+    def move_to(self, node_id: str) -> None:
+        self.current_node = _intern(node_id)
+        self.history += (self.current_node,)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """従来の dict 形式（APIレスポンス・ログ用）"""
+        return {
+            "current_node": self.current_node,
+            "history": list(self.history),
+            "answers": [
+                {"node_id": node_id, "answer": answer, "timestamp": timestamp}
+                for node_id, answer, timestamp in self.answers
+            ],
+            "created_at": self.created_at,
+            "category": self.category,
+            "fallback": self.fallback,
+        }
+
+    def dumps(self) -> str:
+        return json.dumps(
+            [self.current_node, self.category, self.created_at, self.history, self.answers, int(self.fallback)],
+            ensure_ascii=False, separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, data: str) -> "DiagnosticSession":
+        current_node, category, created_at, history, answers, fallback = json.loads(data)
+        return cls(current_node, category, created_at, history, answers, bool(fallback))
+
+
+class SessionStore(ABC):
+    """セッションストアのインターフェース"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[DiagnosticSession]:
+        """セッションを取得（期限切れ・未登録は None。取得しても有効期限を延ばす）"""
+
+    @abstractmethod
+    def put(self, session_id: str, session: DiagnosticSession) -> None:
+        """セッションを保存（変更後は毎回呼ぶ。有効期限はここから数える）"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """セッションを削除"""
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """件数・ヒット数などの統計"""
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """プロセス内のLRU + TTLストア（ワーカー間では共有されない）"""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 3600):
+        """
+        初期化
+
+        Args:
+            max_sessions: 保持する最大セッション数（超えたら最後の利用が古いものから削除）
+            ttl_seconds: 最後の利用からの有効期限（秒）
+        """
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Tuple[float, DiagnosticSession]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _purge_expired(self, now: float) -> None:
+        # 利用順に並んでいるので、先頭から期限切れの間だけ削除すればよい
+        while self._sessions:
+            session_id, (touched_at, _) = next(iter(self._sessions.items()))
+            if now - touched_at < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self._stats["expired"] += 1
+
+    def get(self, session_id: str) -> Optional[DiagnosticSession]:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, session_id: str, session: DiagnosticSession) -> None:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            self._sessions[session_id] = (now, session)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                **self._stats,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite（WAL）のストア（同じファイルを使う複数プロセスで共有できる）"""
+
+    def __init__(
+        self,
+        db_path: str = "diagnostic_sessions.db",
+        max_sessions: int = 100000,
+        ttl_seconds: float = 3600,
+        purge_interval: float = 60,
+    ):
+        """
+        初期化
+
+        Args:
+            db_path: SQLiteファイルのパス
+            max_sessions: 保持する最大セッション数（超えたら更新が古いものから削除）
+            ttl_seconds: 最後の利用（取得・保存）からの有効期限（秒）
+            purge_interval: 期限切れ・上限超過の削除を行う間隔（秒）
+        """
+        self.db_path = db_path
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
+
+    def _init_database(self):
+        """セッションテーブルを作成"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def get(self, session_id: str) -> Optional[DiagnosticSession]:
+        # メモリのストアと同じく、利用中のセッションは取得のたびに有効期限を延ばす
+        now = time.time()
+        conn = self._connect()
+        touched = conn.execute(
+            "UPDATE sessions SET updated_at = ? WHERE id = ? AND updated_at >= ?",
+            (now, session_id, now - self.ttl_seconds),
+        ).rowcount
+        row = conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone() if touched else None
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            session = DiagnosticSession.loads(row[0])
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ 診断セッションの読み込みエラー: {session_id}: {e}")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return session
+
+    def put(self, session_id: str, session: DiagnosticSession) -> None:
+        now = time.time()
+        self._connect().execute(
+            '''
+            INSERT INTO sessions (id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            ''',
+            (session_id, session.dumps(), now),
+        )
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self.purge(now)
+
+    def purge(self, now: Optional[float] = None) -> Dict[str, int]:
+        """期限切れと上限超過のセッションを削除"""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        expired = conn.execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        evicted = conn.execute(
+            '''
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+            ''',
+            (self.max_sessions,),
+        ).rowcount
+        self._count("expired", expired)
+        self._count("evicted", evicted)
+        return {"expired": expired, "evicted": evicted}
+
+    def delete(self, session_id: str) -> None:
+        self._connect().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        size = self._connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "size": size,
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                **self._stats,
+            }
+
+
+def create_session_store() -> SessionStore:
+    """環境変数の設定でセッションストアを作成"""
+    ttl_seconds = float(os.getenv("DIAGNOSTIC_SESSION_TTL", "3600"))
+    if os.getenv("DIAGNOSTIC_SESSION_STORE", "memory").lower() == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("DIAGNOSTIC_SESSION_DB_PATH", data_path("diagnostic_sessions.db")),
+            max_sessions=int(os.getenv("DIAGNOSTIC_SESSION_MAX", "100000")),
+            ttl_seconds=ttl_seconds,
+        )
+    return MemorySessionStore(
+        max_sessions=int(os.getenv("DIAGNOSTIC_SESSION_MAX", "10000")),
+        ttl_seconds=ttl_seconds,
+    )
+
+
+# グローバルセッションストア（/chat/diagnose/* 用）
+diagnostic_sessions = create_session_store()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RAG用の見出し単位のチャンク分割
+テキストファイル（## 【Case ...】 / ### 見出しのマークダウン）やPDFのページを、
+見出しの区切りを保ったままトークン数の上限内の小さな断片に分ける。
+
+- ケースの見出し（無ければ最も浅い見出し）ごとに分け、ケースをまたいだ断片は作らない
+- 上限を超えるケースは次の階層の見出し（### 症状 / 原因 / 対処法 など）で分けて詰め直す
+- 見出しの無い長い本文は段落・行の単位で、前の断片の末尾を重ねて分ける
+- 断片の先頭には「文書名 > ケース見出し」を付け、断片だけでも文脈が分かるようにする
+- 断片IDは文書・見出し・本文から作るので、内容が変わらなければ再構築しても同じIDになる
+"""
+
+import hashlib
+import os
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+RAG_CHUNK_MAX_TOKENS = int(os.getenv("RAG_CHUNK_MAX_TOKENS", "500"))
+RAG_CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "60"))
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*$")
+CASE_ID_RE = re.compile(r"[【\[]\s*Case\s+([^】\]]+?)\s*[】\]]")
+
+
+class TextChunk(NamedTuple):
+    text: str
+    section: str
+    case_id: Optional[str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算（埋め込みモデルのトークナイザーを使わずに高速に見積もる）
+
+    日本語などASCII以外の文字は1文字1トークン、ASCIIは4文字で1トークンとして数える。
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def _heading(line: str) -> Optional[Tuple[int, str]]:
+    match = HEADING_RE.match(line)
+    return (len(match.group(1)), match.group(2)) if match else None
+
+
+def _headings(lines: Sequence[str]) -> List[Optional[Tuple[int, str]]]:
+    """各行の見出し（```で囲まれたコードブロック内の # コメントは見出しにしない）"""
+    result: List[Optional[Tuple[int, str]]] = []
+    in_fence = False
+    for line in lines:
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+            result.append(None)
+            continue
+        result.append(None if in_fence else _heading(line))
+    return result
+
+
+class _Block(NamedTuple):
+    heading: Optional[str]  # ブロック先頭の見出し（前書き部分は None）
+    lines: List[str]
+
+
+def _split_blocks(lines: Sequence[str], level: Optional[int] = None) -> List[_Block]:
+    """行を、指定した階層（省略時はその中で最も浅い見出し）の位置で分割（見出しが無ければ1ブロック）"""
+    headings = _headings(lines)
+    levels = [h[0] for h in headings if h]
+    if not levels:
+        return [_Block(None, list(lines))]
+    top = min(levels) if level is None else level
+    blocks: List[_Block] = []
+    current = _Block(None, [])
+    for line, heading in zip(lines, headings):
+        if heading and heading[0] == top:
+            if current.lines:
+                blocks.append(current)
+            current = _Block(heading[1], [])
+        current.lines.append(line)
+    if current.lines:
+        blocks.append(current)
+    return blocks
+
+
+def _join(lines: Iterable[str]) -> str:
+    return "\n".join(lines).strip()
+
+
+class _Chunker:
+    def __init__(self, title: str, max_tokens: int, overlap_tokens: int):
+        self.title = title
+        self.max_tokens = max(50, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.chunks: List[TextChunk] = []
+
+    def _emit(self, body: str, path: List[str], case_id: Optional[str]) -> None:
+        if not body:
+            return
+        # 本文に含まれていない上位の見出しを先頭に付ける
+        context = [self.title] if self.title else []
+        context += [heading for heading in path if heading not in body.split("\n", 1)[0]]
+        text = f"{' > '.join(context)}\n{body}" if context else body
+        self.chunks.append(TextChunk(text, " > ".join(path), case_id))
+
+    def _budget(self, path: List[str]) -> int:
+        # 先頭に付ける見出しの分を差し引く
+        prefix = " > ".join([self.title, *path])
+        return max(self.max_tokens // 2, self.max_tokens - estimate_tokens(prefix))
+
+    def top(self, lines: Sequence[str]) -> None:
+        """ケースの見出し（無ければ最も浅い見出し）ごとに分け、ケースごとに断片を作る"""
+        case_level = next(
+            (h[0] for h in _headings(lines) if h and CASE_ID_RE.search(h[1])), None
+        )
+        for block in _split_blocks(lines, case_level):
+            path = [block.heading] if block.heading else []
+            case_id = self._case_id(block.heading)
+            self.section(block.lines, path, case_id)
+
+    def _case_id(self, heading: Optional[str]) -> Optional[str]:
+        match = CASE_ID_RE.search(heading or "")
+        return match.group(1) if match else None
+
+    def section(self, lines: Sequence[str], path: List[str], case_id: Optional[str]) -> None:
+        body = _join(lines)
+        budget = self._budget(path)
+        if estimate_tokens(body) <= budget:
+            self._emit(body, path, case_id)
+            return
+
+        # 先頭の見出し行の下を次の階層の見出しで分け、上限まで詰める
+        has_heading_line = bool(lines) and _headings(lines[:1])[0] is not None
+        inner = list(lines[1:]) if has_heading_line else list(lines)
+        blocks = _split_blocks(inner)
+        if len(blocks) <= 1 and (not blocks or blocks[0].heading is None):
+            self.window(body, path, case_id)
+            return
+
+        pending: List[str] = []
+        for block in blocks:
+            block_text = _join(block.lines)
+            if estimate_tokens(block_text) > budget:
+                self._emit(_join(pending), path, case_id)
+                pending = []
+                sub_path = path + [block.heading] if block.heading else path
+                self.section(block.lines, sub_path, case_id)
+                continue
+            if pending and estimate_tokens(_join(pending + block.lines)) > budget:
+                self._emit(_join(pending), path, case_id)
+                pending = []
+            pending.extend(block.lines)
+        self._emit(_join(pending), path, case_id)
+
+    def window(self, text: str, path: List[str], case_id: Optional[str]) -> None:
+        """見出しの無い長い本文を段落・行の単位で、末尾を重ねながら分割"""
+        budget = self._budget(path)
+        units: List[str] = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            if estimate_tokens(paragraph) <= budget:
+                units.append(paragraph.strip())
+                continue
+            for line in paragraph.split("\n"):
+                # 1行が上限を超える場合は文字数で切る
+                step = max(1, budget)
+                while estimate_tokens(line) > budget:
+                    units.append(line[:step])
+                    line = line[step:]
+                units.append(line)
+
+        current: List[str] = []
+        for unit in filter(None, units):
+            if current and estimate_tokens("\n".join(current + [unit])) > budget:
+                self._emit("\n".join(current), path, case_id)
+                current = self._overlap(current)
+                # 重ねた分を入れると収まらない場合は重ねない
+                if current and estimate_tokens("\n".join(current + [unit])) > budget:
+                    current = []
+            current.append(unit)
+        self._emit("\n".join(current), path, case_id)
+
+    def _overlap(self, units: List[str]) -> List[str]:
+        tail: List[str] = []
+        for unit in reversed(units):
+            if estimate_tokens("\n".join([unit] + tail)) > self.overlap_tokens:
+                break
+            tail.insert(0, unit)
+        return tail
+
+
+def chunk_text(
+    text: str,
+    title: str = "",
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> List[TextChunk]:
+    """
+    テキストを見出し単位の断片に分割
+
+    Args:
+        text: マークダウン（見出しが無いテキストも可）
+        title: 文書名（各断片の先頭に付ける）
+        max_tokens: 1断片のトークン数の上限（省略時は RAG_CHUNK_MAX_TOKENS）
+        overlap_tokens: 見出しの無い本文を分割するときに重ねるトークン数（省略時は RAG_CHUNK_OVERLAP_TOKENS）
+    """
+    chunker = _Chunker(
+        title,
+        RAG_CHUNK_MAX_TOKENS if max_tokens is None else max_tokens,
+        RAG_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+    )
+    chunker.top(text.split("\n"))
+    return chunker.chunks
+
+
+def make_chunk_id(source: str, section: str, text: str) -> str:
+    digest = hashlib.md5("\x1f".join([source, section, text]).encode("utf-8")).hexdigest()
+    return f"{source}#{digest[:16]}"
+
+
+def chunk_documents(
+    documents: Iterable[Any],
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> List[Any]:
+    """
+    langchain の Document を断片の Document に分割
+
+    断片は元の metadata をすべて引き継ぎ、chunk_id / chunk_source / chunk_index / chunk_count /
+    section（ケースの場合は case_id）を追加する。chunk_id は一覧の中で重複しない。
+
+    Args:
+        documents: page_content と metadata を持つドキュメント
+    """
+    chunked: List[Any] = []
+    seen_ids: Dict[str, int] = {}
+    for doc in documents:
+        metadata = dict(doc.metadata or {})
+        source = str(metadata.get("url") or metadata.get("notion_id") or metadata.get("title") or metadata.get("source") or "doc")
+        if metadata.get("page") is not None:
+            source = f"{source}:p{metadata['page']}"
+        chunks = chunk_text(str(doc.page_content or ""), str(metadata.get("title") or ""), max_tokens, overlap_tokens)
+        for index, chunk in enumerate(chunks):
+            chunk_id = make_chunk_id(source, chunk.section, chunk.text)
+            if chunk_id in seen_ids:
+                seen_ids[chunk_id] += 1
+                chunk_id = f"{chunk_id}-{seen_ids[chunk_id]}"
+            else:
+                seen_ids[chunk_id] = 0
+            chunk_metadata = {
+                **metadata,
+                "chunk_id": chunk_id,
+                "chunk_source": source,
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                "section": chunk.section,
+            }
+            if chunk.case_id:
+                chunk_metadata["case_id"] = chunk.case_id
+            chunked.append(type(doc)(page_content=chunk.text, metadata=chunk_metadata))
+    return chunked
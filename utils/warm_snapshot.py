@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+起動時の暖機用スナップショット
+Notionから読み込んだデータセットと、そこから作ったインデックスをローカルファイルに保存し、
+再起動・デプロイ直後はこれを読み込んで即座に応答できるようにする（その後Notionで再検証する）。
+
+ファイルは「マジック + バージョン」の1行のヘッダーと pickle 本体からなる。
+保存する内容の構造を変えたら SNAPSHOT_VERSION を上げること（古いファイルは読み込まない）。
+"""
+
+import os
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.data_paths import data_path, ensure_parent_dir
+
+SNAPSHOT_MAGIC = b"CAMPER-WARM-SNAPSHOT"
+SNAPSHOT_VERSION = 1
+
+
+class WarmSnapshot:
+    """データセットごとのセクションをまとめて保存・復元する"""
+
+    def __init__(self, path: Optional[str] = "warm_snapshot.pkl", save_delay: float = 5.0):
+        """
+        初期化
+
+        Args:
+            path: スナップショットファイルのパス（空・None の場合は保存・復元しない）
+            save_delay: 更新通知から保存までの待ち時間（秒。続けて更新された場合は1回にまとめる）
+        """
+        self.path = path or None
+        self.save_delay = save_delay
+        self._sections: Dict[str, Dict[str, Callable]] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._saved_at: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+        self._stats = {"saves": 0, "loads": 0, "errors": 0}
+
+    def register(self, name: str, export: Callable[[], Any], restore: Callable[[Any], bool]) -> None:
+        """
+        セクションを登録
+
+        Args:
+            name: セクション名
+            export: 保存する値を返す関数（None は保存しない）。1回の保存のすべてのセクションを
+                1つの pickle にするので、セクション間で共有しているオブジェクトは復元後も共有される
+            restore: 読み込んだ値を反映する関数（反映できたら True）
+        """
+        with self._lock:
+            self._sections[name] = {"export": export, "restore": restore}
+            self._state.setdefault(name, {"source": None, "updated_at": None})
+
+    # ---- 保存 ----
+
+    def mark_refreshed(self, name: str) -> None:
+        """セクションのデータがNotionから更新されたことを通知し、少し後に保存する"""
+        with self._lock:
+            self._state[name] = {"source": "live", "updated_at": time.time()}
+        self.schedule_save()
+
+    def schedule_save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(self.save_delay, self.save)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def save(self) -> bool:
+        """登録されたセクションをファイルに書き出す（一時ファイルに書いてから置き換える）"""
+        if self.path is None:
+            return False
+        with self._lock:
+            sections = dict(self._sections)
+        with self._save_lock:
+            payload = {}
+            for name, section in sections.items():
+                try:
+                    value = section["export"]()
+                except Exception as e:
+                    print(f"⚠️ スナップショットの取得エラー（{name}）: {e}")
+                    continue
+                if value is not None:
+                    payload[name] = value
+            if not payload:
+                return False
+
+            saved_at = time.time()
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                ensure_parent_dir(self.path)
+                with open(temp_path, "wb") as f:
+                    f.write(SNAPSHOT_MAGIC + b" %d\n" % SNAPSHOT_VERSION)
+                    pickle.dump({"saved_at": saved_at, "sections": payload}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self.path)
+            except Exception as e:
+                print(f"⚠️ スナップショット保存エラー: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                return False
+
+        with self._lock:
+            self._saved_at = saved_at
+            self._stats["saves"] += 1
+        print(f"💾 スナップショット保存: {sorted(payload)}")
+        return True
+
+    # ---- 復元 ----
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            header = f.readline().split()
+            if len(header) != 2 or header[0] != SNAPSHOT_MAGIC or header[1] != b"%d" % SNAPSHOT_VERSION:
+                print(f"⚠️ スナップショットの形式・バージョンが異なるため使用しません: {self.path}")
+                return None
+            return pickle.load(f)
+
+    def load(self) -> Dict[str, bool]:
+        """
+        ファイルを読み込んで登録済みのセクションに反映
+
+        Returns:
+            セクション名 → 反映できたか
+        """
+        started = time.time()
+        try:
+            snapshot = self._read()
+        except Exception as e:
+            print(f"⚠️ スナップショット読み込みエラー: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return {}
+        if snapshot is None:
+            return {}
+
+        with self._lock:
+            sections = dict(self._sections)
+        results = {}
+        for name, value in snapshot.get("sections", {}).items():
+            section = sections.get(name)
+            if section is None:
+                continue
+            try:
+                results[name] = bool(section["restore"](value))
+            except Exception as e:
+                print(f"⚠️ スナップショットの反映エラー（{name}）: {e}")
+                results[name] = False
+
+        saved_at = snapshot.get("saved_at")
+        with self._lock:
+            self._saved_at = saved_at
+            self._loaded_at = time.time()
+            self._stats["loads"] += 1
+            for name, restored in results.items():
+                # 起動後にNotionから更新済みのセクションは上書きしない
+                if restored and self._state[name]["source"] is None:
+                    self._state[name] = {"source": "snapshot", "updated_at": saved_at}
+        elapsed_ms = (time.time() - started) * 1000
+        print(f"⚡ スナップショット読み込み: {results}（{elapsed_ms:.1f}ms）")
+        return results
+
+    # ---- 状態 ----
+
+    def is_ready(self) -> bool:
+        """登録されたすべてのセクションにデータがあるか（スナップショットまたはNotionから）"""
+        with self._lock:
+            return bool(self._state) and all(state["source"] for state in self._state.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            sections = {
+                name: {
+                    "source": state["source"],
+                    "age_seconds": round(now - state["updated_at"], 1) if state["updated_at"] else None,
+                }
+                for name, state in self._state.items()
+            }
+            return {
+                "path": self.path,
+                "version": SNAPSHOT_VERSION,
+                "ready": bool(sections) and all(section["source"] for section in sections.values()),
+                "loaded": self._loaded_at is not None,
+                "age_seconds": round(now - self._saved_at, 1) if self._saved_at else None,
+                "sections": sections,
+                **self._stats,
+            }
+
+
+# グローバルスナップショット（WARM_SNAPSHOT_PATH を空にすると無効）
+warm_snapshot = WarmSnapshot(
+    os.getenv("WARM_SNAPSHOT_PATH", data_path("warm_snapshot.pkl")),
+    save_delay=float(os.getenv("WARM_SNAPSHOT_SAVE_DELAY", "5")),
+)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ライトビハインドキュー
+書き込み（Notionへの会話ログ保存など）をSQLiteのスプールファイルに積んでからすぐに返し、
+バックグラウンドワーカーが一定のペースで送信する（再起動・Notion障害時もスプールに残る）
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.data_paths import ensure_parent_dir
+
+
+class RetryableWriteError(Exception):
+    """一時的な書き込みエラー（429・5xxなど。retry_after 秒後に再送する）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentWriteError(Exception):
+    """再送しても成功しない書き込みエラー（400など。すぐにデッドレターへ移す）"""
+
+
+class WriteBehindQueue:
+    """
+    SQLiteスプール + 送信ワーカー
+
+    handler(payload) が例外なく戻れば送信成功としてスプールから削除する。
+    PermanentWriteError はデッドレターへ、それ以外の例外は指数バックオフで再送し、
+    max_attempts 回失敗したらデッドレターへ移す。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Dict[str, Any]], Any],
+        spool_path: str,
+        batch_size: int = 10,
+        max_attempts: int = 8,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+        min_interval: float = 0.0,
+        poll_interval: float = 5.0,
+        lease_seconds: float = 120.0,
+    ):
+        """
+        初期化
+
+        Args:
+            name: キュー名（ログ・スレッド名用）
+            handler: 1件を送信する関数
+            spool_path: スプールファイル（SQLite）のパス
+            batch_size: 1回に取り出す件数
+            max_attempts: デッドレターへ移すまでの送信回数
+            base_delay: 再送待ちの初期秒数（失敗ごとに2倍）
+            max_delay: 再送待ちの上限秒数
+            min_interval: 送信と送信の最小間隔（秒）
+            poll_interval: キューが空のときの確認間隔（秒）
+            lease_seconds: 取り出した行を他のワーカーに渡さない秒数（送信中に落ちた場合は再送される）
+        """
+        self.name = name
+        self.handler = handler
+        self.spool_path = spool_path
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"enqueued": 0, "delivered": 0, "retried": 0, "dead_lettered": 0}
+        self._last_error: Optional[str] = None
+        self._init_lock = threading.Lock()
+        self._initialized = False  # ファイルとテーブルは最初の接続で作る
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（トランザクションは明示的に開始する）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._initialized:
+                ensure_parent_dir(self.spool_path)
+            conn = sqlite3.connect(self.spool_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        self._init_database()
+                        self._initialized = True
+        return conn
+
+    def _init_database(self):
+        """スプールテーブルを作成"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                dead INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_spool_due ON spool (dead, next_attempt_at)")
+
+    # ---- 投入 ----
+
+    def enqueue(self, payload: Dict[str, Any]) -> int:
+        """
+        書き込みをスプールに追加（ディスクに書いた時点で戻る）
+
+        Returns:
+            スプールの行ID
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO spool (payload, next_attempt_at, created_at) VALUES (?, ?, ?)",
+            (json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        with self._lock:
+            self._stats["enqueued"] += 1
+        self._wake.set()
+        return cursor.lastrowid
+
+    # ---- 送信 ----
+
+    def _claim(self, limit: int) -> List[tuple]:
+        """送信時刻を過ぎた行を取り出し、リース期間中は他のワーカーに渡さない"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM spool WHERE dead = 0 AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE spool SET next_attempt_at = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+
+    def drain_once(self, limit: Optional[int] = None) -> int:
+        """
+        送信時刻を過ぎた行を最大 limit 件送信し、結果を1トランザクションでスプールに反映
+
+        Returns:
+            処理した件数（成功・失敗を含む）
+        """
+        rows = self._claim(limit or self.batch_size)
+        if not rows:
+            return 0
+
+        delivered: List[int] = []
+        failed: List[tuple] = []
+        for index, (row_id, payload, attempts) in enumerate(rows):
+            if index and self.min_interval:
+                if self._stop.wait(self.min_interval):
+                    # 停止中は未送信の行のリースを解除して次回起動時に送る
+                    failed.extend((r[0], r[2], None, None, False) for r in rows[index:])
+                    break
+            attempts += 1
+            try:
+                self.handler(json.loads(payload))
+                delivered.append(row_id)
+            except PermanentWriteError as e:
+                failed.append((row_id, attempts, str(e), None, True))
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                failed.append((row_id, attempts, str(e), retry_after, attempts >= self.max_attempts))
+
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if delivered:
+                conn.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in delivered])
+            for row_id, attempts, error, retry_after, dead in failed:
+                if error is None:
+                    conn.execute("UPDATE spool SET next_attempt_at = ? WHERE id = ?", (now, row_id))
+                    continue
+                delay = retry_after if retry_after is not None else self._backoff(attempts)
+                conn.execute(
+                    "UPDATE spool SET attempts = ?, last_error = ?, next_attempt_at = ?, dead = ? WHERE id = ?",
+                    (attempts, error[:500], now + delay, 1 if dead else 0, row_id),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        errors = [f for f in failed if f[2] is not None]
+        with self._lock:
+            self._stats["delivered"] += len(delivered)
+            self._stats["dead_lettered"] += sum(1 for f in errors if f[4])
+            self._stats["retried"] += sum(1 for f in errors if not f[4])
+            if errors:
+                self._last_error = errors[-1][2]
+        for row_id, attempts, error, _, dead in errors:
+            if dead:
+                print(f"❌ {self.name}: 送信失敗のためデッドレターへ移動 (id={row_id}, 試行{attempts}回): {error}")
+            else:
+                print(f"⚠️ {self.name}: 送信失敗、後で再送します (id={row_id}, 試行{attempts}回): {error}")
+        return len(delivered) + len(errors)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """送信時刻を過ぎた行が無くなるまで送信（テスト・シャットダウン用）"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.drain_once() == 0:
+                return True
+        return False
+
+    # ---- ワーカー ----
+
+    def start(self) -> bool:
+        """送信ワーカーを開始（起動済みなら何もしない）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                print(f"⚠️ {self.name}: スプール処理エラー: {e}")
+                processed = 0
+            if processed == 0:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # ---- デッドレター ----
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """デッドレターの一覧（新しい順）"""
+        rows = self._connect().execute(
+            "SELECT id, payload, attempts, last_error, created_at FROM spool WHERE dead = 1 ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [
+            {"id": row[0], "payload": json.loads(row[1]), "attempts": row[2], "last_error": row[3], "created_at": row[4]}
+            for row in rows
+        ]
+
+    def requeue_dead(self) -> int:
+        """デッドレターを再送対象に戻す（Notion側の設定を直した後など）"""
+        cursor = self._connect().execute(
+            "UPDATE spool SET dead = 0, attempts = 0, next_attempt_at = ? WHERE dead = 1",
+            (time.time(),),
+        )
+        self._wake.set()
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """未送信・デッドレター件数と送信回数"""
+        pending, dead = self._connect().execute(
+            "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM spool"
+        ).fetchone()
+        with self._lock:
+            return {
+                "pending": pending,
+                "dead": dead,
+                "worker_alive": bool(self._thread and self._thread.is_alive()),
+                "last_error": self._last_error,
+                **self._stats,
+            }